@@ -0,0 +1,50 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:28
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Q, Subquery
+
+
+def backfill_last_activity(apps, schema_editor):
+    User = apps.get_model('accounts', 'User')
+    Checkin = apps.get_model('habits', 'Checkin')
+    UserEvent = apps.get_model('analytics', 'UserEvent')
+
+    last_checkin = Checkin.objects.filter(
+        habit__user=OuterRef('pk')
+    ).values('habit__user').annotate(last=Max('created_at')).values('last')
+
+    last_event = UserEvent.objects.filter(
+        user=OuterRef('pk')
+    ).values('user').annotate(last=Max('timestamp')).values('last')
+
+    User.objects.update(last_activity_at=Subquery(last_checkin))
+
+    # Events only move the timestamp forward
+    User.objects.annotate(last_event=Subquery(last_event)).filter(
+        Q(last_activity_at__isnull=True) | Q(last_activity_at__lt=models.F('last_event')),
+        last_event__isnull=False,
+    ).update(last_activity_at=Subquery(last_event))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_initial'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0002_enable_pgvector'),
+        ('habits', '0001_initial'),
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='last_activity_at',
+            field=models.DateTimeField(blank=True, help_text='Last checkin or tracked event', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_active', 'last_activity_at'], name='users_is_acti_60f5fa_idx'),
+        ),
+        migrations.RunPython(backfill_last_activity, migrations.RunPython.noop),
+    ]
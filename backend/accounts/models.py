@@ -1,10 +1,14 @@
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from django.core.cache import cache
 from django.db import models
 from django.utils import timezone
+from datetime import timedelta
 import uuid
 
 
 class UserManager(BaseUserManager):
+    ACTIVITY_THROTTLE_SECONDS = 60
+
     def create_user(self, email, name, password=None, **extra_fields):
         if not email:
             raise ValueError('Users must have an email address')
@@ -31,6 +35,19 @@ class UserManager(BaseUserManager):
         
         return self.create_user(email, name, password, **extra_fields)
 
+    def record_activity(self, user_id, when=None):
+        """Move a user's last_activity_at forward, at most once per ACTIVITY_THROTTLE_SECONDS"""
+        when = when or timezone.now()
+        throttle = timedelta(seconds=self.ACTIVITY_THROTTLE_SECONDS)
+
+        # Skip the write entirely when another request just recorded activity
+        if not cache.add(f'user_activity:{user_id}', 1, self.ACTIVITY_THROTTLE_SECONDS):
+            return 0
+
+        return self.filter(pk=user_id).filter(
+            models.Q(last_activity_at__isnull=True) | models.Q(last_activity_at__lt=when - throttle)
+        ).update(last_activity_at=when)
+
 
 class User(AbstractBaseUser, PermissionsMixin):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -45,6 +62,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_staff = models.BooleanField(default=False)
     date_joined = models.DateTimeField(default=timezone.now)
     last_login = models.DateTimeField(null=True, blank=True)
+    last_activity_at = models.DateTimeField(null=True, blank=True, help_text="Last checkin or tracked event")
     
     objects = UserManager()
     
@@ -55,6 +73,9 @@ class User(AbstractBaseUser, PermissionsMixin):
         db_table = 'users'
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        indexes = [
+            models.Index(fields=['is_active', 'last_activity_at']),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.email})"
@@ -0,0 +1,33 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+import logging
+
+from analytics.models import UserEvent
+from habits.models import Checkin
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Checkin)
+def record_checkin_activity(sender, instance, created, **kwargs):
+    """Keep last_activity_at current when a user checks in"""
+    if not created:
+        return
+
+    try:
+        User.objects.record_activity(instance.habit.user_id, instance.created_at)
+    except Exception as e:
+        logger.error(f"Error recording checkin activity: {str(e)}")
+
+
+@receiver(post_save, sender=UserEvent)
+def record_event_activity(sender, instance, created, **kwargs):
+    """Keep last_activity_at current when a user event is tracked"""
+    if not created:
+        return
+
+    try:
+        User.objects.record_activity(instance.user_id, instance.timestamp)
+    except Exception as e:
+        logger.error(f"Error recording event activity: {str(e)}")
@@ -1,3 +1,87 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from habits.models import Checkin, Habit
+from messaging.aha_moments import AhaMomentScheduler
+from .models import User
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ActivityTrackingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='active@example.com', name='Active')
+
+    def last_activity(self):
+        self.user.refresh_from_db()
+        return self.user.last_activity_at
+
+    def test_checkins_record_activity(self):
+        habit = Habit.objects.create(user=self.user, title='Read')
+        checkin = Checkin.objects.create(habit=habit, date=timezone.localdate(), value=True)
+
+        self.assertEqual(self.last_activity(), checkin.created_at)
+
+    def test_writes_are_throttled_per_user(self):
+        now = timezone.now()
+
+        self.assertEqual(User.objects.record_activity(self.user.id, now), 1)
+        self.assertEqual(User.objects.record_activity(self.user.id, now + timedelta(seconds=5)), 0)
+
+        # Another process without the cache key still skips a write this recent
+        cache.clear()
+        self.assertEqual(User.objects.record_activity(self.user.id, now + timedelta(seconds=30)), 0)
+        self.assertEqual(self.last_activity(), now)
+
+        cache.clear()
+        self.assertEqual(User.objects.record_activity(self.user.id, now + timedelta(minutes=5)), 1)
+        self.assertEqual(self.last_activity(), now + timedelta(minutes=5))
+
+    def test_activity_never_moves_backwards(self):
+        now = timezone.now()
+        User.objects.record_activity(self.user.id, now)
+        cache.clear()
+
+        self.assertEqual(User.objects.record_activity(self.user.id, now - timedelta(days=1)), 0)
+        self.assertEqual(self.last_activity(), now)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class InactivitySweepTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('messaging.tasks.send_aha_moment_email.chunks')
+        self.chunks = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        now = timezone.now()
+        self.lapsed = User.objects.create_user(email='lapsed@example.com', name='Lapsed')
+        self.recent = User.objects.create_user(email='recent@example.com', name='Recent')
+        User.objects.filter(id=self.lapsed.id).update(last_activity_at=now - timedelta(days=3, minutes=1))
+        User.objects.filter(id=self.recent.id).update(last_activity_at=now - timedelta(days=1))
+
+    def queued(self):
+        return [args for call in self.chunks.call_args_list for args in call.args[0]]
+
+    def test_users_crossing_a_threshold_are_queued_once(self):
+        self.assertEqual(AhaMomentScheduler.check_inactive_users(), 1)
+        self.assertEqual(self.queued(), [(str(self.lapsed.id), 'come_back_hero', {'days_inactive': 3})])
+
+        # The next sweep covers only the time since this one
+        self.assertEqual(AhaMomentScheduler.check_inactive_users(), 0)
+
+    def test_a_lost_sweep_position_does_not_fire_twice(self):
+        AhaMomentScheduler.check_inactive_users()
+        cache.clear()
+
+        self.assertEqual(AhaMomentScheduler.check_inactive_users(), 0)
+        self.assertEqual(len(self.queued()), 1)
@@ -1,4 +1,3 @@
-from django.core.mail import send_mail
 from django.core.cache import cache
 from django.conf import settings
 from django.utils import timezone
@@ -14,6 +13,7 @@ from drf_spectacular.utils import extend_schema
 import random
 import string
 from .models import User, ContactMethod, ChannelPreference
+from messaging.tasks import send_otp_email
 from .serializers import (
     UserSerializer, JoinSerializer, OTPRequestSerializer, 
     OTPVerifySerializer, ContactMethodSerializer, ChannelPreferenceSerializer
@@ -73,13 +73,8 @@ class RequestOTPView(APIView):
             cache_key = f'otp_{email}'
             cache.set(cache_key, otp, 300)  # 5 minutes expiry
             
-            send_mail(
-                subject='Your Quanta Login Code',
-                message=f'Your login code is: {otp}',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[email],
-                fail_silently=False,
-            )
+            # Deliver on the OTP lane so bulk sends can't delay login codes
+            send_otp_email.delay(email, otp, user.name)
             
             return Response({'status': 'OTP sent'})
         
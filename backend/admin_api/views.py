@@ -10,6 +10,11 @@ from collections import defaultdict
 from accounts.models import User, ContactMethod, ChannelPreference
 from habits.models import Habit, Checkin, Mood, Mission, Vision, Badge
 from ai_services.langgraph_service import langgraph_ai_service
+from ai_services.limits import ai_limiter
+from core.singleflight import single_flight_stats
+from reports.cache import report_cache
+from reports.services import REPORT_KINDS
+from reports.usage import AIUsageTracker
 import logging
 
 logger = logging.getLogger(__name__)
@@ -305,72 +310,58 @@ def ai_usage_analytics(request):
         
         days = int(request.query_params.get('days', 30))
         
-        # Since we don't have detailed AI usage tracking yet, provide estimated analytics
-        # TODO: Implement proper AI usage tracking with database storage
-        
-        total_users = User.objects.count()
-        active_users = User.objects.filter(
-            last_login__gte=timezone.now() - timedelta(days=days)
-        ).count()
-        
-        # Estimate AI usage based on user activity
-        estimated_daily_requests = max(1, active_users * 2)  # Assume 2 AI requests per active user per day
-        estimated_total_requests = estimated_daily_requests * days
-        
-        # Mock usage trends (replace with real data when tracking is implemented)
-        usage_trends = []
-        end_date = timezone.now().date()
-        start_date = end_date - timedelta(days=days-1)
-        
-        current_date = start_date
-        while current_date <= end_date:
-            # Simulate usage patterns (higher on weekdays, lower on weekends)
-            base_usage = estimated_daily_requests
-            if current_date.weekday() >= 5:  # Weekend
-                daily_usage = int(base_usage * 0.6)
-            else:  # Weekday
-                daily_usage = base_usage
-                
-            usage_trends.append({
-                'date': current_date.isoformat(),
-                'requests': daily_usage,
-                'unique_users': min(daily_usage, active_users)
-            })
-            current_date += timedelta(days=1)
+        usage = AIUsageTracker.summarize(AIUsageTracker.get_daily_usage(days), days)
+        totals = usage['totals']
+        active_users = AIUsageTracker.active_users(days)
+        
+        usage_trends = [
+            {
+                'date': day['date'],
+                'requests': day['requests'],
+                'errors': day['errors'],
+                'tokens': day['total_tokens'],
+                'estimated_cost': day['estimated_cost'],
+                'average_latency_ms': day['average_latency_ms'],
+                'latency_ms_p95': day['latency_ms_p95'],
+            }
+            for day in usage['by_date']
+        ]
         
         # Service health metrics
         service_metrics = {
             'langgraph_available': langgraph_ai_service.ai_available,
-            'gemini_model': 'gemini-1.5-flash-002',
-            'embeddings_model': 'text-embedding-004',
-            'estimated_cost_per_request': 0.001,  # Estimated cost in USD
-            'estimated_total_cost': estimated_total_requests * 0.001
+            'models': usage['by_model'],
+            'average_latency_ms': totals['average_latency_ms'],
+            'latency_ms_p95': totals['latency_ms_p95'],
+            'error_rate': totals['error_rate'],
+            'estimated_cost_per_request': round(totals['estimated_cost'] / totals['requests'], 6) if totals['requests'] else 0,
+            'estimated_total_cost': totals['estimated_cost'],
+            'report_cache': report_cache.stats(REPORT_KINDS),
+            'single_flight': single_flight_stats(),
+            'rate_limits': ai_limiter.stats()
         }
         
-        # Feature usage breakdown (estimated)
-        feature_usage = {
-            'progress_reports': int(estimated_total_requests * 0.4),
-            'habit_insights': int(estimated_total_requests * 0.3),
-            'embeddings_generation': int(estimated_total_requests * 0.2),
-            'motivational_messages': int(estimated_total_requests * 0.1)
-        }
+        feature_usage = {feature['feature']: feature for feature in usage['by_feature']}
+        
+        end_date = timezone.now().date()
+        start_date = end_date - timedelta(days=days-1)
         
         analytics = {
             'usage_trends': usage_trends,
             'service_metrics': service_metrics,
             'feature_usage': feature_usage,
             'summary': {
-                'total_estimated_requests': estimated_total_requests,
-                'daily_average': round(estimated_total_requests / days, 1),
+                'total_requests': totals['requests'],
+                'total_tokens': totals['total_tokens'],
+                'daily_average': round(totals['requests'] / days, 1),
                 'active_ai_users': active_users,
-                'requests_per_user': round(estimated_total_requests / active_users, 1) if active_users > 0 else 0
+                'requests_per_user': round(totals['requests'] / active_users, 1) if active_users > 0 else 0
             },
             'time_period': {
                 'start_date': start_date.isoformat(),
                 'end_date': end_date.isoformat(),
                 'days': days
-            },
-            'note': 'AI usage data is currently estimated. Implement detailed tracking for accurate metrics.'
+            }
         }
         
         return Response(analytics)
@@ -14,6 +14,18 @@ from core.models import Course, Enrollment
 from habits.models import Habit, Checkin
 from accounts.serializers import UserSerializer
 from core.serializers import CourseSerializer
+from reports.models import AIUsage
+from reports.usage import AIUsageTracker
+
+
+def timeframe_days(timeframe):
+    """'24h' -> 1, '7d' -> 7, '30d' -> 30; defaults to 7"""
+    try:
+        if timeframe.endswith('h'):
+            return max(1, -(-int(timeframe[:-1]) // 24))
+        return max(1, int(timeframe.rstrip('d')))
+    except ValueError:
+        return 7
 
 
 @api_view(['GET'])
@@ -30,8 +42,7 @@ def admin_stats(request):
     week_ago = timezone.now() - timedelta(days=7)
     new_users_week = User.objects.filter(date_joined__gte=week_ago).count()
     
-    # AI usage simulation (would be real data in production)
-    ai_usage_today = 156  # Simulated
+    ai_usage_today = AIUsage.objects.filter(created_at__date=timezone.now().date()).count()
     
     return Response({
         'total_users': total_users,
@@ -180,46 +191,47 @@ def admin_update_course(request, course_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def admin_ai_usage(request):
-    """Get AI usage statistics (simulated for MVP)"""
-    
-    # In production, this would query actual AI usage logs
-    # For now, we'll return simulated data
+    """Get AI usage statistics from recorded usage and daily rollups"""
     
     timeframe = request.GET.get('timeframe', '7d')
+    days = timeframe_days(timeframe)
+    
+    usage = AIUsageTracker.summarize(AIUsageTracker.get_daily_usage(days), days)
+    totals = usage['totals']
+    
+    recent = AIUsage.objects.select_related('user')[:20]
     
-    # Simulated usage data
     usage_data = {
-        'total_requests': 1247,
-        'total_tokens': 125000,
-        'total_cost': 18.75,
-        'requests_today': 156,
-        'average_response_time': 1.2,
+        'total_requests': totals['requests'],
+        'total_tokens': totals['total_tokens'],
+        'total_cost': totals['estimated_cost'],
+        'requests_today': usage['by_date'][-1]['requests'],
+        'average_response_time': round(totals['average_latency_ms'] / 1000, 2),
+        'p95_response_time': round(totals['latency_ms_p95'] / 1000, 2),
+        'error_rate': totals['error_rate'],
         'usage_by_feature': [
-            {'feature': 'Progress Report', 'requests': 487, 'cost': 9.74},
-            {'feature': 'Hero Infographic', 'requests': 312, 'cost': 6.24},
-            {'feature': 'Habit Insights', 'requests': 248, 'cost': 1.98},
-            {'feature': 'Mission Analysis', 'requests': 124, 'cost': 0.62},
-            {'feature': 'Mood Analysis', 'requests': 76, 'cost': 0.17}
+            {
+                'feature': feature['label'],
+                'requests': feature['requests'],
+                'tokens': feature['total_tokens'],
+                'cost': feature['estimated_cost'],
+                'average_response_time': round(feature['average_latency_ms'] / 1000, 2),
+            }
+            for feature in usage['by_feature']
         ],
+        'usage_by_day': usage['by_date'],
         'recent_requests': [
             {
-                'id': '1',
-                'user': 'Alice Johnson',
-                'feature': 'Progress Report',
-                'tokens': 1250,
-                'cost': 0.025,
-                'timestamp': timezone.now().isoformat(),
-                'response_time': 1.1
-            },
-            {
-                'id': '2',
-                'user': 'Bob Smith',
-                'feature': 'Hero Infographic',
-                'tokens': 2100,
-                'cost': 0.042,
-                'timestamp': (timezone.now() - timedelta(minutes=5)).isoformat(),
-                'response_time': 1.8
+                'id': str(entry.id),
+                'user': entry.user.name if entry.user else 'System',
+                'feature': entry.get_feature_display(),
+                'tokens': entry.total_tokens,
+                'cost': entry.estimated_cost,
+                'timestamp': entry.created_at.isoformat(),
+                'response_time': round(entry.latency_ms / 1000, 2),
+                'status': entry.status,
             }
+            for entry in recent
         ]
     }
     
@@ -239,15 +251,17 @@ def export_ai_usage_csv(request):
     writer = csv.writer(response)
     writer.writerow(['User', 'Feature', 'Tokens', 'Cost (USD)', 'Response Time (s)', 'Timestamp'])
     
-    # In production, this would query actual AI usage logs
-    # For now, we'll use simulated data
-    simulated_data = [
-        ['Alice Johnson', 'Progress Report', 1250, 0.025, 1.1, timezone.now().isoformat()],
-        ['Bob Smith', 'Hero Infographic', 2100, 0.042, 1.8, (timezone.now() - timedelta(minutes=5)).isoformat()],
-        ['Carol Davis', 'Habit Insights', 850, 0.017, 0.9, (timezone.now() - timedelta(minutes=10)).isoformat()]
-    ]
+    since = timezone.now() - timedelta(days=timeframe_days(timeframe))
+    rows = AIUsage.objects.filter(created_at__gte=since).select_related('user').order_by('-created_at')
     
-    for row in simulated_data:
-        writer.writerow(row)
+    for entry in rows.iterator(chunk_size=2000):
+        writer.writerow([
+            entry.user.name if entry.user else 'System',
+            entry.get_feature_display(),
+            entry.total_tokens,
+            entry.estimated_cost,
+            round(entry.latency_ms / 1000, 2),
+            entry.created_at.isoformat(),
+        ])
     
     return response
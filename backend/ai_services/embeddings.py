@@ -0,0 +1,429 @@
+"""
+Batched background generation of text embeddings
+
+Saving a Mission, Habit, Checkin or Mood only records an EmbeddingJob
+(model, pk, field, text hash) in the same transaction; no embedding call
+happens on the request thread. Workers claim due jobs with SKIP LOCKED,
+embed the distinct texts with one embed_documents call per batch and write
+the vectors back with one bulk_update per model. Failed batches are retried
+with exponential backoff; beat runs the worker periodically, so retries come
+due even when nothing new is saved.
+
+Vectors are content-addressed: a TextEmbedding row holds one vector per
+normalized text and embedding model, fronted by a per-process LRU. Common
+short texts ("Drink water") are embedded once for all users, and switching
+embedding models re-embeds each distinct text once.
+
+A claim is a lease: claimed rows get a future next_attempt_at, so a worker
+that dies simply lets its jobs come due again. Re-enqueueing a job (the text
+changed again) clears its claim, and finished jobs are only deleted while
+their claim is unchanged, so the newer text is never lost.
+"""
+import hashlib
+import logging
+import random
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+import numpy as np
+
+from habits.models import EmbeddingJob, TextEmbedding
+
+logger = logging.getLogger(__name__)
+
+
+# Text fields embedded per model; vectors are stored in <field>_embedding
+EMBEDDING_FIELDS = {
+    'habits.Mission': ['skill', 'weakness'],
+    'habits.Habit': ['title', 'anchor'],
+    'habits.Checkin': ['note'],
+    'habits.Mood': ['note'],
+}
+
+SCHEDULED_KEY = 'embedding_jobs:scheduled'
+
+# How long a field's last embedded text hash is remembered to skip no-op saves
+EMBEDDED_HASH_TTL = 30 * 24 * 3600
+
+
+def normalize_text(text):
+    """Case- and whitespace-insensitive form of a text, so trivial variants share a vector"""
+    return ' '.join(text.split()).casefold()
+
+
+def text_hash(text):
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+def model_name_for(embeddings):
+    return getattr(embeddings, 'model', None) or 'default'
+
+
+def embedded_hash_key(label, object_id, field):
+    return f'embedding_hash:{label}:{object_id}:{field}'
+
+
+def get_config():
+    return getattr(settings, 'EMBEDDINGS', {})
+
+
+def enqueue_embeddings(instance, update_fields=None):
+    """
+    Record embedding jobs for the instance's changed text fields.
+
+    Called from post_save; costs one cache round-trip and at most one upsert.
+    Fields whose current text was already embedded are skipped.
+    """
+    label = instance._meta.label
+    fields = EMBEDDING_FIELDS.get(label, [])
+    if update_fields is not None:
+        fields = [f for f in fields if f in update_fields]
+
+    hashes = {
+        field: text_hash(getattr(instance, field))
+        for field in fields
+        if getattr(instance, field)
+    }
+    if not hashes:
+        return 0
+
+    embedded = cache.get_many([embedded_hash_key(label, instance.pk, field) for field in hashes])
+    now = timezone.now()
+    jobs = [
+        EmbeddingJob(
+            model=label,
+            object_id=instance.pk,
+            field=field,
+            text_hash=digest,
+            next_attempt_at=now,
+        )
+        for field, digest in hashes.items()
+        if not (
+            embedded.get(embedded_hash_key(label, instance.pk, field)) == digest
+            and getattr(instance, f'{field}_embedding') is not None
+        )
+    ]
+    if not jobs:
+        return 0
+
+    # Savepoint, so a failed upsert cannot poison the caller's transaction
+    with transaction.atomic():
+        upsert_jobs(jobs)
+    transaction.on_commit(schedule_processing)
+    return len(jobs)
+
+
+def enqueue_bulk(instances):
+    """
+    Record embedding jobs for instances written with bulk_create, which
+    sends no post_save. Every non-empty text field is queued.
+    """
+    now = timezone.now()
+    jobs = [
+        EmbeddingJob(
+            model=instance._meta.label,
+            object_id=instance.pk,
+            field=field,
+            text_hash=text_hash(getattr(instance, field)),
+            next_attempt_at=now,
+        )
+        for instance in instances
+        if instance.pk is not None
+        for field in EMBEDDING_FIELDS.get(instance._meta.label, [])
+        if getattr(instance, field)
+    ]
+    if not jobs:
+        return 0
+
+    with transaction.atomic():
+        upsert_jobs(jobs)
+    transaction.on_commit(schedule_processing)
+    return len(jobs)
+
+
+def upsert_jobs(jobs):
+    """Create jobs, or reset existing ones to the new text and a fresh retry budget"""
+    EmbeddingJob.objects.bulk_create(
+        jobs,
+        update_conflicts=True,
+        unique_fields=['model', 'object_id', 'field'],
+        update_fields=['text_hash', 'attempts', 'next_attempt_at', 'claimed_at', 'error_message'],
+    )
+    return len(jobs)
+
+
+def enqueue_all(labels=None, chunk_size=2000):
+    """
+    Queue every non-empty text field of the given models (all by default),
+    e.g. after switching embedding models. Returns the number of jobs.
+    """
+    now = timezone.now()
+    total = 0
+    for label in labels or EMBEDDING_FIELDS:
+        model = apps.get_model(label)
+        for field in EMBEDDING_FIELDS[label]:
+            rows = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+            batch = []
+            for object_id, text in rows.values_list('pk', field).iterator(chunk_size=chunk_size):
+                batch.append(EmbeddingJob(
+                    model=label, object_id=object_id, field=field,
+                    text_hash=text_hash(text), next_attempt_at=now,
+                ))
+                if len(batch) >= chunk_size:
+                    total += upsert_jobs(batch)
+                    batch = []
+            if batch:
+                total += upsert_jobs(batch)
+    return total
+
+
+def schedule_processing():
+    """Kick the worker once per debounce window, however many jobs arrive"""
+    debounce = get_config().get('DEBOUNCE_SECONDS', 5)
+    if cache.add(SCHEDULED_KEY, True, debounce):
+        from .tasks import process_embedding_jobs
+        try:
+            process_embedding_jobs.apply_async(countdown=debounce)
+        except Exception as e:
+            # Jobs stay due and are picked up by the next run
+            logger.error(f"Error scheduling embedding jobs: {str(e)}")
+
+
+class EmbeddingCache:
+    """
+    Vectors by normalized-text hash for one embedding model.
+
+    Lookups go to the in-process LRU first and then to TextEmbedding in one
+    query; vectors are kept as float32 arrays (3 KB each) to bound memory.
+    """
+
+    def __init__(self, model_name, max_size=None):
+        self.model_name = model_name
+        self.max_size = max_size or get_config().get('CACHE_SIZE', 10000)
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, digests):
+        """Known vectors for the given hashes, as {hash: vector}"""
+        found = {}
+        with self._lock:
+            for digest in digests:
+                vector = self._vectors.get(digest)
+                if vector is not None:
+                    self._vectors.move_to_end(digest)
+                    found[digest] = vector
+
+        misses = [digest for digest in digests if digest not in found]
+        if misses:
+            rows = TextEmbedding.objects.filter(
+                model_name=self.model_name, text_hash__in=misses
+            ).values_list('text_hash', 'embedding')
+            loaded = {digest: np.asarray(vector, dtype=np.float32) for digest, vector in rows}
+            self.remember(loaded)
+            found.update(loaded)
+
+        return found
+
+    def set_many(self, vectors):
+        """Store new vectors; concurrent workers may race on the same text, first one wins"""
+        vectors = {digest: np.asarray(vector, dtype=np.float32) for digest, vector in vectors.items()}
+        TextEmbedding.objects.bulk_create(
+            [
+                TextEmbedding(model_name=self.model_name, text_hash=digest, embedding=vector)
+                for digest, vector in vectors.items()
+            ],
+            ignore_conflicts=True,
+        )
+        self.remember(vectors)
+
+    def remember(self, vectors):
+        with self._lock:
+            for digest, vector in vectors.items():
+                self._vectors[digest] = vector
+                self._vectors.move_to_end(digest)
+            while len(self._vectors) > self.max_size:
+                self._vectors.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._vectors.clear()
+
+
+_caches = {}
+
+
+def get_embedding_cache(model_name):
+    """Process-wide cache per embedding model"""
+    if model_name not in _caches:
+        _caches[model_name] = EmbeddingCache(model_name)
+    return _caches[model_name]
+
+
+class EmbeddingPipeline:
+    """Claim due embedding jobs, embed them in batches and store the vectors"""
+
+    def __init__(self, embeddings=None, batch_size=None, claim_size=None):
+        config = get_config()
+        if embeddings is None:
+            from .langgraph_service import langgraph_ai_service
+            embeddings = langgraph_ai_service.embeddings
+        self.embeddings = embeddings
+        self.cache = get_embedding_cache(model_name_for(embeddings)) if embeddings is not None else None
+        self.batch_size = batch_size or config.get('BATCH_SIZE', 100)
+        self.claim_size = claim_size or config.get('CLAIM_SIZE', 500)
+        self.max_attempts = config.get('MAX_ATTEMPTS', 5)
+        self.lease_seconds = config.get('LEASE_SECONDS', 300)
+        self.backoff_base = config.get('BACKOFF_BASE_SECONDS', 30)
+        self.backoff_max = config.get('BACKOFF_MAX_SECONDS', 3600)
+
+    def run_once(self):
+        """Process one claim of jobs. Returns the number of jobs claimed."""
+        if self.embeddings is None:
+            return 0
+
+        jobs, claimed_at = self.claim()
+        if not jobs:
+            return 0
+
+        items, stale = self.load_texts(jobs)
+        if stale:
+            EmbeddingJob.objects.filter(id__in=[job.id for job in stale], claimed_at=claimed_at).delete()
+
+        # Identical texts (e.g. common habit titles) are embedded once
+        by_hash = defaultdict(list)
+        for item in items:
+            by_hash[item['hash']].append(item)
+
+        known = self.cache.get_many(list(by_hash))
+        if known:
+            cached_items = [item for digest in known for item in by_hash.pop(digest)]
+            for item in cached_items:
+                item['vector'] = known[item['hash']]
+            self.record_success(cached_items, claimed_at)
+        digests = list(by_hash)
+
+        for start in range(0, len(digests), self.batch_size):
+            batch = digests[start:start + self.batch_size]
+            batch_items = [item for digest in batch for item in by_hash[digest]]
+            try:
+                vectors = self.embeddings.embed_documents([by_hash[digest][0]['text'] for digest in batch])
+                if len(vectors) != len(batch):
+                    raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+            except Exception as e:
+                logger.error(f"Error embedding batch of {len(batch)} texts: {str(e)}")
+                self.record_failure([item['job'] for item in batch_items], claimed_at, str(e))
+                continue
+
+            self.cache.set_many(dict(zip(batch, vectors)))
+            for digest, vector in zip(batch, vectors):
+                for item in by_hash[digest]:
+                    item['vector'] = vector
+            self.record_success(batch_items, claimed_at)
+
+        return len(jobs)
+
+    def claim(self):
+        """Lease a batch of due jobs, skipping jobs other workers hold"""
+        now = timezone.now()
+
+        with transaction.atomic():
+            jobs = list(
+                EmbeddingJob.objects
+                .select_for_update(skip_locked=True)
+                .filter(next_attempt_at__lte=now, attempts__lt=self.max_attempts)
+                .order_by('next_attempt_at')[:self.claim_size]
+            )
+            if not jobs:
+                return [], now
+
+            EmbeddingJob.objects.filter(id__in=[job.id for job in jobs]).update(
+                claimed_at=now,
+                next_attempt_at=now + timedelta(seconds=self.lease_seconds),
+                attempts=F('attempts') + 1,
+            )
+
+        for job in jobs:
+            job.claimed_at = now
+            job.attempts += 1
+        return jobs, now
+
+    def load_texts(self, jobs):
+        """
+        Current text of each job's field, one query per model.
+
+        Returns (items, stale_jobs); a job is stale when its row is gone or
+        the field is now empty.
+        """
+        by_model = defaultdict(list)
+        for job in jobs:
+            by_model[job.model].append(job)
+
+        items = []
+        stale = []
+        for label, model_jobs in by_model.items():
+            if label not in EMBEDDING_FIELDS:
+                stale.extend(model_jobs)
+                continue
+            model = apps.get_model(label)
+            objects = model.objects.only('pk', *EMBEDDING_FIELDS[label]).in_bulk({job.object_id for job in model_jobs})
+
+            for job in model_jobs:
+                obj = objects.get(job.object_id)
+                text = getattr(obj, job.field, None) if obj is not None else None
+                if not text:
+                    stale.append(job)
+                    continue
+                # The text may have changed since enqueueing; embed what is there now
+                items.append({'job': job, 'object': obj, 'text': text, 'hash': text_hash(text)})
+
+        return items, stale
+
+    def record_success(self, items, claimed_at):
+        """Write vectors with one bulk_update per model and retire the jobs"""
+        by_model = defaultdict(dict)
+        fields = defaultdict(set)
+        for item in items:
+            label = item['job'].model
+            obj = item['object']
+            setattr(obj, f"{item['job'].field}_embedding", item['vector'])
+            by_model[label][obj.pk] = obj
+            fields[label].add(f"{item['job'].field}_embedding")
+
+        for label, objects in by_model.items():
+            model = apps.get_model(label)
+            model.objects.bulk_update(list(objects.values()), sorted(fields[label]))
+
+        EmbeddingJob.objects.filter(id__in=[item['job'].id for item in items], claimed_at=claimed_at).delete()
+        cache.set_many({
+            embedded_hash_key(item['job'].model, item['job'].object_id, item['job'].field): item['hash']
+            for item in items
+        }, EMBEDDED_HASH_TTL)
+        logger.info(f"Stored {len(items)} embeddings")
+
+    def record_failure(self, jobs, claimed_at, error):
+        """Schedule retries with backoff; jobs out of attempts are kept for inspection"""
+        now = timezone.now()
+        by_attempts = defaultdict(list)
+        for job in jobs:
+            by_attempts[job.attempts].append(job.id)
+
+        for attempts, ids in by_attempts.items():
+            EmbeddingJob.objects.filter(id__in=ids, claimed_at=claimed_at).update(
+                claimed_at=None,
+                next_attempt_at=now + timedelta(seconds=self.backoff_delay(attempts)),
+                error_message=error,
+            )
+            if attempts >= self.max_attempts:
+                logger.error(f"Giving up on {len(ids)} embedding jobs after {attempts} attempts")
+
+    def backoff_delay(self, attempts):
+        """Exponential backoff with full jitter"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return random.uniform(delay / 2, delay)
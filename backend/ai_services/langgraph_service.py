@@ -1,6 +1,8 @@
 import os
 import json
+import asyncio
 import logging
+import operator
 from typing import Dict, Any, List, Optional, TypedDict, Annotated
 from datetime import datetime, timedelta
 
@@ -8,6 +10,9 @@ from django.conf import settings
 from django.utils import timezone
 import numpy as np
 
+from core.singleflight import embedding_flight
+from .metering import MeteredEmbeddings, MeteredLLM
+
 logger = logging.getLogger(__name__)
 
 # Import AI dependencies with fallbacks
@@ -41,6 +46,9 @@ class ProgressAnalysisState(TypedDict):
     insights: List[Dict[str, Any]]
     recommendations: List[str]
     motivational_message: str
+    # Set by any branch that fell back to canned content; branches run
+    # concurrently, so updates are OR-ed together
+    degraded: Annotated[bool, operator.or_]
     final_report: Dict[str, Any]
     
 
@@ -51,6 +59,31 @@ class EmbeddingState(TypedDict):
     error: Optional[str]
 
 
+class SimulatedLLM:
+    """Stand-in for the Gemini client in load tests: waits like a real call, returns canned text"""
+    
+    model = 'simulated'
+    
+    INSIGHTS = json.dumps([
+        {"type": "pattern", "title": "Simulated insight", "description": "Load test response", "confidence": 0.5}
+    ])
+    
+    def __init__(self, latency: float):
+        self.latency = float(latency)
+    
+    def _respond(self, prompt: str) -> str:
+        return self.INSIGHTS if 'insights' in prompt else "Keep going, hero! 🚀"
+    
+    async def ainvoke(self, prompt: str) -> str:
+        await asyncio.sleep(self.latency)
+        return self._respond(prompt)
+    
+    def invoke(self, prompt: str) -> str:
+        import time
+        time.sleep(self.latency)
+        return self._respond(prompt)
+
+
 class LangGraphAIService:
     """Enhanced AI Service using LangGraph for complex workflows and Gemini Flash for speed"""
     
@@ -75,6 +108,19 @@ class LangGraphAIService:
         else:
             self.llm = None
             self.embeddings = None
+        
+        # Load testing without a provider: a fake LLM with realistic latency
+        simulated_latency = getattr(settings, 'AI_SERVICES', {}).get('SIMULATED_LLM_LATENCY_SECONDS', 0)
+        if simulated_latency and self.llm is None and LANGGRAPH_AVAILABLE:
+            logger.warning(f"Using simulated LLM with {simulated_latency}s latency")
+            self.llm = SimulatedLLM(simulated_latency)
+            self.ai_available = True
+        
+        # Every call through these clients is timed and recorded as AIUsage
+        if self.llm is not None:
+            self.llm = MeteredLLM(self.llm)
+        if self.embeddings is not None:
+            self.embeddings = MeteredEmbeddings(self.embeddings)
             
         # Build workflow graphs
         self._build_progress_analysis_graph()
@@ -97,12 +143,13 @@ class LangGraphAIService:
         workflow.add_node("generate_motivation", self._generate_motivation_node)
         workflow.add_node("compile_report", self._compile_report_node)
         
-        # Add edges
+        # Add edges: the three branches only need the context, so they run
+        # concurrently and compile_report waits for all of them
+        branches = ["generate_insights", "create_recommendations", "generate_motivation"]
         workflow.add_edge(START, "analyze_context")
-        workflow.add_edge("analyze_context", "generate_insights")
-        workflow.add_edge("generate_insights", "create_recommendations")
-        workflow.add_edge("create_recommendations", "generate_motivation")
-        workflow.add_edge("generate_motivation", "compile_report")
+        for branch in branches:
+            workflow.add_edge("analyze_context", branch)
+        workflow.add_edge(branches, "compile_report")
         workflow.add_edge("compile_report", END)
         
         # Compile the graph
@@ -137,15 +184,13 @@ class LangGraphAIService:
                 insights=[],
                 recommendations=[],
                 motivational_message="",
+                degraded=False,
                 final_report={}
             )
             
             # Run the workflow
             result = await self.progress_graph.ainvoke(initial_state)
             
-            # Track usage (estimate tokens)
-            self._track_usage(user, 1500, 'progress_report_langgraph')
-            
             return result["final_report"]
             
         except Exception as e:
@@ -157,27 +202,32 @@ class LangGraphAIService:
         try:
             if not self.ai_available or not text.strip():
                 return None
-                
-            # Initialize state
-            initial_state = EmbeddingState(
-                text=text,
-                embedding=None,
-                error=None
-            )
             
-            # Run embedding workflow
-            result = await self.embedding_graph.ainvoke(initial_state)
-            
-            if result.get("error"):
-                logger.error(f"Embedding error: {result['error']}")
-                return None
-                
-            return result.get("embedding")
+            # Identical texts requested at the same time share one call
+            from .embeddings import text_hash
+            return await embedding_flight.ado(text_hash(text), lambda: self._embed_text(text))
             
         except Exception as e:
             logger.error(f"Error generating embedding: {str(e)}")
             return None
     
+    async def _embed_text(self, text: str) -> Optional[List[float]]:
+        # Initialize state
+        initial_state = EmbeddingState(
+            text=text,
+            embedding=None,
+            error=None
+        )
+        
+        # Run embedding workflow
+        result = await self.embedding_graph.ainvoke(initial_state)
+        
+        if result.get("error"):
+            logger.error(f"Embedding error: {result['error']}")
+            return None
+            
+        return result.get("embedding")
+    
     def generate_text_embedding_sync(self, text: str) -> Optional[List[float]]:
         """Synchronous version of text embedding generation"""
         try:
@@ -185,8 +235,8 @@ class LangGraphAIService:
                 return None
                 
             # Use embeddings directly for sync operation
-            embedding = self.embeddings.embed_query(text)
-            return embedding
+            from .embeddings import text_hash
+            return embedding_flight.do(text_hash(text), lambda: self.embeddings.embed_query(text))
             
         except Exception as e:
             logger.error(f"Error generating sync embedding: {str(e)}")
@@ -217,7 +267,17 @@ class LangGraphAIService:
             state["context"] = {}
             return state
     
-    async def _generate_insights_node(self, state: ProgressAnalysisState) -> ProgressAnalysisState:
+    async def _invoke_llm(self, prompt: str, node: str, user_id: Optional[str] = None) -> str:
+        """LLM call bounded by the per-node timeout, so one slow branch cannot stall the report"""
+        timeout = getattr(settings, 'AI_SERVICES', {}).get('NODE_TIMEOUT_SECONDS', 10)
+        call = self.llm.ainvoke(prompt, feature='report', user_id=user_id, request_data={'node': node})
+        try:
+            return await asyncio.wait_for(call, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{node} timed out after {timeout}s, using fallback")
+            raise
+
+    async def _generate_insights_node(self, state: ProgressAnalysisState) -> Dict[str, Any]:
         """Generate insights using LLM"""
         try:
             context = state["context"]
@@ -240,50 +300,38 @@ class LangGraphAIService:
             Be encouraging and focus on teen-friendly language with emojis.
             """
             
-            response = await self.llm.ainvoke(prompt)
+            response = await self._invoke_llm(prompt, "generate_insights", state["user_id"])
             
             # Parse insights from response
-            insights = self._parse_insights_from_response(response)
-            state["insights"] = insights
+            return {"insights": self._parse_insights_from_response(response)}
             
         except Exception as e:
-            logger.error(f"Error in generate_insights_node: {str(e)}")
-            state["insights"] = self._get_fallback_insights(state["context"])
-            
-        return state
+            logger.error(f"Error in generate_insights_node: {str(e) or type(e).__name__}")
+            return {"insights": self._get_fallback_insights(state["context"]), "degraded": True}
     
-    async def _create_recommendations_node(self, state: ProgressAnalysisState) -> ProgressAnalysisState:
-        """Create actionable recommendations"""
+    async def _create_recommendations_node(self, state: ProgressAnalysisState) -> Dict[str, Any]:
+        """Create actionable recommendations from similar users' habits (no LLM call)"""
         try:
-            context = state["context"]
-            insights = state["insights"]
+            from asgiref.sync import sync_to_async
+            from accounts.models import User
+            from .recommender import habit_recommender
             
-            prompt = f"""
-            Based on these insights about a teen's habits, create 3-5 specific, actionable recommendations:
+            def recommend():
+                user = User.objects.get(id=state["user_id"])
+                return habit_recommender.recommend_text(user, limit=3)
             
-            Context: {json.dumps(context, indent=2)}
-            Insights: {json.dumps(insights, indent=2)}
+            timeout = getattr(settings, 'AI_SERVICES', {}).get('NODE_TIMEOUT_SECONDS', 10)
+            recommendations = await asyncio.wait_for(sync_to_async(recommend)(), timeout=timeout)
             
-            Provide recommendations as a JSON array of strings. Keep them:
-            - Specific and actionable
-            - Teen-friendly language
-            - Encouraging tone
-            - Include relevant emojis
-            
-            Format: ["Recommendation 1", "Recommendation 2", ...]
-            """
-            
-            response = await self.llm.ainvoke(prompt)
-            recommendations = self._parse_recommendations_from_response(response)
-            state["recommendations"] = recommendations
+            # Round out suggestions of what to do with the general tips
+            fallback = self._get_fallback_recommendations(state["context"])
+            return {"recommendations": (recommendations + fallback)[:5]}
             
         except Exception as e:
-            logger.error(f"Error in create_recommendations_node: {str(e)}")
-            state["recommendations"] = self._get_fallback_recommendations(state["context"])
-            
-        return state
+            logger.error(f"Error in create_recommendations_node: {str(e) or type(e).__name__}")
+            return {"recommendations": self._get_fallback_recommendations(state["context"]), "degraded": True}
     
-    async def _generate_motivation_node(self, state: ProgressAnalysisState) -> ProgressAnalysisState:
+    async def _generate_motivation_node(self, state: ProgressAnalysisState) -> Dict[str, Any]:
         """Generate personalized motivational message"""
         try:
             context = state["context"]
@@ -302,14 +350,12 @@ class LangGraphAIService:
             Just return the message directly, no formatting.
             """
             
-            response = await self.llm.ainvoke(prompt)
-            state["motivational_message"] = response.strip()
+            response = await self._invoke_llm(prompt, "generate_motivation", state["user_id"])
+            return {"motivational_message": response.strip()}
             
         except Exception as e:
-            logger.error(f"Error in generate_motivation_node: {str(e)}")
-            state["motivational_message"] = self._get_fallback_motivation(state["context"])
-            
-        return state
+            logger.error(f"Error in generate_motivation_node: {str(e) or type(e).__name__}")
+            return {"motivational_message": self._get_fallback_motivation(state["context"]), "degraded": True}
     
     async def _compile_report_node(self, state: ProgressAnalysisState) -> ProgressAnalysisState:
         """Compile final report from all components"""
@@ -322,7 +368,8 @@ class LangGraphAIService:
                 "recommendations": state["recommendations"], 
                 "motivational_message": state["motivational_message"],
                 "generated_at": timezone.now().isoformat(),
-                "analysis_method": "langgraph_workflow"
+                "analysis_method": "langgraph_workflow",
+                "degraded": state["degraded"]
             }
             
             state["final_report"] = report
@@ -481,11 +528,5 @@ class LangGraphAIService:
             "analysis_method": "emergency_fallback"
         }
     
-    def _track_usage(self, user, estimated_tokens: int, operation: str):
-        """Track AI usage"""
-        logger.info(f"AI usage: user={user.email}, operation={operation}, tokens={estimated_tokens}")
-        # TODO: Implement database tracking
-
-
 # Initialize the service
 langgraph_ai_service = LangGraphAIService()
\ No newline at end of file
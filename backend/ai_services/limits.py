@@ -0,0 +1,157 @@
+"""
+Per-user and global limits on AI usage
+
+One runaway client must not be able to exhaust the provider quota or queue
+everyone else behind its calls. Three limits, all shared across processes
+through core.rate_limit (atomic Redis scripts, in-process stand-ins without
+Redis):
+
+- requests per user per day, a token bucket refilled continuously, taken
+  when an AI endpoint admits a request. Report endpoints only ask on a cache
+  miss (reports.cache), so cached reports are always served;
+- tokens per user per day, charged after each metered call with the real
+  token count. A user may overdraw once; further requests are refused until
+  the balance refills;
+- a global ceiling on calls in flight toward the provider. Endpoints refuse
+  new requests while it is full, and each metered call holds a slot, waiting
+  briefly for one to free up.
+
+Rejections are counted per reason (see AILimiter.stats).
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+
+from core.metrics import get_counts, increment
+from core.rate_limit import ConcurrencyLimiter, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+REASONS = ('user_requests', 'user_tokens', 'provider_concurrency')
+
+
+class AIRateLimitExceeded(Exception):
+    """An AI call refused by a limit; retry after `retry_after` seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"AI rate limit exceeded ({reason}), retry in {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AILimiter:
+    """Daily per-user request and token budgets plus a provider concurrency ceiling"""
+
+    def __init__(self):
+        limits = getattr(settings, 'AI_RATE_LIMIT', {})
+        self.enabled = limits.get('ENABLED', True)
+        self.requests_per_day = limits.get('REQUESTS_PER_DAY', 100)
+        self.tokens_per_day = limits.get('TOKENS_PER_DAY', 200000)
+        self.slot_wait_seconds = limits.get('SLOT_WAIT_SECONDS', 5)
+        self.provider_slots = ConcurrencyLimiter(
+            'ai:provider',
+            limit=limits.get('MAX_CONCURRENCY', 32),
+            lease_seconds=limits.get('SLOT_LEASE_SECONDS', 120),
+        )
+
+    def request_bucket(self, user_id):
+        return TokenBucket(f'ai:requests:{user_id}', rate=self.requests_per_day / 86400, capacity=self.requests_per_day)
+
+    def token_bucket(self, user_id):
+        return TokenBucket(f'ai:tokens:{user_id}', rate=self.tokens_per_day / 86400, capacity=self.tokens_per_day)
+
+    def admit(self, user):
+        """
+        Admit one AI request by `user`.
+
+        Returns (allowed, retry_after_seconds, reason). Only admitted
+        requests count against the user's daily request budget.
+        """
+        if not self.enabled:
+            return True, 0.0, None
+
+        # Peek: is any token budget left?
+        allowed, retry_after = self.token_bucket(user.id).consume(0, reserve=1)
+        if not allowed:
+            return self.reject('user_tokens', retry_after, user.id)
+
+        if self.provider_slots.in_flight() >= self.provider_slots.limit:
+            return self.reject('provider_concurrency', 1.0, user.id)
+
+        allowed, retry_after = self.request_bucket(user.id).consume(1)
+        if not allowed:
+            return self.reject('user_requests', retry_after, user.id)
+
+        return True, 0.0, None
+
+    def check(self, user):
+        """admit(), raising AIRateLimitExceeded when the request is refused"""
+        allowed, retry_after, reason = self.admit(user)
+        if not allowed:
+            raise AIRateLimitExceeded(reason, retry_after)
+
+    def charge_tokens(self, user_id, tokens):
+        """Charge tokens a call actually used to the user's daily budget"""
+        if self.enabled and user_id and tokens:
+            self.token_bucket(user_id).consume(tokens, force=True)
+
+    @contextmanager
+    def provider_slot(self):
+        """Hold one provider slot for a call; raises AIRateLimitExceeded if none frees up in time"""
+        if not self.enabled:
+            yield
+            return
+
+        deadline = time.monotonic() + self.slot_wait_seconds
+        token = self.provider_slots.acquire()
+        while token is None:
+            if time.monotonic() >= deadline:
+                self.reject('provider_concurrency', 1.0)
+                raise AIRateLimitExceeded('provider_concurrency', 1.0)
+            time.sleep(0.05)
+            token = self.provider_slots.acquire()
+        try:
+            yield
+        finally:
+            self.provider_slots.release(token)
+
+    @asynccontextmanager
+    async def aprovider_slot(self):
+        """provider_slot for async callers"""
+        if not self.enabled:
+            yield
+            return
+
+        deadline = time.monotonic() + self.slot_wait_seconds
+        token = self.provider_slots.acquire()
+        while token is None:
+            if time.monotonic() >= deadline:
+                self.reject('provider_concurrency', 1.0)
+                raise AIRateLimitExceeded('provider_concurrency', 1.0)
+            await asyncio.sleep(0.05)
+            token = self.provider_slots.acquire()
+        try:
+            yield
+        finally:
+            self.provider_slots.release(token)
+
+    def reject(self, reason, retry_after, user_id=None):
+        increment(f'ai_rate_limit:rejected:{reason}')
+        logger.info(f"AI request rejected ({reason}) for user {user_id or '-'}, retry in {retry_after:.0f}s")
+        return False, retry_after, reason
+
+    def stats(self):
+        """Rejections per reason and provider calls in flight"""
+        counts = get_counts([f'ai_rate_limit:rejected:{reason}' for reason in REASONS])
+        return {
+            'rejected': {reason: counts[f'ai_rate_limit:rejected:{reason}'] for reason in REASONS},
+            'provider_in_flight': self.provider_slots.in_flight(),
+            'provider_max_concurrency': self.provider_slots.limit,
+        }
+
+
+ai_limiter = AILimiter()
@@ -0,0 +1,163 @@
+import io
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+
+class Command(BaseCommand):
+    help = 'Benchmark HNSW vector search against exact search: recall@k and latency, global and per-user filtered'
+
+    TABLE = 'vector_benchmark'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Vectors to load')
+        parser.add_argument('--dimensions', type=int, default=768)
+        parser.add_argument('--users', type=int, default=20000, help='Distinct owners, for filtered searches')
+        parser.add_argument('--clusters', type=int, default=2000, help='Topic clusters the synthetic texts fall into')
+        parser.add_argument('--queries', type=int, default=100)
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--ef-search', default='40,100,200', help='Comma-separated hnsw.ef_search values to try')
+        parser.add_argument('--m', type=int, default=16)
+        parser.add_argument('--ef-construction', type=int, default=64)
+        parser.add_argument('--reuse', action='store_true', help='Reuse the table and index from a previous run')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark table afterwards')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Vector search benchmarks need PostgreSQL with pgvector')
+
+        self.rng = np.random.default_rng(options['seed'])
+        self.centers = self.normalize(self.rng.standard_normal((options['clusters'], options['dimensions'])))
+        k = options['k']
+        ef_values = [int(v) for v in options['ef_search'].split(',') if v]
+
+        if not options['reuse']:
+            self.load(options)
+            self.build_index(options)
+
+        queries = self.make_vectors(options['queries'])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT user_id FROM {self.TABLE} TABLESAMPLE SYSTEM (1) LIMIT %s', [options['queries']])
+            owners = [row[0] for row in cursor.fetchall()]
+        owners = (owners * (options['queries'] // max(len(owners), 1) + 1))[:options['queries']]
+
+        try:
+            for label, filtered in [('global', False), ('filtered by user', True)]:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'\n{label} top-{k}'))
+
+                exact, exact_ms = self.run_queries(queries, owners, k, filtered, exact=True)
+                self.stdout.write(f'exact      p50={self.pct(exact_ms, 0.5):8.1f}ms p95={self.pct(exact_ms, 0.95):8.1f}ms')
+
+                for ef in ef_values:
+                    found, ann_ms = self.run_queries(queries, owners, k, filtered, ef_search=ef)
+                    recalls = [
+                        len(set(a) & set(e)) / len(e)
+                        for a, e in zip(found, exact) if e
+                    ]
+                    recall = statistics.mean(recalls) if recalls else 0.0
+                    self.stdout.write(
+                        f'ef={ef:<7} p50={self.pct(ann_ms, 0.5):8.1f}ms p95={self.pct(ann_ms, 0.95):8.1f}ms '
+                        f'recall@{k}={recall:.3f}'
+                    )
+        finally:
+            if not options['keep']:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DROP TABLE IF EXISTS {self.TABLE}')
+
+    def normalize(self, vectors):
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def make_vectors(self, count):
+        """Points scattered around random cluster centers, like many texts on a few topics"""
+        centers = self.centers[self.rng.integers(len(self.centers), size=count)]
+        noise = self.rng.standard_normal(centers.shape) * (0.6 / np.sqrt(centers.shape[1]))
+        return self.normalize(centers + noise).astype(np.float32)
+
+    def load(self, options):
+        rows, dimensions = options['rows'], options['dimensions']
+        self.stdout.write(f'Loading {rows} vectors of {dimensions} dimensions...')
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.TABLE}')
+            cursor.execute(
+                f'CREATE UNLOGGED TABLE {self.TABLE} '
+                f'(id bigint PRIMARY KEY, user_id integer NOT NULL, embedding vector({dimensions}) NOT NULL)'
+            )
+
+            started = time.perf_counter()
+            chunk_size = 20000
+            for start in range(0, rows, chunk_size):
+                count = min(chunk_size, rows - start)
+                vectors = self.make_vectors(count)
+                owners = self.rng.integers(options['users'], size=count)
+
+                buffer = io.StringIO()
+                for offset, (owner, vector) in enumerate(zip(owners, vectors)):
+                    buffer.write(f"{start + offset}\t{owner}\t[{','.join(f'{x:.5f}' for x in vector)}]\n")
+                buffer.seek(0)
+                cursor.cursor.copy_expert(f'COPY {self.TABLE} (id, user_id, embedding) FROM STDIN', buffer)
+
+                if (start // chunk_size) % 10 == 0:
+                    self.stdout.write(f'  {start + count} rows')
+
+            cursor.execute(f'CREATE INDEX ON {self.TABLE} (user_id)')
+            cursor.execute(f'ANALYZE {self.TABLE}')
+
+        self.stdout.write(f'Loaded in {time.perf_counter() - started:.0f}s')
+
+    def build_index(self, options):
+        self.stdout.write(f"Building HNSW index (m={options['m']}, ef_construction={options['ef_construction']})...")
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute("SET maintenance_work_mem = '2GB'")
+            cursor.execute(
+                f'CREATE INDEX {self.TABLE}_hnsw ON {self.TABLE} USING hnsw (embedding vector_cosine_ops) '
+                f"WITH (m = {options['m']}, ef_construction = {options['ef_construction']})"
+            )
+            cursor.execute(f"SELECT pg_size_pretty(pg_relation_size('{self.TABLE}_hnsw'))")
+            size = cursor.fetchone()[0]
+        self.stdout.write(f'Index built in {time.perf_counter() - started:.0f}s, {size}')
+
+    def run_queries(self, queries, owners, k, filtered, exact=False, ef_search=None):
+        """Ids found and latency (ms) per query"""
+        where = 'WHERE user_id = %s' if filtered else ''
+        sql = f'SELECT id FROM {self.TABLE} {where} ORDER BY embedding <=> %s::vector LIMIT %s'
+
+        results = []
+        latencies = []
+        for vector, owner in zip(queries, owners):
+            literal = '[' + ','.join(f'{x:.5f}' for x in vector) + ']'
+            params = [owner, literal, k] if filtered else [literal, k]
+
+            with transaction.atomic(), connection.cursor() as cursor:
+                if exact:
+                    # Sequential or bitmap scan: the true nearest neighbours
+                    cursor.execute('SET LOCAL enable_indexscan = off')
+                else:
+                    cursor.execute('SET LOCAL hnsw.ef_search = %s', [ef_search])
+                    if filtered:
+                        self.enable_iterative_scan(cursor)
+
+                started = time.perf_counter()
+                cursor.execute(sql, params)
+                ids = [row[0] for row in cursor.fetchall()]
+                latencies.append((time.perf_counter() - started) * 1000)
+            results.append(ids)
+
+        return results, latencies
+
+    def enable_iterative_scan(self, cursor):
+        """pgvector 0.8+: keep scanning the index until enough rows pass the filter"""
+        try:
+            with transaction.atomic():
+                cursor.execute("SET LOCAL hnsw.iterative_scan = 'relaxed_order'")
+        except Exception:
+            pass
+
+    def pct(self, values, p):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p))]
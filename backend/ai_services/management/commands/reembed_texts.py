@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_services.embeddings import EMBEDDING_FIELDS, EmbeddingPipeline, enqueue_all
+
+
+class Command(BaseCommand):
+    help = 'Queue embeddings for all habit, mission, check-in and mood texts (e.g. after changing embedding model)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            action='append',
+            choices=list(EMBEDDING_FIELDS),
+            help='Only this model (repeatable); all embedded models by default',
+        )
+        parser.add_argument(
+            '--process',
+            action='store_true',
+            help='Process the queue in this process instead of leaving it to workers',
+        )
+
+    def handle(self, *args, **options):
+        queued = enqueue_all(options['model'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Queued {queued} embedding jobs'))
+
+        if not options['process']:
+            return
+
+        pipeline = EmbeddingPipeline()
+        if pipeline.embeddings is None:
+            raise CommandError('Embeddings are not configured (GEMINI_API_KEY)')
+
+        total = 0
+        while True:
+            claimed = pipeline.run_once()
+            if not claimed:
+                break
+            total += claimed
+            self.stdout.write(f'Processed {claimed} jobs ({total} total)')
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Processed {total} embedding jobs'))
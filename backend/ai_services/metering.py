@@ -0,0 +1,159 @@
+"""
+Timing and token accounting around the LangChain clients
+
+LangGraphAIService hands out its Gemini clients wrapped in MeteredLLM and
+MeteredEmbeddings, so every call made through `langgraph_ai_service.llm` or
+`.embeddings` is reported to reports.usage.AIUsageTracker with its latency,
+token counts and outcome. LLM token counts come from the provider's usage
+metadata (returned by generate / agenerate); clients without it, and
+embeddings, which report none, are estimated from the text length.
+Everything else, `model` included, is delegated to the wrapped client, so
+code keyed on the client's model name (the TextEmbedding namespace) sees the
+same name as before; usage is recorded under the short `usage_model` label.
+
+Each call also holds a provider slot and charges its tokens to the user's
+daily budget (ai_services.limits).
+"""
+import logging
+import time
+
+from .limits import ai_limiter
+
+logger = logging.getLogger(__name__)
+
+
+def model_label(client):
+    """'models/text-embedding-004' -> 'text-embedding-004'"""
+    name = getattr(client, 'model', None) or type(client).__name__
+    return str(name).split('/')[-1]
+
+
+def usage_from_result(result):
+    """(prompt tokens, output tokens) from an LLMResult's usage metadata, or None"""
+    try:
+        info = result.generations[0][0].generation_info or {}
+    except (AttributeError, IndexError):
+        return None
+    usage = info.get('usage_metadata') or (result.llm_output or {}).get('usage_metadata')
+    if not usage:
+        return None
+    return usage.get('prompt_token_count', 0), usage.get('candidates_token_count', 0)
+
+
+class MeteredClient:
+    """Delegates to `client` and records usage per call"""
+
+    def __init__(self, client):
+        self.client = client
+        self.usage_model = model_label(client)
+
+    def __getattr__(self, name):
+        if name == 'client':
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def record(self, feature, started, token_in, token_out, user_id=None, error=None, request_data=None):
+        from reports.usage import AIUsageTracker
+
+        AIUsageTracker.record(
+            feature,
+            self.usage_model,
+            token_in=token_in,
+            token_out=token_out,
+            latency_ms=(time.perf_counter() - started) * 1000,
+            status='error' if error is not None else 'ok',
+            user_id=user_id,
+            error_message=(str(error) or type(error).__name__) if error is not None else '',
+            request_data=request_data,
+        )
+        ai_limiter.charge_tokens(user_id, token_in + token_out)
+
+
+class MeteredLLM(MeteredClient):
+    """Text LLM whose invoke / ainvoke calls are metered"""
+
+    def invoke(self, prompt, feature='report', user_id=None, request_data=None):
+        with ai_limiter.provider_slot():
+            started = time.perf_counter()
+            try:
+                if hasattr(self.client, 'generate'):
+                    result = self.client.generate([prompt])
+                    text, usage = result.generations[0][0].text, usage_from_result(result)
+                else:
+                    text, usage = self.client.invoke(prompt), None
+            except BaseException as e:
+                self.record_call(feature, started, prompt, '', None, user_id, e, request_data)
+                raise
+        self.record_call(feature, started, prompt, text, usage, user_id, None, request_data)
+        return text
+
+    async def ainvoke(self, prompt, feature='report', user_id=None, request_data=None):
+        async with ai_limiter.aprovider_slot():
+            started = time.perf_counter()
+            try:
+                if hasattr(self.client, 'agenerate'):
+                    result = await self.client.agenerate([prompt])
+                    text, usage = result.generations[0][0].text, usage_from_result(result)
+                else:
+                    text, usage = await self.client.ainvoke(prompt), None
+            except BaseException as e:
+                # Includes cancellation by a node timeout
+                self.record_call(feature, started, prompt, '', None, user_id, e, request_data)
+                raise
+        self.record_call(feature, started, prompt, text, usage, user_id, None, request_data)
+        return text
+
+    def record_call(self, feature, started, prompt, text, usage, user_id, error, request_data):
+        from reports.usage import estimate_tokens
+
+        token_in, token_out = usage or (estimate_tokens(prompt), estimate_tokens(text))
+        self.record(
+            feature, started, token_in, token_out, user_id=user_id, error=error,
+            request_data={**(request_data or {}), 'tokens': 'provider' if usage else 'estimated'},
+        )
+
+
+class MeteredEmbeddings(MeteredClient):
+    """Embeddings client whose calls are metered (tokens estimated)"""
+
+    def embed_query(self, text, *args, **kwargs):
+        return self.call([text], self.client.embed_query, text, *args, **kwargs)
+
+    async def aembed_query(self, text, *args, **kwargs):
+        return await self.acall([text], self.client.aembed_query, text, *args, **kwargs)
+
+    def embed_documents(self, texts, *args, **kwargs):
+        return self.call(texts, self.client.embed_documents, texts, *args, **kwargs)
+
+    async def aembed_documents(self, texts, *args, **kwargs):
+        return await self.acall(texts, self.client.aembed_documents, texts, *args, **kwargs)
+
+    def call(self, texts, method, *args, **kwargs):
+        with ai_limiter.provider_slot():
+            started = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except BaseException as e:
+                self.record_texts(started, texts, e)
+                raise
+        self.record_texts(started, texts)
+        return result
+
+    async def acall(self, texts, method, *args, **kwargs):
+        async with ai_limiter.aprovider_slot():
+            started = time.perf_counter()
+            try:
+                result = await method(*args, **kwargs)
+            except BaseException as e:
+                self.record_texts(started, texts, e)
+                raise
+        self.record_texts(started, texts)
+        return result
+
+    def record_texts(self, started, texts, error=None):
+        from reports.usage import estimate_tokens
+
+        self.record(
+            'embedding', started, sum(estimate_tokens(text) for text in texts), 0, error=error,
+            request_data={'texts': len(texts), 'tokens': 'estimated'},
+        )
@@ -0,0 +1,292 @@
+"""
+Habit recommendations from similar users, without an LLM call
+
+Neighbours are found with ANN lookups over vectors that are already stored:
+the user's Mission skill and weakness embeddings against other missions, and
+their habit title embeddings against other users' habits. Habits those
+neighbours keep are scored by neighbour similarity times their precomputed
+popularity (PopularHabit, refreshed periodically), and titles the user
+already has (or near-duplicates of them) are dropped. Popular habits related
+to the user's own fill any remaining slots, then the globally popular ones.
+
+A recommendation is a handful of indexed queries; an LLM is only used, if
+enabled, to phrase the final list.
+"""
+import json
+import logging
+import math
+import re
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from pgvector.django import CosineDistance
+
+from habits.models import Habit, Mission, PopularHabit, TextEmbedding
+from .embeddings import model_name_for, text_hash
+
+logger = logging.getLogger(__name__)
+
+
+def get_config():
+    return getattr(settings, 'RECOMMENDER', {})
+
+
+def cosine_similarity(a, b):
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    denominator = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(np.dot(a, b)) / denominator if denominator else 0.0
+
+
+class HabitRecommender:
+    """Nearest-neighbour habit recommendations"""
+
+    def __init__(self):
+        config = get_config()
+        self.neighbours = config.get('NEIGHBOURS', 50)
+        self.duplicate_similarity = config.get('DUPLICATE_SIMILARITY', 0.9)
+        self.related_similarity = config.get('RELATED_SIMILARITY', 0.55)
+
+    def recommend(self, user, limit=3):
+        """
+        Ranked habit suggestions for a user, as dicts with 'title',
+        'user_count', 'completion_rate', 'score' and 'reason'.
+        """
+        own_habits = list(
+            Habit.objects.filter(user=user, is_active=True).values('title', 'title_embedding')
+        )
+        own_hashes = {text_hash(h['title']) for h in own_habits}
+        own_vectors = [h['title_embedding'] for h in own_habits if h['title_embedding'] is not None]
+
+        with transaction.atomic():
+            neighbours = self.find_neighbours(user, own_vectors)
+
+            scores = defaultdict(float)
+            reasons = {}
+            for row in Habit.objects.filter(user_id__in=list(neighbours), is_active=True).values('user_id', 'title'):
+                digest = text_hash(row['title'])
+                if digest in own_hashes:
+                    continue
+                scores[digest] += neighbours[row['user_id']]
+                reasons.setdefault(digest, 'similar_users')
+
+            for digest, similarity in self.related_popular(own_vectors, exclude=own_hashes):
+                if digest not in scores:
+                    scores[digest] += similarity
+                    reasons.setdefault(digest, 'related_to_your_habits')
+
+        popular = PopularHabit.objects.in_bulk(list(scores), field_name='text_hash')
+        ranked = []
+        for digest, score in scores.items():
+            habit = popular.get(digest)
+            if habit is None:
+                continue
+            if habit.embedding is not None and any(
+                cosine_similarity(habit.embedding, vector) >= self.duplicate_similarity for vector in own_vectors
+            ):
+                continue
+            ranked.append((score * (0.5 + habit.completion_rate) * math.log1p(habit.user_count), habit, reasons[digest]))
+
+        ranked.sort(key=lambda item: -item[0])
+        results = [self.format(habit, score, reason) for score, habit, reason in ranked[:limit]]
+
+        if len(results) < limit:
+            seen = own_hashes | {r['text_hash'] for r in results}
+            for habit in PopularHabit.objects.exclude(text_hash__in=seen)[:limit - len(results)]:
+                results.append(self.format(habit, 0.0, 'popular'))
+
+        return results
+
+    def find_neighbours(self, user, own_vectors):
+        """{user_id: similarity} of the users closest by mission and by habits"""
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL hnsw.ef_search = %s', [max(40, self.neighbours)])
+
+        neighbours = defaultdict(float)
+        mission = Mission.objects.filter(user=user).values('skill_embedding', 'weakness_embedding').first() or {}
+
+        for field in ('skill_embedding', 'weakness_embedding'):
+            vector = mission.get(field)
+            if vector is None:
+                continue
+            rows = (
+                Mission.objects
+                .exclude(user=user)
+                .filter(**{f'{field}__isnull': False})
+                .annotate(distance=CosineDistance(field, vector))
+                .order_by('distance')
+                .values_list('user_id', 'distance')[:self.neighbours]
+            )
+            for user_id, distance in rows:
+                neighbours[user_id] = max(neighbours[user_id], 1 - distance)
+
+        for vector in own_vectors[:5]:
+            rows = (
+                Habit.objects
+                .exclude(user=user)
+                .filter(title_embedding__isnull=False)
+                .annotate(distance=CosineDistance('title_embedding', vector))
+                .order_by('distance')
+                .values_list('user_id', 'distance')[:self.neighbours]
+            )
+            for user_id, distance in rows:
+                # Sharing a habit is weaker evidence than sharing goals
+                neighbours[user_id] = max(neighbours[user_id], 0.5 * (1 - distance))
+
+        return neighbours
+
+    def related_popular(self, own_vectors, exclude):
+        """(hash, similarity) of popular habits close to, but not the same as, the user's habits"""
+        related = {}
+        for vector in own_vectors[:5]:
+            rows = (
+                PopularHabit.objects
+                .filter(embedding__isnull=False)
+                .annotate(distance=CosineDistance('embedding', vector))
+                .order_by('distance')
+                .values_list('text_hash', 'distance')[:10]
+            )
+            for digest, distance in rows:
+                similarity = 1 - distance
+                if digest in exclude or not self.related_similarity <= similarity < self.duplicate_similarity:
+                    continue
+                related[digest] = max(related.get(digest, 0.0), similarity * 0.5)
+        return related.items()
+
+    @staticmethod
+    def format(habit, score, reason):
+        return {
+            'title': habit.title,
+            'text_hash': habit.text_hash,
+            'user_count': habit.user_count,
+            'completion_rate': round(habit.completion_rate, 2),
+            'score': round(score, 3),
+            'reason': reason,
+        }
+
+    def recommend_text(self, user, limit=3, phrase=None):
+        """
+        Recommendations as short sentences. The LLM phrases them only when
+        enabled (RECOMMENDER['PHRASE_WITH_LLM']) and available.
+        """
+        recommendations = self.recommend(user, limit=limit)
+        if not recommendations:
+            return []
+
+        if phrase is None:
+            phrase = get_config().get('PHRASE_WITH_LLM', False)
+        if phrase:
+            phrased = self.phrase_with_llm(user, recommendations)
+            if phrased:
+                return phrased
+
+        return [self.describe(r) for r in recommendations]
+
+    @staticmethod
+    def describe(recommendation):
+        title = recommendation['title']
+        count = recommendation['user_count']
+        if recommendation['reason'] == 'similar_users':
+            return f"✨ Try \"{title}\" - heroes with goals like yours are building it too!"
+        if recommendation['reason'] == 'related_to_your_habits':
+            return f"🔗 \"{title}\" pairs well with the habits you already have!"
+        return f"🔥 \"{title}\" is a favourite with {count} heroes - give it a go!"
+
+    @staticmethod
+    def phrase_with_llm(user, recommendations):
+        from .langgraph_service import langgraph_ai_service
+
+        if not langgraph_ai_service.ai_available or langgraph_ai_service.llm is None:
+            return None
+        try:
+            prompt = f"""
+            Rewrite each habit suggestion below as one short, encouraging sentence for a teen
+            named {user.name or 'Hero'}, with one emoji. Keep the habit itself unchanged.
+
+            Suggestions: {json.dumps([r['title'] for r in recommendations])}
+
+            Return a JSON array of strings in the same order.
+            """
+            response = langgraph_ai_service.llm.invoke(prompt, feature='recommendation', user_id=user.id)
+            match = re.search(r'\[.*\]', response, re.DOTALL)
+            phrased = json.loads(match.group()) if match else None
+            if isinstance(phrased, list) and len(phrased) == len(recommendations):
+                return [str(p) for p in phrased]
+        except Exception as e:
+            logger.error(f"Error phrasing recommendations: {str(e)}")
+        return None
+
+
+def refresh_popular_habits(window_days=30, min_users=None, max_habits=None):
+    """
+    Recompute PopularHabit from active habits and their recent check-ins.
+
+    Titles are grouped by normalized text, so "Drink water" and "drink
+    water " count together. Returns the number of popular habits stored.
+    """
+    config = get_config()
+    min_users = min_users or config.get('MIN_USERS', 2)
+    max_habits = max_habits or config.get('MAX_POPULAR_HABITS', 5000)
+    since = timezone.now().date() - timedelta(days=window_days)
+
+    rows = (
+        Habit.objects.filter(is_active=True)
+        .values('title')
+        .annotate(
+            users=Count('user', distinct=True),
+            habits=Count('id', distinct=True),
+            done=Count('checkins', filter=Q(checkins__date__gte=since, checkins__value=True)),
+        )
+    )
+
+    merged = {}
+    for row in rows.iterator(chunk_size=5000):
+        digest = text_hash(row['title'])
+        entry = merged.setdefault(digest, {'title': row['title'].strip(), 'users': 0, 'habits': 0, 'done': 0})
+        entry['users'] += row['users']
+        entry['habits'] += row['habits']
+        entry['done'] += row['done']
+
+    popular = sorted(
+        ((digest, e) for digest, e in merged.items() if e['users'] >= min_users),
+        key=lambda item: -item[1]['users'],
+    )[:max_habits]
+
+    from .langgraph_service import langgraph_ai_service
+    model_name = model_name_for(langgraph_ai_service.embeddings)
+    vectors = dict(
+        TextEmbedding.objects.filter(model_name=model_name, text_hash__in=[d for d, _ in popular])
+        .values_list('text_hash', 'embedding')
+    )
+
+    habits = [
+        PopularHabit(
+            text_hash=digest,
+            title=entry['title'][:255],
+            user_count=entry['users'],
+            completion_rate=min(1.0, entry['done'] / (entry['habits'] * window_days)),
+            embedding=vectors.get(digest),
+        )
+        for digest, entry in popular
+    ]
+
+    with transaction.atomic():
+        PopularHabit.objects.bulk_create(
+            habits,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['text_hash'],
+            update_fields=['title', 'user_count', 'completion_rate', 'embedding', 'updated_at'],
+        )
+        PopularHabit.objects.exclude(text_hash__in=[h.text_hash for h in habits]).delete()
+
+    logger.info(f"Refreshed {len(habits)} popular habits from {len(merged)} distinct titles")
+    return len(habits)
+
+
+habit_recommender = HabitRecommender()
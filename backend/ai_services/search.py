@@ -0,0 +1,130 @@
+"""
+Semantic search over a user's habits, mission and journal notes
+
+The query text is embedded once (through the shared TextEmbedding cache) and
+each source is searched with ORDER BY cosine distance LIMIT k. Every query is
+filtered to the requesting user: with few rows the planner scans them through
+the user's btree index, which is exact; otherwise the HNSW index is used and,
+on pgvector 0.8+, iterative index scans keep going until enough of the user's
+rows pass the filter instead of returning a short page.
+"""
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from pgvector.django import CosineDistance
+
+from core.singleflight import embedding_flight
+from habits.models import Checkin, Habit, Mission, Mood
+from .embeddings import get_embedding_cache, model_name_for, text_hash
+
+logger = logging.getLogger(__name__)
+
+
+# kind -> (model, text field, lookup to the owning user, extra values)
+SEARCH_SOURCES = {
+    'habit': [
+        (Habit, 'title', 'user', ['is_active']),
+        (Habit, 'anchor', 'user', ['title']),
+    ],
+    'mission': [
+        (Mission, 'skill', 'user', []),
+        (Mission, 'weakness', 'user', []),
+    ],
+    'checkin': [
+        (Checkin, 'note', 'habit__user', ['date', 'habit_id', 'habit__title']),
+    ],
+    'mood': [
+        (Mood, 'note', 'user', ['date', 'score']),
+    ],
+}
+
+# None until probed: whether this pgvector supports hnsw.iterative_scan
+_iterative_scan_supported = None
+
+
+def get_config():
+    return getattr(settings, 'VECTOR_SEARCH', {})
+
+
+class SemanticSearch:
+    """Nearest texts to a query among one user's rows"""
+
+    def __init__(self, embeddings=None):
+        if embeddings is None:
+            from .langgraph_service import langgraph_ai_service
+            embeddings = langgraph_ai_service.embeddings
+        self.embeddings = embeddings
+
+    @property
+    def available(self):
+        return self.embeddings is not None
+
+    def embed_query(self, text):
+        """Query vector, reusing the stored vector when the text was seen before"""
+        cache = get_embedding_cache(model_name_for(self.embeddings))
+        digest = text_hash(text)
+        vector = cache.get_many([digest]).get(digest)
+        if vector is None:
+            vector = embedding_flight.do(digest, lambda: self.embeddings.embed_query(text))
+            cache.set_many({digest: vector})
+        return vector
+
+    def search(self, user, query, kinds=None, limit=10):
+        """Up to `limit` matches across `kinds`, most similar first"""
+        vector = self.embed_query(query)
+        kinds = kinds or list(SEARCH_SOURCES)
+
+        matches = []
+        with transaction.atomic():
+            self.configure_scan()
+            for kind in kinds:
+                for model, field, user_lookup, extra in SEARCH_SOURCES[kind]:
+                    rows = (
+                        model.objects
+                        .filter(**{user_lookup: user, f'{field}_embedding__isnull': False})
+                        .annotate(distance=CosineDistance(f'{field}_embedding', vector))
+                        .order_by('distance')
+                        .values('id', field, 'distance', *extra)[:limit]
+                    )
+                    for row in rows:
+                        matches.append(self.format_match(kind, field, row))
+
+        # Iterative scans may return each page slightly out of order
+        matches.sort(key=lambda match: -match['similarity'])
+        return matches[:limit]
+
+    def configure_scan(self):
+        """Per-transaction HNSW settings; must run inside an atomic block"""
+        global _iterative_scan_supported
+        config = get_config()
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL hnsw.ef_search = %s', [int(config.get('EF_SEARCH', 100))])
+
+            if _iterative_scan_supported is False:
+                return
+            try:
+                with transaction.atomic():
+                    cursor.execute("SET LOCAL hnsw.iterative_scan = 'relaxed_order'")
+                    cursor.execute('SET LOCAL hnsw.max_scan_tuples = %s', [int(config.get('MAX_SCAN_TUPLES', 20000))])
+                _iterative_scan_supported = True
+            except DatabaseError:
+                logger.info("pgvector has no iterative index scans; filtered searches may return fewer results")
+                _iterative_scan_supported = False
+
+    @staticmethod
+    def format_match(kind, field, row):
+        match = {
+            'type': kind,
+            'id': str(row.pop('id')),
+            'field': field,
+            'text': row.pop(field),
+            'similarity': round(1 - float(row.pop('distance')), 4),
+        }
+        for name, value in row.items():
+            match[name.replace('__', '_')] = str(value) if name.endswith('_id') or name == 'date' else value
+        return match
+
+
+semantic_search = SemanticSearch()
@@ -0,0 +1,50 @@
+from celery import shared_task
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=3)
+def process_embedding_jobs(self):
+    """Embed pending texts in batches until the queue is empty or the time budget is spent"""
+    from .embeddings import EmbeddingPipeline
+
+    try:
+        pipeline = EmbeddingPipeline()
+        if pipeline.embeddings is None:
+            logger.warning("Embeddings unavailable, leaving embedding jobs queued")
+            return 0
+
+        budget = getattr(settings, 'EMBEDDINGS', {}).get('RUN_SECONDS', 60)
+        started = time.monotonic()
+        total = 0
+        while time.monotonic() - started < budget:
+            claimed = pipeline.run_once()
+            if not claimed:
+                return total
+            total += claimed
+
+        # Out of time with jobs left: continue in a fresh task
+        process_embedding_jobs.delay()
+        return total
+
+    except Exception as e:
+        logger.error(f"Error processing embedding jobs: {str(e)}")
+        raise self.retry(countdown=60, exc=e)
+
+
+@shared_task
+def refresh_popular_habits():
+    """Recompute habit popularity for the recommender - runs daily"""
+    from .recommender import refresh_popular_habits as refresh
+
+    try:
+        count = refresh()
+        logger.info(f"Refreshed {count} popular habits")
+        return count
+    except Exception as e:
+        logger.error(f"Failed to refresh popular habits: {str(e)}")
+        raise
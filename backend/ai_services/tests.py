@@ -0,0 +1,386 @@
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import User
+from core.rate_limit import ConcurrencyLimiter, TokenBucket
+from habits.models import Checkin, EmbeddingJob, Habit, Mission, Mood, PopularHabit, TextEmbedding
+from .embeddings import EmbeddingCache, EmbeddingPipeline, get_embedding_cache, text_hash
+from .langgraph_service import LangGraphAIService
+from .limits import AILimiter, AIRateLimitExceeded
+from .recommender import HabitRecommender, refresh_popular_habits
+from .search import SemanticSearch
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    AI_RATE_LIMIT={'REQUESTS_PER_DAY': 2, 'TOKENS_PER_DAY': 86400, 'MAX_CONCURRENCY': 1, 'SLOT_WAIT_SECONDS': 0},
+)
+class AILimiterTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        TokenBucket._local_state.clear()
+        ConcurrencyLimiter._local_leases.clear()
+        patcher = mock.patch('core.rate_limit.time.monotonic', return_value=1000.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.limiter = AILimiter()
+        self.user = SimpleNamespace(id='user-1')
+
+    def test_admits_until_the_daily_request_budget_is_spent(self):
+        self.assertEqual(self.limiter.admit(self.user), (True, 0.0, None))
+        self.assertEqual(self.limiter.admit(self.user), (True, 0.0, None))
+
+        allowed, retry_after, reason = self.limiter.admit(self.user)
+        self.assertFalse(allowed)
+        self.assertEqual(reason, 'user_requests')
+        self.assertAlmostEqual(retry_after, 43200.0)
+
+        # Other users have their own budget
+        self.assertTrue(self.limiter.admit(SimpleNamespace(id='user-2'))[0])
+
+    def test_overdrawn_token_budget_refuses_before_spending_a_request(self):
+        self.limiter.charge_tokens(self.user.id, 86400 + 10)
+
+        allowed, retry_after, reason = self.limiter.admit(self.user)
+        self.assertFalse(allowed)
+        self.assertEqual(reason, 'user_tokens')
+        self.assertAlmostEqual(retry_after, 11.0)
+        self.assertTrue(self.limiter.request_bucket(self.user.id).consume(2)[0])
+
+    def test_full_provider_refuses_new_requests(self):
+        token = self.limiter.provider_slots.acquire()
+
+        self.assertEqual(self.limiter.admit(self.user), (False, 1.0, 'provider_concurrency'))
+
+        self.limiter.provider_slots.release(token)
+        self.assertTrue(self.limiter.admit(self.user)[0])
+
+    def test_check_raises_with_the_reason_and_retry_after(self):
+        self.limiter.charge_tokens(self.user.id, 86400 + 10)
+
+        with self.assertRaises(AIRateLimitExceeded) as raised:
+            self.limiter.check(self.user)
+        self.assertEqual((raised.exception.reason, raised.exception.retry_after), ('user_tokens', 11.0))
+
+    def test_provider_slot_gives_up_when_none_frees_up(self):
+        self.limiter.provider_slots.acquire()
+
+        with self.assertRaises(AIRateLimitExceeded) as raised:
+            with self.limiter.provider_slot():
+                pass
+        self.assertEqual(raised.exception.reason, 'provider_concurrency')
+
+    def test_rejections_are_counted_per_reason(self):
+        for _ in range(3):
+            self.limiter.admit(self.user)
+        self.limiter.provider_slots.acquire()
+        self.limiter.admit(self.user)
+
+        stats = self.limiter.stats()
+        self.assertEqual(
+            stats['rejected'], {'user_requests': 1, 'user_tokens': 0, 'provider_concurrency': 1}
+        )
+        self.assertEqual((stats['provider_in_flight'], stats['provider_max_concurrency']), (1, 1))
+
+    @override_settings(AI_RATE_LIMIT={'ENABLED': False, 'REQUESTS_PER_DAY': 0})
+    def test_disabled_limiter_admits_everything(self):
+        limiter = AILimiter()
+
+        self.assertEqual(limiter.admit(self.user), (True, 0.0, None))
+        limiter.charge_tokens(self.user.id, 10 ** 9)
+        self.assertEqual(limiter.admit(self.user), (True, 0.0, None))
+
+
+class FakeEmbeddings:
+    """Stands in for the provider client, recording each batch"""
+
+    model = 'models/fake-embedding'
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        if self.error is not None:
+            raise self.error
+        return [[0.1] * 768 for _ in texts]
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class EmbeddingPipelineTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_embedding_cache(FakeEmbeddings.model).clear()
+        self.user = User.objects.create_user(email='embed@example.com', name='Embed')
+
+    def habit(self, title):
+        # Saving queues the job; nothing is embedded on the request path
+        return Habit.objects.create(user=self.user, title=title)
+
+    def test_identical_texts_are_embedded_once_and_written_back(self):
+        habits = [self.habit('Drink water'), self.habit('drink  WATER')]
+        self.assertEqual(EmbeddingJob.objects.count(), 2)
+        embeddings = FakeEmbeddings()
+
+        self.assertEqual(EmbeddingPipeline(embeddings).run_once(), 2)
+
+        self.assertEqual(len(embeddings.calls), 1)
+        self.assertEqual(len(embeddings.calls[0]), 1)
+        for habit in habits:
+            habit.refresh_from_db()
+            self.assertIsNotNone(habit.title_embedding)
+        self.assertFalse(EmbeddingJob.objects.exists())
+        self.assertEqual(TextEmbedding.objects.filter(model_name=FakeEmbeddings.model).count(), 1)
+
+    def test_known_texts_are_not_sent_to_the_provider(self):
+        self.habit('Drink water')
+        EmbeddingPipeline(FakeEmbeddings()).run_once()
+        habit = self.habit('Drink Water')
+        get_embedding_cache(FakeEmbeddings.model).clear()
+        embeddings = FakeEmbeddings()
+
+        self.assertEqual(EmbeddingPipeline(embeddings).run_once(), 1)
+
+        self.assertEqual(embeddings.calls, [])
+        habit.refresh_from_db()
+        self.assertIsNotNone(habit.title_embedding)
+
+    def test_failed_batches_back_off_and_keep_their_jobs(self):
+        self.habit('Drink water')
+        pipeline = EmbeddingPipeline(FakeEmbeddings(error=RuntimeError('quota exceeded')))
+
+        self.assertEqual(pipeline.run_once(), 1)
+
+        job = EmbeddingJob.objects.get()
+        self.assertEqual((job.attempts, job.claimed_at, job.error_message), (1, None, 'quota exceeded'))
+        self.assertGreater(job.next_attempt_at, timezone.now())
+        # Not due again until the backoff has passed
+        self.assertEqual(pipeline.run_once(), 0)
+
+    def test_jobs_out_of_attempts_are_not_claimed(self):
+        self.habit('Drink water')
+        pipeline = EmbeddingPipeline(FakeEmbeddings())
+        EmbeddingJob.objects.update(attempts=pipeline.max_attempts)
+
+        self.assertEqual(pipeline.run_once(), 0)
+        self.assertEqual(EmbeddingJob.objects.count(), 1)
+
+    def test_jobs_for_deleted_rows_are_dropped(self):
+        self.habit('Drink water').delete()
+        embeddings = FakeEmbeddings()
+
+        self.assertEqual(EmbeddingPipeline(embeddings).run_once(), 1)
+
+        self.assertEqual(embeddings.calls, [])
+        self.assertFalse(EmbeddingJob.objects.exists())
+
+
+class EmbeddingCacheTests(TestCase):
+
+    def setUp(self):
+        self.cache = EmbeddingCache(FakeEmbeddings.model, max_size=2)
+        self.water, self.read, self.walk = (text_hash(text) for text in ('Drink water', 'Read', 'Walk'))
+
+    def test_vectors_are_keyed_by_normalized_text(self):
+        self.assertEqual(text_hash('  Drink\tWATER '), self.water)
+        self.assertNotEqual(text_hash('Drink waters'), self.water)
+
+    def test_hits_are_served_from_memory_and_misses_in_one_query(self):
+        self.cache.set_many({self.water: [0.1] * 768, self.read: [0.2] * 768})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(set(self.cache.get_many([self.water, self.read])), {self.water, self.read})
+
+        other_process = EmbeddingCache(FakeEmbeddings.model)
+        with self.assertNumQueries(1):
+            found = other_process.get_many([self.water, self.read, self.walk])
+        self.assertEqual(set(found), {self.water, self.read})
+        self.assertEqual(found[self.read].dtype, 'float32')
+
+    def test_least_recently_used_vectors_are_evicted(self):
+        self.cache.set_many({self.water: [0.1] * 768, self.read: [0.2] * 768})
+        self.cache.get_many([self.water])
+        self.cache.set_many({self.walk: [0.3] * 768})
+
+        with self.assertNumQueries(0):
+            self.cache.get_many([self.water, self.walk])
+        with self.assertNumQueries(1):
+            self.cache.get_many([self.read])
+
+    def test_each_embedding_model_has_its_own_vectors(self):
+        self.cache.set_many({self.water: [0.1] * 768})
+        # A concurrent worker storing the same text again is ignored
+        self.cache.set_many({self.water: [0.5] * 768})
+
+        self.assertEqual(EmbeddingCache('models/other-embedding').get_many([self.water]), {})
+        self.assertEqual(TextEmbedding.objects.filter(text_hash=self.water).count(), 1)
+
+
+def unit_vector(axis):
+    vector = [0.0] * 768
+    vector[axis] = 1.0
+    return vector
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SemanticSearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_embedding_cache(FakeEmbeddings.model).clear()
+        self.embeddings = mock.Mock(model=FakeEmbeddings.model)
+        self.embeddings.embed_query.return_value = unit_vector(0)
+        self.search = SemanticSearch(self.embeddings)
+
+        self.user = User.objects.create_user(email='search@example.com', name='Search')
+        other = User.objects.create_user(email='other@example.com', name='Other')
+        self.water = self.embedded(Habit.objects.create(user=self.user, title='Drink water'), unit_vector(0))
+        self.walk = self.embedded(Habit.objects.create(user=self.user, title='Walk'), unit_vector(1))
+        self.embedded(Habit.objects.create(user=other, title='Drink water'), unit_vector(0))
+        Habit.objects.create(user=self.user, title='Not embedded yet')
+        self.mood = Mood.objects.create(user=self.user, date=timezone.localdate(), score=4, note='thirsty')
+        Mood.objects.filter(id=self.mood.id).update(note_embedding=[0.9] + [0.0] * 766 + [0.1])
+
+    def embedded(self, habit, vector):
+        Habit.objects.filter(id=habit.id).update(title_embedding=vector)
+        return habit
+
+    def test_only_the_users_embedded_rows_are_returned_most_similar_first(self):
+        matches = self.search.search(self.user, 'water')
+
+        self.assertEqual([(m['type'], m['id']) for m in matches], [
+            ('habit', str(self.water.id)), ('mood', str(self.mood.id)), ('habit', str(self.walk.id)),
+        ])
+        self.assertEqual(matches[0]['similarity'], 1.0)
+        self.assertEqual((matches[0]['text'], matches[0]['is_active']), ('Drink water', True))
+        self.assertEqual(matches[1]['date'], str(self.mood.date))
+
+    def test_kinds_and_limit_narrow_the_results(self):
+        self.assertEqual([m['type'] for m in self.search.search(self.user, 'water', kinds=['mood'])], ['mood'])
+        self.assertEqual([m['id'] for m in self.search.search(self.user, 'water', limit=1)], [str(self.water.id)])
+
+    def test_repeated_queries_reuse_the_stored_vector(self):
+        self.search.search(self.user, 'Water')
+        get_embedding_cache(FakeEmbeddings.model).clear()
+        self.search.search(self.user, 'water ')
+
+        self.embeddings.embed_query.assert_called_once_with('Water')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class HabitRecommenderTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='me@example.com', name='Me')
+        self.neighbour = User.objects.create_user(email='alike@example.com', name='Alike')
+
+        Mission.objects.create(user=self.user, skill='Focus', weakness='Sleep', skill_embedding=unit_vector(0))
+        Mission.objects.create(user=self.neighbour, skill='Focus', weakness='Phone', skill_embedding=unit_vector(0))
+        habit = Habit.objects.create(user=self.user, title='Drink water')
+        Habit.objects.filter(id=habit.id).update(title_embedding=unit_vector(2))
+        for title in ('Stretch', 'drink water', 'Hydrate'):
+            Habit.objects.create(user=self.neighbour, title=title)
+
+    def popular(self, title, user_count, embedding=None):
+        return PopularHabit.objects.create(
+            text_hash=text_hash(title), title=title, user_count=user_count, completion_rate=0.5, embedding=embedding,
+        )
+
+    def test_neighbours_habits_come_first_then_popular_ones(self):
+        self.popular('Stretch', 5, unit_vector(3))
+        self.popular('Journal', 10)
+        self.popular('Drink water', 20, unit_vector(2))
+        # Near-duplicate of a habit the user already has
+        self.popular('Hydrate', 3, [0.0, 0.0, 0.95, 0.0, 0.05] + [0.0] * 763)
+
+        recommendations = HabitRecommender().recommend(self.user, limit=2)
+
+        self.assertEqual(
+            [(r['title'], r['reason']) for r in recommendations],
+            [('Stretch', 'similar_users'), ('Journal', 'popular')],
+        )
+        self.assertGreater(recommendations[0]['score'], 0)
+
+    def test_refresh_groups_titles_and_keeps_shared_ones(self):
+        Habit.objects.create(user=User.objects.create_user(email='third@example.com', name='Third'), title='Walk')
+        Checkin.objects.create(habit=Habit.objects.get(user=self.user), date=timezone.localdate(), value=True)
+        water = text_hash('Drink water')
+        TextEmbedding.objects.create(model_name=FakeEmbeddings.model, text_hash=water, embedding=unit_vector(2))
+        self.popular('Gone', 9)
+
+        service = SimpleNamespace(embeddings=FakeEmbeddings())
+        with mock.patch('ai_services.langgraph_service.langgraph_ai_service', service):
+            self.assertEqual(refresh_popular_habits(min_users=2), 1)
+
+        popular = PopularHabit.objects.get()
+        self.assertEqual((popular.text_hash, popular.user_count), (water, 2))
+        self.assertAlmostEqual(popular.completion_rate, 1 / (2 * 30))
+        self.assertIsNotNone(popular.embedding)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    GEMINI_API_KEY='',
+    AI_SERVICES={'SIMULATED_LLM_LATENCY_SECONDS': 0.3, 'NODE_TIMEOUT_SECONDS': 5},
+)
+class ProgressReportGraphTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        TokenBucket._local_state.clear()
+        ConcurrencyLimiter._local_leases.clear()
+        patcher = mock.patch('reports.tasks.flush_ai_usage.apply_async')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(User.objects, 'get', return_value=SimpleNamespace(id='user-1', name='Hero'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('ai_services.recommender.habit_recommender.recommend_text', return_value=['Try "Stretch"'])
+        self.recommend = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.service = LangGraphAIService()
+        self.user = SimpleNamespace(id='user-1')
+        self.habits_data = {'total_habits': 2, 'overall_completion_rate': 75.0}
+
+    async def test_branches_run_concurrently(self):
+        started = time.monotonic()
+        report = await self.service.generate_progress_report(self.user, self.habits_data)
+
+        # Two 0.3s LLM branches run side by side, not one after the other
+        self.assertLess(time.monotonic() - started, 0.55)
+        self.assertEqual(report['analysis_method'], 'langgraph_workflow')
+        self.assertFalse(report['degraded'])
+        self.assertEqual(report['insights'][0]['title'], 'Simulated insight')
+        self.assertEqual(report['recommendations'][0], 'Try "Stretch"')
+
+    async def test_a_timed_out_branch_falls_back_and_marks_the_report_degraded(self):
+        with self.settings(AI_SERVICES={'SIMULATED_LLM_LATENCY_SECONDS': 0.3, 'NODE_TIMEOUT_SECONDS': 0.05}):
+            report = await self.service.generate_progress_report(self.user, self.habits_data)
+
+        self.assertTrue(report['degraded'])
+        self.assertEqual(report['insights'][0]['title'], 'Strong Progress!')
+        self.assertEqual(report['motivational_message'], self.service._get_fallback_motivation({'completion_rate': 75.0}))
+        self.assertEqual(report['recommendations'][0], 'Try "Stretch"')
+
+    async def test_one_failed_branch_degrades_the_report_but_keeps_the_others(self):
+        self.recommend.side_effect = RuntimeError('database unavailable')
+
+        report = await self.service.generate_progress_report(self.user, self.habits_data)
+
+        self.assertTrue(report['degraded'])
+        self.assertEqual(report['recommendations'], self.service._get_fallback_recommendations({}))
+        self.assertEqual(report['insights'][0]['title'], 'Simulated insight')
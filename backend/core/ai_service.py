@@ -1,6 +1,7 @@
 import os
 import json
 import logging
+import time
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 from django.conf import settings
@@ -83,12 +84,47 @@ class AIService:
             
         self.max_tokens_per_request = 8000  # Conservative limit for Gemini Pro
     
-    def track_usage(self, user, tokens_used: int, operation: str):
-        """Track AI usage for monitoring and billing."""
-        # For now, just log the usage - we can implement database tracking later
-        logger.info(f"AI usage: user={user.email}, operation={operation}, tokens={tokens_used}")
-        # TODO: Implement AIUsage model when needed
-        pass
+    def track_usage(self, user, feature: str, token_in: int, token_out: int, latency_ms: float,
+                    status: str = 'ok', error_message: str = '', estimated: bool = False):
+        """Record AI usage for monitoring and billing (buffered, see reports.usage)."""
+        from ai_services.limits import ai_limiter
+        from reports.usage import AIUsageTracker
+        
+        AIUsageTracker.record(
+            feature,
+            'gemini-pro',
+            token_in=token_in,
+            token_out=token_out,
+            latency_ms=latency_ms,
+            status=status,
+            user_id=user.id if user else None,
+            error_message=error_message,
+            request_data={'tokens': 'estimated' if estimated else 'provider'},
+        )
+        ai_limiter.charge_tokens(user.id if user else None, token_in + token_out)
+    
+    def _generate_content(self, user, prompt: str, feature: str):
+        """Call Gemini within a provider slot, recording latency and the token counts it reports."""
+        from ai_services.limits import ai_limiter
+        
+        with ai_limiter.provider_slot():
+            started = time.perf_counter()
+            try:
+                response = self.model.generate_content(prompt)
+            except Exception as e:
+                self.track_usage(user, feature, self._count_tokens(prompt), 0,
+                                 (time.perf_counter() - started) * 1000, status='error',
+                                 error_message=str(e), estimated=True)
+                raise
+        
+        latency_ms = (time.perf_counter() - started) * 1000
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            self.track_usage(user, feature, usage.prompt_token_count, usage.candidates_token_count, latency_ms)
+        else:
+            self.track_usage(user, feature, self._count_tokens(prompt), self._count_tokens(response.text),
+                             latency_ms, estimated=True)
+        return response
     
     def _count_tokens(self, text: str) -> int:
         """Estimate token count for text."""
@@ -147,16 +183,12 @@ class AIService:
             # Generate with Gemini if available
             if self.ai_available and self.model:
                 full_prompt = f"{system_prompt}\n\n{user_prompt}"
-                response = self.model.generate_content(full_prompt)
+                response = self._generate_content(user, full_prompt, 'report')
                 
                 if not response.text:
                     raise Exception("Empty response from AI model")
                 
                 response_text = response.text
-                
-                # Track usage
-                tokens_used = self._count_tokens(context_str + response_text)
-                self.track_usage(user, tokens_used, 'progress_report')
             else:
                 # Fallback response when AI is not available
                 completion_rate = context.get('overall_completion_rate', 0)
@@ -210,7 +242,7 @@ class AIService:
             
             Keep it encouraging! 🎯"""
             
-            response = self.model.generate_content(prompt)
+            response = self._generate_content(user, prompt, 'insight')
             
             if not response.text:
                 raise Exception("Empty response from AI model")
@@ -218,10 +250,6 @@ class AIService:
             # Parse insights from response
             insights = self._parse_habit_insights(response.text)
             
-            # Track usage
-            tokens_used = self._count_tokens(context_str + response.text)
-            self.track_usage(user, tokens_used, 'habit_insights')
-            
             return insights
             
         except Exception as e:
@@ -241,16 +269,12 @@ class AIService:
             Make it personal, encouraging, and fun! 🚀"""
             
             if self.ai_available and self.model:
-                response = self.model.generate_content(prompt)
+                response = self._generate_content(user, prompt, 'coach_prompt')
                 
                 if not response.text:
                     raise Exception("Empty response from AI model")
                 
                 message = response.text.strip()
-                
-                # Track usage
-                tokens_used = self._count_tokens(context + message)
-                self.track_usage(user, tokens_used, 'motivational_message')
             else:
                 # Fallback motivational messages
                 messages = [
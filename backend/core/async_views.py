@@ -0,0 +1,110 @@
+"""
+Async class-based API views
+
+DRF 3.14 views are synchronous, so a view that awaits a multi-second LLM
+call would hold a worker thread the whole time. AsyncAPIView keeps the DRF
+pieces that matter here (authentication, permission and throttle classes,
+the exception handler, Response rendering) but dispatches to `async def`
+handlers. Under ASGI one
+process can then keep hundreds of slow requests in flight; under WSGI the
+views still work, one request per thread as before.
+
+Authentication, permission and throttle checks may hit the database or the
+cache, so they run through sync_to_async. Errors are APIExceptions rendered
+by DRF's exception handler, so clients see the same bodies and headers
+(Retry-After, WWW-Authenticate) as from any other endpoint.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAPIView(View):
+    """Class-based view with async handlers and DRF authentication, permissions and throttling"""
+
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated]
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    parser_classes = [JSONParser, FormParser, MultiPartParser]
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # Like APIView: session auth enforces CSRF itself, token auth needs none
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        drf_request = Request(
+            request,
+            parsers=[parser() for parser in self.parser_classes],
+            authenticators=[auth() for auth in self.authentication_classes],
+        )
+        self.request = drf_request
+
+        try:
+            handler = getattr(self, request.method.lower(), None)
+            if request.method.lower() not in self.http_method_names or handler is None:
+                raise exceptions.MethodNotAllowed(request.method)
+
+            await sync_to_async(self.initial)(drf_request)
+            response = await handler(drf_request, *args, **kwargs)
+        except exceptions.APIException as e:
+            response = self.handle_exception(e, drf_request, args, kwargs)
+
+        return self.finalize_response(drf_request, response)
+
+    def initial(self, request):
+        self.check_permissions(request)
+        self.check_throttles(request)
+
+    def check_permissions(self, request):
+        """Authenticate (touching request.user) and apply the permission classes"""
+        request.user
+        for permission in [permission() for permission in self.permission_classes]:
+            if not permission.has_permission(request, self):
+                if request.successful_authenticator is None:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(getattr(permission, 'message', None))
+
+    def check_throttles(self, request):
+        """Apply the throttle classes; Throttled carries the longest wait"""
+        durations = [
+            throttle.wait()
+            for throttle in [throttle() for throttle in self.throttle_classes]
+            if not throttle.allow_request(request, self)
+        ]
+        if durations:
+            durations = [duration for duration in durations if duration is not None]
+            raise exceptions.Throttled(wait=max(durations, default=None))
+
+    def handle_exception(self, exc, request, args, kwargs):
+        """A DRF-shaped error response, as APIView.handle_exception builds it"""
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            authenticators = request.authenticators
+            auth_header = authenticators[0].authenticate_header(request) if authenticators else None
+            if auth_header:
+                exc.auth_header = auth_header
+            else:
+                exc.status_code = 403
+
+        context = {'view': self, 'args': args, 'kwargs': kwargs, 'request': request}
+        return api_settings.EXCEPTION_HANDLER(exc, context)
+
+    def finalize_response(self, request, response):
+        """Give DRF Responses a renderer; Django handles the deferred render"""
+        if isinstance(response, Response):
+            response.accepted_renderer = JSONRenderer()
+            response.accepted_media_type = 'application/json'
+            response.renderer_context = {'view': self, 'request': request, 'response': response}
+        return response
@@ -0,0 +1,111 @@
+"""
+Append-only event buffers drained in bulk by background jobs
+
+Hot request paths push small JSON events here instead of writing to the
+database. Buffers are Redis lists when the default cache is Redis-backed, so
+every web process feeds the same buffer; otherwise an in-process deque is
+used (tests). An in-process deque is only visible to its own process, so a
+Celery worker never drains what a web process pushed there, and a full
+deque drops its oldest events.
+
+Durable buffers hold events nobody else keeps, such as webhook messages
+that the provider will not resend once acknowledged. They never fall back:
+push() raises BufferUnavailable, so the caller can refuse the request and
+let the sender retry.
+"""
+import json
+import logging
+import threading
+from collections import deque
+
+from .redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class BufferUnavailable(Exception):
+    """A durable buffer could not store an event"""
+
+
+class EventBuffer:
+    """A named FIFO of JSON-serializable events"""
+
+    _local_buffers = {}
+    _local_lock = threading.Lock()
+
+    def __init__(self, name, max_local_size=100000, durable=False):
+        self.key = f'buffer:{name}'
+        self.max_local_size = max_local_size
+        self.durable = durable
+
+    def push(self, event):
+        """Append one event. Returns the buffer length after the push."""
+        client = self._client_for_push()
+        if client is not None:
+            try:
+                return client.rpush(self.key, json.dumps(event))
+            except Exception as e:
+                logger.error(f"Error pushing to buffer {self.key}: {str(e)}")
+                if self.durable:
+                    raise BufferUnavailable(self.key) from e
+
+        with self._local_lock:
+            buffer = self._local_buffers.setdefault(self.key, deque(maxlen=self.max_local_size))
+            buffer.append(event)
+            return len(buffer)
+
+    def push_many(self, events):
+        """Append several events, e.g. to put back a drained batch that could not be applied"""
+        if not events:
+            return len(self)
+        client = self._client_for_push()
+        if client is not None:
+            try:
+                return client.rpush(self.key, *[json.dumps(event) for event in events])
+            except Exception as e:
+                logger.error(f"Error pushing to buffer {self.key}: {str(e)}")
+                if self.durable:
+                    raise BufferUnavailable(self.key) from e
+
+        with self._local_lock:
+            buffer = self._local_buffers.setdefault(self.key, deque(maxlen=self.max_local_size))
+            buffer.extend(events)
+            return len(buffer)
+
+    def _client_for_push(self):
+        client = get_redis_client()
+        if client is None and self.durable:
+            raise BufferUnavailable(f"{self.key} needs a Redis-backed cache")
+        return client
+
+    def drain(self, max_items=1000):
+        """Remove and return up to `max_items` events, oldest first"""
+        client = get_redis_client()
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=True)
+                pipe.lrange(self.key, 0, max_items - 1)
+                pipe.ltrim(self.key, max_items, -1)
+                raw_events, _ = pipe.execute()
+                return [json.loads(raw) for raw in raw_events]
+            except Exception as e:
+                logger.error(f"Error draining buffer {self.key}: {str(e)}")
+                return []
+
+        with self._local_lock:
+            buffer = self._local_buffers.get(self.key)
+            if not buffer:
+                return []
+            return [buffer.popleft() for _ in range(min(max_items, len(buffer)))]
+
+    def __len__(self):
+        client = get_redis_client()
+        if client is not None:
+            try:
+                return client.llen(self.key)
+            except Exception as e:
+                logger.error(f"Error reading buffer {self.key} length: {str(e)}")
+                return 0
+
+        with self._local_lock:
+            return len(self._local_buffers.get(self.key, ()))
@@ -0,0 +1,34 @@
+"""
+Process-shared counters in the default cache
+
+For cheap operational metrics (cache hit rates, coalesced calls,
+rejections) that several web and worker processes add to. Counters never
+expire but may be evicted, so treat them as approximate.
+"""
+import logging
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+def metric_key(name):
+    return f'metrics:{name}'
+
+
+def increment(name, amount=1):
+    key = metric_key(name)
+    try:
+        if not cache.add(key, amount, None):
+            cache.incr(key, amount)
+    except ValueError:
+        # Evicted between add and incr
+        cache.set(key, amount, None)
+    except Exception as e:
+        logger.error(f"Error incrementing metric {name}: {str(e)}")
+
+
+def get_counts(names):
+    """{name: count} for the given counters, 0 when never incremented"""
+    values = cache.get_many([metric_key(name) for name in names])
+    return {name: values.get(metric_key(name), 0) for name in names}
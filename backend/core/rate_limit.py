@@ -0,0 +1,212 @@
+"""
+Token bucket rate limiting and concurrency limits shared across processes
+
+Buckets and concurrency slots live in Redis when the default cache is
+Redis-backed, so every web and Celery worker draws from the same budget.
+Without Redis (development, tests) in-process stand-ins are used instead.
+"""
+import logging
+import threading
+import time
+import uuid
+
+from .redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+# Refill and consume atomically. Uses the Redis server clock so that workers
+# with skewed clocks still agree on the refill rate.
+TOKEN_BUCKET_SCRIPT = """
+local key = KEYS[1]
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local reserve = tonumber(ARGV[4])
+local force = tonumber(ARGV[5])
+
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local state = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local retry_after = 0
+if force == 1 then
+    -- Charge for work already done: may run into debt, negative amounts refund
+    tokens = math.max(-capacity, math.min(capacity, tokens - requested))
+    allowed = 1
+elseif tokens - requested >= reserve then
+    tokens = tokens - requested
+    allowed = 1
+else
+    retry_after = (requested + reserve - tokens) / rate
+end
+
+redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', key, math.ceil(capacity / rate) + 60)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class TokenBucket:
+    """A named token bucket refilled at `rate` tokens per second up to `capacity`"""
+
+    _local_state = {}
+    _local_lock = threading.Lock()
+
+    def __init__(self, name, rate, capacity):
+        self.key = f'rate_limit:{name}'
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._script = None
+
+    def consume(self, tokens=1, reserve=0, force=False):
+        """
+        Try to take `tokens` from the bucket, leaving at least `reserve` behind.
+
+        Returns a (allowed, retry_after_seconds) tuple. The reserve lets
+        low-priority callers back off early so higher-priority callers keep
+        headroom in the same bucket. With `force` the tokens are always taken,
+        down to a debt of -capacity, for costs only known after the fact.
+        """
+        client = get_redis_client()
+        if client is not None:
+            try:
+                if self._script is None:
+                    self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+                allowed, retry_after = self._script(
+                    keys=[self.key],
+                    args=[self.rate, self.capacity, tokens, reserve, int(force)]
+                )
+                return bool(int(allowed)), float(retry_after)
+            except Exception as e:
+                logger.error(f"Error consuming from token bucket {self.key}: {str(e)}")
+
+        return self._consume_local(tokens, reserve, force)
+
+    def _consume_local(self, tokens, reserve, force=False):
+        """In-process fallback used when Redis is not available"""
+        now = time.monotonic()
+
+        with self._local_lock:
+            current, ts = self._local_state.get(self.key, (self.capacity, now))
+            current = min(self.capacity, current + max(0.0, now - ts) * self.rate)
+
+            if force:
+                self._local_state[self.key] = (max(-self.capacity, min(self.capacity, current - tokens)), now)
+                return True, 0.0
+
+            if current - tokens >= reserve:
+                self._local_state[self.key] = (current - tokens, now)
+                return True, 0.0
+
+            self._local_state[self.key] = (current, now)
+            return False, (tokens + reserve - current) / self.rate
+
+
+# Take a slot if fewer than `limit` unexpired leases are held. Leases expire so
+# that slots held by crashed workers come back on their own.
+CONCURRENCY_ACQUIRE_SCRIPT = """
+local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local lease = tonumber(ARGV[2])
+local token = ARGV[3]
+
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - lease)
+if redis.call('ZCARD', key) < limit then
+    redis.call('ZADD', key, now, token)
+    redis.call('EXPIRE', key, math.ceil(lease) + 60)
+    return 1
+end
+return 0
+"""
+
+# Unexpired leases only, by the same Redis clock that stamped them
+CONCURRENCY_COUNT_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+return redis.call('ZCOUNT', KEYS[1], '(' .. (now - tonumber(ARGV[1])), '+inf')
+"""
+
+
+class ConcurrencyLimiter:
+    """At most `limit` holders at a time across processes, each for up to `lease_seconds`"""
+
+    _local_leases = {}
+    _local_lock = threading.Lock()
+
+    def __init__(self, name, limit, lease_seconds=120):
+        self.key = f'concurrency:{name}'
+        self.limit = int(limit)
+        self.lease_seconds = float(lease_seconds)
+        self._script = None
+        self._count_script = None
+
+    def acquire(self):
+        """A lease token when a slot is free, otherwise None. Pass the token to release()."""
+        token = uuid.uuid4().hex
+        client = get_redis_client()
+        if client is not None:
+            try:
+                if self._script is None:
+                    self._script = client.register_script(CONCURRENCY_ACQUIRE_SCRIPT)
+                acquired = self._script(keys=[self.key], args=[self.limit, self.lease_seconds, token])
+                return token if int(acquired) else None
+            except Exception as e:
+                logger.error(f"Error acquiring concurrency slot {self.key}: {str(e)}")
+
+        return self._acquire_local(token)
+
+    def release(self, token):
+        client = get_redis_client()
+        if client is not None:
+            try:
+                client.zrem(self.key, token)
+                return
+            except Exception as e:
+                logger.error(f"Error releasing concurrency slot {self.key}: {str(e)}")
+
+        with self._local_lock:
+            self._local_leases.get(self.key, {}).pop(token, None)
+
+    def in_flight(self):
+        """Slots currently held by unexpired leases"""
+        client = get_redis_client()
+        if client is not None:
+            try:
+                if self._count_script is None:
+                    self._count_script = client.register_script(CONCURRENCY_COUNT_SCRIPT)
+                return int(self._count_script(keys=[self.key], args=[self.lease_seconds]))
+            except Exception as e:
+                logger.error(f"Error reading concurrency slots {self.key}: {str(e)}")
+
+        with self._local_lock:
+            now = time.monotonic()
+            return sum(1 for expires in self._local_leases.get(self.key, {}).values() if expires > now)
+
+    def _acquire_local(self, token):
+        """In-process fallback used when Redis is not available"""
+        now = time.monotonic()
+
+        with self._local_lock:
+            leases = self._local_leases.setdefault(self.key, {})
+            for held, expires in list(leases.items()):
+                if expires <= now:
+                    del leases[held]
+
+            if len(leases) >= self.limit:
+                return None
+            leases[token] = now + self.lease_seconds
+            return token
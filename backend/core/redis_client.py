@@ -0,0 +1,22 @@
+"""
+Access to the raw Redis connection behind the Django cache
+"""
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def get_redis_client(alias='default'):
+    """Return the raw Redis client for a cache alias, or None if the cache is not Redis-backed"""
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    if 'django_redis' not in backend:
+        return None
+
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection(alias)
+    except Exception as e:
+        logger.error(f"Error getting Redis connection for cache '{alias}': {str(e)}")
+        return None
@@ -0,0 +1,254 @@
+"""
+Single-flight coalescing of identical concurrent calls
+
+A double-tapped "generate report" button or a dashboard that refreshes on
+several tabs asks for the same expensive result at the same moment. Instead
+of paying for every round-trip, the first caller for a key (the leader)
+computes it and everyone else waiting on that key gets the leader's result:
+
+- within a process, followers wait on the leader's threading.Event (sync
+  callers) or asyncio Future (async callers on the same event loop);
+- across processes, the leader holds a short cache lock and publishes its
+  result under the key for RESULT_SECONDS; followers in other processes poll
+  for it. If the leader fails or the wait runs past WAIT_SECONDS, a follower
+  computes the result itself, so coalescing never turns into an outage.
+
+Errors are shared in-process only. Results must be picklable to be shared
+across processes. Leader, coalesced and fallback calls are counted per
+flight name (see SingleFlight.stats).
+"""
+import asyncio
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import get_counts, increment
+
+logger = logging.getLogger(__name__)
+
+
+OUTCOMES = ('leader', 'coalesced_local', 'coalesced_remote', 'fallback')
+
+
+def get_config():
+    return getattr(settings, 'SINGLE_FLIGHT', {})
+
+
+class _Call:
+    """An in-flight computation that sync followers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key"""
+
+    def __init__(self, name, distributed=True):
+        config = get_config()
+        self.name = name
+        self.distributed = distributed and config.get('DISTRIBUTED', True)
+        self.lock_seconds = config.get('LOCK_SECONDS', 120)
+        self.wait_seconds = config.get('WAIT_SECONDS', 90)
+        self.result_seconds = config.get('RESULT_SECONDS', 10)
+        self.poll_seconds = config.get('POLL_SECONDS', 0.2)
+
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._futures = {}
+
+    def lock_key(self, key):
+        return f'singleflight:{self.name}:{key}:lock'
+
+    def result_key(self, key):
+        return f'singleflight:{self.name}:{key}:result'
+
+    def count(self, outcome):
+        increment(f'singleflight:{self.name}:{outcome}')
+
+    def do(self, key, fn):
+        """`fn()`, or the result of an identical call already in flight"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(self.wait_seconds):
+                self.count('coalesced_local')
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            self.count('fallback')
+            return fn()
+
+        try:
+            call.result = self._do_across_processes(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            call.done.set()
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def ado(self, key, afn):
+        """do() for async callers; `afn` is a coroutine function"""
+        loop = asyncio.get_running_loop()
+        flight = (id(loop), key)
+
+        future = self._futures.get(flight)
+        if future is not None:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future), self.wait_seconds)
+            except asyncio.TimeoutError:
+                self.count('fallback')
+                return await afn()
+            self.count('coalesced_local')
+            return result
+
+        future = self._futures[flight] = loop.create_future()
+        try:
+            result = await self._ado_across_processes(key, afn)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark it retrieved; with no followers nobody else will
+            future.exception()
+            raise
+        finally:
+            self._futures.pop(flight, None)
+
+    def _do_across_processes(self, key, fn):
+        if not self.distributed:
+            self.count('leader')
+            return fn()
+
+        token = uuid.uuid4().hex
+        if self._acquire(key, token):
+            self.count('leader')
+            try:
+                result = fn()
+                self._publish(key, result)
+                return result
+            finally:
+                self._release(key, token)
+
+        deadline = time.monotonic() + self.wait_seconds
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_seconds)
+            entry, holder = self._poll(key)
+            if entry is not None:
+                self.count('coalesced_remote')
+                return entry['value']
+            if holder is None:
+                break
+
+        self.count('fallback')
+        return fn()
+
+    async def _ado_across_processes(self, key, afn):
+        if not self.distributed:
+            self.count('leader')
+            return await afn()
+
+        token = uuid.uuid4().hex
+        if await self._aacquire(key, token):
+            self.count('leader')
+            try:
+                result = await afn()
+                await self._apublish(key, result)
+                return result
+            finally:
+                await self._arelease(key, token)
+
+        deadline = time.monotonic() + self.wait_seconds
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_seconds)
+            entry, holder = await self._apoll(key)
+            if entry is not None:
+                self.count('coalesced_remote')
+                return entry['value']
+            if holder is None:
+                break
+
+        self.count('fallback')
+        return await afn()
+
+    def _acquire(self, key, token):
+        try:
+            return cache.add(self.lock_key(key), token, self.lock_seconds)
+        except Exception as e:
+            # Without the cache every process computes on its own
+            logger.error(f"Single-flight lock unavailable for {self.name}: {str(e)}")
+            return True
+
+    def _publish(self, key, result):
+        try:
+            cache.set(self.result_key(key), {'value': result}, self.result_seconds)
+        except Exception as e:
+            logger.error(f"Error sharing single-flight result for {self.name}: {str(e)}")
+
+    def _release(self, key, token):
+        try:
+            if cache.get(self.lock_key(key)) == token:
+                cache.delete(self.lock_key(key))
+        except Exception as e:
+            logger.error(f"Error releasing single-flight lock for {self.name}: {str(e)}")
+
+    def _poll(self, key):
+        """(published result entry or None, lock holder or None)"""
+        values = cache.get_many([self.result_key(key), self.lock_key(key)])
+        return values.get(self.result_key(key)), values.get(self.lock_key(key))
+
+    async def _aacquire(self, key, token):
+        try:
+            return await cache.aadd(self.lock_key(key), token, self.lock_seconds)
+        except Exception as e:
+            logger.error(f"Single-flight lock unavailable for {self.name}: {str(e)}")
+            return True
+
+    async def _apublish(self, key, result):
+        try:
+            await cache.aset(self.result_key(key), {'value': result}, self.result_seconds)
+        except Exception as e:
+            logger.error(f"Error sharing single-flight result for {self.name}: {str(e)}")
+
+    async def _arelease(self, key, token):
+        try:
+            if await cache.aget(self.lock_key(key)) == token:
+                await cache.adelete(self.lock_key(key))
+        except Exception as e:
+            logger.error(f"Error releasing single-flight lock for {self.name}: {str(e)}")
+
+    async def _apoll(self, key):
+        values = await cache.aget_many([self.result_key(key), self.lock_key(key)])
+        return values.get(self.result_key(key)), values.get(self.lock_key(key))
+
+    def stats(self):
+        """Leader, coalesced and fallback call counts and the share of calls saved"""
+        counts = get_counts([f'singleflight:{self.name}:{outcome}' for outcome in OUTCOMES])
+        stats = {outcome: counts[f'singleflight:{self.name}:{outcome}'] for outcome in OUTCOMES}
+        total = sum(stats.values())
+        coalesced = stats['coalesced_local'] + stats['coalesced_remote']
+        stats['coalesced_rate'] = round(coalesced / total, 3) if total else 0.0
+        return stats
+
+
+report_flight = SingleFlight('ai_report')
+embedding_flight = SingleFlight('embedding')
+
+FLIGHTS = (report_flight, embedding_flight)
+
+
+def single_flight_stats():
+    return {flight.name: flight.stats() for flight in FLIGHTS}
@@ -1,3 +1,288 @@
-from django.test import TestCase
+import asyncio
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.throttling import AnonRateThrottle
+
+from .async_views import AsyncAPIView
+
+from .rate_limit import ConcurrencyLimiter, TokenBucket
+from .singleflight import SingleFlight
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TokenBucketLocalTests(SimpleTestCase):
+    """The in-process stand-in used without Redis"""
+
+    def setUp(self):
+        TokenBucket._local_state.clear()
+        patcher = mock.patch('core.rate_limit.time.monotonic', return_value=1000.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_starts_full_and_refuses_when_empty(self):
+        bucket = TokenBucket('test', rate=1, capacity=3)
+
+        self.assertEqual([bucket.consume()[0] for _ in range(3)], [True, True, True])
+        allowed, retry_after = bucket.consume()
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 1.0)
+
+    def test_refills_at_rate_up_to_capacity(self):
+        bucket = TokenBucket('test', rate=2, capacity=4)
+        bucket.consume(4)
+
+        self.clock.return_value += 1
+        self.assertTrue(bucket.consume(2)[0])
+        self.assertFalse(bucket.consume(1)[0])
+
+        self.clock.return_value += 3600
+        self.assertTrue(bucket.consume(4)[0])
+        self.assertFalse(bucket.consume(1)[0])
+
+    def test_reserve_is_left_behind(self):
+        bucket = TokenBucket('test', rate=1, capacity=10)
+
+        self.assertTrue(bucket.consume(7, reserve=3)[0])
+        allowed, retry_after = bucket.consume(1, reserve=3)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 1.0)
+        # A caller without a reserve can still use it
+        self.assertTrue(bucket.consume(3)[0])
+
+    def test_force_runs_into_bounded_debt_and_refunds(self):
+        bucket = TokenBucket('test', rate=1, capacity=5)
+
+        self.assertEqual(bucket.consume(50, force=True), (True, 0.0))
+        allowed, retry_after = bucket.consume(1)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 6.0)
+
+        bucket.consume(-6, force=True)
+        self.assertTrue(bucket.consume(1)[0])
+
+    def test_buckets_are_independent(self):
+        TokenBucket('a', rate=1, capacity=1).consume()
+
+        self.assertTrue(TokenBucket('b', rate=1, capacity=1).consume()[0])
+        self.assertFalse(TokenBucket('a', rate=1, capacity=1).consume()[0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConcurrencyLimiterLocalTests(SimpleTestCase):
+    """The in-process stand-in used without Redis"""
+
+    def setUp(self):
+        ConcurrencyLimiter._local_leases.clear()
+        patcher = mock.patch('core.rate_limit.time.monotonic', return_value=1000.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_refuses_past_the_limit_until_a_slot_is_released(self):
+        limiter = ConcurrencyLimiter('test', limit=2)
+        first, second = limiter.acquire(), limiter.acquire()
+
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertIsNone(limiter.acquire())
+        self.assertEqual(limiter.in_flight(), 2)
+
+        limiter.release(first)
+        self.assertEqual(limiter.in_flight(), 1)
+        self.assertIsNotNone(limiter.acquire())
+
+    def test_expired_leases_free_their_slots(self):
+        limiter = ConcurrencyLimiter('test', limit=1, lease_seconds=30)
+        limiter.acquire()
+
+        self.clock.return_value += 30
+        self.assertEqual(limiter.in_flight(), 0)
+        self.assertIsNotNone(limiter.acquire())
+        self.assertEqual(limiter.in_flight(), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SINGLE_FLIGHT={'WAIT_SECONDS': 2, 'POLL_SECONDS': 0.01})
+class SingleFlightTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.flight = SingleFlight('test')
+        self.calls = 0
+
+    def compute(self, value='fresh'):
+        self.calls += 1
+        return value
+
+    def test_leader_computes_publishes_and_unlocks(self):
+        self.assertEqual(self.flight.do('k', self.compute), 'fresh')
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(cache.get(self.flight.result_key('k')), {'value': 'fresh'})
+        self.assertIsNone(cache.get(self.flight.lock_key('k')))
+        self.assertEqual(self.flight.stats()['leader'], 1)
+
+    def test_followers_in_the_process_share_the_leaders_result(self):
+        entered, release = threading.Event(), threading.Event()
+        results = []
+
+        def slow():
+            entered.set()
+            release.wait(2)
+            return self.compute()
+
+        leader = threading.Thread(target=lambda: results.append(self.flight.do('k', slow)))
+        follower = threading.Thread(target=lambda: results.append(self.flight.do('k', slow)))
+        leader.start()
+        entered.wait(2)
+        follower.start()
+        # Let the follower reach the leader's call before it completes
+        follower.join(0.1)
+        release.set()
+        leader.join(2)
+        follower.join(2)
+
+        self.assertEqual(results, ['fresh', 'fresh'])
+        self.assertEqual(self.calls, 1)
+        stats = self.flight.stats()
+        self.assertEqual((stats['leader'], stats['coalesced_local']), (1, 1))
+
+    def test_leader_errors_are_shared_in_process(self):
+        entered, release = threading.Event(), threading.Event()
+        errors = []
+
+        def failing():
+            entered.set()
+            release.wait(2)
+            raise RuntimeError('provider down')
+
+        def call():
+            try:
+                self.flight.do('k', failing)
+            except RuntimeError as e:
+                errors.append(e)
+
+        leader, follower = threading.Thread(target=call), threading.Thread(target=call)
+        leader.start()
+        entered.wait(2)
+        follower.start()
+        follower.join(0.1)
+        release.set()
+        leader.join(2)
+        follower.join(2)
+
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+
+    def test_follower_in_another_process_gets_the_published_result(self):
+        cache.set(self.flight.lock_key('k'), 'other-process')
+        cache.set(self.flight.result_key('k'), {'value': 'shared'})
+
+        self.assertEqual(self.flight.do('k', self.compute), 'shared')
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(self.flight.stats()['coalesced_remote'], 1)
+
+    def test_follower_computes_when_the_leader_vanishes_without_a_result(self):
+        cache.set(self.flight.lock_key('k'), 'other-process')
+
+        with mock.patch(
+            'core.singleflight.time.sleep', side_effect=lambda seconds: cache.delete(self.flight.lock_key('k'))
+        ):
+            self.assertEqual(self.flight.do('k', self.compute), 'fresh')
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.flight.stats()['fallback'], 1)
+
+    @override_settings(SINGLE_FLIGHT={'WAIT_SECONDS': 0})
+    def test_follower_computes_when_the_wait_runs_out(self):
+        flight = SingleFlight('test')
+        cache.set(flight.lock_key('k'), 'other-process')
+
+        self.assertEqual(flight.do('k', self.compute), 'fresh')
+        self.assertEqual(flight.stats()['fallback'], 1)
+
+    def test_async_callers_on_one_loop_are_coalesced(self):
+        async def acompute():
+            await asyncio.sleep(0.01)
+            return self.compute()
+
+        async def both():
+            return await asyncio.gather(self.flight.ado('k', acompute), self.flight.ado('k', acompute))
+
+        self.assertEqual(asyncio.run(both()), ['fresh', 'fresh'])
+        self.assertEqual(self.calls, 1)
+        stats = self.flight.stats()
+        self.assertEqual((stats['leader'], stats['coalesced_local'], stats['coalesced_rate']), (1, 1, 0.5))
+
+    def test_undistributed_flight_ignores_other_processes(self):
+        flight = SingleFlight('test', distributed=False)
+        cache.set(flight.lock_key('k'), 'other-process')
+
+        self.assertEqual(flight.do('k', self.compute), 'fresh')
+        self.assertEqual(self.flight.stats()['leader'], 1)
+
+
+class OncePerMinute(AnonRateThrottle):
+    rate = '1/min'
+
+
+class EchoView(AsyncAPIView):
+    async def post(self, request):
+        return Response({'echo': request.data.get('text')})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncAPIViewTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def call(self, view, method='post', data='{"text": "hi"}', **extra):
+        request = getattr(RequestFactory(), method)('/echo/', data=data, content_type='application/json', **extra)
+        response = asyncio.run(view(request))
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_handler_response_is_rendered(self):
+        view = EchoView.as_view(permission_classes=[AllowAny], throttle_classes=[])
+
+        response = self.call(view)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'echo': 'hi'})
+
+    def test_anonymous_requests_are_refused_with_an_auth_challenge(self):
+        response = self.call(EchoView.as_view(throttle_classes=[]))
+
+        # TokenAuthentication comes first, so clients are asked for a token
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        self.assertIn('detail', response.data)
+
+    def test_throttled_requests_get_429_with_retry_after(self):
+        view = EchoView.as_view(permission_classes=[AllowAny], throttle_classes=[OncePerMinute])
+
+        self.assertEqual(self.call(view).status_code, 200)
+        response = self.call(view)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertIn('detail', response.data)
+
+    def test_unsupported_methods_are_drf_errors(self):
+        response = self.call(EchoView.as_view(permission_classes=[AllowAny]), method='get', data=None)
+
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response.data, {'detail': 'Method "GET" not allowed.'})
+
+    def test_malformed_bodies_are_400(self):
+        view = EchoView.as_view(permission_classes=[AllowAny], throttle_classes=[])
+
+        self.assertEqual(self.call(view, data='{').status_code, 400)
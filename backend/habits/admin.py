@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Mission, Vision, Habit, Checkin, Mood, Trigger, EnvPledge, PlanIfThen, Badge
+from .models import Mission, Vision, Habit, Checkin, Mood, Trigger, EnvPledge, PlanIfThen, Badge, EmbeddingJob, PopularHabit
 
 
 @admin.register(Mission)
@@ -63,3 +63,16 @@ class BadgeAdmin(admin.ModelAdmin):
     list_display = ['user', 'type', 'awarded_at']
     list_filter = ['type', 'awarded_at']
     search_fields = ['user__email']
+
+
+@admin.register(EmbeddingJob)
+class EmbeddingJobAdmin(admin.ModelAdmin):
+    list_display = ['model', 'object_id', 'field', 'attempts', 'next_attempt_at', 'created_at']
+    list_filter = ['model', 'field']
+    search_fields = ['object_id', 'error_message']
+
+
+@admin.register(PopularHabit)
+class PopularHabitAdmin(admin.ModelAdmin):
+    list_display = ['title', 'user_count', 'completion_rate', 'updated_at']
+    search_fields = ['title']
@@ -0,0 +1,67 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:48
+
+import django.utils.timezone
+import pgvector.django.vector
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_enable_pgvector'),
+        ('habits', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkin',
+            name='note_embedding',
+            field=pgvector.django.vector.VectorField(blank=True, dimensions=768, null=True),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='anchor_embedding',
+            field=pgvector.django.vector.VectorField(blank=True, dimensions=768, null=True),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='title_embedding',
+            field=pgvector.django.vector.VectorField(blank=True, dimensions=768, null=True),
+        ),
+        migrations.AddField(
+            model_name='mission',
+            name='skill_embedding',
+            field=pgvector.django.vector.VectorField(blank=True, dimensions=768, null=True),
+        ),
+        migrations.AddField(
+            model_name='mission',
+            name='weakness_embedding',
+            field=pgvector.django.vector.VectorField(blank=True, dimensions=768, null=True),
+        ),
+        migrations.AddField(
+            model_name='mood',
+            name='note_embedding',
+            field=pgvector.django.vector.VectorField(blank=True, dimensions=768, null=True),
+        ),
+        migrations.CreateModel(
+            name='EmbeddingJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('model', models.CharField(help_text='Model label, e.g. habits.Habit', max_length=50)),
+                ('object_id', models.UUIDField()),
+                ('field', models.CharField(help_text='Text field; the vector goes to <field>_embedding', max_length=50)),
+                ('text_hash', models.CharField(help_text='SHA-256 of the text when enqueued', max_length=64)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('error_message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'embedding_jobs',
+                'indexes': [models.Index(fields=['next_attempt_at'], name='embedding_j_next_at_beec26_idx')],
+                'unique_together': {('model', 'object_id', 'field')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:50
+
+import pgvector.django.vector
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0002_embeddings_and_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TextEmbedding',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('model_name', models.CharField(help_text='Embedding model that produced the vector', max_length=100)),
+                ('text_hash', models.CharField(help_text='SHA-256 of the normalized text', max_length=64)),
+                ('embedding', pgvector.django.vector.VectorField(dimensions=768)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'text_embeddings',
+                'unique_together': {('model_name', 'text_hash')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:51
+
+import pgvector.django.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # HNSW builds on populated tables are slow; build without blocking writes
+    atomic = False
+
+    dependencies = [
+        ('habits', '0003_text_embeddings'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='checkin',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['note_embedding'], m=16, name='checkins_note_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='habit',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['title_embedding'], m=16, name='habits_title_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='habit',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['anchor_embedding'], m=16, name='habits_anchor_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='mission',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['skill_embedding'], m=16, name='missions_skill_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='mission',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['weakness_embedding'], m=16, name='missions_weakness_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='mood',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['note_embedding'], m=16, name='moods_note_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+    ]
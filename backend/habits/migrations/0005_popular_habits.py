@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:53
+
+import pgvector.django.indexes
+import pgvector.django.vector
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0004_vector_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularHabit',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('text_hash', models.CharField(help_text='Same hash as TextEmbedding.text_hash', max_length=64, unique=True)),
+                ('title', models.CharField(max_length=255)),
+                ('user_count', models.PositiveIntegerField(default=0)),
+                ('completion_rate', models.FloatField(default=0.0, help_text='Share of the last 30 days checked in as done, 0-1')),
+                ('embedding', pgvector.django.vector.VectorField(blank=True, dimensions=768, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'popular_habits',
+                'ordering': ['-user_count'],
+                'indexes': [models.Index(fields=['-user_count'], name='popular_hab_user_co_0b5569_idx'), pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='popular_habits_hnsw', opclasses=['vector_cosine_ops'])],
+            },
+        ),
+    ]
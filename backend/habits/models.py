@@ -1,7 +1,7 @@
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
-from pgvector.django import VectorField
+from pgvector.django import HnswIndex, VectorField
 import uuid
 
 
@@ -17,6 +17,10 @@ class Mission(models.Model):
     
     class Meta:
         db_table = 'missions'
+        indexes = [
+            HnswIndex(fields=['skill_embedding'], name='missions_skill_hnsw', m=16, ef_construction=64, opclasses=['vector_cosine_ops']),
+            HnswIndex(fields=['weakness_embedding'], name='missions_weakness_hnsw', m=16, ef_construction=64, opclasses=['vector_cosine_ops']),
+        ]
     
     def __str__(self):
         return f"{self.user.name}'s Mission"
@@ -69,15 +73,17 @@ class Habit(models.Model):
         ordering = ['order', 'created_at']
         indexes = [
             models.Index(fields=['user', 'is_active']),
+            HnswIndex(fields=['title_embedding'], name='habits_title_hnsw', m=16, ef_construction=64, opclasses=['vector_cosine_ops']),
+            HnswIndex(fields=['anchor_embedding'], name='habits_anchor_hnsw', m=16, ef_construction=64, opclasses=['vector_cosine_ops']),
         ]
     
     def __str__(self):
         return f"{self.user.name} - {self.title}"
     
-    def get_current_streak(self):
-        """Calculate current streak with insurance logic"""
-        today = timezone.now().date()
-        checkins = self.checkins.order_by('-date')
+    def get_current_streak(self, as_of=None):
+        """Calculate current streak with insurance logic, as of today unless `as_of` is given"""
+        today = as_of or timezone.now().date()
+        checkins = self.checkins.filter(date__lte=today).order_by('-date')
         
         if not checkins.exists():
             return 0
@@ -299,6 +305,7 @@ class Checkin(models.Model):
         indexes = [
             models.Index(fields=['habit', 'date']),
             models.Index(fields=['date']),
+            HnswIndex(fields=['note_embedding'], name='checkins_note_hnsw', m=16, ef_construction=64, opclasses=['vector_cosine_ops']),
         ]
     
     def __str__(self):
@@ -326,6 +333,7 @@ class Mood(models.Model):
         unique_together = ['user', 'date']
         indexes = [
             models.Index(fields=['user', 'date']),
+            HnswIndex(fields=['note_embedding'], name='moods_note_hnsw', m=16, ef_construction=64, opclasses=['vector_cosine_ops']),
         ]
     
     def __str__(self):
@@ -409,3 +417,65 @@ class Badge(models.Model):
     
     def __str__(self):
         return f"{self.user.name} - {self.get_type_display()}"
+
+
+class EmbeddingJob(models.Model):
+    """A text field whose embedding is pending, processed in batches by ai_services.embeddings"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    model = models.CharField(max_length=50, help_text="Model label, e.g. habits.Habit")
+    object_id = models.UUIDField()
+    field = models.CharField(max_length=50, help_text="Text field; the vector goes to <field>_embedding")
+    text_hash = models.CharField(max_length=64, help_text="SHA-256 of the text when enqueued")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    error_message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'embedding_jobs'
+        unique_together = ['model', 'object_id', 'field']
+        indexes = [
+            models.Index(fields=['next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.model}:{self.object_id}.{self.field}"
+
+
+class TextEmbedding(models.Model):
+    """One vector per distinct normalized text and embedding model, shared by every row with that text"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    model_name = models.CharField(max_length=100, help_text="Embedding model that produced the vector")
+    text_hash = models.CharField(max_length=64, help_text="SHA-256 of the normalized text")
+    embedding = VectorField(dimensions=768)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'text_embeddings'
+        unique_together = ['model_name', 'text_hash']
+
+    def __str__(self):
+        return f"{self.model_name}:{self.text_hash[:12]}"
+
+
+class PopularHabit(models.Model):
+    """Precomputed popularity of one habit title (normalized) across users, refreshed periodically"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    text_hash = models.CharField(max_length=64, unique=True, help_text="Same hash as TextEmbedding.text_hash")
+    title = models.CharField(max_length=255)
+    user_count = models.PositiveIntegerField(default=0)
+    completion_rate = models.FloatField(default=0.0, help_text="Share of the last 30 days checked in as done, 0-1")
+    embedding = VectorField(dimensions=768, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'popular_habits'
+        ordering = ['-user_count']
+        indexes = [
+            models.Index(fields=['-user_count']),
+            HnswIndex(fields=['embedding'], name='popular_habits_hnsw', m=16, ef_construction=64, opclasses=['vector_cosine_ops']),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.user_count} users)"
@@ -5,6 +5,7 @@ urlpatterns = [
     path('mission/', views.MissionView.as_view(), name='mission'),
     path('vision/', views.VisionView.as_view(), name='vision'),
     path('habits/', views.HabitListCreateView.as_view(), name='habits'),
+    path('habits/recommendations/', views.HabitRecommendationView.as_view(), name='habit-recommendations'),
     path('habits/<uuid:pk>/', views.HabitDetailView.as_view(), name='habit-detail'),
     path('habits/<uuid:pk>/checkins/', views.CheckinCreateView.as_view(), name='habit-checkin'),
     path('habits/<uuid:pk>/insurance/', views.HabitInsuranceView.as_view(), name='habit-insurance'),
@@ -23,4 +24,7 @@ urlpatterns = [
     path('progress/stats/', views.ProgressStatsView.as_view(), name='progress-stats'),
     path('progress/chart/', views.HabitProgressView.as_view(), name='progress-chart'),
     path('progress/calendar/', views.HabitCalendarView.as_view(), name='progress-calendar'),
+    
+    # Semantic search
+    path('search/', views.SemanticSearchView.as_view(), name='semantic-search'),
 ]
\ No newline at end of file
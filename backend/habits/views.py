@@ -13,6 +13,9 @@ from .serializers import (
     CheckinSerializer, MoodSerializer, TriggerSerializer,
     EnvPledgeSerializer, PlanIfThenSerializer, BadgeSerializer
 )
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class MissionView(RetrieveUpdateAPIView):
@@ -368,4 +371,70 @@ class HabitCalendarView(APIView):
                 'end_date': end_date.isoformat()
             },
             'habits': [{'id': str(h.id), 'name': h.title} for h in habits]
-        })
\ No newline at end of file
+        })
+
+
+class SemanticSearchView(APIView):
+    """Search the user's habits, mission, check-in notes and mood notes by meaning"""
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        from ai_services.search import SEARCH_SOURCES, semantic_search
+        
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {'error': 'Query parameter q is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        kinds = [k for k in request.query_params.get('types', '').split(',') if k]
+        unknown = [k for k in kinds if k not in SEARCH_SOURCES]
+        if unknown:
+            return Response(
+                {'error': f"Unknown types: {', '.join(unknown)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            limit = 10
+        
+        if not semantic_search.available:
+            return Response(
+                {'error': 'Semantic search is not available'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        
+        try:
+            results = semantic_search.search(request.user, query[:1000], kinds=kinds, limit=limit)
+        except Exception as e:
+            logger.error(f"Semantic search failed for user {request.user.id}: {str(e)}")
+            return Response(
+                {'error': 'Search failed'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        
+        return Response({'query': query, 'results': results})
+
+
+class HabitRecommendationView(APIView):
+    """Habits popular among users with similar goals and habits"""
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        from ai_services.recommender import habit_recommender
+        
+        try:
+            limit = min(max(int(request.query_params.get('limit', 3)), 1), 10)
+        except ValueError:
+            limit = 3
+        
+        try:
+            recommendations = habit_recommender.recommend(request.user, limit=limit)
+        except Exception as e:
+            logger.error(f"Habit recommendations failed for user {request.user.id}: {str(e)}")
+            recommendations = []
+        
+        return Response({'recommendations': recommendations})
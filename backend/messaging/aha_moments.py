@@ -56,6 +56,7 @@ class AhaMoments:
         'key': 'streak_recovery',
         'name': 'Streak Recovery Support',
         'trigger': 'streak_broken',
+        'condition': {'broken_streak__gte': 7},  # Only for meaningful streaks
         'delay': 1440,  # 24 hours after streak breaks
         'subject': '💪 Every Hero Has Setbacks - Let\'s Bounce Back!',
         'category': 'engagement',
@@ -74,7 +75,8 @@ class AhaMoments:
     LEVEL_UP_CELEBRATION = {
         'key': 'level_up',
         'name': 'Level Up Celebration',
-        'trigger': 'level_increased',
+        'trigger': 'streak_reached',
+        'condition': {'streak_days': [14, 21, 30, 60, 100]},
         'subject': '⚡ LEVEL UP! You\'ve Unlocked New Powers!',
         'category': 'engagement',
         'description': 'Celebrates user leveling up with new features'
@@ -130,34 +132,42 @@ class AhaMoments:
         'description': 'Seasonal challenges and special events'
     }
     
+    # Indexed registry, built once from the definitions above
+    _registry = None
+    
+    @classmethod
+    def _get_registry(cls):
+        """Index moment definitions by key, trigger and category"""
+        if cls._registry is None:
+            moments = [attr for attr in vars(cls).values() if isinstance(attr, dict) and 'key' in attr]
+            registry = {'all': moments, 'key': {}, 'trigger': {}, 'category': {}}
+            for moment in moments:
+                registry['key'][moment['key']] = moment
+                registry['trigger'].setdefault(moment['trigger'], []).append(moment)
+                registry['category'].setdefault(moment['category'], []).append(moment)
+            cls._registry = registry
+        return cls._registry
+    
     # Get all aha moments
     @classmethod
     def get_all_moments(cls):
         """Return all defined aha moments"""
-        moments = []
-        for attr_name in dir(cls):
-            attr = getattr(cls, attr_name)
-            if isinstance(attr, dict) and 'key' in attr:
-                moments.append(attr)
-        return moments
+        return list(cls._get_registry()['all'])
     
     @classmethod
     def get_moment_by_key(cls, key):
         """Get specific aha moment by key"""
-        for moment in cls.get_all_moments():
-            if moment['key'] == key:
-                return moment
-        return None
+        return cls._get_registry()['key'].get(key)
     
     @classmethod
     def get_moments_by_category(cls, category):
         """Get all moments in a specific category"""
-        return [m for m in cls.get_all_moments() if m['category'] == category]
+        return list(cls._get_registry()['category'].get(category, []))
     
     @classmethod
     def get_moments_by_trigger(cls, trigger):
         """Get all moments for a specific trigger"""
-        return [m for m in cls.get_all_moments() if m['trigger'] == trigger]
+        return list(cls._get_registry()['trigger'].get(trigger, []))
 
 
 class AhaMomentScheduler:
@@ -167,6 +177,7 @@ class AhaMomentScheduler:
     def schedule_moment(user, moment_key, context=None, delay_minutes=None):
         """Schedule an aha moment email"""
         from .tasks import send_aha_moment_email
+        from .delivery import EmailLane
         
         moment = AhaMoments.get_moment_by_key(moment_key)
         if not moment:
@@ -177,17 +188,35 @@ class AhaMomentScheduler:
         if delay_minutes is None:
             delay_minutes = moment.get('delay', 0)
         
-        # Schedule the email
-        if delay_minutes > 0:
+        # Route onto the lane matching the moment's urgency
+        lane = EmailLane.for_moment(moment)
+        queue = EmailLane.queue_for(lane)
+        
+        # Non-urgent emails wait for the user's preferred send slot
+        if lane == EmailLane.BULK:
+            from .send_times import SendTimeModel
+            
+            earliest = timezone.now() + timedelta(minutes=delay_minutes)
+            send_aha_moment_email.apply_async(
+                args=[str(user.id), moment_key, context or {}],
+                eta=SendTimeModel.next_send_time(user.id, after=earliest),
+                queue=queue
+            )
+            logger.info(f"Scheduled {moment_key} for user {user.email} at their preferred send time")
+        elif delay_minutes > 0:
             # Schedule for later using Celery
             send_aha_moment_email.apply_async(
                 args=[str(user.id), moment_key, context or {}],
-                countdown=delay_minutes * 60
+                countdown=delay_minutes * 60,
+                queue=queue
             )
             logger.info(f"Scheduled {moment_key} for user {user.email} in {delay_minutes} minutes")
         else:
             # Send immediately
-            send_aha_moment_email.delay(str(user.id), moment_key, context or {})
+            send_aha_moment_email.apply_async(
+                args=[str(user.id), moment_key, context or {}],
+                queue=queue
+            )
             logger.info(f"Queued {moment_key} for immediate delivery to {user.email}")
         
         return True
@@ -195,110 +224,56 @@ class AhaMomentScheduler:
     @staticmethod
     def trigger_welcome_sequence(user):
         """Trigger the complete welcome sequence"""
-        AhaMomentScheduler.schedule_moment(user, 'welcome_hero')
-        logger.info(f"Welcome sequence started for {user.email}")
+        from .aha_rules import AhaRuleEngine
+        return AhaRuleEngine.publish('user_signup', user)
     
     @staticmethod
     def trigger_habit_created(user, habit):
-        """Trigger emails when first habit is created"""
-        # Check if this is user's first habit
-        from habits.models import Habit
-        habit_count = Habit.objects.filter(user=user, is_active=True).count()
-        
-        if habit_count == 1:  # First habit
-            AhaMomentScheduler.schedule_moment(
-                user, 
-                'first_habit_created',
-                context={'habit_title': habit.title, 'habit_difficulty': habit.difficulty_level}
-            )
-            
-            # Schedule 24-hour reminder
-            AhaMomentScheduler.schedule_moment(
-                user,
-                'first_day_reminder',
-                context={'habit_title': habit.title},
-                delay_minutes=1440  # 24 hours
-            )
+        """Trigger emails when first habit is created (later habits dedup to nothing)"""
+        from .aha_rules import AhaRuleEngine
+        return AhaRuleEngine.publish('habit_created', user, {
+            'habit_id': str(habit.id),
+            'habit_title': habit.title,
+            'habit_difficulty': habit.difficulty_level,
+        })
     
     @staticmethod
     def trigger_streak_milestone(user, habit, streak_days):
         """Trigger emails for streak milestones"""
-        if streak_days == 7:
-            AhaMomentScheduler.schedule_moment(
-                user,
-                'first_week_milestone',
-                context={
-                    'habit_title': habit.title,
-                    'streak_days': streak_days,
-                    'user_name': user.name
-                }
-            )
-        elif streak_days in [14, 21, 30, 60, 100]:
-            # Special milestone celebrations
-            AhaMomentScheduler.schedule_moment(
-                user,
-                'level_up',
-                context={
-                    'habit_title': habit.title,
-                    'streak_days': streak_days,
-                    'milestone_type': f'{streak_days}_day_streak'
-                }
-            )
+        from .aha_rules import AhaRuleEngine
+        return AhaRuleEngine.publish('streak_reached', user, {
+            'habit_id': str(habit.id),
+            'habit_title': habit.title,
+            'streak_days': streak_days,
+            'milestone_type': f'{streak_days}_day_streak',
+            'date': timezone.now().date().isoformat(),
+        })
     
     @staticmethod
     def trigger_streak_broken(user, habit, broken_streak):
         """Trigger supportive email when streak breaks"""
-        if broken_streak >= 7:  # Only for meaningful streaks
-            AhaMomentScheduler.schedule_moment(
-                user,
-                'streak_recovery',
-                context={
-                    'habit_title': habit.title,
-                    'broken_streak': broken_streak,
-                    'user_name': user.name
-                },
-                delay_minutes=1440  # 24 hours delay for emotional processing
-            )
+        from .aha_rules import AhaRuleEngine
+        return AhaRuleEngine.publish('streak_broken', user, {
+            'habit_id': str(habit.id),
+            'habit_title': habit.title,
+            'broken_streak': broken_streak,
+            'date': timezone.now().date().isoformat(),
+        })
     
     @staticmethod
     def trigger_badge_earned(user, badge):
         """Trigger email when user earns a badge"""
-        AhaMomentScheduler.schedule_moment(
-            user,
-            'badge_unlock',
-            context={
-                'badge_type': badge.type,
-                'badge_name': badge.get_type_display(),
-                'user_name': user.name
-            }
-        )
+        from .aha_rules import AhaRuleEngine
+        return AhaRuleEngine.publish('badge_earned', user, {
+            'badge_type': badge.type,
+            'badge_name': badge.get_type_display(),
+        })
     
     @staticmethod
     def check_inactive_users():
-        """Check for inactive users and trigger re-engagement emails"""
-        from accounts.models import User
-        from django.db.models import Max
-        
-        # Get users and their last activity
-        users = User.objects.annotate(
-            last_checkin=Max('habits__checkins__created_at')
-        ).filter(is_active=True)
-        
-        now = timezone.now()
-        
-        for user in users:
-            if not user.last_checkin:
-                continue
-                
-            days_inactive = (now - user.last_checkin).days
-            
-            # Trigger appropriate re-engagement emails
-            if days_inactive == 3:
-                AhaMomentScheduler.schedule_moment(user, 'come_back_hero')
-            elif days_inactive == 7:
-                AhaMomentScheduler.schedule_moment(user, 'we_miss_you')
-            elif days_inactive == 14:
-                AhaMomentScheduler.schedule_moment(user, 'comeback_special')
+        """Fire re-engagement emails for users who crossed an inactivity threshold"""
+        from .aha_rules import AhaRuleEngine
+        return AhaRuleEngine.fire_inactivity_timers()
     
     @staticmethod
     def trigger_monthly_report(user):
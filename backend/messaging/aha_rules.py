@@ -0,0 +1,213 @@
+"""
+Event-driven aha-moment rule engine
+
+Domain events (signup, habit created, streak reached, streak broken, badge
+earned, inactivity) are published here as they happen. Each event looks up only the
+moments registered for its trigger, checks their conditions against the
+event context, and claims a per-user dedup row before delivering. No rule is
+ever evaluated for users that did not produce an event.
+"""
+import logging
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.utils import timezone
+
+from .aha_moments import AhaMoments, AhaMomentScheduler
+from .models import AhaMomentDelivery
+
+logger = logging.getLogger(__name__)
+
+
+class AhaRuleEngine:
+    """Evaluate aha-moment rules for published domain events"""
+
+    # What makes two firings of the same moment distinct, per trigger
+    DEDUP_KEYS = {
+        'user_signup': 'once',
+        'habit_created': 'once',
+        'streak_reached': '{habit_id}:{streak_days}:{date}',
+        'streak_broken': '{habit_id}:{date}',
+        'badge_earned': '{badge_type}',
+        'inactive_days': '{days_inactive}:{last_activity_date}',
+    }
+
+    # Celebrations can arrive in bursts, so they go through the coalescer
+    COALESCED_TRIGGERS = ('streak_reached', 'badge_earned')
+
+    INACTIVITY_SWEEP_KEY = 'aha_rules:last_inactivity_sweep'
+    STREAK_SWEEP_KEY = 'aha_rules:streak_sweep:{date}'
+    INACTIVITY_CHUNK_SIZE = 100
+
+    @staticmethod
+    def publish(trigger, user, context=None):
+        """Fire every moment whose rule matches the event. Returns the moment keys fired."""
+        context = context or {}
+        fired = []
+
+        for moment in AhaMoments.get_moments_by_trigger(trigger):
+            if not AhaRuleEngine.matches(moment.get('condition'), context):
+                continue
+
+            dedup_key = AhaRuleEngine.dedup_key(trigger, context)
+            if not AhaRuleEngine.claim(user, moment['key'], dedup_key):
+                continue
+
+            AhaRuleEngine.deliver(user, moment, context)
+            fired.append(moment['key'])
+
+        if fired:
+            logger.info(f"Event {trigger} for {user.email} fired {', '.join(fired)}")
+        return fired
+
+    @staticmethod
+    def dedup_key(trigger, context):
+        """The occurrence key for an event; at most once a day when the context lacks a field"""
+        template = AhaRuleEngine.DEDUP_KEYS.get(trigger, 'once')
+        try:
+            return template.format(**context)
+        except (KeyError, IndexError) as e:
+            logger.warning(f"Event {trigger} context has no {e} for its dedup key, deduplicating per day")
+            return f"{template}@{timezone.now().date().isoformat()}"
+
+    @staticmethod
+    def matches(condition, context):
+        """Check a moment condition such as {'streak_days': 7} or {'broken_streak__gte': 7}"""
+        for field, expected in (condition or {}).items():
+            if field.endswith('__gte'):
+                value = context.get(field[:-5])
+                if value is None or value < expected:
+                    return False
+            elif isinstance(expected, (list, tuple)):
+                if context.get(field) not in expected:
+                    return False
+            elif context.get(field) != expected:
+                return False
+        return True
+
+    @staticmethod
+    def claim(user, moment_key, dedup_key):
+        """Record the firing; False if this occurrence already fired"""
+        try:
+            _, created = AhaMomentDelivery.objects.get_or_create(
+                user=user, moment_key=moment_key, dedup_key=dedup_key[:255]
+            )
+            return created
+        except IntegrityError:
+            return False
+
+    @staticmethod
+    def deliver(user, moment, context):
+        if moment['trigger'] in AhaRuleEngine.COALESCED_TRIGGERS:
+            from .coalescing import NotificationCoalescer
+            NotificationCoalescer.add(user, 'aha_moment', moment['key'], context)
+        else:
+            AhaMomentScheduler.schedule_moment(user, moment['key'], context)
+
+    @staticmethod
+    def handle_checkin(user, habit, checkin_date):
+        """A completed checkin may reach a streak milestone"""
+        streak_days = habit.get_current_streak()
+        return AhaRuleEngine.publish('streak_reached', user, {
+            'habit_id': str(habit.id),
+            'habit_title': habit.title,
+            'streak_days': streak_days,
+            'milestone_type': f'{streak_days}_day_streak',
+            'date': checkin_date.isoformat(),
+        })
+
+    @staticmethod
+    def fire_inactivity_timers(now=None):
+        """
+        Fire inactivity rules for users whose inactivity threshold passed since the last sweep.
+
+        Each sweep only covers the slice of time since the previous one, as
+        an indexed range on last_activity_at, so running it every few minutes
+        fires re-engagement within minutes without rescanning users.
+        """
+        from accounts.models import User
+        from .delivery import EmailLane
+        from .tasks import send_aha_moment_email
+
+        now = now or timezone.now()
+        since = cache.get(AhaRuleEngine.INACTIVITY_SWEEP_KEY) or now - timedelta(days=1)
+        since = max(since, now - timedelta(days=1))
+
+        fired = 0
+        for moment in AhaMoments.get_moments_by_trigger('inactive_days'):
+            days = moment.get('condition', {}).get('days_inactive')
+            if not days:
+                continue
+
+            due = User.objects.filter(
+                is_active=True,
+                last_activity_at__gt=since - timedelta(days=days),
+                last_activity_at__lte=now - timedelta(days=days),
+            ).values_list('id', 'last_activity_at')
+
+            candidates = {
+                user_id: f"{days}:{last_activity_at.date().isoformat()}"
+                for user_id, last_activity_at in due.iterator()
+            }
+            if not candidates:
+                continue
+
+            # Drop users this occurrence already fired for, then claim the rest in bulk
+            already = set(AhaMomentDelivery.objects.filter(
+                moment_key=moment['key'],
+                user_id__in=list(candidates),
+                dedup_key__in=set(candidates.values()),
+            ).values_list('user_id', 'dedup_key'))
+            new = {user_id: key for user_id, key in candidates.items() if (user_id, key) not in already}
+            if not new:
+                continue
+
+            AhaMomentDelivery.objects.bulk_create(
+                [AhaMomentDelivery(user_id=user_id, moment_key=moment['key'], dedup_key=key) for user_id, key in new.items()],
+                ignore_conflicts=True,
+            )
+
+            args = [(str(user_id), moment['key'], {'days_inactive': days}) for user_id in new]
+            send_aha_moment_email.chunks(args, AhaRuleEngine.INACTIVITY_CHUNK_SIZE).apply_async(
+                queue=EmailLane.queue_for(EmailLane.for_moment(moment))
+            )
+            fired += len(args)
+            logger.info(f"Queued {moment['key']} for {len(args)} users inactive for {days} days")
+
+        cache.set(AhaRuleEngine.INACTIVITY_SWEEP_KEY, now, 60 * 60 * 48)
+        return fired
+
+    @staticmethod
+    def fire_streak_breaks(now=None):
+        """
+        Publish streak_broken for daily habits whose streak ended today.
+
+        A single missed day is covered by streak insurance, so a streak ends
+        on the second day without a checkin: the habit's last completion was
+        the day before yesterday and nothing was checked in since. Runs once
+        a day, on the first sweep after midnight; only those habits are read.
+        """
+        from habits.models import Checkin
+
+        today = (now or timezone.now()).date()
+        if not cache.add(AhaRuleEngine.STREAK_SWEEP_KEY.format(date=today.isoformat()), 1, 60 * 60 * 48):
+            return 0
+
+        last_done = today - timedelta(days=2)
+        ended = Checkin.objects.filter(
+            date=last_done,
+            value=True,
+            habit__is_active=True,
+            habit__cadence='daily',
+            habit__user__is_active=True,
+        ).exclude(
+            habit__checkins__date__gt=last_done,
+        ).select_related('habit__user')
+
+        fired = 0
+        for checkin in ended.iterator():
+            habit = checkin.habit
+            broken_streak = habit.get_current_streak(as_of=last_done)
+            fired += len(AhaMomentScheduler.trigger_streak_broken(habit.user, habit, broken_streak))
+        return fired
@@ -48,7 +48,7 @@ class AIEmailPersonalizer:
             """
             
             # Generate using LangGraph service
-            response = langgraph_ai_service.llm.invoke(prompt)
+            response = langgraph_ai_service.llm.invoke(prompt, feature='email', user_id=user.id)
             
             if response and len(response.strip()) > 0:
                 # Extract the best subject line
@@ -108,7 +108,7 @@ class AIEmailPersonalizer:
             """
             
             # Generate personalization using LangGraph
-            response = langgraph_ai_service.llm.invoke(prompt)
+            response = langgraph_ai_service.llm.invoke(prompt, feature='email', user_id=user.id)
             
             if response and len(response.strip()) > 0:
                 personalized_content = response.strip()
@@ -130,46 +130,15 @@ class AIEmailPersonalizer:
     
     @staticmethod
     def generate_optimal_send_time(user, template_key):
-        """Use AI to determine optimal send time for user"""
+        """Best send hour for user from their precomputed send time profile"""
+        from .send_times import SendTimeModel
+        
         try:
-            if not langgraph_ai_service.ai_available:
-                return AIEmailPersonalizer._get_default_send_time(template_key)
-            
-            # Gather user activity patterns
-            user_context = AIEmailPersonalizer._gather_user_context(user)
-            activity_patterns = AIEmailPersonalizer._analyze_user_activity_patterns(user)
-            
-            prompt = f"""
-            Determine the optimal time to send an email to a teen user based on their activity patterns.
-            
-            User Activity Data:
-            - Most active hours: {activity_patterns.get('most_active_hours', 'Unknown')}
-            - Typical check-in times: {activity_patterns.get('checkin_times', 'Unknown')}
-            - Weekend vs weekday activity: {activity_patterns.get('weekend_pattern', 'Unknown')}
-            - Time zone: {user_context.get('timezone', 'Unknown')}
-            
-            Email Type: {template_key}
-            
-            Consider:
-            - Teen schedules (school hours, after-school activities)
-            - Email type urgency and purpose
-            - Best engagement times for habit reminders
-            - Avoid too early (before 7 AM) or too late (after 9 PM)
-            
-            Return the optimal hour (0-23) as a single number.
-            """
-            
-            response = langgraph_ai_service.llm.invoke(prompt)
-            
-            if response and response.strip().isdigit():
-                optimal_hour = int(response.strip())
-                
-                # Validate the hour is reasonable
-                if 7 <= optimal_hour <= 21:  # Between 7 AM and 9 PM
-                    logger.info(f"AI recommended send time for {user.email}: {optimal_hour}:00")
-                    return optimal_hour
-            
-            return AIEmailPersonalizer._get_default_send_time(template_key)
+            return SendTimeModel.get_send_hour(
+                user.id,
+                timezone.now().date(),
+                default_hour=AIEmailPersonalizer._get_default_send_time(template_key)
+            )
             
         except Exception as e:
             logger.error(f"Error generating optimal send time: {str(e)}")
@@ -177,55 +146,16 @@ class AIEmailPersonalizer:
     
     @staticmethod
     def generate_dynamic_recommendations(user, context=None):
-        """Generate dynamic habit recommendations using AI"""
+        """Habit recommendations from similar users (see ai_services.recommender)"""
         try:
-            if not langgraph_ai_service.ai_available:
-                return AIEmailPersonalizer._get_fallback_recommendations()
+            from ai_services.recommender import habit_recommender
             
-            # Gather user context
-            user_context = AIEmailPersonalizer._gather_user_context(user)
-            
-            prompt = f"""
-            Generate 3 personalized habit recommendations for a teen user based on their current progress.
-            
-            User Profile:
-            - Name: {user.name or 'Hero'}
-            - Current habits: {user_context.get('habit_titles', [])}
-            - Completion rate: {user_context.get('completion_rate', 0)}%
-            - Current challenges: {user_context.get('challenges', 'Unknown')}
-            - Best streak: {user_context.get('best_streak', 0)} days
-            - Recent mood: {user_context.get('recent_mood', 'Unknown')}
-            
-            Additional Context: {context or {}}
-            
-            Requirements:
-            1. Make recommendations specific and actionable
-            2. Consider their current habits to avoid conflicts
-            3. Use teen-friendly language with appropriate emojis
-            4. Focus on building existing strengths or addressing gaps
-            5. Each recommendation should be 1-2 sentences maximum
-            
-            Return as a JSON array of strings: ["recommendation1", "recommendation2", "recommendation3"]
-            """
+            recommendations = habit_recommender.recommend_text(user, limit=3)
+            if len(recommendations) >= 3:
+                logger.info(f"Generated habit recommendations for {user.email}")
+                return recommendations
             
-            response = langgraph_ai_service.llm.invoke(prompt)
-            
-            # Parse the JSON response
-            import json
-            import re
-            
-            # Try to extract JSON array from response
-            json_match = re.search(r'\[.*\]', response, re.DOTALL)
-            if json_match:
-                try:
-                    recommendations = json.loads(json_match.group())
-                    if isinstance(recommendations, list) and len(recommendations) >= 3:
-                        logger.info(f"Generated AI recommendations for {user.email}")
-                        return recommendations[:3]
-                except json.JSONDecodeError:
-                    pass
-            
-            return AIEmailPersonalizer._get_fallback_recommendations()
+            return (recommendations + AIEmailPersonalizer._get_fallback_recommendations())[:3]
             
         except Exception as e:
             logger.error(f"Error generating dynamic recommendations: {str(e)}")
@@ -382,7 +312,7 @@ class AIEmailPersonalizer:
             insertion_markers = [
                 '<div class="content">',
                 '<p style="font-size: 16px; color: #4a5568; margin: 25px 0;">',
-                'You're doing amazing!'
+                "You're doing amazing!"
             ]
             
             for marker in insertion_markers:
@@ -0,0 +1,299 @@
+"""
+Segment broadcasts of one MessageTemplate
+
+Recipients are streamed with keyset pagination on user id, so each chunk is
+one indexed range scan however large the segment is. A chunk is rendered
+(optionally in a process pool, for heavy templates), sent over one SMTP
+connection under the shared provider rate limit and logged with one bulk
+insert. The Broadcast row keeps the cursor, so a deferred or crashed run
+resumes where it stopped, and is leased (messaging.leases) while a runner
+sends, so a second runner for the same broadcast exits.
+"""
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connections
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from accounts.models import User
+from core.models import Enrollment
+from .delivery import EmailLane, email_rate_limiter
+from .leases import RowLease
+from .models import Broadcast, MessageTemplate, OutboundMessage
+from .templating import CompiledTemplate, TemplateValidationError
+
+logger = logging.getLogger(__name__)
+
+
+# activity_score ranges (0-100) per engagement bucket
+ENGAGEMENT_BUCKETS = {
+    'high': (70, None),
+    'medium': (40, 70),
+    'low': (0, 40),
+}
+
+
+def segment_queryset(segment):
+    """Active, reachable users in a segment"""
+    users = User.objects.filter(is_active=True).exclude(channel_preference__allow_prompts=False)
+    segment_type = segment.get('type')
+
+    if segment_type == 'course':
+        code = segment.get('course_code')
+        enrolled = Enrollment.objects.filter(user_id=OuterRef('id'), course__code=code, role='student')
+        return users.filter(Q(class_code__code=code) | Exists(enrolled))
+
+    if segment_type == 'engagement':
+        if segment.get('bucket') == 'at_risk':
+            return users.filter(engagement_metrics__retention_risk_score__gte=70)
+        low, high = ENGAGEMENT_BUCKETS[segment.get('bucket')]
+        users = users.filter(engagement_metrics__activity_score__gte=low)
+        if high is not None:
+            users = users.filter(engagement_metrics__activity_score__lt=high)
+        return users
+
+    if segment_type == 'inactive':
+        cutoff = timezone.now() - timedelta(days=int(segment.get('days', 7)))
+        return users.filter(last_activity_at__lte=cutoff)
+
+    raise ValueError(f"Unknown segment type: {segment_type}")
+
+
+def validate_segment(segment):
+    """Return an error message, or None if the segment is valid"""
+    if not isinstance(segment, dict):
+        return "Segment must be an object"
+    segment_type = segment.get('type')
+    if segment_type not in Broadcast.SEGMENT_TYPES:
+        return f"Segment type must be one of {', '.join(Broadcast.SEGMENT_TYPES)}"
+    if segment_type == 'course' and not segment.get('course_code'):
+        return "Course segments need a course_code"
+    if segment_type == 'engagement' and segment.get('bucket') not in (*ENGAGEMENT_BUCKETS, 'at_risk'):
+        return f"Engagement bucket must be one of {', '.join([*ENGAGEMENT_BUCKETS, 'at_risk'])}"
+    if segment_type == 'inactive':
+        try:
+            if int(segment.get('days', 7)) < 1:
+                return "Inactive days must be at least 1"
+        except (TypeError, ValueError):
+            return "Inactive days must be a number"
+    return None
+
+
+def can_broadcast(user, segment):
+    """Staff may message any segment; coaches only the courses they coach"""
+    if user.is_staff or user.email.endswith('@eurekia.com'):
+        return True
+    if segment.get('type') != 'course':
+        return False
+    return Enrollment.objects.filter(user=user, course__code=segment.get('course_code'), role='coach').exists()
+
+
+# Process pool workers compile each template version once and keep it
+_worker_templates = {}
+
+
+def render_in_worker(template_row, contexts):
+    """Render a slice of recipients in a pool process (no database access)"""
+    version = (template_row['key'], template_row['updated_at'])
+    compiled = _worker_templates.get(version)
+    if compiled is None:
+        compiled = CompiledTemplate(MessageTemplate(**template_row), 'email')
+        _worker_templates.clear()
+        _worker_templates[version] = compiled
+    return [compiled.render(context) for context in contexts]
+
+
+class BroadcastSender:
+    """Send one Broadcast, chunk by chunk"""
+
+    # Waits shorter than this are slept through; longer ones defer the run
+    MAX_INLINE_WAIT_SECONDS = 5
+
+    def __init__(self, broadcast, chunk_size=None, render_processes=None):
+        config = getattr(settings, 'BROADCAST', {})
+        self.broadcast = broadcast
+        self.chunk_size = chunk_size or config.get('CHUNK_SIZE', 500)
+        self.render_processes = config.get('RENDER_PROCESSES', 0) if render_processes is None else render_processes
+        self.lease = RowLease(broadcast, config.get('LEASE_SECONDS', 600))
+        self.pool = None
+        self.compiled = None
+
+    def run(self):
+        """
+        Process chunks until done or rate limited.
+
+        Returns (finished, retry_after_seconds), like DigestPipeline.run.
+        """
+        broadcast = self.broadcast
+        if not self.lease.acquire():
+            logger.info(f"Broadcast {broadcast.id} is being sent by another worker")
+            return True, 0
+
+        try:
+            return self.send_all()
+        finally:
+            self.lease.release()
+            if self.pool is not None:
+                self.pool.shutdown()
+
+    def send_all(self):
+        broadcast = self.broadcast
+        if broadcast.status in ('completed', 'failed'):
+            return True, 0
+
+        template = MessageTemplate.objects.filter(
+            key=broadcast.template_key, is_active=True, channel__in=['all', 'email']
+        ).first()
+        if template is None:
+            return self.fail(f"No active email template {broadcast.template_key}")
+        try:
+            self.compiled = CompiledTemplate(template, 'email')
+        except TemplateValidationError as e:
+            return self.fail(str(e))
+
+        broadcast.status = 'running'
+        self.lease.save('status')
+
+        while True:
+            recipients = self.next_recipients()
+            if not recipients:
+                broadcast.status = 'completed'
+                broadcast.completed_at = timezone.now()
+                self.lease.save('status', 'completed_at')
+                logger.info(f"Broadcast {broadcast.id} completed: {broadcast.sent_count} sent, {broadcast.failed_count} failed")
+                return True, 0
+
+            rendered = self.render(template, recipients)
+            processed, sent, failed, retry_after = self.send_chunk(recipients, rendered)
+
+            if processed:
+                broadcast.cursor = processed[-1]['id']
+                broadcast.sent_count += sent
+                broadcast.failed_count += failed
+                if not self.lease.save('cursor', 'sent_count', 'failed_count'):
+                    # Another runner owns the broadcast now and resumes from its checkpoint
+                    return True, 0
+
+            if retry_after:
+                return False, retry_after
+
+    def fail(self, error):
+        logger.error(f"Broadcast {self.broadcast.id} failed: {error}")
+        self.broadcast.status = 'failed'
+        self.broadcast.error_message = error
+        self.lease.save('status', 'error_message')
+        return True, 0
+
+    def next_recipients(self):
+        """Next chunk of the segment after the cursor"""
+        users = segment_queryset(self.broadcast.segment_json).order_by('id')
+        if self.broadcast.cursor:
+            users = users.filter(id__gt=self.broadcast.cursor)
+        return list(users.values('id', 'name', 'email')[:self.chunk_size])
+
+    def render(self, template, recipients):
+        """Rendered dict per recipient, in order"""
+        contexts = [
+            {**self.broadcast.context_json, 'user_name': r['name'] or 'Hero', 'user_email': r['email']}
+            for r in recipients
+        ]
+
+        pool = self.get_pool()
+        if pool is not None:
+            template_row = {
+                'key': template.key,
+                'subject': template.subject,
+                'body': template.body,
+                'variables': template.variables,
+                'updated_at': template.updated_at,
+            }
+            size = -(-len(contexts) // self.render_processes)
+            slices = [contexts[i:i + size] for i in range(0, len(contexts), size)]
+            try:
+                return [
+                    item
+                    for rendered in pool.map(render_in_worker, [template_row] * len(slices), slices)
+                    for item in rendered
+                ]
+            except Exception as e:
+                # e.g. Celery prefork children are daemonic and cannot start processes
+                logger.warning(f"Rendering broadcast inline, process pool unavailable: {str(e)}")
+                pool.shutdown(cancel_futures=True)
+                self.pool = None
+                self.render_processes = 0
+
+        return [self.compiled.render(context) for context in contexts]
+
+    def get_pool(self):
+        """Process pool for rendering, or None to render inline"""
+        if self.pool is None and self.render_processes > 1:
+            # Forked children must not share the parent's database sockets
+            connections.close_all()
+            self.pool = ProcessPoolExecutor(max_workers=self.render_processes)
+        return self.pool
+
+    def send_chunk(self, recipients, rendered):
+        """
+        Send a rendered chunk over one connection.
+
+        Returns (processed_recipients, sent, failed, retry_after).
+        """
+        processed = []
+        log_rows = []
+        sent = failed = 0
+        retry_after = 0
+        now = timezone.now()
+
+        connection = get_connection()
+        try:
+            connection.open()
+
+            for recipient, content in zip(recipients, rendered):
+                allowed, wait = email_rate_limiter.acquire(EmailLane.BULK)
+                if not allowed and wait <= self.MAX_INLINE_WAIT_SECONDS:
+                    time.sleep(wait)
+                    allowed, wait = email_rate_limiter.acquire(EmailLane.BULK)
+                if not allowed:
+                    retry_after = wait
+                    break
+
+                success = self.send_one(connection, recipient, content)
+
+                processed.append(recipient)
+                log_rows.append(OutboundMessage(
+                    user_id=recipient['id'],
+                    channel='email',
+                    template_key=self.broadcast.template_key,
+                    payload_json={'broadcast_id': str(self.broadcast.id)},
+                    status='sent' if success else 'failed',
+                    sent_at=now if success else None,
+                ))
+                if success:
+                    sent += 1
+                else:
+                    failed += 1
+        finally:
+            connection.close()
+
+        OutboundMessage.objects.bulk_create(log_rows)
+        return processed, sent, failed, retry_after
+
+    def send_one(self, connection, recipient, content):
+        try:
+            email = EmailMultiAlternatives(
+                subject=content['subject'] or 'Message from Quanta',
+                body=content['text'],
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[recipient['email']],
+                connection=connection,
+            )
+            email.attach_alternative(content['html'], "text/html")
+            return bool(email.send())
+        except Exception as e:
+            logger.error(f"Error sending broadcast {self.broadcast.id} to {recipient['email']}: {str(e)}")
+            return False
@@ -0,0 +1,367 @@
+"""
+Channel adapters used by the outbox to deliver OutboundMessage rows
+
+Email batches share one SMTP connection. Chat channels (Telegram, WhatsApp)
+are HTTP APIs with much higher per-second limits, so their adapters fan a
+batch out over a small thread pool on a pooled keep-alive session, drawing
+from a per-channel token bucket shared by all workers.
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.message import make_msgid
+from django.core.mail.utils import DNS_NAME
+
+from core.rate_limit import TokenBucket
+from .delivery import EmailLane, email_rate_limiter
+from .templating import template_renderer
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelAdapter:
+    """Base adapter: deliver a batch of messages over one channel"""
+
+    channel = None
+
+    def send_batch(self, messages):
+        """
+        Deliver messages and return one result dict per message, in order.
+
+        Result keys: 'status' ('sent', 'failed' or 'deferred'), plus
+        'provider_msg_id', 'error' or 'retry_after' as applicable.
+        """
+        raise NotImplementedError
+
+
+class EmailChannelAdapter(ChannelAdapter):
+    """Send email through a single SMTP connection per batch"""
+
+    channel = 'email'
+
+    def send_batch(self, messages):
+        results = []
+        connection = get_connection()
+
+        try:
+            connection.open()
+
+            for message in messages:
+                lane = (message.payload_json or {}).get('lane', EmailLane.BULK)
+                allowed, retry_after = email_rate_limiter.acquire(lane)
+                if not allowed:
+                    results.append({'status': 'deferred', 'retry_after': retry_after})
+                    continue
+
+                try:
+                    email = self.build_email(message, connection)
+                    sent = email.send()
+                    if sent:
+                        results.append({'status': 'sent', 'provider_msg_id': email.extra_headers['Message-ID']})
+                    else:
+                        results.append({'status': 'failed', 'error': 'Email send failed'})
+                except Exception as e:
+                    logger.error(f"Error sending outbound email {message.id}: {str(e)}")
+                    results.append({'status': 'failed', 'error': str(e)})
+        finally:
+            connection.close()
+
+        return results
+
+    def build_email(self, message, connection):
+        """Render an outbound row into an email"""
+        subject, html_content, text_content = render_email(message)
+
+        email = EmailMultiAlternatives(
+            subject=subject,
+            body=text_content,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[message.user.email],
+            connection=connection,
+        )
+        email.attach_alternative(html_content, "text/html")
+        # Django only makes up a Message-ID while serialising; set our own to record it
+        email.extra_headers['Message-ID'] = make_msgid(domain=DNS_NAME)
+        return email
+
+
+def render_email(message):
+    """Get (subject, html, text) for an outbound email row"""
+    from .aha_moments import AhaMoments
+    from .tasks import get_personalized_email_content, create_text_version
+
+    payload = message.payload_json or {}
+
+    # Callers may queue fully rendered content
+    if payload.get('html'):
+        html_content = payload['html']
+        return (
+            payload.get('subject', 'Message from Quanta'),
+            html_content,
+            payload.get('text') or create_text_version(html_content),
+        )
+
+    moment = AhaMoments.get_moment_by_key(message.template_key) or {}
+
+    rendered = template_renderer.render(message.template_key, 'email', template_context(message))
+    if rendered:
+        return (
+            rendered['subject'] or payload.get('subject') or moment.get('subject', 'Message from Quanta'),
+            rendered['html'],
+            rendered['text'],
+        )
+
+    html_content = get_personalized_email_content(message.user, message.template_key, payload)
+    if not html_content:
+        raise ValueError(f"Could not render template {message.template_key}")
+
+    subject = payload.get('subject') or moment.get('subject', 'Message from Quanta')
+    return subject, html_content, create_text_version(html_content)
+
+
+class ProviderRateLimited(Exception):
+    """The provider answered 429; retry after `retry_after` seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Rate limited by provider, retry after {retry_after}s')
+        self.retry_after = retry_after
+
+
+class HttpTransport:
+    """Shared pooled HTTP session for a chat provider"""
+
+    def __init__(self, pool_size=16, timeout=10):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def post(self, url, **kwargs):
+        response = self.session.post(url, timeout=self.timeout, **kwargs)
+        if response.status_code == 429:
+            raise ProviderRateLimited(float(response.headers.get('Retry-After') or 1))
+        return response
+
+
+class TelegramTransport(HttpTransport):
+    """Bot API sendMessage"""
+
+    def send(self, address, text):
+        token = getattr(settings, 'TELEGRAM_BOT_TOKEN', '')
+        response = self.post(
+            f'https://api.telegram.org/bot{token}/sendMessage',
+            json={'chat_id': address, 'text': text},
+        )
+        data = response.json()
+        if not data.get('ok'):
+            retry_after = data.get('parameters', {}).get('retry_after')
+            if retry_after:
+                raise ProviderRateLimited(float(retry_after))
+            raise ValueError(data.get('description', f'Telegram error {response.status_code}'))
+        return str(data['result']['message_id'])
+
+
+class WhatsAppTransport(HttpTransport):
+    """Cloud API /messages"""
+
+    def send(self, address, text):
+        phone_number_id = getattr(settings, 'WHATSAPP_PHONE_NUMBER_ID', '')
+        response = self.post(
+            f'https://graph.facebook.com/v19.0/{phone_number_id}/messages',
+            headers={'Authorization': f"Bearer {getattr(settings, 'WHATSAPP_ACCESS_TOKEN', '')}"},
+            json={
+                'messaging_product': 'whatsapp',
+                'to': address.lstrip('+'),
+                'type': 'text',
+                'text': {'body': text},
+            },
+        )
+        data = response.json()
+        if response.status_code >= 400:
+            raise ValueError(data.get('error', {}).get('message', f'WhatsApp error {response.status_code}'))
+        return data['messages'][0]['id']
+
+
+class MockTransport:
+    """Local stand-in provider for tests and benchmarks"""
+
+    def __init__(self, latency=0.05, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, address, text):
+        import random
+
+        time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ValueError('Mock provider failure')
+
+        provider_msg_id = uuid.uuid4().hex
+        with self._lock:
+            self.sent.append((address, text, provider_msg_id))
+        return provider_msg_id
+
+
+class ChatChannelAdapter(ChannelAdapter):
+    """Send a batch concurrently over a pooled HTTP transport under a shared rate limit"""
+
+    transport_class = None
+    max_text_length = 4096
+
+    def __init__(self, transport=None):
+        config = getattr(settings, 'CHAT_CHANNELS', {}).get(self.channel, {})
+        self.concurrency = config.get('CONCURRENCY', 8)
+        rate = config.get('RATE_PER_SECOND', 20)
+
+        if transport is None:
+            if config.get('TRANSPORT') == 'mock':
+                transport = MockTransport(latency=config.get('MOCK_LATENCY', 0.05))
+            else:
+                transport = self.transport_class(pool_size=self.concurrency, timeout=config.get('TIMEOUT', 10))
+        self.transport = transport
+        self.rate_limit = TokenBucket(f'{self.channel}:second', rate=rate, capacity=rate)
+
+    def send_batch(self, messages):
+        addresses = get_chat_addresses(self.channel, {m.user_id for m in messages})
+        jobs = []
+        for message in messages:
+            address = addresses.get(message.user_id)
+            if not address:
+                jobs.append({'status': 'failed', 'error': f'No verified {self.channel} contact'})
+            else:
+                jobs.append((address, render_chat_text(message)[:self.max_text_length]))
+        return self.deliver(jobs)
+
+    def deliver(self, jobs):
+        """
+        Send (address, text) jobs; items that are already result dicts pass through.
+
+        Rate-limit tokens are taken up front, in order, so a batch that runs
+        out of budget defers its tail instead of failing it.
+        """
+        results = [None] * len(jobs)
+        pending = []
+
+        for i, job in enumerate(jobs):
+            if isinstance(job, dict):
+                results[i] = job
+                continue
+            allowed, retry_after = self.rate_limit.consume()
+            if not allowed:
+                results[i] = {'status': 'deferred', 'retry_after': retry_after}
+                continue
+            pending.append((i, job))
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(pending))) as executor:
+                futures = [(i, executor.submit(self.send_one, *job)) for i, job in pending]
+                for i, future in futures:
+                    results[i] = future.result()
+
+        return results
+
+    def send_one(self, address, text):
+        try:
+            return {'status': 'sent', 'provider_msg_id': self.transport.send(address, text)}
+        except ProviderRateLimited as e:
+            return {'status': 'deferred', 'retry_after': e.retry_after}
+        except Exception as e:
+            logger.error(f"Error sending {self.channel} message to {address}: {str(e)}")
+            return {'status': 'failed', 'error': str(e)}
+
+
+class TelegramChannelAdapter(ChatChannelAdapter):
+    channel = 'telegram'
+    transport_class = TelegramTransport
+
+
+class WhatsAppChannelAdapter(ChatChannelAdapter):
+    channel = 'whatsapp'
+    transport_class = WhatsAppTransport
+
+
+def get_chat_addresses(channel, user_ids):
+    """user_id -> address of each user's verified, consenting contact on a chat channel"""
+    from accounts.models import ContactMethod
+
+    rows = (
+        ContactMethod.objects
+        .filter(channel=channel, user_id__in=user_ids, verified=True)
+        .exclude(consent='revoked')
+        .order_by('created_at')
+        .values_list('user_id', 'address')
+    )
+    return dict(rows)
+
+
+def render_chat_text(message):
+    """Plain text for a chat message: explicit payload text, else the email rendering's text"""
+    payload = message.payload_json or {}
+    if payload.get('text'):
+        return payload['text']
+
+    rendered = template_renderer.render(message.template_key, message.channel, template_context(message))
+    if rendered:
+        return rendered['text']
+
+    _, _, text_content = render_email(message)
+    return text_content
+
+
+def template_context(message):
+    return {
+        'user_name': message.user.name or 'Hero',
+        'user_email': message.user.email,
+        **(message.payload_json or {}),
+    }
+
+
+def resolve_channel(user):
+    """
+    Delivery channel for reminders and notifications.
+
+    The user's primary channel when it is a chat channel we can actually
+    reach them on, otherwise email.
+    """
+    from accounts.models import ChannelPreference
+
+    primary = ChannelPreference.objects.filter(user=user).values_list('primary', flat=True).first()
+    if primary in CHAT_ADAPTER_CHANNELS and get_chat_addresses(primary, [user.id]):
+        return primary
+    return 'email'
+
+
+CHANNEL_ADAPTERS = {
+    'email': EmailChannelAdapter(),
+    'telegram': TelegramChannelAdapter(),
+    'whatsapp': WhatsAppChannelAdapter(),
+}
+
+CHAT_ADAPTER_CHANNELS = ('telegram', 'whatsapp')
+
+
+def get_channel_adapter(channel):
+    """Get the adapter for a channel, or None if it is not supported yet"""
+    return CHANNEL_ADAPTERS.get(channel)
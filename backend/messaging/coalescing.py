@@ -0,0 +1,156 @@
+"""
+Coalescing of bursty notifications into per-user digests
+
+Completing several habits at once can trigger achievements, streak milestones
+and badges within seconds of each other. Instead of sending each as its own
+email, they are held as PendingNotification rows for a short window. When the
+window closes they are merged into one message on the user's primary channel,
+recorded as a single queued OutboundMessage, and delivered by the outbox.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .channels import resolve_channel
+from .delivery import EmailLane
+from .email_service import EmailService
+from .email_templates import EmailTemplates
+from .models import OutboundMessage, PendingNotification
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationCoalescer:
+    """Hold a user's notifications for a short window and send them as one email"""
+
+    @staticmethod
+    def window_seconds():
+        return getattr(settings, 'NOTIFICATION_COALESCE_WINDOW_SECONDS', 600)
+
+    @staticmethod
+    def add(user, kind, key, context=None):
+        """Hold a notification; the first one in a window schedules the flush"""
+        from .tasks import flush_pending_notifications
+
+        PendingNotification.objects.create(
+            user=user,
+            kind=kind,
+            key=key,
+            context_json=context or {},
+        )
+
+        window = NotificationCoalescer.window_seconds()
+        if cache.add(f'notification_window:{user.id}', 1, window + 60):
+            transaction.on_commit(lambda: flush_pending_notifications.apply_async(
+                args=[str(user.id)],
+                countdown=window,
+                queue=EmailLane.queue_for(EmailLane.TRANSACTIONAL),
+            ))
+            logger.info(f"Opened {window}s notification window for user {user.id}")
+
+    @staticmethod
+    def flush(user):
+        """Merge all of a user's held notifications into one queued OutboundMessage"""
+        # Anything added from here on opens a new window
+        cache.delete(f'notification_window:{user.id}')
+
+        with transaction.atomic():
+            items = list(
+                PendingNotification.objects
+                .select_for_update(skip_locked=True)
+                .filter(user=user, outbound_message__isnull=True)
+                .order_by('created_at')
+            )
+            if not items:
+                return None
+
+            channel = resolve_channel(user)
+            if channel == 'email':
+                template_key, subject, html_content, text_content = NotificationCoalescer.render(user, items)
+                payload = {
+                    'lane': EmailLane.TRANSACTIONAL,
+                    'subject': subject,
+                    'html': html_content,
+                    'text': text_content,
+                }
+            else:
+                template_key = items[0].key if len(items) == 1 else 'notification_digest'
+                payload = {'text': NotificationCoalescer.render_chat(user, items)}
+
+            message = OutboundMessage.objects.create(
+                user=user,
+                channel=channel,
+                template_key=template_key,
+                payload_json={**payload, 'merged_count': len(items)},
+                status='queued',
+            )
+            PendingNotification.objects.filter(id__in=[item.id for item in items]).update(
+                outbound_message=message
+            )
+
+        logger.info(f"Merged {len(items)} notifications for user {user.id} into message {message.id}")
+        return message
+
+    @staticmethod
+    def render(user, items):
+        """Render held items as (template_key, subject, html, text)"""
+        if len(items) == 1:
+            return NotificationCoalescer.render_single(user, items[0])
+
+        summaries = [NotificationCoalescer.summarize(item) for item in items]
+        return (
+            'notification_digest',
+            f"🏆 {len(items)} new wins, {user.name}!",
+            EmailTemplates.notification_digest(user.name, summaries),
+            EmailTemplates.notification_digest_text(user.name, summaries),
+        )
+
+    @staticmethod
+    def render_chat(user, items):
+        """Short plain-text version for chat channels"""
+        summaries = [NotificationCoalescer.summarize(item) for item in items]
+        if len(summaries) == 1:
+            s = summaries[0]
+            return f"{s['emoji']} {s['title']}\n{s['message']}"
+
+        lines = [f"🏆 {len(summaries)} new wins, {user.name}!"]
+        lines += [f"{s['emoji']} {s['title']}: {s['message']}" for s in summaries]
+        return '\n'.join(lines)
+
+    @staticmethod
+    def render_single(user, item):
+        """A lone notification keeps its own full template"""
+        from .aha_moments import AhaMoments
+        from .tasks import get_personalized_email_content, create_text_version
+
+        if item.kind == 'achievement':
+            subject, html_content, text_content = EmailService.build_achievement_content(
+                user, item.key, item.context_json
+            )
+            return f'achievement_{item.key}', subject, html_content, text_content
+
+        moment = AhaMoments.get_moment_by_key(item.key) or {}
+        html_content = get_personalized_email_content(user, item.key, item.context_json)
+        return (
+            item.key,
+            moment.get('subject', 'Message from Quanta'),
+            html_content,
+            create_text_version(html_content or ''),
+        )
+
+    @staticmethod
+    def summarize(item):
+        """One line item for the merged email"""
+        from .aha_moments import AhaMoments
+
+        if item.kind == 'achievement':
+            return EmailService.get_achievement(item.key, item.context_json)
+
+        moment = AhaMoments.get_moment_by_key(item.key) or {}
+        return {
+            'emoji': '✨',
+            'title': moment.get('name', item.key),
+            'message': moment.get('description', ''),
+        }
@@ -0,0 +1,103 @@
+"""
+Priority lanes and provider rate limiting for outbound email
+
+Every email leaves through one SMTP provider with a per-second and a daily cap.
+Sends are split into lanes, each with its own Celery queue, and all lanes draw
+from the same shared token buckets. Lower-priority lanes must leave a reserve
+in each bucket, so a bulk fan-out can never starve login codes.
+"""
+import logging
+import random
+
+from django.conf import settings
+
+from core.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class EmailLane:
+    """Delivery lanes, highest priority first"""
+
+    OTP = 'otp'
+    TRANSACTIONAL = 'transactional'
+    BULK = 'bulk'
+
+    QUEUES = {
+        OTP: 'email_otp',
+        TRANSACTIONAL: 'email_transactional',
+        BULK: 'email_bulk',
+    }
+
+    # Aha-moment categories that are a direct response to something the user did
+    TRANSACTIONAL_CATEGORIES = ('onboarding', 'achievement')
+
+    @classmethod
+    def queue_for(cls, lane):
+        """Get the Celery queue serving a lane"""
+        return cls.QUEUES.get(lane, cls.QUEUES[cls.BULK])
+
+    @classmethod
+    def for_moment(cls, moment):
+        """Pick the lane for an aha moment definition"""
+        if moment and moment.get('category') in cls.TRANSACTIONAL_CATEGORIES:
+            return cls.TRANSACTIONAL
+        return cls.BULK
+
+
+class EmailRateLimiter:
+    """Shared per-second and daily send budget with per-lane reserves"""
+
+    def __init__(self):
+        limits = getattr(settings, 'EMAIL_RATE_LIMIT', {})
+        per_second = limits.get('PER_SECOND', 5)
+        per_day = limits.get('PER_DAY', 2000)
+
+        self.reserves = limits.get('LANE_RESERVE', {})
+        self.second_bucket = TokenBucket('email:second', rate=per_second, capacity=per_second)
+        self.daily_bucket = TokenBucket('email:day', rate=per_day / 86400, capacity=per_day)
+
+    def acquire(self, lane, count=1):
+        """
+        Reserve provider capacity for `count` emails on a lane.
+
+        Returns (allowed, retry_after_seconds). Callers should defer the send
+        by `retry_after_seconds` when not allowed rather than fail it.
+        """
+        reserve_share = self.reserves.get(lane, 0)
+
+        allowed, retry_after = self.daily_bucket.consume(
+            count, reserve=self.daily_bucket.capacity * reserve_share
+        )
+        if not allowed:
+            logger.info(f"Daily email budget exhausted for lane {lane}, retry in {retry_after:.0f}s")
+            return False, retry_after
+
+        allowed, retry_after = self.second_bucket.consume(
+            count, reserve=self.second_bucket.capacity * reserve_share
+        )
+        if not allowed:
+            # Nothing is sent, so the daily budget gets its tokens back
+            self.daily_bucket.consume(-count, force=True)
+            return False, retry_after
+
+        return True, 0.0
+
+
+def defer_task(task, countdown):
+    """Re-enqueue the running Celery task on its current queue instead of failing it"""
+    delivery_info = task.request.delivery_info or {}
+
+    # Jitter keeps deferred sends from waking up in lockstep
+    countdown = max(1, countdown) + random.uniform(0, 1)
+
+    task.apply_async(
+        args=task.request.args,
+        kwargs=task.request.kwargs,
+        countdown=countdown,
+        queue=delivery_info.get('routing_key'),
+    )
+    logger.info(f"Deferred {task.name} by {countdown:.1f}s (provider rate limit)")
+
+
+email_rate_limiter = EmailRateLimiter()
@@ -0,0 +1,237 @@
+"""
+Bulk weekly and monthly progress digests
+
+Recipients are walked in user-id order (keyset pagination), so each chunk is
+one indexed range scan. Stats for a whole chunk come from two grouped
+aggregate queries, the chunk is sent over a single SMTP connection and logged
+with one bulk insert. After every chunk the position is saved on a DigestRun
+row, so a crashed or deferred run resumes where it stopped instead of
+starting over. A runner holds a lease on the row (messaging.leases) while it
+sends, so a second runner for the same period exits instead of sending
+duplicates.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import IntegrityError
+from django.db.models import Count
+from django.utils import timezone
+
+from accounts.models import User
+from habits.models import Habit, Checkin
+from .delivery import EmailLane, email_rate_limiter
+from .email_templates import EmailTemplates
+from .leases import RowLease
+from .models import DigestRun, OutboundMessage
+
+logger = logging.getLogger(__name__)
+
+
+class DigestPipeline:
+    """Send one kind of digest for one period to every active user"""
+
+    KINDS = {
+        'weekly': {
+            'template_key': 'weekly_summary',
+            'subject': '🌟 Your Weekly Hero Summary!',
+            'title': 'Weekly Hero Summary',
+            'period_label': 'this week',
+        },
+        'monthly': {
+            'template_key': 'monthly_progress',
+            'subject': '📊 Your Monthly Hero Report is Here!',
+            'title': 'Monthly Hero Report',
+            'period_label': 'last month',
+        },
+    }
+
+    # Waits shorter than this are slept through; longer ones defer the run
+    MAX_INLINE_WAIT_SECONDS = 5
+
+    def __init__(self, kind, now=None, chunk_size=None):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown digest kind: {kind}")
+
+        self.kind = kind
+        self.config = self.KINDS[kind]
+        self.chunk_size = chunk_size or getattr(settings, 'DIGEST_CHUNK_SIZE', 200)
+        self.start_date, self.end_date, self.period_key = self.get_period((now or timezone.now()).date())
+
+    def get_period(self, today):
+        """Return (start_date, end_date_exclusive, period_key) for the digest"""
+        if self.kind == 'weekly':
+            start = today - timedelta(days=7)
+            year, week, _ = today.isocalendar()
+            return start, today, f'{year}-W{week:02d}'
+
+        # Monthly digests report on the previous calendar month
+        end = today.replace(day=1)
+        start = (end - timedelta(days=1)).replace(day=1)
+        return start, end, start.strftime('%Y-%m')
+
+    def get_run(self):
+        """Get or start the checkpoint row for this period"""
+        try:
+            run, _ = DigestRun.objects.get_or_create(kind=self.kind, period_key=self.period_key)
+        except IntegrityError:
+            run = DigestRun.objects.get(kind=self.kind, period_key=self.period_key)
+        return run
+
+    def run(self):
+        """
+        Process chunks until done or rate limited.
+
+        Returns (finished, retry_after_seconds). When not finished the caller
+        should run the pipeline again after `retry_after_seconds`.
+        """
+        run = self.get_run()
+        lease = RowLease(run, getattr(settings, 'DIGEST_LEASE_SECONDS', 600))
+        if not lease.acquire():
+            logger.info(f"{self.kind} digest {self.period_key} is being sent by another worker")
+            return True, 0
+
+        try:
+            if run.status == 'completed':
+                logger.info(f"{self.kind} digest {self.period_key} already completed")
+                return True, 0
+
+            while True:
+                recipients = self.next_recipients(run.cursor)
+                if not recipients:
+                    run.status = 'completed'
+                    run.completed_at = timezone.now()
+                    lease.save('status', 'completed_at')
+                    logger.info(f"{self.kind} digest {self.period_key} completed: {run.sent_count} sent, {run.failed_count} failed")
+                    return True, 0
+
+                stats = self.get_stats([r['id'] for r in recipients])
+                processed, sent, failed, retry_after = self.send_chunk(recipients, stats)
+
+                if processed:
+                    run.cursor = processed[-1]['id']
+                    run.sent_count += sent
+                    run.failed_count += failed
+                    if not lease.save('cursor', 'sent_count', 'failed_count'):
+                        # Another runner owns the period now and resumes from its checkpoint
+                        return True, 0
+
+                if retry_after:
+                    return False, retry_after
+        finally:
+            lease.release()
+
+    def next_recipients(self, cursor):
+        """Next chunk of active users after the cursor"""
+        users = User.objects.filter(is_active=True).order_by('id')
+        if cursor:
+            users = users.filter(id__gt=cursor)
+        return list(users.values('id', 'name', 'email')[:self.chunk_size])
+
+    def get_stats(self, user_ids):
+        """Per-user habit and checkin counts for a chunk, in two grouped queries"""
+        habit_counts = dict(
+            Habit.objects.filter(user_id__in=user_ids, is_active=True)
+            .values('user_id')
+            .annotate(total=Count('id'))
+            .values_list('user_id', 'total')
+        )
+        checkin_counts = dict(
+            Checkin.objects.filter(
+                habit__user_id__in=user_ids,
+                date__gte=self.start_date,
+                date__lt=self.end_date,
+            )
+            .values('habit__user_id')
+            .annotate(total=Count('id'))
+            .values_list('habit__user_id', 'total')
+        )
+
+        days = (self.end_date - self.start_date).days
+        stats = {}
+        for user_id in user_ids:
+            total_habits = habit_counts.get(user_id, 0)
+            completed = checkin_counts.get(user_id, 0)
+            possible = total_habits * days
+            stats[user_id] = {
+                'total_habits': total_habits,
+                'completed_checkins': completed,
+                'completion_rate': (completed / possible * 100) if possible > 0 else 0,
+            }
+        return stats
+
+    def send_chunk(self, recipients, stats):
+        """
+        Render and send a chunk over one connection.
+
+        Returns (processed_recipients, sent, failed, retry_after). Stops early
+        when the daily budget runs out so the run can be checkpointed.
+        """
+        processed = []
+        log_rows = []
+        sent = failed = 0
+        retry_after = 0
+        now = timezone.now()
+
+        connection = get_connection()
+        try:
+            connection.open()
+
+            for recipient in recipients:
+                allowed, wait = email_rate_limiter.acquire(EmailLane.BULK)
+                if not allowed and wait <= self.MAX_INLINE_WAIT_SECONDS:
+                    time.sleep(wait)
+                    allowed, wait = email_rate_limiter.acquire(EmailLane.BULK)
+                if not allowed:
+                    retry_after = wait
+                    break
+
+                user_stats = stats[recipient['id']]
+                success = self.send_one(connection, recipient, user_stats)
+
+                processed.append(recipient)
+                log_rows.append(OutboundMessage(
+                    user_id=recipient['id'],
+                    channel='email',
+                    template_key=self.config['template_key'],
+                    payload_json={
+                        'period_key': self.period_key,
+                        'completion_rate': round(user_stats['completion_rate'], 1),
+                    },
+                    status='sent' if success else 'failed',
+                    sent_at=now if success else None,
+                ))
+                if success:
+                    sent += 1
+                else:
+                    failed += 1
+        finally:
+            connection.close()
+
+        OutboundMessage.objects.bulk_create(log_rows)
+        return processed, sent, failed, retry_after
+
+    def send_one(self, connection, recipient, user_stats):
+        """Send a single digest on an open connection"""
+        digest = {
+            'user_name': recipient['name'],
+            'title': self.config['title'],
+            'period_label': self.config['period_label'],
+            **user_stats,
+        }
+
+        try:
+            email = EmailMultiAlternatives(
+                subject=self.config['subject'],
+                body=EmailTemplates.progress_digest_text(**digest),
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[recipient['email']],
+                connection=connection,
+            )
+            email.attach_alternative(EmailTemplates.progress_digest(**digest), "text/html")
+            return bool(email.send())
+        except Exception as e:
+            logger.error(f"Error sending {self.kind} digest to {recipient['email']}: {str(e)}")
+            return False
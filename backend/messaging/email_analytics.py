@@ -4,77 +4,16 @@ Email Analytics System for tracking email performance and user engagement
 import uuid
 import logging
 import re
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 from django.utils import timezone
-from django.db import models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import ExtractHour, TruncDate
 from django.core.cache import cache
 
-logger = logging.getLogger(__name__)
-
+from .link_tracking import add_click_tracking
+from .models import EmailAnalyticsModel, EmailClickModel, EmailDailyRollup
 
-class EmailAnalyticsModel(models.Model):
-    """Model to track email analytics"""
-    
-    STATUS_CHOICES = [
-        ('sent', 'Sent'),
-        ('delivered', 'Delivered'),
-        ('opened', 'Opened'),
-        ('clicked', 'Clicked'),
-        ('bounced', 'Bounced'),
-        ('unsubscribed', 'Unsubscribed'),
-    ]
-    
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    tracking_id = models.CharField(max_length=255, unique=True, db_index=True)
-    user = models.ForeignKey('accounts.User', on_delete=models.CASCADE, related_name='email_analytics')
-    template_key = models.CharField(max_length=100)
-    message_id = models.CharField(max_length=255, blank=True)
-    
-    # Timestamps
-    sent_at = models.DateTimeField(auto_now_add=True)
-    delivered_at = models.DateTimeField(null=True, blank=True)
-    opened_at = models.DateTimeField(null=True, blank=True)
-    first_clicked_at = models.DateTimeField(null=True, blank=True)
-    
-    # Analytics data
-    open_count = models.IntegerField(default=0)
-    click_count = models.IntegerField(default=0)
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='sent')
-    
-    # Device and location info
-    user_agent = models.TextField(blank=True)
-    ip_address = models.GenericIPAddressField(null=True, blank=True)
-    device_type = models.CharField(max_length=50, blank=True)
-    
-    # Additional metadata
-    metadata = models.JSONField(default=dict, blank=True)
-    
-    class Meta:
-        db_table = 'email_analytics'
-        ordering = ['-sent_at']
-        indexes = [
-            models.Index(fields=['user', 'template_key']),
-            models.Index(fields=['tracking_id']),
-            models.Index(fields=['sent_at']),
-        ]
-    
-    def __str__(self):
-        return f"{self.user.email} - {self.template_key} - {self.status}"
-
-
-class EmailClickModel(models.Model):
-    """Model to track individual email clicks"""
-    
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    analytics = models.ForeignKey(EmailAnalyticsModel, on_delete=models.CASCADE, related_name='clicks')
-    url = models.URLField()
-    clicked_at = models.DateTimeField(auto_now_add=True)
-    user_agent = models.TextField(blank=True)
-    ip_address = models.GenericIPAddressField(null=True, blank=True)
-    
-    class Meta:
-        db_table = 'email_clicks'
-        ordering = ['-clicked_at']
+logger = logging.getLogger(__name__)
 
 
 class EmailAnalytics:
@@ -178,26 +117,7 @@ class EmailAnalytics:
     def add_click_tracking(html_content, tracking_id):
         """Add click tracking to all links in HTML content"""
         try:
-            # Find all links and replace with tracking URLs
-            def replace_link(match):
-                full_match = match.group(0)
-                url = match.group(1)
-                
-                # Skip already tracked URLs and tracking pixels
-                if 'track/click' in url or 'track/open' in url:
-                    return full_match
-                
-                # Create tracked URL
-                tracked_url = f'https://quanta.app/api/email/track/click/{tracking_id}?url={url}'
-                
-                # Replace the href attribute
-                return full_match.replace(f'href="{url}"', f'href="{tracked_url}"')
-            
-            # Pattern to match href attributes
-            link_pattern = r'href="([^"]+)"'
-            tracked_html = re.sub(link_pattern, replace_link, html_content)
-            
-            return tracked_html
+            return add_click_tracking(html_content, tracking_id)
             
         except Exception as e:
             logger.error(f"Error adding click tracking: {str(e)}")
@@ -220,40 +140,88 @@ class EmailAnalytics:
         else:
             return 'unknown'
     
+    @staticmethod
+    def get_period_counts(days, template_key=None, group_by_template=False):
+        """
+        Sent/opened/clicked/unsubscribed counts since `days` ago.
+        
+        Whole days come from EmailDailyRollup; today, and any day the rollup
+        has not covered yet, is aggregated live from the raw table, so the
+        result stays current without scanning history.
+        """
+        today = timezone.now().date()
+        since_date = today - timedelta(days=days)
+        fields = ['sent', 'opened', 'clicked', 'unsubscribed']
+        
+        rollups = EmailDailyRollup.objects.filter(date__gte=since_date, date__lt=today)
+        rolled_up = set(rollups.values_list('date', flat=True).distinct())
+        missing = [since_date + timedelta(days=n) for n in range(days)]
+        missing = [day for day in missing if day not in rolled_up]
+        live = EmailAnalyticsModel.objects.filter(
+            Q(sent_at__date__gte=today) | Q(sent_at__date__in=missing)
+        )
+        if template_key:
+            rollups = rollups.filter(template_key=template_key)
+            live = live.filter(template_key=template_key)
+        
+        rollup_sums = {f: Sum(f) for f in fields}
+        live_counts = EmailAnalytics.count_expressions()
+        
+        if group_by_template:
+            rows = list(rollups.values('template_key').annotate(**rollup_sums))
+            rows += list(live.values('template_key').annotate(**live_counts))
+        else:
+            rows = [rollups.aggregate(**rollup_sums), live.aggregate(**live_counts)]
+        
+        totals = {}
+        for row in rows:
+            key = row.get('template_key')
+            bucket = totals.setdefault(key, dict.fromkeys(fields, 0))
+            for f in fields:
+                bucket[f] += row.get(f) or 0
+        
+        if group_by_template:
+            return totals
+        return totals.get(None, dict.fromkeys(fields, 0))
+    
+    @staticmethod
+    def count_expressions():
+        """Conditional aggregates over EmailAnalyticsModel rows"""
+        return {
+            'sent': Count('id'),
+            'opened': Count('id', filter=Q(opened_at__isnull=False)),
+            'clicked': Count('id', filter=Q(first_clicked_at__isnull=False)),
+            'unsubscribed': Count('id', filter=Q(status='unsubscribed')),
+        }
+    
+    @staticmethod
+    def build_performance_stats(counts, days):
+        """Turn raw counts into the performance stats dict"""
+        total_sent = counts['sent']
+        total_opened = counts['opened']
+        total_clicked = counts['clicked']
+        
+        # Calculate rates
+        open_rate = (total_opened / total_sent * 100) if total_sent > 0 else 0
+        click_rate = (total_clicked / total_sent * 100) if total_sent > 0 else 0
+        click_through_rate = (total_clicked / total_opened * 100) if total_opened > 0 else 0
+        
+        return {
+            'total_sent': total_sent,
+            'total_opened': total_opened,
+            'total_clicked': total_clicked,
+            'open_rate': round(open_rate, 2),
+            'click_rate': round(click_rate, 2),
+            'click_through_rate': round(click_through_rate, 2),
+            'period_days': days
+        }
+    
     @staticmethod
     def get_email_performance_stats(template_key=None, days=30):
         """Get email performance statistics"""
         try:
-            # Date filter
-            since_date = timezone.now() - timedelta(days=days)
-            
-            # Base queryset
-            queryset = EmailAnalyticsModel.objects.filter(sent_at__gte=since_date)
-            
-            if template_key:
-                queryset = queryset.filter(template_key=template_key)
-            
-            # Calculate stats
-            total_sent = queryset.count()
-            total_opened = queryset.filter(opened_at__isnull=False).count()
-            total_clicked = queryset.filter(first_clicked_at__isnull=False).count()
-            
-            # Calculate rates
-            open_rate = (total_opened / total_sent * 100) if total_sent > 0 else 0
-            click_rate = (total_clicked / total_sent * 100) if total_sent > 0 else 0
-            click_through_rate = (total_clicked / total_opened * 100) if total_opened > 0 else 0
-            
-            stats = {
-                'total_sent': total_sent,
-                'total_opened': total_opened,
-                'total_clicked': total_clicked,
-                'open_rate': round(open_rate, 2),
-                'click_rate': round(click_rate, 2),
-                'click_through_rate': round(click_through_rate, 2),
-                'period_days': days
-            }
-            
-            return stats
+            counts = EmailAnalytics.get_period_counts(days, template_key=template_key)
+            return EmailAnalytics.build_performance_stats(counts, days)
             
         except Exception as e:
             logger.error(f"Error getting email performance stats: {str(e)}")
@@ -263,17 +231,11 @@ class EmailAnalytics:
     def get_template_performance(days=30):
         """Get performance stats by template"""
         try:
-            since_date = timezone.now() - timedelta(days=days)
-            
-            templates = EmailAnalyticsModel.objects.filter(
-                sent_at__gte=since_date
-            ).values('template_key').distinct()
+            counts_by_template = EmailAnalytics.get_period_counts(days, group_by_template=True)
             
             template_stats = []
-            
-            for template in templates:
-                template_key = template['template_key']
-                stats = EmailAnalytics.get_email_performance_stats(template_key, days)
+            for template_key, counts in counts_by_template.items():
+                stats = EmailAnalytics.build_performance_stats(counts, days)
                 stats['template_key'] = template_key
                 template_stats.append(stats)
             
@@ -292,21 +254,25 @@ class EmailAnalytics:
         try:
             since_date = timezone.now() - timedelta(days=days)
             
-            analytics = EmailAnalyticsModel.objects.filter(
+            totals = EmailAnalyticsModel.objects.filter(
                 user=user,
                 sent_at__gte=since_date
+            ).aggregate(
+                total_sent=Count('id'),
+                total_opens=Sum('open_count'),
+                total_clicks=Sum('click_count'),
             )
             
-            if not analytics.exists():
+            total_sent = totals['total_sent']
+            if not total_sent:
                 return 0
             
-            total_sent = analytics.count()
-            total_opens = sum(a.open_count for a in analytics)
-            total_clicks = sum(a.click_count for a in analytics)
+            total_opens = totals['total_opens'] or 0
+            total_clicks = totals['total_clicks'] or 0
             
             # Calculate engagement score (0-100)
-            open_score = min(total_opens / total_sent * 50, 50) if total_sent > 0 else 0
-            click_score = min(total_clicks / total_sent * 50, 50) if total_sent > 0 else 0
+            open_score = min(total_opens / total_sent * 50, 50)
+            click_score = min(total_clicks / total_sent * 50, 50)
             
             engagement_score = open_score + click_score
             
@@ -327,29 +293,22 @@ class EmailAnalytics:
             if user:
                 queryset = queryset.filter(user=user)
             
-            # Group by hour of day
-            hourly_stats = {}
-            
-            for analytics in queryset:
-                hour = analytics.sent_at.hour
-                
-                if hour not in hourly_stats:
-                    hourly_stats[hour] = {'sent': 0, 'opened': 0}
-                
-                hourly_stats[hour]['sent'] += 1
-                if analytics.opened_at:
-                    hourly_stats[hour]['opened'] += 1
-            
-            # Calculate open rates by hour
-            hourly_rates = []
-            for hour, stats in hourly_stats.items():
-                if stats['sent'] >= 5:  # Minimum sample size
-                    open_rate = (stats['opened'] / stats['sent']) * 100
-                    hourly_rates.append({
-                        'hour': hour,
-                        'open_rate': round(open_rate, 2),
-                        'sample_size': stats['sent']
-                    })
+            # Group by hour of day (UTC), minimum sample size of 5 per hour
+            hourly_stats = queryset.annotate(
+                hour=ExtractHour('sent_at', tzinfo=dt_timezone.utc)
+            ).values('hour').annotate(
+                sent=Count('id'),
+                opened=Count('id', filter=Q(opened_at__isnull=False)),
+            ).filter(sent__gte=5)
+            
+            hourly_rates = [
+                {
+                    'hour': stats['hour'],
+                    'open_rate': round(stats['opened'] / stats['sent'] * 100, 2),
+                    'sample_size': stats['sent']
+                }
+                for stats in hourly_stats
+            ]
             
             # Sort by open rate
             hourly_rates.sort(key=lambda x: x['open_rate'], reverse=True)
@@ -360,6 +319,51 @@ class EmailAnalytics:
             logger.error(f"Error analyzing best send times: {str(e)}")
             return []
     
+    @staticmethod
+    def rollup_daily_stats(days=7):
+        """
+        Recompute EmailDailyRollup rows for the last `days` complete days.
+        
+        Opens and clicks keep arriving after the send date, so recent days
+        are recomputed on every run; older days settle and stay fixed.
+        """
+        try:
+            today = timezone.now().date()
+            since_date = today - timedelta(days=days)
+            
+            rows = EmailAnalyticsModel.objects.filter(
+                sent_at__date__gte=since_date,
+                sent_at__date__lt=today,
+            ).annotate(
+                day=TruncDate('sent_at')
+            ).values('day', 'template_key').annotate(**EmailAnalytics.count_expressions())
+            
+            rollups = [
+                EmailDailyRollup(
+                    date=row['day'],
+                    template_key=row['template_key'],
+                    sent=row['sent'],
+                    opened=row['opened'],
+                    clicked=row['clicked'],
+                    unsubscribed=row['unsubscribed'],
+                )
+                for row in rows
+            ]
+            
+            EmailDailyRollup.objects.bulk_create(
+                rollups,
+                update_conflicts=True,
+                unique_fields=['date', 'template_key'],
+                update_fields=['sent', 'opened', 'clicked', 'unsubscribed', 'updated_at'],
+            )
+            
+            logger.info(f"Rolled up {len(rollups)} daily email stats rows")
+            return len(rollups)
+            
+        except Exception as e:
+            logger.error(f"Error rolling up email stats: {str(e)}")
+            return 0
+    
     @staticmethod
     def cleanup_old_analytics(days=180):
         """Clean up old analytics data"""
@@ -391,15 +395,10 @@ class EmailAnalytics:
     def get_unsubscribe_rate(template_key=None, days=30):
         """Calculate unsubscribe rate for emails"""
         try:
-            since_date = timezone.now() - timedelta(days=days)
-            
-            queryset = EmailAnalyticsModel.objects.filter(sent_at__gte=since_date)
-            
-            if template_key:
-                queryset = queryset.filter(template_key=template_key)
+            counts = EmailAnalytics.get_period_counts(days, template_key=template_key)
             
-            total_sent = queryset.count()
-            unsubscribed = queryset.filter(status='unsubscribed').count()
+            total_sent = counts['sent']
+            unsubscribed = counts['unsubscribed']
             
             unsubscribe_rate = (unsubscribed / total_sent * 100) if total_sent > 0 else 0
             
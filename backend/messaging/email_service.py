@@ -185,76 +185,90 @@ class EmailService:
             logger.error(f"Error sending habit reminder: {str(e)}")
             return False
     
+    @staticmethod
+    def get_achievement(achievement_type, details):
+        """Get the emoji, title and message for an achievement type"""
+        achievements = {
+            'first_habit': {'emoji': '🌟', 'title': 'First Quest Completed!', 'message': 'You\'ve started your hero journey!'},
+            'streak_7': {'emoji': '🔥', 'title': 'Week Warrior!', 'message': 'Amazing! 7 days in a row!'},
+            'streak_30': {'emoji': '💎', 'title': 'Diamond Hero!', 'message': 'Incredible! 30 days of consistency!'},
+            'level_up': {'emoji': '⚡', 'title': 'Level Up!', 'message': f'You\'ve reached level {details.get("level", "2")}!'},
+        }
+        
+        return achievements.get(achievement_type, achievements['first_habit'])
+    
+    @staticmethod
+    def build_achievement_content(user, achievement_type, details):
+        """Render (subject, html_content, text_content) for an achievement notification"""
+        achievement = EmailService.get_achievement(achievement_type, details)
+        
+        subject = f"{achievement['emoji']} {achievement['title']}"
+        
+        html_content = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <title>Achievement Unlocked!</title>
+        </head>
+        <body style="font-family: Arial, sans-serif; background: linear-gradient(135deg, #ffd89b 0%, #19547b 100%); margin: 0; padding: 20px;">
+            <div style="max-width: 600px; margin: 0 auto; background: white; border-radius: 20px; padding: 40px; box-shadow: 0 10px 30px rgba(0,0,0,0.1);">
+                <div style="text-align: center; margin-bottom: 30px;">
+                    <div style="font-size: 80px; margin-bottom: 20px; animation: bounce 2s infinite;">{achievement['emoji']}</div>
+                    <h1 style="color: #19547b; margin: 0; font-size: 32px;">Achievement Unlocked!</h1>
+                    <h2 style="color: #ffd89b; margin: 10px 0; font-size: 24px; text-shadow: 2px 2px 4px rgba(0,0,0,0.3);">{achievement['title']}</h2>
+                </div>
+
+                <div style="background: linear-gradient(135deg, #ffd89b 0%, #19547b 100%); border-radius: 15px; padding: 30px; text-align: center; margin: 30px 0;">
+                    <h3 style="color: white; margin: 0; font-size: 20px;">Hey {user.name}! 🎉</h3>
+                    <p style="color: white; font-size: 18px; margin: 15px 0;">{achievement['message']}</p>
+                    <p style="color: white; font-size: 16px;">Keep up the amazing work, hero! 💪</p>
+                </div>
+
+                <div style="text-align: center; margin: 30px 0;">
+                    <a href="https://quanta.app" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; text-decoration: none; padding: 15px 30px; border-radius: 25px; font-weight: bold; font-size: 18px; display: inline-block;">
+                        🚀 Continue Your Journey!
+                    </a>
+                </div>
+
+                <div style="border-top: 1px solid #eee; padding-top: 20px; margin-top: 30px; text-align: center;">
+                    <p style="color: #999; font-size: 12px;">
+                        You're building something amazing! 🌟<br>
+                        Every small step counts! ✨
+                    </p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+
+        text_content = f"""
+        🎉 Achievement Unlocked! 🎉
+
+        {achievement['title']}
+
+        Hey {user.name}!
+
+        {achievement['message']}
+
+        Keep up the amazing work, hero! 💪
+
+        Continue your journey at: https://quanta.app
+
+        You're building something amazing! 🌟
+        Every small step counts! ✨
+        """
+        
+        return subject, html_content, text_content
+    
     @staticmethod
     def send_achievement_notification(user, achievement_type, details):
         """Send achievement notification"""
         try:
-            achievements = {
-                'first_habit': {'emoji': '🌟', 'title': 'First Quest Completed!', 'message': 'You\'ve started your hero journey!'},
-                'streak_7': {'emoji': '🔥', 'title': 'Week Warrior!', 'message': 'Amazing! 7 days in a row!'},
-                'streak_30': {'emoji': '💎', 'title': 'Diamond Hero!', 'message': 'Incredible! 30 days of consistency!'},
-                'level_up': {'emoji': '⚡', 'title': 'Level Up!', 'message': f'You\'ve reached level {details.get("level", "2")}!'},
-            }
-            
-            achievement = achievements.get(achievement_type, achievements['first_habit'])
-            
-            subject = f"{achievement['emoji']} {achievement['title']}"
-            
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="utf-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <title>Achievement Unlocked!</title>
-            </head>
-            <body style="font-family: Arial, sans-serif; background: linear-gradient(135deg, #ffd89b 0%, #19547b 100%); margin: 0; padding: 20px;">
-                <div style="max-width: 600px; margin: 0 auto; background: white; border-radius: 20px; padding: 40px; box-shadow: 0 10px 30px rgba(0,0,0,0.1);">
-                    <div style="text-align: center; margin-bottom: 30px;">
-                        <div style="font-size: 80px; margin-bottom: 20px; animation: bounce 2s infinite;">{achievement['emoji']}</div>
-                        <h1 style="color: #19547b; margin: 0; font-size: 32px;">Achievement Unlocked!</h1>
-                        <h2 style="color: #ffd89b; margin: 10px 0; font-size: 24px; text-shadow: 2px 2px 4px rgba(0,0,0,0.3);">{achievement['title']}</h2>
-                    </div>
-                    
-                    <div style="background: linear-gradient(135deg, #ffd89b 0%, #19547b 100%); border-radius: 15px; padding: 30px; text-align: center; margin: 30px 0;">
-                        <h3 style="color: white; margin: 0; font-size: 20px;">Hey {user.name}! 🎉</h3>
-                        <p style="color: white; font-size: 18px; margin: 15px 0;">{achievement['message']}</p>
-                        <p style="color: white; font-size: 16px;">Keep up the amazing work, hero! 💪</p>
-                    </div>
-                    
-                    <div style="text-align: center; margin: 30px 0;">
-                        <a href="https://quanta.app" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; text-decoration: none; padding: 15px 30px; border-radius: 25px; font-weight: bold; font-size: 18px; display: inline-block;">
-                            🚀 Continue Your Journey!
-                        </a>
-                    </div>
-                    
-                    <div style="border-top: 1px solid #eee; padding-top: 20px; margin-top: 30px; text-align: center;">
-                        <p style="color: #999; font-size: 12px;">
-                            You're building something amazing! 🌟<br>
-                            Every small step counts! ✨
-                        </p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            text_content = f"""
-            🎉 Achievement Unlocked! 🎉
-            
-            {achievement['title']}
-            
-            Hey {user.name}!
-            
-            {achievement['message']}
-            
-            Keep up the amazing work, hero! 💪
-            
-            Continue your journey at: https://quanta.app
-            
-            You're building something amazing! 🌟
-            Every small step counts! ✨
-            """
+            subject, html_content, text_content = EmailService.build_achievement_content(
+                user, achievement_type, details
+            )
             
             email = EmailMultiAlternatives(
                 subject=subject,
@@ -720,6 +720,128 @@ class EmailTemplates:
             accent_gradient="#667eea 0%, #764ba2 100%"
         )
     
+    @staticmethod
+    def progress_digest(user_name, title, period_label, total_habits, completed_checkins, completion_rate):
+        """Weekly or monthly progress digest"""
+        encouragement = "Amazing work! Keep it up! 🌟" if completion_rate >= 70 else "Every step counts! You're building great habits! 💪"
+        
+        return f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <title>{title}</title>
+        </head>
+        <body style="font-family: Arial, sans-serif; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); margin: 0; padding: 20px;">
+            <div style="max-width: 600px; margin: 0 auto; background: white; border-radius: 20px; padding: 40px;">
+                <div style="text-align: center; margin-bottom: 30px;">
+                    <div style="font-size: 60px; margin-bottom: 20px;">📊</div>
+                    <h1 style="color: #667eea; margin: 0; font-size: 28px;">{title}</h1>
+                    <p style="color: #666; font-size: 18px;">Hey {user_name}! Here's how you did {period_label}! 🎉</p>
+                </div>
+                
+                <div style="background: linear-gradient(135deg, #84fab0 0%, #8fd3f4 100%); border-radius: 15px; padding: 30px; margin: 30px 0;">
+                    <h2 style="color: white; text-align: center; margin-bottom: 20px;">Your Stats</h2>
+                    <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 20px; text-align: center;">
+                        <div style="background: white; border-radius: 10px; padding: 20px;">
+                            <div style="font-size: 32px; font-weight: bold; color: #667eea;">{total_habits}</div>
+                            <div style="color: #666;">Active Quests</div>
+                        </div>
+                        <div style="background: white; border-radius: 10px; padding: 20px;">
+                            <div style="font-size: 32px; font-weight: bold; color: #667eea;">{completed_checkins}</div>
+                            <div style="color: #666;">Completed</div>
+                        </div>
+                    </div>
+                    <div style="background: white; border-radius: 10px; padding: 20px; margin-top: 20px; text-align: center;">
+                        <div style="font-size: 32px; font-weight: bold; color: #667eea;">{completion_rate:.1f}%</div>
+                        <div style="color: #666;">Completion Rate</div>
+                    </div>
+                </div>
+                
+                <div style="text-align: center; margin: 30px 0;">
+                    <p style="color: #666; font-size: 16px;">{encouragement}</p>
+                    <a href="https://quanta.app" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; text-decoration: none; padding: 15px 30px; border-radius: 25px; font-weight: bold; display: inline-block; margin-top: 20px;">
+                        🚀 Continue Your Journey
+                    </a>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+    
+    @staticmethod
+    def progress_digest_text(user_name, title, period_label, total_habits, completed_checkins, completion_rate):
+        """Plain text version of the progress digest"""
+        encouragement = "Amazing work! Keep it up! 🌟" if completion_rate >= 70 else "Every step counts! You're building great habits! 💪"
+        
+        return f"""
+        {title} for {user_name}!
+        
+        Your Stats {period_label.capitalize()}:
+        - Active Quests: {total_habits}
+        - Completed: {completed_checkins}
+        - Completion Rate: {completion_rate:.1f}%
+        
+        {encouragement}
+        
+        Continue your journey at: https://quanta.app
+        """
+    
+    @staticmethod
+    def notification_digest(user_name, items):
+        """Several notifications merged into one email"""
+        rows = "".join(
+            f"""
+                    <div style="background: white; border-radius: 10px; padding: 20px; margin-bottom: 15px;">
+                        <div style="font-size: 20px; font-weight: bold; color: #19547b;">{item.get('emoji', '🎉')} {item['title']}</div>
+                        <div style="color: #666; font-size: 16px; margin-top: 5px;">{item['message']}</div>
+                    </div>"""
+            for item in items
+        )
+        
+        return f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <title>Your Latest Wins</title>
+        </head>
+        <body style="font-family: Arial, sans-serif; background: linear-gradient(135deg, #ffd89b 0%, #19547b 100%); margin: 0; padding: 20px;">
+            <div style="max-width: 600px; margin: 0 auto; background: white; border-radius: 20px; padding: 40px;">
+                <div style="text-align: center; margin-bottom: 30px;">
+                    <div style="font-size: 60px; margin-bottom: 20px;">🏆</div>
+                    <h1 style="color: #19547b; margin: 0; font-size: 28px;">{len(items)} New Wins!</h1>
+                    <p style="color: #666; font-size: 18px;">Hey {user_name}! You've been busy - here's everything you just unlocked! 🎉</p>
+                </div>
+                
+                <div style="background: linear-gradient(135deg, #ffd89b 0%, #19547b 100%); border-radius: 15px; padding: 30px 30px 15px; margin: 30px 0;">{rows}
+                </div>
+                
+                <div style="text-align: center; margin: 30px 0;">
+                    <a href="https://quanta.app" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; text-decoration: none; padding: 15px 30px; border-radius: 25px; font-weight: bold; display: inline-block;">
+                        🚀 Continue Your Journey
+                    </a>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+    
+    @staticmethod
+    def notification_digest_text(user_name, items):
+        """Plain text version of the notification digest"""
+        rows = "\n".join(f"- {item.get('emoji', '🎉')} {item['title']}: {item['message']}" for item in items)
+        
+        return f"""
+        {len(items)} New Wins!
+        
+        Hey {user_name}! Here's everything you just unlocked:
+        
+{rows}
+        
+        Continue your journey at: https://quanta.app
+        """
+    
     @staticmethod
     def get_template_by_key(template_key, **kwargs):
         """Get template by key with parameters"""
@@ -0,0 +1,421 @@
+"""
+Inbound chat message processing
+
+Unprocessed InboundMessage rows are claimed in batches with SELECT ... FOR
+UPDATE SKIP LOCKED, so several workers can drain a burst side by side. Each
+message goes through a compiled rule parser first; recognized check-ins and
+moods for the whole batch are written with one bulk upsert each, and the
+short confirmations are queued on the outbox in one insert. Only messages the
+rules cannot resolve are handed to the LLM, several per prompt, with no
+transaction open while it runs. bulk_create sends no post_save, so the
+batch queues embedding jobs for its check-ins and moods itself.
+"""
+import json
+import logging
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from habits.models import Checkin, Habit, Mood
+from .models import InboundMessage, OutboundMessage
+
+logger = logging.getLogger(__name__)
+
+
+CHAT_CHANNELS = ('telegram', 'whatsapp')
+
+MOOD_WORDS = {
+    'awful': 1, 'terrible': 1, 'horrible': 1,
+    'bad': 2, 'sad': 2, 'down': 2, 'tired': 2, 'mal': 2,
+    'meh': 3, 'ok': 3, 'okay': 3, 'fine': 3, 'normal': 3,
+    'good': 4, 'happy': 4, 'bien': 4,
+    'great': 5, 'amazing': 5, 'awesome': 5, 'excellent': 5, 'genial': 5,
+}
+
+MOOD_EMOJI = {'😭': 1, '😢': 1, '😞': 2, '😔': 2, '😐': 3, '🙂': 4, '😊': 4, '😄': 5, '😁': 5, '🤩': 5}
+
+HELP_TEXT = (
+    "Reply 'done' to check in (add the habit name if you have several), "
+    "'skip' to log a skipped day, or 'mood 1-5' to log how you feel."
+)
+
+
+class IntentParser:
+    """Rule-based intent parser; returns None when the text is ambiguous"""
+
+    HELP = re.compile(r'^\s*/?(?:help|start|commands|menu|ayuda)\s*[?!.]*\s*$|^\s*\?+\s*$', re.IGNORECASE)
+    CHECKIN = re.compile(
+        r'^\s*/?(?:done|did it|completed?|finished|yes|yep|si|sí|hecho|listo|✅|✔️|👍)(?:[\s,:!.-]+(?P<rest>.*))?$',
+        re.IGNORECASE | re.DOTALL,
+    )
+    SKIP = re.compile(
+        # A bare 'no' is a reply to a reminder; 'no ...' is usually just conversation
+        r'^\s*/?(?:(?:skip|skipped|missed|not today|hoy no|❌)(?:[\s,:!.-]+(?P<rest>.*))?|no|nope)\s*[!.]*$',
+        re.IGNORECASE | re.DOTALL,
+    )
+    MOOD = re.compile(
+        r'^\s*/?(?:mood|feeling|i feel|i\'?m feeling|[aá]nimo)\s*[:=-]?\s*(?P<value>[1-5]|\w+)(?:\s*/\s*5)?(?:[\s,:!.-]+(?P<rest>.*))?$',
+        re.IGNORECASE | re.DOTALL,
+    )
+    SCORE = re.compile(r'^\s*(?P<value>[1-5])\s*/\s*5\s*(?:[\s,:!.-]+(?P<rest>.*))?$', re.DOTALL)
+
+    @classmethod
+    def parse(cls, text):
+        text = (text or '').strip()
+        if not text:
+            return None
+
+        if cls.HELP.match(text):
+            return {'intent': 'help'}
+
+        match = cls.MOOD.match(text) or cls.SCORE.match(text)
+        if match:
+            value = match.group('value').lower()
+            score = int(value) if value.isdigit() else MOOD_WORDS.get(value)
+            if score:
+                return {'intent': 'mood', 'score': score, 'note': (match.group('rest') or '').strip()}
+
+        if text in MOOD_EMOJI:
+            return {'intent': 'mood', 'score': MOOD_EMOJI[text], 'note': ''}
+
+        for pattern, value in ((cls.CHECKIN, True), (cls.SKIP, False)):
+            match = pattern.match(text)
+            if match:
+                return {'intent': 'checkin', 'value': value, 'rest': (match.group('rest') or '').strip()}
+
+        return None
+
+
+def resolve_habit(rest, habits):
+    """
+    Pick the habit a check-in refers to from the text after 'done'.
+
+    Returns (habit, note), or (None, rest) when it cannot be decided.
+    """
+    if not habits:
+        return None, rest
+
+    lowered = rest.lower()
+    if lowered.isdigit() and 1 <= int(lowered) <= len(habits):
+        return habits[int(lowered) - 1], ''
+
+    named = [h for h in habits if h.title.lower() in lowered]
+    if len(named) == 1:
+        note = re.sub(re.escape(named[0].title), '', rest, count=1, flags=re.IGNORECASE).strip(' ,:-')
+        return named[0], note
+
+    if len(habits) == 1:
+        return habits[0], rest
+
+    return None, rest
+
+
+class InboundBatch:
+    """Writes collected while processing one batch"""
+
+    def __init__(self):
+        self.checkins = {}
+        self.moods = {}
+        self.replies = []
+        self.active_users = {}
+
+    def add_checkin(self, message, habit, value, note):
+        day = timezone.localdate(message.created_at)
+        # Later messages for the same habit and day win
+        self.checkins[(habit.id, day)] = Checkin(
+            habit=habit, date=day, value=value, note=note, channel=message.channel
+        )
+        self.touch(message)
+
+    def add_mood(self, message, score, note):
+        day = timezone.localdate(message.created_at)
+        channel = message.channel if message.channel in CHAT_CHANNELS else 'web'
+        self.moods[(message.user_id, day)] = Mood(
+            user_id=message.user_id, date=day, score=score, note=note, channel=channel
+        )
+        self.touch(message)
+
+    def reply(self, message, text):
+        if message.channel not in CHAT_CHANNELS:
+            return
+        self.replies.append(OutboundMessage(
+            user_id=message.user_id,
+            channel=message.channel,
+            template_key='inbound_reply',
+            payload_json={'text': text, 'in_reply_to': str(message.id)},
+        ))
+
+    def touch(self, message):
+        self.active_users[message.user_id] = max(message.created_at, self.active_users.get(message.user_id, message.created_at))
+
+    def write(self):
+        """Bulk upsert everything collected; call inside the claiming transaction"""
+        from accounts.models import User
+        from .tasks import process_checkin_event, process_outbox
+
+        checkins = list(self.checkins.values())
+        existing = self.existing_checkins(checkins)
+        if checkins:
+            Checkin.objects.bulk_create(
+                checkins,
+                update_conflicts=True,
+                unique_fields=['habit', 'date'],
+                update_fields=['value', 'note', 'channel'],
+            )
+        if self.moods:
+            Mood.objects.bulk_create(
+                list(self.moods.values()),
+                update_conflicts=True,
+                unique_fields=['user', 'date'],
+                update_fields=['score', 'note', 'channel'],
+            )
+        if self.replies:
+            OutboundMessage.objects.bulk_create(self.replies)
+
+        # bulk_create skips post_save, so do what the signals would have done
+        self.queue_embeddings(checkins + list(self.moods.values()))
+        # Like the post_save signal, only new completed check-ins are published
+        completed = [
+            str(c.id) for c in checkins
+            if c.value and c.id and (c.habit_id, c.date) not in existing
+        ]
+        active_users = dict(self.active_users)
+        checkin_users = list({c.habit.user_id for c in checkins})
+
+        def after_commit():
+            from reports.cache import report_cache
+
+            for user_id, when in active_users.items():
+                User.objects.record_activity(user_id, when)
+            if checkin_users:
+                report_cache.invalidate(checkin_users)
+            for checkin_id in completed:
+                process_checkin_event.delay(checkin_id)
+            if self.replies:
+                process_outbox.delay()
+
+        transaction.on_commit(after_commit)
+
+    @staticmethod
+    def existing_checkins(checkins):
+        """(habit id, date) of the check-ins the upsert will update rather than create"""
+        if not checkins:
+            return set()
+        rows = Checkin.objects.filter(
+            habit_id__in={c.habit_id for c in checkins},
+            date__in={c.date for c in checkins},
+        ).values_list('habit_id', 'date')
+        return set(rows)
+
+    @staticmethod
+    def queue_embeddings(instances):
+        from ai_services.embeddings import enqueue_bulk
+
+        try:
+            enqueue_bulk(instances)
+        except Exception as e:
+            # Never fail the batch over an embedding
+            logger.error(f"Error queueing embeddings for inbound writes: {str(e)}")
+
+
+class InboundProcessor:
+    """Claim unprocessed inbound messages and apply them in bulk"""
+
+    def __init__(self, batch_size=None):
+        config = getattr(settings, 'INBOUND', {})
+        self.batch_size = batch_size or config.get('BATCH_SIZE', 200)
+        self.llm_batch_size = config.get('LLM_BATCH_SIZE', 20)
+
+    def run_once(self):
+        """Process one batch. Returns the number of messages claimed."""
+        from .tasks import parse_inbound_with_llm
+
+        with transaction.atomic():
+            messages = list(
+                InboundMessage.objects
+                .select_for_update(skip_locked=True, of=('self',))
+                .filter(processed=False)
+                .order_by('created_at')[:self.batch_size]
+            )
+            if not messages:
+                return 0
+
+            habits = load_active_habits({m.user_id for m in messages})
+            batch = InboundBatch()
+            ambiguous = []
+
+            for message in messages:
+                parsed = IntentParser.parse(message.text)
+                if parsed is None or not apply_intent(batch, message, parsed, habits.get(message.user_id, [])):
+                    message.parsed_intent = 'unknown'
+                    message.meta_json = {**(message.meta_json or {}), 'parser': 'llm_pending'}
+                    ambiguous.append(str(message.id))
+                else:
+                    message.meta_json = {**(message.meta_json or {}), 'parser': 'rules'}
+                message.processed = True
+
+            batch.write()
+            InboundMessage.objects.bulk_update(messages, ['parsed_intent', 'meta_json', 'processed'])
+
+            for i in range(0, len(ambiguous), self.llm_batch_size):
+                chunk = ambiguous[i:i + self.llm_batch_size]
+                transaction.on_commit(lambda chunk=chunk: parse_inbound_with_llm.delay(chunk))
+
+        logger.info(f"Processed {len(messages)} inbound messages, {len(ambiguous)} sent to LLM parsing")
+        return len(messages)
+
+
+def load_active_habits(user_ids):
+    """Active habits per user, in a stable order so 'done 2' means the same habit every time"""
+    habits = defaultdict(list)
+    for habit in Habit.objects.filter(user_id__in=user_ids, is_active=True).order_by('created_at'):
+        habits[habit.user_id].append(habit)
+    return habits
+
+
+def apply_intent(batch, message, parsed, habits):
+    """Record the effects of one parsed message. Returns False if it is still ambiguous."""
+    intent = parsed['intent']
+
+    if intent == 'help':
+        message.parsed_intent = 'help'
+        batch.reply(message, HELP_TEXT)
+        return True
+
+    if intent == 'mood':
+        message.parsed_intent = 'mood'
+        batch.add_mood(message, parsed['score'], parsed.get('note', ''))
+        batch.reply(message, f"Mood logged: {parsed['score']}/5. Thanks for sharing!")
+        return True
+
+    if intent == 'checkin':
+        rest = parsed.get('rest', '')
+        if rest.lower() in ('all', 'todos', 'todo') and habits:
+            for habit in habits:
+                batch.add_checkin(message, habit, parsed['value'], '')
+            message.parsed_intent = 'checkin'
+            batch.reply(message, f"Logged {len(habits)} habits. Keep it up!")
+            return True
+        else:
+            habit, note = resolve_habit(rest, habits)
+
+        if habit is None:
+            return False
+
+        message.parsed_intent = 'checkin'
+        batch.add_checkin(message, habit, parsed['value'], note)
+        batch.reply(
+            message,
+            f"✅ {habit.title} checked in!" if parsed['value'] else f"Noted, {habit.title} skipped today. Tomorrow's a new day."
+        )
+        return True
+
+    return False
+
+
+def parse_with_llm(messages, habits):
+    """
+    Classify several ambiguous messages with one LLM call.
+
+    Returns {message_id: parsed} in the rule parser's format; messages the
+    model cannot place are left out.
+    """
+    from ai_services.langgraph_service import langgraph_ai_service
+
+    if not langgraph_ai_service.llm:
+        return {}
+
+    lines = []
+    for message in messages:
+        titles = [h.title for h in habits.get(message.user_id, [])]
+        lines.append(json.dumps({'id': str(message.id), 'text': message.text[:500], 'habits': titles}, ensure_ascii=False))
+
+    prompt = (
+        "Classify each chat message sent to a habit tracking app. For each input line return one JSON object "
+        "per line with keys: id, intent ('checkin', 'mood', 'help' or 'unknown'), and where relevant "
+        "habit (exact title from the habits list), completed (true/false) and score (mood 1-5). "
+        "Return only the JSON lines.\n\n" + '\n'.join(lines)
+    )
+
+    response = langgraph_ai_service.llm.invoke(prompt, feature='chat_intent')
+
+    results = {}
+    for line in (response or '').splitlines():
+        line = line.strip().strip('`')
+        if not line.startswith('{'):
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            continue
+
+        intent = item.get('intent')
+        if intent == 'help':
+            results[item.get('id')] = {'intent': 'help'}
+        elif intent == 'mood' and str(item.get('score', '')).isdigit() and 1 <= int(item['score']) <= 5:
+            results[item.get('id')] = {'intent': 'mood', 'score': int(item['score']), 'note': ''}
+        elif intent == 'checkin' and item.get('habit'):
+            results[item.get('id')] = {
+                'intent': 'checkin',
+                'value': bool(item.get('completed', True)),
+                'rest': item['habit'],
+            }
+
+    return results
+
+
+def process_ambiguous(message_ids):
+    """
+    LLM fallback for messages the rules left unresolved. Returns the number resolved.
+
+    The messages are claimed (parser 'llm_pending' -> 'llm_running') in one
+    short transaction and the results applied in another; no transaction or
+    row lock is held during the LLM call.
+    """
+    with transaction.atomic():
+        messages = list(
+            InboundMessage.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .filter(id__in=message_ids, meta_json__parser='llm_pending')
+        )
+        if not messages:
+            return 0
+
+        for message in messages:
+            message.meta_json = {**(message.meta_json or {}), 'parser': 'llm_running'}
+        InboundMessage.objects.bulk_update(messages, ['meta_json'])
+
+    habits = load_active_habits({m.user_id for m in messages})
+    try:
+        parsed = parse_with_llm(messages, habits)
+    except Exception as e:
+        logger.error(f"Error parsing inbound messages with LLM: {str(e)}")
+        parsed = {}
+
+    with transaction.atomic():
+        messages = list(
+            InboundMessage.objects
+            .select_for_update(of=('self',))
+            .filter(id__in=[m.id for m in messages], meta_json__parser='llm_running')
+        )
+
+        batch = InboundBatch()
+        resolved = 0
+        for message in messages:
+            result = parsed.get(str(message.id))
+            if result and apply_intent(batch, message, result, habits.get(message.user_id, [])):
+                resolved += 1
+                parser = 'llm'
+            else:
+                message.parsed_intent = 'unknown'
+                batch.reply(message, f"Sorry, I didn't get that. {HELP_TEXT}")
+                parser = 'unresolved'
+            message.meta_json = {**(message.meta_json or {}), 'parser': parser}
+
+        batch.write()
+        InboundMessage.objects.bulk_update(messages, ['parsed_intent', 'meta_json'])
+
+    return resolved
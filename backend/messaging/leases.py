@@ -0,0 +1,58 @@
+"""
+Exclusive, expiring claims on checkpoint rows (DigestRun, Broadcast)
+
+A resumable run may be started twice: a beat tick and a manual trigger, or a
+deferred retry that overlaps a slow chunk. Both would read the same cursor
+and send the same chunk. A runner therefore claims the row with a
+conditional update of claimed_by / claimed_at and exits if another owner
+holds a live claim. Every checkpoint write is conditional on still owning
+the claim and renews it; a runner that crashed simply lets its claim expire.
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class RowLease:
+    """One runner's claim on one row with claimed_by, claimed_at and updated_at fields"""
+
+    def __init__(self, instance, seconds):
+        self.instance = instance
+        self.seconds = seconds
+        self.owner = uuid.uuid4().hex
+
+    def rows(self):
+        return type(self.instance).objects.filter(pk=self.instance.pk)
+
+    def acquire(self):
+        """Claim the row if it is unclaimed or its claim expired; True on success"""
+        now = timezone.now()
+        cutoff = now - timedelta(seconds=self.seconds)
+        claimed = self.rows().filter(
+            Q(claimed_at__isnull=True) | Q(claimed_at__lt=cutoff)
+        ).update(claimed_by=self.owner, claimed_at=now)
+        if claimed:
+            # Pick up the checkpoint the previous owner left
+            self.instance.refresh_from_db()
+        return bool(claimed)
+
+    def save(self, *fields):
+        """Write these fields and renew the claim; False if another runner took the row over"""
+        now = timezone.now()
+        self.instance.updated_at = now
+        saved = self.rows().filter(claimed_by=self.owner).update(
+            claimed_at=now,
+            updated_at=now,
+            **{field: getattr(self.instance, field) for field in fields},
+        )
+        if not saved:
+            logger.warning(f"Lost the claim on {self.instance._meta.label} {self.instance.pk}")
+        return bool(saved)
+
+    def release(self):
+        self.rows().filter(claimed_by=self.owner).update(claimed_by='', claimed_at=None)
@@ -0,0 +1,152 @@
+"""
+Precomputed link-rewrite plans for email click tracking
+
+Rewriting links used to scan the whole rendered HTML with a regex on every
+send. A plan does that scan once per distinct HTML (or template source) and
+keeps the result as the literal text between tracking-id insertion points.
+Each link's tracked URL is already percent-encoded in the plan, so applying
+it to a message only joins the parts with the tracking id and a signature.
+
+The click endpoint redirects to whatever URL the link carries, so every
+tracked link is signed with an HMAC over the tracking id and the URL;
+links with a missing or wrong signature go to a safe default instead.
+"""
+import hashlib
+import html
+import logging
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+logger = logging.getLogger(__name__)
+
+
+HREF_PATTERN = re.compile(r'href="([^"]+)"')
+
+
+def tracking_base_url():
+    return getattr(settings, 'EMAIL_TRACKING_BASE_URL', 'https://quanta.app/api/email/track')
+
+
+def click_fallback_url():
+    return getattr(settings, 'EMAIL_CLICK_FALLBACK_URL', 'https://quanta.app')
+
+
+def sign_click(tracking_id, url):
+    """Signature binding a click link's URL to its tracking id"""
+    return salted_hmac('messaging.click', f'{tracking_id}\n{url}', algorithm='sha256').hexdigest()[:32]
+
+
+def verify_click(tracking_id, url, signature):
+    return bool(signature) and constant_time_compare(sign_click(tracking_id, url), signature)
+
+
+def is_trackable(url):
+    """Only plain web links that are not tracking links themselves"""
+    if not url.startswith(('http://', 'https://')):
+        return False
+    if 'track/click' in url or 'track/open' in url:
+        return False
+    # Template expressions can only be resolved at render time
+    if '{{' in url or '{%' in url:
+        return False
+    return True
+
+
+class LinkRewritePlan:
+    """Literal HTML parts with a tracked link (id, URL, signature) going between each pair"""
+
+    def __init__(self, parts, urls):
+        self.parts = parts
+        # (original URL, percent-encoded URL) per link
+        self.urls = urls
+        self.link_count = len(urls)
+
+    @classmethod
+    def build(cls, source):
+        """Split `source` around every trackable href"""
+        click_base = f'{tracking_base_url()}/click/'
+        parts = []
+        urls = []
+        last = 0
+
+        for match in HREF_PATTERN.finditer(source):
+            url = html.unescape(match.group(1))
+            if not is_trackable(url):
+                continue
+
+            # Literal text up to the tracking id; the URL and signature follow it
+            parts.append(source[last:match.start(1)] + click_base)
+            urls.append((url, quote(url, safe='')))
+            last = match.end(1)
+
+        parts.append(source[last:])
+        return cls(parts, urls)
+
+    def apply(self, tracking_id):
+        """Render the tracked HTML for one message"""
+        if not self.link_count:
+            return self.parts[0]
+
+        encoded_id = quote(str(tracking_id), safe='')
+        pieces = []
+        for literal, (url, encoded_url) in zip(self.parts, self.urls):
+            pieces.append(
+                f'{literal}{encoded_id}?url={encoded_url}&amp;sig={sign_click(tracking_id, url)}'
+            )
+        pieces.append(self.parts[-1])
+        return ''.join(pieces)
+
+
+class LinkPlanCache:
+    """Small thread-safe LRU of plans keyed by content hash"""
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_plan(self, source):
+        key = hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                return plan
+
+        plan = LinkRewritePlan.build(source)
+
+        with self._lock:
+            self._plans[key] = plan
+            if len(self._plans) > self.max_size:
+                self._plans.popitem(last=False)
+        return plan
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+
+
+link_plan_cache = LinkPlanCache()
+
+
+def add_click_tracking(html_content, tracking_id):
+    """Tracked copy of already rendered HTML"""
+    return link_plan_cache.get_plan(html_content).apply(tracking_id)
+
+
+def add_open_pixel(html_content, tracking_id):
+    """Append the open-tracking pixel just before </body>"""
+    pixel = (
+        f'<img src="{tracking_base_url()}/open/{quote(str(tracking_id), safe="")}" '
+        f'width="1" height="1" alt="" style="display:none">'
+    )
+    index = html_content.rfind('</body>')
+    if index == -1:
+        return html_content + pixel
+    return html_content[:index] + pixel + html_content[index:]
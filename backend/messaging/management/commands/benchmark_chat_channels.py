@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.rate_limit import TokenBucket
+from messaging.channels import MockTransport, TelegramChannelAdapter, WhatsAppChannelAdapter
+
+
+class Command(BaseCommand):
+    help = 'Benchmark chat channel adapter throughput against the local mock provider'
+
+    ADAPTERS = {
+        'telegram': TelegramChannelAdapter,
+        'whatsapp': WhatsAppChannelAdapter,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--channel', choices=list(self.ADAPTERS), default='telegram')
+        parser.add_argument('--count', type=int, default=1000, help='Messages to send')
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages per send_batch call (outbox batch)')
+        parser.add_argument('--latency', type=float, default=0.05, help='Mock provider latency in seconds')
+        parser.add_argument('--rate', type=float, default=None, help='Override the channel rate limit (messages/second)')
+
+    def handle(self, *args, **options):
+        transport = MockTransport(latency=options['latency'])
+        adapter = self.ADAPTERS[options['channel']](transport=transport)
+        if options['rate']:
+            adapter.rate_limit = TokenBucket(f"benchmark:{options['channel']}", rate=options['rate'], capacity=options['rate'])
+
+        pending = [(str(1000 + i), f'Benchmark message {i}') for i in range(options['count'])]
+        deferred = 0
+        failed = 0
+
+        self.stdout.write(
+            f"Sending {options['count']} {options['channel']} messages, {adapter.concurrency} concurrent, "
+            f"{options['latency'] * 1000:.0f}ms provider latency"
+        )
+
+        started = time.perf_counter()
+        while pending:
+            batch, pending = pending[:options['batch_size']], pending[options['batch_size']:]
+            results = adapter.deliver(batch)
+
+            retry = [job for job, result in zip(batch, results) if result['status'] == 'deferred']
+            failed += sum(1 for result in results if result['status'] == 'failed')
+            deferred += len(retry)
+            pending = retry + pending
+
+            if retry and len(retry) == len(batch):
+                time.sleep(min(r['retry_after'] for r in results))
+        duration = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {len(transport.sent)} sent in {duration:.2f}s ({len(transport.sent) / duration:.0f} msg/s), "
+            f"{deferred} deferrals, {failed} failures"
+        ))
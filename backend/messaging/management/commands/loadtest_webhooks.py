@@ -0,0 +1,156 @@
+import hashlib
+import hmac
+import json
+import random
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from accounts.models import ContactMethod
+
+
+class Command(BaseCommand):
+    help = 'Stand-in Telegram/WhatsApp sender: fire signed webhook requests and report throughput and latency'
+
+    TEXTS = ['done', 'done reading', 'skip', 'mood 4', 'feeling great', 'help', '✅', 'did it, 20 minutes today']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--channel', choices=['telegram', 'whatsapp'], default='telegram')
+        parser.add_argument('--count', type=int, default=5000, help='Total webhook requests to send')
+        parser.add_argument('--concurrency', type=int, default=50, help='Parallel senders')
+        parser.add_argument(
+            '--url',
+            default=None,
+            help='Webhook URL of a running server; without it requests go through the Django test client in-process',
+        )
+        parser.add_argument(
+            '--senders',
+            type=int,
+            default=100,
+            help='Distinct sender addresses, taken from verified contact methods when available',
+        )
+
+    def handle(self, *args, **options):
+        channel = options['channel']
+        secret = settings.TELEGRAM_WEBHOOK_SECRET if channel == 'telegram' else settings.WHATSAPP_APP_SECRET
+        if not secret:
+            raise CommandError(f'Set the {channel} webhook secret in settings before load testing')
+
+        addresses = self.get_addresses(channel, options['senders'])
+        send = self.http_sender(options['url']) if options['url'] else self.client_sender(f'{channel}-webhook')
+
+        latencies = []
+        failures = []
+        lock = threading.Lock()
+
+        def fire(i):
+            body, headers = self.build_request(channel, secret, random.choice(addresses), i)
+            started = time.perf_counter()
+            try:
+                status_code = send(body, headers)
+            except Exception as e:
+                status_code = str(e)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if status_code != 200:
+                    failures.append(status_code)
+
+        self.stdout.write(
+            f"Sending {options['count']} {channel} webhooks from {len(addresses)} senders "
+            f"with {options['concurrency']} workers"
+        )
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(fire, range(options['count'])))
+        duration = time.perf_counter() - started
+
+        latencies.sort()
+        percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {len(latencies)} requests in {duration:.2f}s ({len(latencies) / duration:.0f} req/s)"
+        ))
+        self.stdout.write(
+            f"Latency ms: p50={percentile(0.50):.1f} p95={percentile(0.95):.1f} "
+            f"p99={percentile(0.99):.1f} max={latencies[-1]:.1f} mean={statistics.mean(latencies):.1f}"
+        )
+        if failures:
+            self.stdout.write(self.style.ERROR(f"{len(failures)} failed requests, e.g. {failures[:5]}"))
+
+    def get_addresses(self, channel, count):
+        addresses = list(
+            ContactMethod.objects.filter(channel=channel, verified=True)
+            .values_list('address', flat=True)[:count]
+        )
+        if not addresses:
+            self.stdout.write(self.style.WARNING(
+                f'No verified {channel} contacts; using random senders (messages will be dropped as unknown)'
+            ))
+            addresses = [str(random.randint(10 ** 9, 10 ** 10)) for _ in range(count)]
+        return addresses
+
+    def build_request(self, channel, secret, address, i):
+        text = random.choice(self.TEXTS)
+
+        if channel == 'telegram':
+            body = json.dumps({
+                'update_id': uuid.uuid4().int % 10 ** 12,
+                'message': {
+                    'message_id': i,
+                    'date': int(time.time()),
+                    'chat': {'id': int(address), 'type': 'private'},
+                    'text': text,
+                },
+            }).encode()
+            return body, {'HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN': secret}
+
+        body = json.dumps({
+            'object': 'whatsapp_business_account',
+            'entry': [{'changes': [{'field': 'messages', 'value': {'messages': [{
+                'from': address.lstrip('+'),
+                'id': f'wamid.{uuid.uuid4().hex}',
+                'timestamp': str(int(time.time())),
+                'type': 'text',
+                'text': {'body': text},
+            }]}}]}],
+        }).encode()
+        signature = 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        return body, {'HTTP_X_HUB_SIGNATURE_256': signature}
+
+    def client_sender(self, url_name):
+        from django.test import Client
+
+        url = reverse(url_name)
+        local = threading.local()
+
+        def send(body, headers):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            return local.client.post(url, data=body, content_type='application/json', **headers).status_code
+
+        return send
+
+    def http_sender(self, url):
+        import requests
+
+        local = threading.local()
+
+        def send(body, headers):
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            # HTTP_X_FOO_BAR -> X-Foo-Bar
+            http_headers = {
+                name[5:].replace('_', '-').title(): value for name, value in headers.items()
+            }
+            http_headers['Content-Type'] = 'application/json'
+            return local.session.post(url, data=body, headers=http_headers, timeout=10).status_code
+
+        return send
@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from messaging.inbound import InboundProcessor
+
+
+class Command(BaseCommand):
+    help = 'Process unprocessed inbound chat messages (run several copies to scale out)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling for new messages instead of exiting when there are none left',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Number of messages to claim per batch',
+        )
+        parser.add_argument(
+            '--idle-sleep',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls when there is nothing to process',
+        )
+
+    def handle(self, *args, **options):
+        worker = InboundProcessor(batch_size=options['batch_size'])
+        total = 0
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Starting inbound worker at {timezone.now()}'
+            )
+        )
+
+        try:
+            while True:
+                claimed = worker.run_once()
+                total += claimed
+
+                if claimed:
+                    self.stdout.write(f'Processed {claimed} messages ({total} total)')
+                elif not options['loop']:
+                    break
+                else:
+                    time.sleep(options['idle_sleep'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(
+            self.style.SUCCESS(f'✓ Inbound worker processed {total} messages')
+        )
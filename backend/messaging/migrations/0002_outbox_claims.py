@@ -0,0 +1,39 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundmessage',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='outboundmessage',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, help_text='When an outbox worker claimed this message', null=True),
+        ),
+        migrations.AddField(
+            model_name='outboundmessage',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, help_text='Earliest time the outbox may retry this message', null=True),
+        ),
+        migrations.AlterField(
+            model_name='outboundmessage',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='queued', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='outboundmessage',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='outbound_me_status_805da6_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:30
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0003_digest_runs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingNotification',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('achievement', 'Achievement'), ('aha_moment', 'Aha Moment')], max_length=20)),
+                ('key', models.CharField(help_text='Achievement type or aha moment key', max_length=100)),
+                ('context_json', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('outbound_message', models.ForeignKey(blank=True, help_text='Set once merged into an outbound message', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='merged_notifications', to='messaging.outboundmessage')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_notifications', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'pending_notifications',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['user', 'outbound_message'], name='pending_not_user_id_0eeb86_idx'), models.Index(fields=['kind', 'key', 'created_at'], name='pending_not_kind_3a0c95_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:31
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0004_pending_notifications'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailAnalyticsModel',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('tracking_id', models.CharField(db_index=True, max_length=255, unique=True)),
+                ('template_key', models.CharField(max_length=100)),
+                ('message_id', models.CharField(blank=True, max_length=255)),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('opened_at', models.DateTimeField(blank=True, null=True)),
+                ('first_clicked_at', models.DateTimeField(blank=True, null=True)),
+                ('open_count', models.IntegerField(default=0)),
+                ('click_count', models.IntegerField(default=0)),
+                ('status', models.CharField(choices=[('sent', 'Sent'), ('delivered', 'Delivered'), ('opened', 'Opened'), ('clicked', 'Clicked'), ('bounced', 'Bounced'), ('unsubscribed', 'Unsubscribed')], default='sent', max_length=20)),
+                ('user_agent', models.TextField(blank=True)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('device_type', models.CharField(blank=True, max_length=50)),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='email_analytics', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'email_analytics',
+                'ordering': ['-sent_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EmailClickModel',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('url', models.URLField()),
+                ('clicked_at', models.DateTimeField(auto_now_add=True)),
+                ('user_agent', models.TextField(blank=True)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('analytics', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='clicks', to='messaging.emailanalyticsmodel')),
+            ],
+            options={
+                'db_table': 'email_clicks',
+                'ordering': ['-clicked_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EmailDailyRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('template_key', models.CharField(max_length=100)),
+                ('sent', models.PositiveIntegerField(default=0)),
+                ('opened', models.PositiveIntegerField(default=0)),
+                ('clicked', models.PositiveIntegerField(default=0)),
+                ('unsubscribed', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'email_daily_rollups',
+                'ordering': ['-date', 'template_key'],
+                'indexes': [models.Index(fields=['date'], name='email_daily_date_445afe_idx')],
+                'unique_together': {('date', 'template_key')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='emailanalyticsmodel',
+            index=models.Index(fields=['user', 'template_key'], name='email_analy_user_id_bd536f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailanalyticsmodel',
+            index=models.Index(fields=['tracking_id'], name='email_analy_trackin_d5c4f7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailanalyticsmodel',
+            index=models.Index(fields=['sent_at'], name='email_analy_sent_at_71778c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailanalyticsmodel',
+            index=models.Index(fields=['template_key', 'sent_at'], name='email_analy_templat_1d418c_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:33
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0005_email_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailclickmodel',
+            name='clicked_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='emailclickmodel',
+            name='url',
+            field=models.URLField(max_length=2048),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:35
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0006_email_click_timestamps'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SendTimeProfile',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('daily_hours', models.JSONField(default=list, help_text='Best send hour (UTC) per ISO weekday, Monday first')),
+                ('top_slots', models.JSONField(default=list, help_text='Best hour-of-week slots (0 = Monday 00:00 UTC), best first')),
+                ('sample_size', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='send_time_profile', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'send_time_profiles',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-19 04:37
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0007_send_time_profiles'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AhaMomentDelivery',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('moment_key', models.CharField(max_length=100)),
+                ('dedup_key', models.CharField(help_text="Identifies the occurrence, e.g. 'once' or habit/streak/date", max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aha_moment_deliveries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'aha_moment_deliveries',
+                'ordering': ['-created_at'],
+                'unique_together': {('user', 'moment_key', 'dedup_key')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0009_broadcasts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcast',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='broadcast',
+            name='claimed_by',
+            field=models.CharField(blank=True, help_text='Runner currently sending (see messaging.leases)', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='digestrun',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='digestrun',
+            name='claimed_by',
+            field=models.CharField(blank=True, help_text='Runner currently sending (see messaging.leases)', max_length=32),
+        ),
+    ]
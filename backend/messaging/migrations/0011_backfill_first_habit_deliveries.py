@@ -0,0 +1,41 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:40
+
+import uuid
+
+from django.db import migrations
+
+
+# The 'habit_created' moments deduplicated as 'once' per user when 0008
+# started recording deliveries
+FIRST_HABIT_MOMENTS = ['first_habit_created', 'first_day_reminder']
+
+
+def backfill_first_habit_deliveries(apps, schema_editor):
+    """Users who had habits before deliveries were recorded already got their first-habit emails"""
+    Habit = apps.get_model('habits', 'Habit')
+    AhaMomentDelivery = apps.get_model('messaging', 'AhaMomentDelivery')
+
+    user_ids = Habit.objects.order_by().values_list('user_id', flat=True).distinct()
+    batch = []
+    for user_id in user_ids.iterator(chunk_size=2000):
+        batch.extend(
+            AhaMomentDelivery(id=uuid.uuid4(), user_id=user_id, moment_key=moment_key, dedup_key='once')
+            for moment_key in FIRST_HABIT_MOMENTS
+        )
+        if len(batch) >= 2000:
+            AhaMomentDelivery.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        AhaMomentDelivery.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0010_checkpoint_leases'),
+        ('habits', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_first_habit_deliveries, migrations.RunPython.noop),
+    ]
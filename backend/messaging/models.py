@@ -1,5 +1,7 @@
 from django.db import models
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 import uuid
 
 
@@ -12,6 +14,7 @@ class OutboundMessage(models.Model):
     
     STATUS_CHOICES = [
         ('queued', 'Queued'),
+        ('sending', 'Sending'),
         ('sent', 'Sent'),
         ('failed', 'Failed'),
     ]
@@ -24,6 +27,9 @@ class OutboundMessage(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
     provider_msg_id = models.CharField(max_length=255, blank=True)
     error_message = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True, help_text="Earliest time the outbox may retry this message")
+    claimed_at = models.DateTimeField(null=True, blank=True, help_text="When an outbox worker claimed this message")
     created_at = models.DateTimeField(auto_now_add=True)
     sent_at = models.DateTimeField(null=True, blank=True)
     
@@ -33,6 +39,7 @@ class OutboundMessage(models.Model):
         indexes = [
             models.Index(fields=['user', 'status']),
             models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['status', 'next_attempt_at']),
         ]
     
     def __str__(self):
@@ -132,3 +139,238 @@ class MessageTemplate(models.Model):
     
     def __str__(self):
         return f"{self.name} ({self.key})"
+    
+    def clean(self):
+        """Reject templates that don't parse or use undeclared variables"""
+        from .templating import TemplateValidationError, validate_template
+        
+        try:
+            validate_template(self)
+        except TemplateValidationError as e:
+            raise ValidationError({'body': str(e)})
+
+
+class DigestRun(models.Model):
+    KIND_CHOICES = [
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    period_key = models.CharField(max_length=20, help_text="e.g. 2025-W36 or 2025-09")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    cursor = models.UUIDField(null=True, blank=True, help_text="Last user id processed, for resuming")
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    claimed_by = models.CharField(max_length=32, blank=True, help_text="Runner currently sending (see messaging.leases)")
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'digest_runs'
+        ordering = ['-started_at']
+        unique_together = ['kind', 'period_key']
+    
+    def __str__(self):
+        return f"{self.kind} digest {self.period_key} - {self.status}"
+
+
+class PendingNotification(models.Model):
+    KIND_CHOICES = [
+        ('achievement', 'Achievement'),
+        ('aha_moment', 'Aha Moment'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='pending_notifications')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    key = models.CharField(max_length=100, help_text="Achievement type or aha moment key")
+    context_json = models.JSONField(default=dict)
+    outbound_message = models.ForeignKey(
+        OutboundMessage, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='merged_notifications', help_text="Set once merged into an outbound message"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'pending_notifications'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['user', 'outbound_message']),
+            models.Index(fields=['kind', 'key', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.name} - {self.kind} - {self.key}"
+
+
+class EmailAnalyticsModel(models.Model):
+    """Model to track email analytics"""
+    
+    STATUS_CHOICES = [
+        ('sent', 'Sent'),
+        ('delivered', 'Delivered'),
+        ('opened', 'Opened'),
+        ('clicked', 'Clicked'),
+        ('bounced', 'Bounced'),
+        ('unsubscribed', 'Unsubscribed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tracking_id = models.CharField(max_length=255, unique=True, db_index=True)
+    user = models.ForeignKey('accounts.User', on_delete=models.CASCADE, related_name='email_analytics')
+    template_key = models.CharField(max_length=100)
+    message_id = models.CharField(max_length=255, blank=True)
+    
+    # Timestamps
+    sent_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    opened_at = models.DateTimeField(null=True, blank=True)
+    first_clicked_at = models.DateTimeField(null=True, blank=True)
+    
+    # Analytics data
+    open_count = models.IntegerField(default=0)
+    click_count = models.IntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='sent')
+    
+    # Device and location info
+    user_agent = models.TextField(blank=True)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    device_type = models.CharField(max_length=50, blank=True)
+    
+    # Additional metadata
+    metadata = models.JSONField(default=dict, blank=True)
+    
+    class Meta:
+        db_table = 'email_analytics'
+        ordering = ['-sent_at']
+        indexes = [
+            models.Index(fields=['user', 'template_key']),
+            models.Index(fields=['tracking_id']),
+            models.Index(fields=['sent_at']),
+            models.Index(fields=['template_key', 'sent_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.email} - {self.template_key} - {self.status}"
+
+
+class EmailClickModel(models.Model):
+    """Model to track individual email clicks"""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    analytics = models.ForeignKey(EmailAnalyticsModel, on_delete=models.CASCADE, related_name='clicks')
+    url = models.URLField(max_length=2048)
+    clicked_at = models.DateTimeField(default=timezone.now)
+    user_agent = models.TextField(blank=True)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'email_clicks'
+        ordering = ['-clicked_at']
+
+
+class EmailDailyRollup(models.Model):
+    """Per-day, per-template email counts, keyed by send date"""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    date = models.DateField()
+    template_key = models.CharField(max_length=100)
+    sent = models.PositiveIntegerField(default=0)
+    opened = models.PositiveIntegerField(default=0)
+    clicked = models.PositiveIntegerField(default=0)
+    unsubscribed = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'email_daily_rollups'
+        ordering = ['-date', 'template_key']
+        unique_together = ['date', 'template_key']
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} - {self.template_key} - {self.sent} sent"
+
+
+class SendTimeProfile(models.Model):
+    """Per-user best send slots, rebuilt in batch from activity histograms"""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='send_time_profile')
+    daily_hours = models.JSONField(default=list, help_text="Best send hour (UTC) per ISO weekday, Monday first")
+    top_slots = models.JSONField(default=list, help_text="Best hour-of-week slots (0 = Monday 00:00 UTC), best first")
+    sample_size = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'send_time_profiles'
+    
+    def __str__(self):
+        return f"{self.user.name} - {self.top_slots[:3]}"
+
+
+class AhaMomentDelivery(models.Model):
+    """Per-user dedup state for aha-moment rules"""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='aha_moment_deliveries')
+    moment_key = models.CharField(max_length=100)
+    dedup_key = models.CharField(max_length=255, help_text="Identifies the occurrence, e.g. 'once' or habit/streak/date")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'aha_moment_deliveries'
+        ordering = ['-created_at']
+        unique_together = ['user', 'moment_key', 'dedup_key']
+    
+    def __str__(self):
+        return f"{self.user.name} - {self.moment_key} - {self.dedup_key}"
+
+
+class Broadcast(models.Model):
+    """One template sent to every user in a segment, resumable from its cursor"""
+    
+    SEGMENT_TYPES = ['course', 'engagement', 'inactive']
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='broadcasts')
+    template_key = models.CharField(max_length=100, help_text="MessageTemplate key")
+    segment_json = models.JSONField(default=dict, help_text="e.g. {'type': 'course', 'course_code': 'BIO101'}")
+    context_json = models.JSONField(default=dict, blank=True, help_text="Extra template variables shared by all recipients")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    cursor = models.UUIDField(null=True, blank=True, help_text="Last user id processed, for resuming")
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    error_message = models.TextField(blank=True)
+    claimed_by = models.CharField(max_length=32, blank=True, help_text="Runner currently sending (see messaging.leases)")
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'broadcasts'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_by', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.template_key} to {self.segment_json.get('type')} - {self.status}"
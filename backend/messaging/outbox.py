@@ -0,0 +1,149 @@
+"""
+Durable outbox for OutboundMessage rows
+
+Rows are created with status 'queued' and delivered here. Workers claim
+batches with SELECT ... FOR UPDATE SKIP LOCKED, so any number of them can run
+side by side without two workers ever claiming the same row. A claimed row is
+moved to 'sending' inside the claiming transaction, sent outside of it, and
+the results are written back with a single bulk update.
+"""
+import logging
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .channels import get_channel_adapter
+from .models import OutboundMessage
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxWorker:
+    """Claim, send and record queued outbound messages"""
+
+    def __init__(self, batch_size=None, max_attempts=None, lease_seconds=None):
+        config = getattr(settings, 'OUTBOX', {})
+        self.batch_size = batch_size or config.get('BATCH_SIZE', 100)
+        self.max_attempts = max_attempts or config.get('MAX_ATTEMPTS', 5)
+        self.lease_seconds = lease_seconds or config.get('LEASE_SECONDS', 300)
+        self.backoff_base = config.get('BACKOFF_BASE_SECONDS', 30)
+        self.backoff_max = config.get('BACKOFF_MAX_SECONDS', 3600)
+
+    def run_once(self):
+        """Process one batch. Returns the number of messages claimed."""
+        self.release_stale_claims()
+
+        messages = self.claim_batch()
+        if not messages:
+            return 0
+
+        by_channel = defaultdict(list)
+        for message in messages:
+            by_channel[message.channel].append(message)
+
+        for channel, channel_messages in by_channel.items():
+            adapter = get_channel_adapter(channel)
+            if adapter is None:
+                results = [{'status': 'failed', 'error': f'No adapter for channel {channel}'}] * len(channel_messages)
+            else:
+                try:
+                    results = adapter.send_batch(channel_messages)
+                except Exception as e:
+                    logger.error(f"Error sending {channel} batch: {str(e)}")
+                    results = [{'status': 'failed', 'error': str(e)}] * len(channel_messages)
+
+            self.record_results(channel_messages, results)
+
+        return len(messages)
+
+    def claim_batch(self):
+        """Lock a batch of due rows, skipping rows other workers hold, and mark them as sending"""
+        now = timezone.now()
+
+        with transaction.atomic():
+            messages = list(
+                OutboundMessage.objects
+                .select_for_update(skip_locked=True, of=('self',))
+                .select_related('user')
+                .filter(status='queued')
+                .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+                .order_by('created_at')[:self.batch_size]
+            )
+            if not messages:
+                return []
+
+            OutboundMessage.objects.filter(id__in=[m.id for m in messages]).update(
+                status='sending',
+                claimed_at=now,
+                attempts=F('attempts') + 1,
+            )
+
+        for message in messages:
+            message.status = 'sending'
+            message.claimed_at = now
+            message.attempts += 1
+
+        return messages
+
+    def record_results(self, messages, results):
+        """Write send results back in one bulk update"""
+        now = timezone.now()
+
+        for message, result in zip(messages, results):
+            outcome = result.get('status')
+            message.claimed_at = None
+
+            if outcome == 'sent':
+                message.status = 'sent'
+                message.sent_at = now
+                message.provider_msg_id = result.get('provider_msg_id', '')[:255]
+                message.error_message = ''
+            elif outcome == 'deferred':
+                # Rate limited: not the message's fault, so don't spend an attempt
+                message.status = 'queued'
+                message.attempts = max(0, message.attempts - 1)
+                message.next_attempt_at = now + timedelta(seconds=max(1, result.get('retry_after', 1)))
+            else:
+                message.error_message = result.get('error', '')
+                if message.attempts >= self.max_attempts:
+                    message.status = 'failed'
+                    logger.error(f"Giving up on outbound message {message.id} after {message.attempts} attempts")
+                else:
+                    message.status = 'queued'
+                    message.next_attempt_at = now + timedelta(seconds=self.backoff_delay(message.attempts))
+
+        OutboundMessage.objects.bulk_update(
+            messages,
+            ['status', 'sent_at', 'provider_msg_id', 'error_message', 'attempts', 'next_attempt_at', 'claimed_at'],
+        )
+
+    def backoff_delay(self, attempts):
+        """Exponential backoff with full jitter"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return random.uniform(delay / 2, delay)
+
+    def release_stale_claims(self):
+        """
+        Put back rows whose worker died mid-send. The claim already spent an
+        attempt, so a message that keeps crashing its worker ends up failed.
+        """
+        cutoff = timezone.now() - timedelta(seconds=self.lease_seconds)
+        stale = OutboundMessage.objects.filter(status='sending', claimed_at__lt=cutoff)
+
+        failed = stale.filter(attempts__gte=self.max_attempts).update(
+            status='failed',
+            claimed_at=None,
+            error_message='Worker stopped while sending',
+        )
+        released = stale.update(status='queued', claimed_at=None)
+
+        if failed:
+            logger.error(f"Gave up on {failed} outbox messages whose sends kept stalling")
+        if released:
+            logger.warning(f"Released {released} stale outbox claims")
+        return released + failed
@@ -0,0 +1,196 @@
+"""
+Statistical per-user send-time model
+
+Each user's checkins and email opens over the last few months are bucketed
+into an hour-of-week histogram (168 slots) with grouped queries. The counts
+are smoothed towards the population histogram, a Dirichlet prior worth
+PRIOR_STRENGTH pseudo-events, so users with little history get sensible
+slots and users with lots of history get their own. The best hour for each
+weekday and the overall top slots are stored on SendTimeProfile, so
+schedulers only need one indexed lookup per user.
+"""
+import logging
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+from django.utils import timezone
+
+from accounts.models import User
+from habits.models import Checkin
+from .models import EmailAnalyticsModel, SendTimeProfile
+
+logger = logging.getLogger(__name__)
+
+
+SLOTS = 7 * 24
+
+
+class SendTimeModel:
+    """Build and read per-user send-time profiles"""
+
+    LOOKBACK_DAYS = 90
+    PRIOR_STRENGTH = 10.0
+    OPEN_WEIGHT = 2.0
+    TOP_SLOTS = 5
+    CHUNK_SIZE = 1000
+
+    # Never schedule into quiet hours (10 PM - 8 AM)
+    ALLOWED_HOURS = range(8, 22)
+
+    GLOBAL_CACHE_KEY = 'send_times:global_daily_hours'
+
+    @staticmethod
+    def slot(iso_weekday, hour):
+        return (iso_weekday - 1) * 24 + hour
+
+    @staticmethod
+    def histograms(user_ids=None, since=None):
+        """
+        Hour-of-week activity counts from two grouped queries.
+
+        Returns {user_id: [168 floats]} per user, or a single list when
+        user_ids is None (the population histogram).
+        """
+        utc = dt_timezone.utc
+        checkins = Checkin.objects.filter(created_at__gte=since)
+        opens = EmailAnalyticsModel.objects.filter(opened_at__gte=since)
+
+        sources = [
+            (checkins, 'habit__user_id', 'created_at', 1.0),
+            (opens, 'user_id', 'opened_at', SendTimeModel.OPEN_WEIGHT),
+        ]
+
+        per_user = {}
+        population = [0.0] * SLOTS
+
+        for queryset, user_field, time_field, weight in sources:
+            group = ['weekday', 'hour']
+            if user_ids is not None:
+                queryset = queryset.filter(**{f'{user_field}__in': user_ids})
+                group = [user_field] + group
+
+            rows = queryset.annotate(
+                weekday=ExtractIsoWeekDay(time_field, tzinfo=utc),
+                hour=ExtractHour(time_field, tzinfo=utc),
+            ).values(*group).annotate(total=Count('id')).values_list(*group, 'total')
+
+            for row in rows:
+                if user_ids is None:
+                    weekday, hour, total = row
+                    population[SendTimeModel.slot(weekday, hour)] += weight * total
+                else:
+                    user_id, weekday, hour, total = row
+                    histogram = per_user.setdefault(user_id, [0.0] * SLOTS)
+                    histogram[SendTimeModel.slot(weekday, hour)] += weight * total
+
+        return population if user_ids is None else per_user
+
+    @staticmethod
+    def build_prior(population):
+        """Normalized population histogram over allowed hours, with add-one smoothing"""
+        prior = [0.0] * SLOTS
+        for weekday in range(1, 8):
+            for hour in SendTimeModel.ALLOWED_HOURS:
+                s = SendTimeModel.slot(weekday, hour)
+                prior[s] = population[s] + 1.0
+
+        total = sum(prior)
+        return [p / total for p in prior]
+
+    @staticmethod
+    def score(histogram, prior):
+        """Posterior mean per slot (unnormalized: the denominator is shared)"""
+        alpha = SendTimeModel.PRIOR_STRENGTH
+        return [
+            (histogram[s] + alpha * prior[s]) if prior[s] > 0 else -1.0
+            for s in range(SLOTS)
+        ]
+
+    @staticmethod
+    def summarize(scores):
+        """(daily_hours, top_slots) from slot scores"""
+        daily_hours = []
+        for weekday in range(1, 8):
+            base = SendTimeModel.slot(weekday, 0)
+            daily_hours.append(max(SendTimeModel.ALLOWED_HOURS, key=lambda h: scores[base + h]))
+
+        top_slots = sorted(range(SLOTS), key=lambda s: scores[s], reverse=True)[:SendTimeModel.TOP_SLOTS]
+        return daily_hours, top_slots
+
+    @staticmethod
+    def rebuild_profiles():
+        """Recompute every user's profile. Returns the number of profiles written."""
+        since = timezone.now() - timedelta(days=SendTimeModel.LOOKBACK_DAYS)
+
+        prior = SendTimeModel.build_prior(SendTimeModel.histograms(since=since))
+        global_daily_hours, _ = SendTimeModel.summarize(SendTimeModel.score([0.0] * SLOTS, prior))
+        cache.set(SendTimeModel.GLOBAL_CACHE_KEY, global_daily_hours, 60 * 60 * 48)
+
+        written = 0
+        cursor = None
+        while True:
+            users = User.objects.filter(is_active=True).order_by('id')
+            if cursor:
+                users = users.filter(id__gt=cursor)
+            user_ids = list(users.values_list('id', flat=True)[:SendTimeModel.CHUNK_SIZE])
+            if not user_ids:
+                break
+            cursor = user_ids[-1]
+
+            profiles = []
+            for user_id, histogram in SendTimeModel.histograms(user_ids, since).items():
+                daily_hours, top_slots = SendTimeModel.summarize(SendTimeModel.score(histogram, prior))
+                profiles.append(SendTimeProfile(
+                    user_id=user_id,
+                    daily_hours=daily_hours,
+                    top_slots=top_slots,
+                    sample_size=int(sum(histogram)),
+                ))
+
+            SendTimeProfile.objects.bulk_create(
+                profiles,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['daily_hours', 'top_slots', 'sample_size', 'updated_at'],
+            )
+            written += len(profiles)
+
+        logger.info(f"Rebuilt {written} send time profiles")
+        return written
+
+    @staticmethod
+    def get_daily_hours(user_id):
+        """Best hour per weekday for a user: their profile, else the population's, else None"""
+        daily_hours = SendTimeProfile.objects.filter(user_id=user_id).values_list('daily_hours', flat=True).first()
+        return daily_hours or SendTimeModel.get_global_daily_hours()
+
+    @staticmethod
+    def get_global_daily_hours():
+        """Population best hour per weekday from the last rebuild, or None"""
+        return cache.get(SendTimeModel.GLOBAL_CACHE_KEY)
+
+    @staticmethod
+    def get_send_hour(user_id, day, default_hour=19, daily_hours=None):
+        """Best send hour (UTC) for a user on a given date"""
+        if daily_hours is None:
+            daily_hours = SendTimeModel.get_daily_hours(user_id)
+        if not daily_hours:
+            return default_hour
+        return daily_hours[day.isoweekday() - 1]
+
+    @staticmethod
+    def next_send_time(user_id, after=None, default_hour=19):
+        """Earliest preferred send time at or after `after`"""
+        after = after or timezone.now()
+        daily_hours = SendTimeModel.get_daily_hours(user_id) or []
+
+        for offset in range(8):
+            day = (after + timedelta(days=offset)).date()
+            hour = SendTimeModel.get_send_hour(user_id, day, default_hour, daily_hours)
+            candidate = datetime.combine(day, time(hour), tzinfo=dt_timezone.utc)
+            if candidate >= after:
+                return candidate
+
+        return after
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import OutboundMessage, InboundMessage, ConsentLog, MessageTemplate
+from .models import OutboundMessage, InboundMessage, ConsentLog, MessageTemplate, Broadcast
 from accounts.models import ChannelPreference
 
 
@@ -49,4 +49,16 @@ class MessageTemplateSerializer(serializers.ModelSerializer):
             'id', 'key', 'name', 'channel', 'subject', 'body', 'variables',
             'is_active', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
\ No newline at end of file
+        read_only_fields = ['id', 'created_at', 'updated_at']
+
+
+class BroadcastSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Broadcast
+        fields = [
+            'id', 'template_key', 'segment_json', 'context_json', 'status',
+            'sent_count', 'failed_count', 'error_message', 'created_at', 'completed_at'
+        ]
+        read_only_fields = [
+            'id', 'status', 'sent_count', 'failed_count', 'error_message', 'created_at', 'completed_at'
+        ]
@@ -0,0 +1,97 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+import logging
+
+from accounts.models import ContactMethod, User
+from habits.models import Badge, Checkin, Habit
+from .models import MessageTemplate
+
+logger = logging.getLogger(__name__)
+
+
+def publish_on_commit(trigger, user_id, context=None):
+    """Evaluate aha-moment rules once the triggering write is committed"""
+    from .tasks import process_aha_event
+
+    transaction.on_commit(lambda: process_aha_event.delay(trigger, str(user_id), context or {}))
+
+
+@receiver(post_save, sender=User)
+def publish_user_signup(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    try:
+        publish_on_commit('user_signup', instance.id)
+    except Exception as e:
+        logger.error(f"Error publishing signup event: {str(e)}")
+
+
+@receiver(post_save, sender=Habit)
+def publish_habit_created(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    try:
+        publish_on_commit('habit_created', instance.user_id, {
+            'habit_id': str(instance.id),
+            'habit_title': instance.title,
+            'habit_difficulty': instance.difficulty_level,
+        })
+    except Exception as e:
+        logger.error(f"Error publishing habit event: {str(e)}")
+
+
+@receiver(post_save, sender=Checkin)
+def publish_checkin(sender, instance, created, **kwargs):
+    """Only completed checkins can extend a streak"""
+    if not created or not instance.value:
+        return
+
+    from .tasks import process_checkin_event
+
+    try:
+        checkin_id = str(instance.id)
+        transaction.on_commit(lambda: process_checkin_event.delay(checkin_id))
+    except Exception as e:
+        logger.error(f"Error publishing checkin event: {str(e)}")
+
+
+@receiver(post_save, sender=Badge)
+def publish_badge_earned(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    try:
+        publish_on_commit('badge_earned', instance.user_id, {
+            'badge_type': instance.type,
+            'badge_name': instance.get_type_display(),
+        })
+    except Exception as e:
+        logger.error(f"Error publishing badge event: {str(e)}")
+
+
+@receiver(post_save, sender=ContactMethod)
+@receiver(post_delete, sender=ContactMethod)
+def invalidate_contact_index(sender, instance, **kwargs):
+    """Verification or consent changes must reach webhook sender lookups"""
+    from .webhooks import ContactIndex
+
+    if instance.channel in ('telegram', 'whatsapp'):
+        ContactIndex.invalidate(instance.channel, instance.address)
+
+
+@receiver(post_save, sender=MessageTemplate)
+def publish_template_version(sender, instance, **kwargs):
+    """Every process recompiles the template on its next render"""
+    from .templating import stamp_for, template_renderer
+
+    template_renderer.invalidate(instance.key, stamp_for(instance))
+
+
+@receiver(post_delete, sender=MessageTemplate)
+def retire_template_version(sender, instance, **kwargs):
+    from .templating import template_renderer
+
+    template_renderer.invalidate(instance.key)
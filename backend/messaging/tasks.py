@@ -7,30 +7,31 @@ import logging
 
 from accounts.models import User, ChannelPreference
 from habits.models import Habit, Checkin
-from messaging.models import OutboundMessage
+from messaging.models import OutboundMessage, PendingNotification, SendTimeProfile
 from messaging.email_service import EmailService
 from messaging.aha_moments import AhaMoments, AhaMomentScheduler
 from messaging.email_templates import EmailTemplates
+from messaging.delivery import EmailLane, email_rate_limiter, defer_task
+from messaging.email_analytics import EmailAnalytics
+from messaging.link_tracking import add_open_pixel
+from messaging.channels import resolve_channel
+from messaging.templating import template_renderer
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task
-def send_habit_reminder(habit_id, user_id):
+@shared_task(bind=True)
+def send_habit_reminder(self, habit_id, user_id):
     """Send habit reminder notification"""
     try:
         habit = Habit.objects.get(id=habit_id, user_id=user_id)
         user = User.objects.get(id=user_id)
         
-        # Check if user has opted in for notifications
-        try:
-            prefs = ChannelPreference.objects.get(user=user, channel='email')
-            if not prefs.allow_prompts:
-                logger.info(f"User {user.email} has disabled habit reminders")
-                return
-        except ChannelPreference.DoesNotExist:
-            # Default to allowing notifications for new users
-            pass
+        # Check if user has opted in for notifications (default to allowing for new users)
+        prefs = ChannelPreference.objects.filter(user=user).first()
+        if prefs and not prefs.allow_prompts:
+            logger.info(f"User {user.email} has disabled habit reminders")
+            return
         
         # Check quiet hours (default 10 PM - 8 AM)
         current_hour = timezone.now().hour
@@ -44,6 +45,34 @@ def send_habit_reminder(habit_id, user_id):
             logger.info(f"User already completed habit {habit.title} today")
             return
         
+        # Chat users get a short message through the outbox on their primary channel
+        channel = resolve_channel(user)
+        if channel != 'email':
+            rendered = template_renderer.render('habit_reminder', channel, {
+                'user_name': user.name or 'Hero',
+                'habit_title': habit.title,
+            })
+            OutboundMessage.objects.create(
+                user=user,
+                channel=channel,
+                template_key='habit_reminder',
+                payload_json={
+                    'habit_id': str(habit.id),
+                    'habit_title': habit.title,
+                    'text': rendered['text'] if rendered else f"⏰ Time for {habit.title}! Reply 'done' when you've finished.",
+                },
+                status='queued'
+            )
+            process_outbox.delay()
+            logger.info(f"Habit reminder queued for {user.email} on {channel}")
+            return
+        
+        # Wait for provider capacity instead of competing with OTP codes
+        allowed, retry_after = email_rate_limiter.acquire(EmailLane.BULK)
+        if not allowed:
+            defer_task(self, retry_after)
+            return
+        
         # Send reminder
         success = EmailService.send_habit_reminder(user, habit)
         
@@ -51,8 +80,8 @@ def send_habit_reminder(habit_id, user_id):
         OutboundMessage.objects.create(
             user=user,
             channel='email',
-            message_type='habit_reminder',
-            content=f"Reminder: {habit.title}",
+            template_key='habit_reminder',
+            payload_json={'habit_id': str(habit.id), 'habit_title': habit.title},
             status='sent' if success else 'failed',
             sent_at=timezone.now() if success else None
         )
@@ -66,65 +95,78 @@ def send_habit_reminder(habit_id, user_id):
         logger.error(f"Error in send_habit_reminder task: {str(e)}")
 
 
-@shared_task 
-def send_achievement_notification(user_id, achievement_type, details=None):
-    """Send achievement notification"""
+@shared_task(bind=True)
+def send_achievement_notification(self, user_id, achievement_type, details=None):
+    """Send achievement notification (coalesced with other notifications in the same window)"""
+    from messaging.coalescing import NotificationCoalescer
+    
     try:
         user = User.objects.get(id=user_id)
         
-        # Check if user has opted in for achievement notifications
-        try:
-            prefs = ChannelPreference.objects.get(user=user, channel='email')
-            if not prefs.allow_prompts:
-                logger.info(f"User {user.email} has disabled achievement notifications")
-                return
-        except ChannelPreference.DoesNotExist:
-            # Default to allowing notifications for new users
-            pass
-        
-        # Send achievement notification
-        success = EmailService.send_achievement_notification(
-            user, achievement_type, details or {}
-        )
-        
-        # Log the message
-        OutboundMessage.objects.create(
-            user=user,
-            channel='email',
-            message_type='achievement',
-            content=f"Achievement: {achievement_type}",
-            status='sent' if success else 'failed',
-            sent_at=timezone.now() if success else None
-        )
+        # Check if user has opted in for achievement notifications (default to allowing for new users)
+        prefs = ChannelPreference.objects.filter(user=user).first()
+        if prefs and not prefs.allow_prompts:
+            logger.info(f"User {user.email} has disabled achievement notifications")
+            return
         
-        if success:
-            logger.info(f"Achievement notification sent to {user.email}: {achievement_type}")
-        else:
-            logger.error(f"Failed to send achievement notification to {user.email}")
+        NotificationCoalescer.add(user, 'achievement', achievement_type, details or {})
+        logger.info(f"Achievement notification held for {user.email}: {achievement_type}")
             
     except Exception as e:
         logger.error(f"Error in send_achievement_notification task: {str(e)}")
 
 
+@shared_task
+def flush_pending_notifications(user_id):
+    """Merge a user's held notifications into one email and hand it to the outbox"""
+    from messaging.coalescing import NotificationCoalescer
+    
+    try:
+        user = User.objects.get(id=user_id)
+        message = NotificationCoalescer.flush(user)
+        if message:
+            process_outbox.delay()
+        return str(message.id) if message else None
+        
+    except Exception as e:
+        logger.error(f"Error in flush_pending_notifications task: {str(e)}")
+        return None
+
+
 @shared_task
 def schedule_daily_reminders():
     """Schedule habit reminders for all active users"""
     try:
+        from messaging.send_times import SendTimeModel
+        
         current_time = timezone.now()
-        reminder_hour = 19  # 7 PM default reminder time
+        default_hour = 19  # 7 PM default reminder time
         
         # Get all active habits that need reminders
-        habits = Habit.objects.filter(
+        habits = list(Habit.objects.filter(
             is_active=True,
             cadence='daily',
             user__is_active=True
-        ).select_related('user')
+        ).select_related('user'))
+        
+        # Each user's preferred hour, from their precomputed send time profile
+        fallback_hours = SendTimeModel.get_global_daily_hours()
+        hours_by_user = dict(
+            SendTimeProfile.objects.filter(
+                user_id__in={habit.user_id for habit in habits}
+            ).values_list('user_id', 'daily_hours')
+        )
         
         count = 0
         for habit in habits:
             # Check if user already completed today
             today = current_time.date()
             if not Checkin.objects.filter(habit=habit, date=today).exists():
+                reminder_hour = SendTimeModel.get_send_hour(
+                    habit.user_id, today, default_hour,
+                    daily_hours=hours_by_user.get(habit.user_id) or fallback_hours or []
+                )
+                
                 # Schedule reminder
                 send_habit_reminder.apply_async(
                     args=[str(habit.id), str(habit.user.id)],
@@ -155,16 +197,17 @@ def check_streak_achievements():
             for habit in habits:
                 current_streak = habit.get_current_streak()
                 if current_streak == milestone:
+                    achievement_type = 'first_habit' if milestone == 1 else f'streak_{milestone}'
+                    
                     # Check if we already sent this achievement
-                    recent_achievement = OutboundMessage.objects.filter(
+                    recent_achievement = PendingNotification.objects.filter(
                         user=habit.user,
-                        message_type='achievement',
-                        content__contains=f'streak_{milestone}',
-                        sent_at__gte=timezone.now() - timedelta(days=1)
+                        kind='achievement',
+                        key=achievement_type,
+                        created_at__gte=timezone.now() - timedelta(days=1)
                     ).exists()
                     
                     if not recent_achievement:
-                        achievement_type = 'first_habit' if milestone == 1 else f'streak_{milestone}'
                         details = {
                             'streak': milestone,
                             'habit': habit.title
@@ -182,12 +225,17 @@ def check_streak_achievements():
         logger.error(f"Error in check_streak_achievements task: {str(e)}")
 
 
-@shared_task
-def send_weekly_progress_summary(user_id):
+@shared_task(bind=True)
+def send_weekly_progress_summary(self, user_id):
     """Send weekly progress summary to user"""
     try:
         user = User.objects.get(id=user_id)
         
+        allowed, retry_after = email_rate_limiter.acquire(EmailLane.BULK)
+        if not allowed:
+            defer_task(self, retry_after)
+            return
+        
         # Get habit progress for the past week
         week_ago = timezone.now() - timedelta(days=7)
         habits = Habit.objects.filter(user=user, is_active=True)
@@ -204,67 +252,16 @@ def send_weekly_progress_summary(user_id):
         
         # Send summary email
         subject = f"🌟 Your Weekly Hero Summary!"
-        
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <title>Weekly Progress Summary</title>
-        </head>
-        <body style="font-family: Arial, sans-serif; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); margin: 0; padding: 20px;">
-            <div style="max-width: 600px; margin: 0 auto; background: white; border-radius: 20px; padding: 40px;">
-                <div style="text-align: center; margin-bottom: 30px;">
-                    <div style="font-size: 60px; margin-bottom: 20px;">📊</div>
-                    <h1 style="color: #667eea; margin: 0; font-size: 28px;">Weekly Hero Summary</h1>
-                    <p style="color: #666; font-size: 18px;">Hey {user.name}! Here's how you did this week! 🎉</p>
-                </div>
-                
-                <div style="background: linear-gradient(135deg, #84fab0 0%, #8fd3f4 100%); border-radius: 15px; padding: 30px; margin: 30px 0;">
-                    <h2 style="color: white; text-align: center; margin-bottom: 20px;">Your Stats</h2>
-                    <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 20px; text-align: center;">
-                        <div style="background: white; border-radius: 10px; padding: 20px;">
-                            <div style="font-size: 32px; font-weight: bold; color: #667eea;">{total_habits}</div>
-                            <div style="color: #666;">Active Quests</div>
-                        </div>
-                        <div style="background: white; border-radius: 10px; padding: 20px;">
-                            <div style="font-size: 32px; font-weight: bold; color: #667eea;">{completed_checkins}</div>
-                            <div style="color: #666;">Completed</div>
-                        </div>
-                    </div>
-                    <div style="background: white; border-radius: 10px; padding: 20px; margin-top: 20px; text-align: center;">
-                        <div style="font-size: 32px; font-weight: bold; color: #667eea;">{completion_rate:.1f}%</div>
-                        <div style="color: #666;">Completion Rate</div>
-                    </div>
-                </div>
-                
-                <div style="text-align: center; margin: 30px 0;">
-                    <p style="color: #666; font-size: 16px;">{"Amazing work! Keep it up! 🌟" if completion_rate >= 70 else "Every step counts! You're building great habits! 💪"}</p>
-                    <a href="https://quanta.app" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; text-decoration: none; padding: 15px 30px; border-radius: 25px; font-weight: bold; display: inline-block; margin-top: 20px;">
-                        🚀 Continue Your Journey
-                    </a>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        # Use EmailMultiAlternatives for HTML email
-        from django.core.mail import EmailMultiAlternatives
-        from django.conf import settings
-        
-        text_content = f"""
-        Weekly Hero Summary for {user.name}!
-        
-        Your Stats This Week:
-        - Active Quests: {total_habits}
-        - Completed: {completed_checkins}
-        - Completion Rate: {completion_rate:.1f}%
-        
-        {"Amazing work! Keep it up! 🌟" if completion_rate >= 70 else "Every step counts! You're building great habits! 💪"}
-        
-        Continue your journey at: https://quanta.app
-        """
+        digest = {
+            'user_name': user.name,
+            'title': 'Weekly Hero Summary',
+            'period_label': 'this week',
+            'total_habits': total_habits,
+            'completed_checkins': completed_checkins,
+            'completion_rate': completion_rate,
+        }
+        html_content = EmailTemplates.progress_digest(**digest)
+        text_content = EmailTemplates.progress_digest_text(**digest)
         
         email = EmailMultiAlternatives(
             subject=subject,
@@ -280,8 +277,8 @@ def send_weekly_progress_summary(user_id):
         OutboundMessage.objects.create(
             user=user,
             channel='email',
-            message_type='weekly_summary',
-            content=f"Weekly summary - {completion_rate:.1f}% completion",
+            template_key='weekly_summary',
+            payload_json={'completion_rate': round(completion_rate, 1)},
             status='sent' if success else 'failed',
             sent_at=timezone.now() if success else None
         )
@@ -295,6 +292,161 @@ def send_weekly_progress_summary(user_id):
         logger.error(f"Error in send_weekly_progress_summary task: {str(e)}")
 
 
+@shared_task(bind=True)
+def send_progress_digests(self, kind='weekly'):
+    """Send the weekly or monthly digest to every active user, resuming from the last checkpoint"""
+    from messaging.digests import DigestPipeline
+    
+    try:
+        finished, retry_after = DigestPipeline(kind).run()
+        if not finished:
+            defer_task(self, retry_after)
+        return finished
+        
+    except Exception as e:
+        logger.error(f"Error in send_progress_digests task: {str(e)}")
+        return False
+
+
+@shared_task(bind=True)
+def send_broadcast(self, broadcast_id):
+    """Send a segment broadcast, resuming from its last checkpoint"""
+    from messaging.broadcasts import BroadcastSender
+    from messaging.models import Broadcast
+    
+    try:
+        broadcast = Broadcast.objects.get(id=broadcast_id)
+        finished, retry_after = BroadcastSender(broadcast).run()
+        if not finished:
+            defer_task(self, retry_after)
+        return finished
+        
+    except Exception as e:
+        logger.error(f"Error in send_broadcast task: {str(e)}")
+        return False
+
+
+@shared_task(bind=True, max_retries=3)
+def send_otp_email(self, email, otp_code, user_name=None):
+    """Deliver a login code on the OTP lane"""
+    allowed, retry_after = email_rate_limiter.acquire(EmailLane.OTP)
+    if not allowed:
+        defer_task(self, retry_after)
+        return False
+    
+    if EmailService.send_otp_email(email, otp_code, user_name):
+        return True
+    
+    # Codes expire quickly, so retry soon rather than with a long backoff
+    if self.request.retries < self.max_retries:
+        raise self.retry(countdown=5 * (self.request.retries + 1))
+    
+    logger.error(f"Giving up on OTP email to {email}")
+    return False
+
+
+@shared_task
+def process_outbox(max_batches=10):
+    """Deliver queued outbound messages. Safe to run on many workers at once."""
+    from messaging.outbox import OutboxWorker
+
+    try:
+        worker = OutboxWorker()
+        processed = 0
+
+        for _ in range(max_batches):
+            claimed = worker.run_once()
+            processed += claimed
+            if claimed < worker.batch_size:
+                break
+
+        if processed:
+            logger.info(f"Outbox processed {processed} messages")
+        return processed
+
+    except Exception as e:
+        logger.error(f"Error in process_outbox task: {str(e)}")
+        return 0
+
+
+@shared_task
+def process_inbound_messages(max_batches=10):
+    """Parse and apply unprocessed inbound chat messages. Safe to run on many workers at once."""
+    from messaging.inbound import InboundProcessor
+
+    try:
+        processor = InboundProcessor()
+        processed = 0
+
+        for _ in range(max_batches):
+            claimed = processor.run_once()
+            processed += claimed
+            if claimed < processor.batch_size:
+                break
+
+        return processed
+
+    except Exception as e:
+        logger.error(f"Error in process_inbound_messages task: {str(e)}")
+        return 0
+
+
+@shared_task
+def flush_inbound_webhooks():
+    """Persist buffered webhook messages in bulk"""
+    from messaging.webhooks import InboundWriter
+
+    try:
+        return InboundWriter.flush()
+    except Exception as e:
+        logger.error(f"Error in flush_inbound_webhooks task: {str(e)}")
+        return 0
+
+
+@shared_task
+def parse_inbound_with_llm(message_ids):
+    """LLM fallback for inbound messages the rule parser could not resolve"""
+    from messaging.inbound import process_ambiguous
+
+    try:
+        return process_ambiguous(message_ids)
+    except Exception as e:
+        logger.error(f"Error in parse_inbound_with_llm task: {str(e)}")
+        return 0
+
+
+@shared_task
+def flush_email_tracking():
+    """Apply buffered email open and click events in bulk"""
+    from messaging.tracking import EmailTracker
+    
+    try:
+        return EmailTracker.flush()
+    except Exception as e:
+        logger.error(f"Error in flush_email_tracking task: {str(e)}")
+        return 0
+
+
+@shared_task
+def rollup_email_analytics(days=7):
+    """Refresh the daily email rollups for recent days"""
+    from messaging.email_analytics import EmailAnalytics
+    
+    return EmailAnalytics.rollup_daily_stats(days)
+
+
+@shared_task
+def rebuild_send_time_profiles():
+    """Recompute every user's best send slots from their activity histograms"""
+    from messaging.send_times import SendTimeModel
+    
+    try:
+        return SendTimeModel.rebuild_profiles()
+    except Exception as e:
+        logger.error(f"Error in rebuild_send_time_profiles task: {str(e)}")
+        return 0
+
+
 @shared_task
 def cleanup_old_messages():
     """Clean up old outbound messages to save database space"""
@@ -335,17 +487,33 @@ def send_aha_moment_email(self, user_id, moment_key, context=None):
             logger.info(f"Skipping email to inactive user: {user.email}")
             return False
         
-        # Generate personalized email content
-        html_content = get_personalized_email_content(user, moment_key, context or {})
-        if not html_content:
-            logger.error(f"Failed to generate email content for {moment_key}")
+        allowed, retry_after = email_rate_limiter.acquire(EmailLane.for_moment(moment))
+        if not allowed:
+            defer_task(self, retry_after)
             return False
         
-        # Extract subject from moment definition
-        subject = moment.get('subject', f'Message from Quanta')
-        
-        # Create plain text version (simplified)
-        text_content = create_text_version(html_content)
+        # Editable copy from MessageTemplate wins over the built-in templates
+        rendered = template_renderer.render(moment_key, 'email', {
+            'user_name': user.name or 'Hero',
+            'user_email': user.email,
+            **(context or {})
+        })
+        if rendered:
+            html_content = rendered['html']
+            subject = rendered['subject'] or moment.get('subject', 'Message from Quanta')
+            text_content = rendered['text']
+        else:
+            # Generate personalized email content
+            html_content = get_personalized_email_content(user, moment_key, context or {})
+            if not html_content:
+                logger.error(f"Failed to generate email content for {moment_key}")
+                return False
+            
+            # Extract subject from moment definition
+            subject = moment.get('subject', f'Message from Quanta')
+            
+            # Create plain text version (simplified)
+            text_content = create_text_version(html_content)
         
         # Create and send email with tracking
         success = send_email_with_analytics(
@@ -461,16 +629,24 @@ def create_text_version(html_content):
 
 def send_email_with_analytics(user, subject, html_content, text_content, template_key, context):
     """Send email with analytics tracking"""
+    outbound_message = None
     try:
-        # Create outbound message record
+        # Create outbound message record, claimed so the outbox leaves it alone
         outbound_message = OutboundMessage.objects.create(
             user=user,
             channel='email',
             template_key=template_key,
             payload_json=context,
-            status='queued'
+            status='sending',
+            claimed_at=timezone.now(),
+            attempts=1
         )
         
+        # Open pixel and click tracking
+        tracking_id = EmailAnalytics.generate_tracking_id()
+        EmailAnalytics.log_email_sent(user, template_key, tracking_id, message_id=str(outbound_message.id))
+        html_content = add_open_pixel(EmailAnalytics.add_click_tracking(html_content, tracking_id), tracking_id)
+        
         # Create email
         email = EmailMultiAlternatives(
             subject=subject,
@@ -487,6 +663,7 @@ def send_email_with_analytics(user, subject, html_content, text_content, templat
             # Update message status
             outbound_message.status = 'sent'
             outbound_message.sent_at = timezone.now()
+            outbound_message.claimed_at = None
             outbound_message.save()
             
             logger.info(f"Email sent successfully: {template_key} to {user.email}")
@@ -494,6 +671,7 @@ def send_email_with_analytics(user, subject, html_content, text_content, templat
         else:
             outbound_message.status = 'failed'
             outbound_message.error_message = 'Email send failed'
+            outbound_message.claimed_at = None
             outbound_message.save()
             
             logger.error(f"Email send failed: {template_key} to {user.email}")
@@ -501,30 +679,58 @@ def send_email_with_analytics(user, subject, html_content, text_content, templat
             
     except Exception as e:
         logger.error(f"Error sending email with analytics: {str(e)}")
+        if outbound_message is not None:
+            # Otherwise the outbox takes the stale 'sending' claim for a retry
+            # of a message that may already have gone out
+            OutboundMessage.objects.filter(id=outbound_message.id).update(
+                status='failed', error_message=str(e), claimed_at=None
+            )
         return False
 
 
 @shared_task
-def check_and_trigger_aha_moments():
-    """Check for users who should receive aha moment emails"""
+def process_aha_event(trigger, user_id, context=None):
+    """Evaluate aha-moment rules for one domain event"""
+    from .aha_rules import AhaRuleEngine
+    
     try:
-        # Check for inactive users (re-engagement)
-        AhaMomentScheduler.check_inactive_users()
-        
-        # Check for other aha moment triggers
-        users = User.objects.filter(is_active=True)
-        
-        for user in users:
-            # Check for monthly report trigger (first of the month)
-            if timezone.now().day == 1:
-                AhaMomentScheduler.trigger_monthly_report(user)
-        
-        logger.info("Completed aha moments check")
-        return True
-        
+        user = User.objects.get(id=user_id, is_active=True)
+        return AhaRuleEngine.publish(trigger, user, context or {})
+    except User.DoesNotExist:
+        logger.warning(f"Skipping {trigger} event for missing user {user_id}")
+        return []
     except Exception as e:
-        logger.error(f"Error checking aha moments: {str(e)}")
-        return False
+        logger.error(f"Error processing {trigger} event for user {user_id}: {str(e)}")
+        return []
+
+
+@shared_task
+def process_checkin_event(checkin_id):
+    """A completed checkin may reach a streak milestone"""
+    from .aha_rules import AhaRuleEngine
+    
+    try:
+        checkin = Checkin.objects.select_related('habit__user').get(id=checkin_id)
+        return AhaRuleEngine.handle_checkin(checkin.habit.user, checkin.habit, checkin.date)
+    except Checkin.DoesNotExist:
+        return []
+    except Exception as e:
+        logger.error(f"Error processing checkin {checkin_id}: {str(e)}")
+        return []
+
+
+@shared_task
+def fire_aha_inactivity_timers():
+    """Fire re-engagement moments for users who just crossed an inactivity threshold or broke a streak"""
+    from .aha_rules import AhaRuleEngine
+    
+    try:
+        fired = AhaRuleEngine.fire_inactivity_timers()
+        fired += AhaRuleEngine.fire_streak_breaks()
+        return fired
+    except Exception as e:
+        logger.error(f"Error firing inactivity timers: {str(e)}")
+        return 0
 
 
 @shared_task
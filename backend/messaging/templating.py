@@ -0,0 +1,180 @@
+"""
+Database-backed message templates
+
+MessageTemplate rows let copy change without a deploy. Each active row is
+compiled once per version (its updated_at) into Django Template objects and
+kept in a per-process LRU, so rendering is a dictionary lookup plus
+Template.render. Saving or deleting a row publishes a new version marker in
+the shared cache, and every process recompiles that key on its next use.
+
+A channel-specific row (key 'habit_reminder.telegram') wins over the
+generic one ('habit_reminder'). Email bodies are HTML and autoescaped; chat
+bodies are plain text.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.template import Context, Engine, TemplateSyntaxError
+from django.template.base import VariableNode
+from django.template.defaulttags import ForNode, WithNode
+
+from .models import MessageTemplate
+
+logger = logging.getLogger(__name__)
+
+
+# Always available to templates without being declared
+BUILTIN_VARIABLES = {'user_name', 'user_email', 'forloop', 'True', 'False', 'None'}
+
+MISSING = 'missing'
+
+
+class TemplateValidationError(ValueError):
+    """A template uses variables it does not declare, or does not parse"""
+
+
+html_engine = Engine(autoescape=True)
+text_engine = Engine(autoescape=False)
+
+
+def used_variables(template):
+    """Top-level context names a compiled template reads"""
+    names = set()
+    local = set()
+
+    for node in template.nodelist.get_nodes_by_type(ForNode):
+        local.update(node.loopvars)
+    for node in template.nodelist.get_nodes_by_type(WithNode):
+        local.update(node.extra_context)
+
+    for node in template.nodelist.get_nodes_by_type(VariableNode):
+        var = node.filter_expression.var
+        lookups = getattr(var, 'lookups', None)
+        if lookups:
+            names.add(lookups[0])
+
+    return names - local
+
+
+class CompiledTemplate:
+    """Compiled subject and body for one template row"""
+
+    def __init__(self, row, channel):
+        self.key = row.key
+        self.channel = channel
+        self.declared = set(row.variables or [])
+
+        engine = html_engine if channel == 'email' else text_engine
+        try:
+            self.body = engine.from_string(row.body)
+            self.subject = text_engine.from_string(row.subject) if row.subject else None
+        except TemplateSyntaxError as e:
+            raise TemplateValidationError(f"Template {row.key} does not parse: {e}")
+
+        used = used_variables(self.body)
+        if self.subject:
+            used |= used_variables(self.subject)
+
+        undeclared = used - self.declared - BUILTIN_VARIABLES
+        if undeclared:
+            raise TemplateValidationError(
+                f"Template {row.key} uses undeclared variables: {', '.join(sorted(undeclared))}"
+            )
+
+    def render(self, context):
+        missing = self.declared - set(context)
+        if missing:
+            logger.warning(f"Rendering {self.key} without {', '.join(sorted(missing))}")
+
+        rendered = {'text': None, 'html': None}
+        rendered['subject'] = self.subject.render(Context(context, autoescape=False)).strip() if self.subject else None
+
+        body = self.body.render(Context(context, autoescape=self.channel == 'email'))
+        if self.channel == 'email':
+            from .tasks import create_text_version
+            rendered['html'] = body
+            rendered['text'] = create_text_version(body)
+        else:
+            rendered['text'] = body.strip()
+        return rendered
+
+
+def stamp_for(row):
+    """Version marker of a row as renderers see it; inactive rows count as missing"""
+    return row.updated_at.isoformat() if row is not None and row.is_active else MISSING
+
+
+def version_key(key):
+    return f'message_template_version:{key}'
+
+
+def validate_template(row, channel=None):
+    """Raise TemplateValidationError if the row would not compile"""
+    CompiledTemplate(row, channel or ('email' if row.channel in ('all', 'email') else row.channel))
+
+
+class TemplateRenderer:
+    """Per-process LRU of compiled templates, kept fresh through shared version markers"""
+
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, key, channel, context):
+        """
+        Render the active template for `key` on `channel`.
+
+        Returns a dict with 'subject', 'html' and 'text', or None when no
+        usable template exists, so callers can fall back to built-in copy.
+        """
+        compiled = self.get(f'{key}.{channel}', channel) or self.get(key, channel)
+        if compiled is None:
+            return None
+        return compiled.render(context)
+
+    def get(self, key, channel):
+        cache_key = (key, channel)
+        shared_version = cache.get(version_key(key))
+
+        with self._lock:
+            entry = self._templates.get(cache_key)
+            if entry is not None and shared_version is not None and entry[0] == shared_version:
+                self._templates.move_to_end(cache_key)
+                return entry[1]
+
+        row = MessageTemplate.objects.filter(key=key).first()
+        version = stamp_for(row)
+
+        compiled = None
+        if row is not None and row.is_active and row.channel in ('all', channel):
+            try:
+                compiled = CompiledTemplate(row, channel)
+            except TemplateValidationError as e:
+                logger.error(str(e))
+
+        # add, not set: a concurrent save's newer marker must win
+        cache.add(version_key(key), version, None)
+
+        with self._lock:
+            self._templates[cache_key] = (version, compiled)
+            self._templates.move_to_end(cache_key)
+            if len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+        return compiled
+
+    def invalidate(self, key, version=MISSING):
+        """Publish a key's new version; this process forgets it now, others on their next lookup"""
+        cache.set(version_key(key), version, None)
+        with self._lock:
+            for cache_key in [k for k in self._templates if k[0] == key]:
+                del self._templates[cache_key]
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+template_renderer = TemplateRenderer()
@@ -1,3 +1,1098 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from urllib.parse import parse_qs, unquote, urlsplit
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import ChannelPreference, ContactMethod, User
+from core.buffers import EventBuffer
+from core.models import Course, Enrollment
+from core.rate_limit import TokenBucket
+from habits.models import Checkin, EmbeddingJob, Habit, Mood
+from . import views
+from .aha_rules import AhaRuleEngine
+from .broadcasts import BroadcastSender, segment_queryset, validate_segment
+from .channels import EmailChannelAdapter
+from .coalescing import NotificationCoalescer
+from .delivery import EmailLane, EmailRateLimiter
+from .digests import DigestPipeline
+from .email_analytics import EmailAnalytics
+from .inbound import InboundProcessor, IntentParser
+from .link_tracking import LinkPlanCache, LinkRewritePlan, add_click_tracking, link_plan_cache, sign_click
+from .models import (
+    AhaMomentDelivery, Broadcast, DigestRun, EmailAnalyticsModel, EmailClickModel, EmailDailyRollup, InboundMessage,
+    MessageTemplate, OutboundMessage, PendingNotification, SendTimeProfile,
+)
+from .outbox import OutboxWorker
+from .send_times import SLOTS, SendTimeModel
+from .templating import CompiledTemplate, TemplateRenderer, TemplateValidationError, validate_template
+from .tracking import EmailTracker
+from .webhooks import InboundWriter
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    EMAIL_RATE_LIMIT={'PER_SECOND': 2, 'PER_DAY': 10, 'LANE_RESERVE': {'otp': 0.0, 'bulk': 0.5}},
+)
+class EmailRateLimiterTests(SimpleTestCase):
+
+    def setUp(self):
+        TokenBucket._local_state.clear()
+        patcher = mock.patch('core.rate_limit.time.monotonic', return_value=1000.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = EmailRateLimiter()
+
+    def daily_tokens(self):
+        return TokenBucket._local_state[self.limiter.daily_bucket.key][0]
+
+    def test_per_second_refusal_refunds_the_daily_budget(self):
+        self.assertEqual(self.limiter.acquire(EmailLane.OTP, 2), (True, 0.0))
+
+        allowed, retry_after = self.limiter.acquire(EmailLane.OTP)
+
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 0)
+        self.assertAlmostEqual(self.daily_tokens(), 8.0)
+
+    def test_bulk_lane_leaves_the_reserve_for_higher_lanes(self):
+        self.assertTrue(self.limiter.acquire(EmailLane.BULK)[0])
+        self.assertFalse(self.limiter.acquire(EmailLane.BULK)[0])
+
+        self.assertTrue(self.limiter.acquire(EmailLane.OTP)[0])
+        self.assertAlmostEqual(self.daily_tokens(), 8.0)
+
+    def test_daily_budget_refusal(self):
+        for _ in range(5):
+            self.assertTrue(self.limiter.acquire(EmailLane.OTP, 2)[0])
+            self.clock.return_value += 1
+
+        allowed, retry_after = self.limiter.acquire(EmailLane.OTP)
+
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 1000)
+
+
+class FakeAdapter:
+    """Channel adapter answering every message with the same result"""
+
+    def __init__(self, result):
+        self.result = result
+        self.sent = []
+
+    def send_batch(self, messages):
+        self.sent.extend(messages)
+        return [dict(self.result) for _ in messages]
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OutboxWorkerTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='outbox@example.com', name='Outbox')
+        self.worker = OutboxWorker(batch_size=10, max_attempts=2, lease_seconds=300)
+
+    def queue(self, **fields):
+        return OutboundMessage.objects.create(
+            user=self.user, channel='telegram', template_key='inbound_reply', payload_json={'text': 'hi'}, **fields
+        )
+
+    def run_with(self, result):
+        adapter = FakeAdapter(result)
+        with mock.patch('messaging.outbox.get_channel_adapter', return_value=adapter):
+            claimed = self.worker.run_once()
+        return claimed, adapter
+
+    def test_claims_only_due_queued_messages(self):
+        due = self.queue()
+        self.queue(next_attempt_at=timezone.now() + timedelta(minutes=5))
+        self.queue(status='sent')
+
+        messages = self.worker.claim_batch()
+
+        self.assertEqual([m.id for m in messages], [due.id])
+        due.refresh_from_db()
+        self.assertEqual(due.status, 'sending')
+        self.assertEqual(due.attempts, 1)
+        self.assertIsNotNone(due.claimed_at)
+        self.assertEqual(self.worker.claim_batch(), [])
+
+    def test_sent_messages_are_recorded(self):
+        message = self.queue()
+
+        claimed, adapter = self.run_with({'status': 'sent', 'provider_msg_id': 'p-1'})
+
+        self.assertEqual(claimed, 1)
+        self.assertEqual(adapter.sent, [message])
+        message.refresh_from_db()
+        self.assertEqual(message.status, 'sent')
+        self.assertEqual(message.provider_msg_id, 'p-1')
+        self.assertIsNotNone(message.sent_at)
+        self.assertIsNone(message.claimed_at)
+
+    def test_failures_back_off_then_give_up(self):
+        message = self.queue()
+
+        self.run_with({'status': 'failed', 'error': 'boom'})
+        message.refresh_from_db()
+        self.assertEqual(message.status, 'queued')
+        self.assertEqual(message.error_message, 'boom')
+        self.assertGreater(message.next_attempt_at, timezone.now())
+
+        # Not due yet
+        self.assertEqual(self.run_with({'status': 'sent'})[0], 0)
+
+        OutboundMessage.objects.filter(id=message.id).update(next_attempt_at=timezone.now())
+        self.run_with({'status': 'failed', 'error': 'boom again'})
+        message.refresh_from_db()
+        self.assertEqual(message.status, 'failed')
+        self.assertEqual(message.attempts, 2)
+
+    def test_deferred_messages_keep_their_attempt(self):
+        message = self.queue()
+
+        self.run_with({'status': 'deferred', 'retry_after': 30})
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, 'queued')
+        self.assertEqual(message.attempts, 0)
+        self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=20))
+
+    def test_stale_claims_are_released(self):
+        stale = self.queue(status='sending', claimed_at=timezone.now() - timedelta(seconds=600), attempts=1)
+        fresh = self.queue(status='sending', claimed_at=timezone.now(), attempts=1)
+
+        self.assertEqual(self.worker.release_stale_claims(), 1)
+
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, stale.claimed_at), ('queued', None))
+        self.assertEqual(fresh.status, 'sending')
+
+    def test_stale_claims_out_of_attempts_are_failed(self):
+        stuck = self.queue(status='sending', claimed_at=timezone.now() - timedelta(seconds=600), attempts=2)
+
+        self.assertEqual(self.worker.release_stale_claims(), 1)
+
+        stuck.refresh_from_db()
+        self.assertEqual((stuck.status, stuck.claimed_at), ('failed', None))
+        self.assertEqual(self.run_with({'status': 'sent'})[0], 0)
+
+    def test_direct_send_that_raises_is_failed_not_left_sending(self):
+        from .tasks import send_email_with_analytics
+
+        with mock.patch('messaging.tasks.EmailMultiAlternatives.send', side_effect=OSError('smtp down')):
+            sent = send_email_with_analytics(self.user, 'Hi', '<p>Hi</p>', 'Hi', 'welcome_hero', {})
+
+        self.assertFalse(sent)
+        message = OutboundMessage.objects.get(user=self.user, template_key='welcome_hero')
+        self.assertEqual(message.status, 'failed')
+        self.assertIsNone(message.claimed_at)
+        self.assertEqual(self.worker.release_stale_claims(), 0)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    EMAIL_TRACKING_BASE_URL='https://t.example/track',
+    EMAIL_CLICK_FALLBACK_URL='https://app.example',
+)
+class ClickTrackingTests(SimpleTestCase):
+
+    def setUp(self):
+        EventBuffer._local_buffers.clear()
+        link_plan_cache.clear()
+        patcher = mock.patch.object(EmailTracker, 'schedule_flush')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = RequestFactory()
+
+    def tracked_links(self, html):
+        links = []
+        for part in html.split('href="https://t.example/track/click/')[1:]:
+            link = urlsplit(part.split('"', 1)[0].replace('&amp;', '&'))
+            query = parse_qs(link.query)
+            links.append((unquote(link.path.rsplit('/', 1)[-1]), query['url'][0], query['sig'][0]))
+        return links
+
+    def click(self, tracking_id, url, sig=None, **extra):
+        params = {'url': url}
+        if sig is not None:
+            params['sig'] = sig
+        return views.track_email_click(self.factory.get(f'/api/email/track/click/{tracking_id}', params, **extra), tracking_id)
+
+    def test_only_web_links_are_rewritten_and_signed(self):
+        html = (
+            '<a href="https://example.com/a?x=1&amp;y=2">A</a>'
+            '<a href="mailto:hi@example.com">M</a>'
+            '<a href="{{ unsubscribe_url }}">U</a>'
+        )
+
+        tracked = add_click_tracking(html, 'tid-1')
+
+        url = 'https://example.com/a?x=1&y=2'
+        self.assertEqual(self.tracked_links(tracked), [('tid-1', url, sign_click('tid-1', url))])
+        self.assertIn('href="mailto:hi@example.com"', tracked)
+        self.assertIn('href="{{ unsubscribe_url }}"', tracked)
+
+    def test_plans_are_built_once_per_html_and_applied_per_message(self):
+        html = '<p>Hi</p><a href="https://example.com/a">A</a><a href="https://example.com/b">B</a>'
+
+        with mock.patch.object(LinkRewritePlan, 'build', wraps=LinkRewritePlan.build) as build:
+            first = add_click_tracking(html, 'tid-1')
+            second = add_click_tracking(html, 'tid 2')
+
+        build.assert_called_once_with(html)
+        self.assertEqual([link[0] for link in self.tracked_links(first)], ['tid-1', 'tid-1'])
+        self.assertEqual(
+            self.tracked_links(second),
+            [('tid 2', url, sign_click('tid 2', url)) for url in ('https://example.com/a', 'https://example.com/b')],
+        )
+        self.assertEqual(add_click_tracking('<p>No links</p>', 'tid-1'), '<p>No links</p>')
+
+    def test_plan_cache_evicts_the_least_recently_used(self):
+        plans = LinkPlanCache(max_size=2)
+        first = plans.get_plan('<a href="https://example.com/1">1</a>')
+        plans.get_plan('<a href="https://example.com/2">2</a>')
+        plans.get_plan('<a href="https://example.com/1">1</a>')
+        plans.get_plan('<a href="https://example.com/3">3</a>')
+
+        self.assertIs(plans.get_plan('<a href="https://example.com/1">1</a>'), first)
+        with mock.patch.object(LinkRewritePlan, 'build', wraps=LinkRewritePlan.build) as build:
+            plans.get_plan('<a href="https://example.com/2">2</a>')
+        build.assert_called_once()
+
+    def test_signed_click_redirects_and_is_buffered(self):
+        url = 'https://example.com/a'
+        response = self.click('tid-1', url, sign_click('tid-1', url), HTTP_X_FORWARDED_FOR='203.0.113.7, 10.0.0.1')
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], url)
+        [event] = EmailTracker.buffer.drain()
+        self.assertEqual((event['type'], event['tracking_id'], event['url'], event['ip_address']), ('click', 'tid-1', url, '203.0.113.7'))
+
+    def test_unsigned_or_tampered_clicks_go_to_the_fallback(self):
+        url = 'https://example.com/a'
+        for tracking_id, target, sig in (
+            ('tid-1', url, None),
+            ('tid-1', 'https://evil.example/', sign_click('tid-1', url)),
+            ('tid-2', url, sign_click('tid-1', url)),
+            ('tid-1', 'javascript:alert(1)', sign_click('tid-1', 'javascript:alert(1)')),
+        ):
+            response = self.click(tracking_id, target, sig)
+            self.assertEqual(response['Location'], 'https://app.example')
+
+        self.assertEqual(len(EmailTracker.buffer), 0)
+
+    def test_invalid_forwarded_addresses_are_not_stored(self):
+        request = self.factory.get('/', HTTP_X_FORWARDED_FOR='not-an-ip', REMOTE_ADDR='198.51.100.4')
+        self.assertEqual(views.get_client_ip(request), '198.51.100.4')
+
+        request = self.factory.get('/', HTTP_X_FORWARDED_FOR='nope', REMOTE_ADDR='')
+        self.assertIsNone(views.get_client_ip(request))
+
+        opens, _ = EmailTracker.summarize([
+            {'type': 'open', 'tracking_id': 't', 'ts': timezone.now().isoformat(), 'ip_address': '999.1.1.1'},
+        ])
+        self.assertNotIn('ip_address', opens['t'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class EmailTrackingFlushTests(TestCase):
+
+    def setUp(self):
+        EventBuffer._local_buffers.clear()
+        patcher = mock.patch.object(EmailTracker, 'schedule_flush')
+        self.schedule_flush = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = User.objects.create_user(email='tracking@example.com', name='Tracking')
+        self.analytics = EmailAnalyticsModel.objects.create(user=user, tracking_id='tid-1', template_key='weekly_summary')
+
+    def test_flush_applies_opens_and_clicks_in_bulk(self):
+        EmailTracker.record_open('tid-1', user_agent='iPhone', ip_address='203.0.113.7')
+        EmailTracker.record_open('tid-1')
+        EmailTracker.record_click('tid-1', 'https://example.com/a', ip_address='bogus')
+        EmailTracker.record_open('unknown-id')
+
+        self.assertEqual(EmailTracker.flush(), 4)
+
+        self.analytics.refresh_from_db()
+        self.assertEqual((self.analytics.open_count, self.analytics.click_count), (2, 1))
+        self.assertEqual(self.analytics.status, 'clicked')
+        self.assertEqual(self.analytics.ip_address, '203.0.113.7')
+        self.assertIsNotNone(self.analytics.opened_at)
+        click = EmailClickModel.objects.get(analytics=self.analytics)
+        self.assertEqual((click.url, click.ip_address), ('https://example.com/a', None))
+        self.assertEqual(len(EmailTracker.buffer), 0)
+
+    def test_failed_flush_puts_the_events_back(self):
+        EmailTracker.record_open('tid-1')
+        EmailTracker.record_click('tid-1', 'https://example.com/a')
+
+        with mock.patch.object(EmailTracker, 'apply_clicks', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                EmailTracker.flush()
+
+        self.assertEqual(len(EmailTracker.buffer), 2)
+        self.analytics.refresh_from_db()
+        self.assertEqual(self.analytics.open_count, 0)
+
+        self.assertEqual(EmailTracker.flush(), 2)
+        self.analytics.refresh_from_db()
+        self.assertEqual((self.analytics.open_count, self.analytics.click_count), (1, 1))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TELEGRAM_WEBHOOK_SECRET='secret')
+class InboundWebhookTests(SimpleTestCase):
+
+    def test_update_is_refused_when_it_cannot_be_buffered_durably(self):
+        # No Redis here, and the inbound buffer never falls back to memory
+        request = RequestFactory().post(
+            '/webhooks/telegram/',
+            data='{"update_id": 1, "message": {"text": "done", "chat": {"id": 42}}}',
+            content_type='application/json',
+            HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN='secret',
+        )
+
+        self.assertEqual(views.telegram_webhook(request).status_code, 503)
+
+    def test_unverified_update_is_forbidden(self):
+        request = RequestFactory().post('/webhooks/telegram/', data='{}', content_type='application/json')
+
+        self.assertEqual(views.telegram_webhook(request).status_code, 403)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class InboundFlushTests(TestCase):
+
+    def setUp(self):
+        for patcher in (
+            mock.patch.object(InboundWriter, 'buffer', EventBuffer('inbound_test')),
+            mock.patch.object(InboundWriter, 'schedule_flush'),
+            mock.patch('messaging.tasks.process_inbound_messages.delay'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        EventBuffer._local_buffers.clear()
+
+        self.user = User.objects.create_user(email='inbound@example.com', name='Inbound')
+        ContactMethod.objects.create(
+            user=self.user, channel='whatsapp', address='+15550001111', verified=True, consent='granted'
+        )
+
+    def receive(self, *msg_ids, address='+1 555 000 1111'):
+        InboundWriter.enqueue([
+            {'channel': 'whatsapp', 'address': address, 'text': 'done', 'provider_msg_id': msg_id}
+            for msg_id in msg_ids
+        ])
+
+    def test_messages_from_known_senders_are_stored(self):
+        self.receive('wamid.1', 'wamid.2')
+        self.receive('wamid.3', address='+1 555 999 9999')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(InboundWriter.flush(), 2)
+
+        stored = InboundMessage.objects.filter(user=self.user)
+        self.assertEqual(
+            sorted(m.meta_json['provider_msg_id'] for m in stored), ['wamid.1', 'wamid.2']
+        )
+        self.assertEqual(stored[0].meta_json['address'], '15550001111')
+        self.assertEqual(len(InboundWriter.buffer), 0)
+
+    def test_redeliveries_are_stored_once(self):
+        self.receive('wamid.1', 'wamid.1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(InboundWriter.flush(), 1)
+
+        self.receive('wamid.1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(InboundWriter.flush(), 0)
+
+        self.assertEqual(InboundMessage.objects.count(), 1)
+
+    def test_seen_keys_are_only_set_once_the_rows_commit(self):
+        self.receive('wamid.1')
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            InboundWriter.flush()
+        self.assertIsNone(cache.get(InboundWriter.dedup_key('whatsapp', 'wamid.1')))
+
+        for callback in callbacks:
+            callback()
+        self.assertIsNotNone(cache.get(InboundWriter.dedup_key('whatsapp', 'wamid.1')))
+
+    def test_failed_flush_puts_the_events_back_unseen(self):
+        self.receive('wamid.1', 'wamid.2')
+
+        with mock.patch.object(InboundMessage.objects, 'bulk_create', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                InboundWriter.flush()
+
+        self.assertEqual(len(InboundWriter.buffer), 2)
+        self.assertFalse(InboundMessage.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(InboundWriter.flush(), 2)
+        self.assertEqual(InboundMessage.objects.count(), 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AhaRuleEngineTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('messaging.aha_rules.AhaMomentScheduler.schedule_moment')
+        self.schedule = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('messaging.coalescing.NotificationCoalescer.add')
+        self.coalesce = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(email='aha@example.com', name='Aha')
+        self.habit = Habit.objects.create(user=self.user, title='Read')
+
+    def test_once_moments_fire_once(self):
+        context = {'habit_id': str(self.habit.id)}
+
+        self.assertEqual(
+            sorted(AhaRuleEngine.publish('habit_created', self.user, context)),
+            ['first_day_reminder', 'first_habit_created'],
+        )
+        self.assertEqual(AhaRuleEngine.publish('habit_created', self.user, {'habit_id': 'another'}), [])
+        self.assertEqual(self.schedule.call_count, 2)
+
+    def test_conditions_and_dedup_keys_select_occurrences(self):
+        context = {'habit_id': str(self.habit.id), 'streak_days': 7, 'date': '2026-01-07'}
+
+        self.assertEqual(AhaRuleEngine.publish('streak_reached', self.user, context), ['first_week_milestone'])
+        self.assertEqual(AhaRuleEngine.publish('streak_reached', self.user, context), [])
+        self.assertEqual(AhaRuleEngine.publish('streak_reached', self.user, {**context, 'streak_days': 8}), [])
+        # Celebrations are coalesced rather than scheduled one by one
+        self.coalesce.assert_called_once()
+        self.schedule.assert_not_called()
+
+        delivery = AhaMomentDelivery.objects.get(user=self.user, moment_key='first_week_milestone')
+        self.assertEqual(delivery.dedup_key, f'{self.habit.id}:7:2026-01-07')
+
+    def test_incomplete_context_deduplicates_per_day(self):
+        today = timezone.now().date().isoformat()
+
+        self.assertEqual(AhaRuleEngine.dedup_key('badge_earned', {}), f'{{badge_type}}@{today}')
+        self.assertEqual(AhaRuleEngine.publish('badge_earned', self.user), ['badge_unlock'])
+        self.assertEqual(AhaRuleEngine.publish('badge_earned', self.user), [])
+
+    def test_sweep_publishes_streaks_that_ended_today_once(self):
+        today = timezone.now().date()
+        Checkin.objects.bulk_create([
+            Checkin(habit=self.habit, date=today - timedelta(days=days), value=True) for days in range(2, 11)
+        ])
+        kept = Habit.objects.create(user=self.user, title='Walk')
+        Checkin.objects.bulk_create([
+            Checkin(habit=kept, date=today - timedelta(days=days), value=True) for days in range(1, 11)
+        ])
+
+        self.assertEqual(AhaRuleEngine.fire_streak_breaks(), 1)
+        self.schedule.assert_called_once()
+        user, moment_key, context = self.schedule.call_args.args
+        self.assertEqual((user, moment_key), (self.user, 'streak_recovery'))
+        self.assertEqual((context['habit_id'], context['broken_streak']), (str(self.habit.id), 9))
+
+        # Later sweeps the same day do not look again
+        self.assertEqual(AhaRuleEngine.fire_streak_breaks(), 0)
+
+    def test_short_streaks_ending_do_not_fire(self):
+        today = timezone.now().date()
+        Checkin.objects.bulk_create([
+            Checkin(habit=self.habit, date=today - timedelta(days=days), value=True) for days in range(2, 5)
+        ])
+
+        self.assertEqual(AhaRuleEngine.fire_streak_breaks(), 0)
+        self.schedule.assert_not_called()
+
+
+class DigestPipelineTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('messaging.digests.email_rate_limiter.acquire', return_value=(True, 0.0))
+        self.acquire = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.users = sorted(
+            (User.objects.create_user(email=f'digest{i}@example.com', name=f'Digest {i}') for i in range(3)),
+            key=lambda user: user.id,
+        )
+
+    def pipeline(self):
+        return DigestPipeline('weekly', chunk_size=2)
+
+    def test_sends_every_user_once_and_completes(self):
+        self.assertEqual(self.pipeline().run(), (True, 0))
+
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), sorted(u.email for u in self.users))
+        run = DigestRun.objects.get(kind='weekly')
+        self.assertEqual((run.status, run.sent_count, run.cursor), ('completed', 3, self.users[-1].id))
+        self.assertEqual((run.claimed_by, run.claimed_at), ('', None))
+        self.assertEqual(OutboundMessage.objects.filter(template_key='weekly_summary', status='sent').count(), 3)
+
+        # A second start for the same period sends nothing
+        self.assertEqual(self.pipeline().run(), (True, 0))
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_rate_limited_run_resumes_from_its_checkpoint(self):
+        self.acquire.side_effect = [(True, 0.0), (True, 0.0), (False, 60.0)]
+
+        self.assertEqual(self.pipeline().run(), (False, 60.0))
+        run = DigestRun.objects.get(kind='weekly')
+        self.assertEqual((run.status, run.sent_count, run.cursor), ('running', 2, self.users[1].id))
+
+        self.acquire.side_effect = None
+        self.assertEqual(self.pipeline().run(), (True, 0))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), sorted(u.email for u in self.users))
+        self.assertEqual(DigestRun.objects.get(kind='weekly').sent_count, 3)
+
+    def test_live_lease_held_by_another_runner_is_left_alone(self):
+        pipeline = self.pipeline()
+        run = pipeline.get_run()
+        DigestRun.objects.filter(id=run.id).update(claimed_by='other', claimed_at=timezone.now())
+
+        self.assertEqual(pipeline.run(), (True, 0))
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(DigestRun.objects.get(id=run.id).claimed_by, 'other')
+
+    @override_settings(DIGEST_LEASE_SECONDS=60)
+    def test_expired_lease_is_taken_over(self):
+        pipeline = self.pipeline()
+        run = pipeline.get_run()
+        DigestRun.objects.filter(id=run.id).update(
+            claimed_by='crashed', claimed_at=timezone.now() - timedelta(minutes=5), cursor=self.users[0].id, sent_count=1
+        )
+
+        self.assertEqual(pipeline.run(), (True, 0))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), sorted(u.email for u in self.users[1:]))
+        self.assertEqual(DigestRun.objects.get(id=run.id).sent_count, 3)
+
+    def test_losing_the_lease_mid_run_stops_sending(self):
+        pipeline = self.pipeline()
+        real_send_chunk = pipeline.send_chunk
+
+        def send_chunk_then_lose_lease(recipients, stats):
+            result = real_send_chunk(recipients, stats)
+            DigestRun.objects.filter(kind='weekly').update(claimed_by='other')
+            return result
+
+        with mock.patch.object(pipeline, 'send_chunk', side_effect=send_chunk_then_lose_lease):
+            self.assertEqual(pipeline.run(), (True, 0))
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(DigestRun.objects.get(kind='weekly').claimed_by, 'other')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class EmailChannelAdapterTests(SimpleTestCase):
+
+    def setUp(self):
+        TokenBucket._local_state.clear()
+
+    def message(self, email):
+        return OutboundMessage(
+            user=User(email=email, name='Adapter'),
+            channel='email',
+            template_key='broadcast',
+            payload_json={'subject': 'News', 'html': '<p>News</p>', 'lane': EmailLane.TRANSACTIONAL},
+        )
+
+    def test_sent_emails_record_the_message_id_they_went_out_with(self):
+        results = EmailChannelAdapter().send_batch([self.message('a@example.com'), self.message('b@example.com')])
+
+        self.assertEqual([r['status'] for r in results], ['sent', 'sent'])
+        ids = [r['provider_msg_id'] for r in results]
+        self.assertTrue(all(ids))
+        self.assertNotEqual(ids[0], ids[1])
+        self.assertEqual([m.message()['Message-ID'] for m in mail.outbox], ids)
+
+    def test_rate_limited_emails_are_deferred(self):
+        with mock.patch('messaging.channels.email_rate_limiter.acquire', return_value=(False, 12.0)):
+            results = EmailChannelAdapter().send_batch([self.message('a@example.com')])
+
+        self.assertEqual(results, [{'status': 'deferred', 'retry_after': 12.0}])
+        self.assertEqual(mail.outbox, [])
+
+
+class IntentParserTests(SimpleTestCase):
+
+    def test_rules_recognize_common_replies(self):
+        cases = {
+            'done': {'intent': 'checkin', 'value': True, 'rest': ''},
+            'Done reading, 20 pages': {'intent': 'checkin', 'value': True, 'rest': 'reading, 20 pages'},
+            'skip': {'intent': 'checkin', 'value': False, 'rest': ''},
+            'no': {'intent': 'checkin', 'value': False, 'rest': ''},
+            'mood 4 long day': {'intent': 'mood', 'score': 4, 'note': 'long day'},
+            'feeling great': {'intent': 'mood', 'score': 5, 'note': ''},
+            '3/5': {'intent': 'mood', 'score': 3, 'note': ''},
+            '😢': {'intent': 'mood', 'score': 1, 'note': ''},
+            '/help': {'intent': 'help'},
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(IntentParser.parse(text), expected)
+
+    def test_conversation_is_left_to_the_llm(self):
+        for text in ('', 'no idea what to do today', 'I went for a run but felt awful after'):
+            with self.subTest(text=text):
+                self.assertIsNone(IntentParser.parse(text))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class InboundProcessorTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.delays = {}
+        for name in ('process_checkin_event', 'process_outbox', 'parse_inbound_with_llm'):
+            patcher = mock.patch(f'messaging.tasks.{name}.delay')
+            self.delays[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('ai_services.embeddings.schedule_processing')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(email='chat@example.com', name='Chat')
+        self.habit = Habit.objects.create(user=self.user, title='Read')
+
+    def receive(self, text):
+        return InboundMessage.objects.create(user=self.user, channel='telegram', text=text)
+
+    def process(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return InboundProcessor(batch_size=10).run_once()
+
+    def test_rule_parsed_messages_are_written_in_bulk(self):
+        checkin_message = self.receive('done 20 pages')
+        self.receive('mood 4')
+
+        self.assertEqual(self.process(), 2)
+
+        checkin = Checkin.objects.get(habit=self.habit)
+        self.assertEqual((checkin.value, checkin.note, checkin.channel), (True, '20 pages', 'telegram'))
+        self.assertEqual(Mood.objects.get(user=self.user).score, 4)
+        self.assertEqual(OutboundMessage.objects.filter(user=self.user, template_key='inbound_reply').count(), 2)
+        checkin_message.refresh_from_db()
+        self.assertEqual((checkin_message.processed, checkin_message.parsed_intent), (True, 'checkin'))
+        self.assertEqual(checkin_message.meta_json['parser'], 'rules')
+
+        # Side effects the post_save signals would have had
+        self.delays['process_checkin_event'].assert_called_once_with(str(checkin.id))
+        self.delays['process_outbox'].assert_called_once_with()
+        self.assertEqual(
+            set(EmbeddingJob.objects.values_list('model', 'object_id')),
+            {('habits.Habit', self.habit.id), ('habits.Checkin', checkin.id)},
+        )
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_activity_at)
+
+    def test_updated_checkins_are_not_published_again(self):
+        Checkin.objects.create(habit=self.habit, date=timezone.localdate(), value=False)
+        self.receive('done')
+
+        self.process()
+
+        self.assertTrue(Checkin.objects.get(habit=self.habit).value)
+        self.delays['process_checkin_event'].assert_not_called()
+
+    def test_ambiguous_messages_go_to_the_llm(self):
+        Habit.objects.create(user=self.user, title='Walk')
+        message = self.receive('done')
+
+        self.assertEqual(self.process(), 1)
+
+        self.assertFalse(Checkin.objects.exists())
+        self.delays['parse_inbound_with_llm'].assert_called_once_with([str(message.id)])
+        message.refresh_from_db()
+        self.assertEqual(message.meta_json['parser'], 'llm_pending')
+
+    def test_processed_messages_are_not_claimed_again(self):
+        self.receive('done')
+        self.process()
+
+        self.assertEqual(self.process(), 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, NOTIFICATION_COALESCE_WINDOW_SECONDS=600)
+class NotificationCoalescerTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('messaging.tasks.flush_pending_notifications.apply_async')
+        self.schedule_flush = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(email='wins@example.com', name='Winner')
+
+    def add(self, *keys):
+        with self.captureOnCommitCallbacks(execute=True):
+            for key in keys:
+                NotificationCoalescer.add(self.user, 'achievement', key, {'level': 3})
+
+    def test_one_flush_per_window(self):
+        self.add('streak_7', 'level_up', 'first_habit')
+
+        self.schedule_flush.assert_called_once()
+        self.assertEqual(self.schedule_flush.call_args.kwargs['args'], [str(self.user.id)])
+        self.assertEqual(self.schedule_flush.call_args.kwargs['countdown'], 600)
+        self.assertEqual(PendingNotification.objects.filter(user=self.user).count(), 3)
+
+    def test_a_window_is_merged_into_one_queued_email(self):
+        self.add('streak_7', 'level_up')
+
+        message = NotificationCoalescer.flush(self.user)
+
+        self.assertEqual((message.channel, message.status, message.template_key), ('email', 'queued', 'notification_digest'))
+        self.assertEqual(message.payload_json['merged_count'], 2)
+        self.assertEqual(message.payload_json['lane'], EmailLane.TRANSACTIONAL)
+        self.assertIn('Week Warrior!', message.payload_json['html'])
+        self.assertIn('Level Up!', message.payload_json['text'])
+        self.assertFalse(PendingNotification.objects.filter(outbound_message__isnull=True).exists())
+
+        # Nothing left to send, and the next notification opens a new window
+        self.assertIsNone(NotificationCoalescer.flush(self.user))
+        self.add('first_habit')
+        self.assertEqual(self.schedule_flush.call_count, 2)
+
+    def test_a_lone_notification_keeps_its_own_template(self):
+        self.add('streak_7')
+
+        message = NotificationCoalescer.flush(self.user)
+
+        self.assertEqual(message.template_key, 'achievement_streak_7')
+        self.assertEqual(message.payload_json['merged_count'], 1)
+
+    def test_chat_users_get_one_plain_text_message(self):
+        ChannelPreference.objects.create(user=self.user, primary='telegram')
+        ContactMethod.objects.create(user=self.user, channel='telegram', address='42', verified=True, consent='granted')
+        self.add('streak_7', 'level_up')
+
+        message = NotificationCoalescer.flush(self.user)
+
+        self.assertEqual(message.channel, 'telegram')
+        self.assertTrue(message.payload_json['text'].startswith('🏆 2 new wins, Winner!'))
+        self.assertIn('⚡ Level Up!: You\'ve reached level 3!', message.payload_json['text'])
+
+
+class EmailAnalyticsRollupTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='reader@example.com', name='Reader')
+        self.today = timezone.now().date()
+
+    def record(self, days_ago, template_key='weekly_digest', opened=False, clicked=False, status='sent'):
+        sent_at = timezone.now() - timedelta(days=days_ago)
+        row = EmailAnalyticsModel.objects.create(
+            tracking_id=f'track-{EmailAnalyticsModel.objects.count()}',
+            user=self.user,
+            template_key=template_key,
+            opened_at=sent_at if opened or clicked else None,
+            first_clicked_at=sent_at if clicked else None,
+            status=status,
+        )
+        EmailAnalyticsModel.objects.filter(id=row.id).update(sent_at=sent_at)
+
+    def test_whole_days_are_rolled_up_per_template(self):
+        self.record(3, opened=True)
+        self.record(3)
+        self.record(3, 'aha_first_checkin', clicked=True)
+        self.record(0)
+
+        self.assertEqual(EmailAnalytics.rollup_daily_stats(days=7), 2)
+
+        rollup = EmailDailyRollup.objects.get(date=self.today - timedelta(days=3), template_key='weekly_digest')
+        self.assertEqual((rollup.sent, rollup.opened, rollup.clicked), (2, 1, 0))
+        # Today is still in progress and stays live
+        self.assertFalse(EmailDailyRollup.objects.filter(date=self.today).exists())
+
+        # Running again updates the same rows
+        self.record(3, status='unsubscribed')
+        EmailAnalytics.rollup_daily_stats(days=7)
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.sent, rollup.unsubscribed), (3, 1))
+
+    def test_period_counts_read_rollups_and_aggregate_the_rest_live(self):
+        self.record(3, opened=True)
+        self.record(3, 'aha_first_checkin', clicked=True)
+        EmailAnalytics.rollup_daily_stats(days=7)
+
+        # Rolled-up days are no longer read from the raw table
+        EmailAnalyticsModel.objects.all().delete()
+        self.record(2, opened=True)
+        self.record(0)
+
+        self.assertEqual(
+            EmailAnalytics.get_period_counts(7),
+            {'sent': 4, 'opened': 3, 'clicked': 1, 'unsubscribed': 0},
+        )
+        self.assertEqual(EmailAnalytics.get_period_counts(7, template_key='aha_first_checkin')['sent'], 1)
+
+        by_template = EmailAnalytics.get_period_counts(7, group_by_template=True)
+        self.assertEqual(by_template['weekly_digest']['sent'], 3)
+        self.assertEqual(by_template['aha_first_checkin']['clicked'], 1)
+
+    def test_days_outside_the_period_are_ignored(self):
+        self.record(10)
+        EmailAnalytics.rollup_daily_stats(days=30)
+
+        self.assertEqual(EmailAnalytics.get_period_counts(7)['sent'], 0)
+
+
+class SendTimeScoringTests(SimpleTestCase):
+
+    def setUp(self):
+        self.prior = SendTimeModel.build_prior([0.0] * SLOTS)
+
+    def test_quiet_hours_are_never_chosen(self):
+        histogram = [0.0] * SLOTS
+        histogram[SendTimeModel.slot(1, 3)] = 100.0
+
+        daily_hours, top_slots = SendTimeModel.summarize(SendTimeModel.score(histogram, self.prior))
+
+        self.assertNotIn(SendTimeModel.slot(1, 3), top_slots)
+        self.assertTrue(all(hour in SendTimeModel.ALLOWED_HOURS for hour in daily_hours))
+
+    def test_a_few_events_are_outweighed_by_the_prior(self):
+        population = [0.0] * SLOTS
+        population[SendTimeModel.slot(1, 18)] = 500.0
+        prior = SendTimeModel.build_prior(population)
+
+        histogram = [0.0] * SLOTS
+        histogram[SendTimeModel.slot(1, 9)] = 1.0
+        self.assertEqual(SendTimeModel.summarize(SendTimeModel.score(histogram, prior))[0][0], 18)
+
+        histogram[SendTimeModel.slot(1, 9)] = 20.0
+        self.assertEqual(SendTimeModel.summarize(SendTimeModel.score(histogram, prior))[0][0], 9)
+
+    def test_next_send_time_is_the_first_preferred_hour_after(self):
+        monday_evening = datetime(2026, 10, 19, 20, 30, tzinfo=dt_timezone.utc)
+
+        with mock.patch.object(SendTimeModel, 'get_daily_hours', return_value=[9, 10, 11, 12, 13, 14, 15]):
+            self.assertEqual(
+                SendTimeModel.next_send_time('user-1', after=monday_evening),
+                datetime(2026, 10, 20, 10, tzinfo=dt_timezone.utc),
+            )
+
+        with mock.patch.object(SendTimeModel, 'get_daily_hours', return_value=None):
+            self.assertEqual(
+                SendTimeModel.next_send_time('user-1', after=monday_evening, default_hour=21),
+                datetime(2026, 10, 19, 21, tzinfo=dt_timezone.utc),
+            )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SendTimeProfileTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='early@example.com', name='Early')
+        self.quiet = User.objects.create_user(email='quiet@example.com', name='Quiet')
+
+        # Eight Wednesday 14:00 checkins and three Thursday 09:00 opens
+        now = timezone.now()
+        wednesday = now - timedelta(days=(now.isoweekday() - 3) % 7 + 7)
+        wednesday = wednesday.replace(hour=14, minute=0, second=0, microsecond=0)
+        habit = Habit.objects.create(user=self.user, title='Run')
+        for week in range(8):
+            created_at = wednesday - timedelta(weeks=week)
+            checkin = Checkin.objects.create(habit=habit, date=created_at.date(), value=True)
+            Checkin.objects.filter(id=checkin.id).update(created_at=created_at)
+        for n in range(3):
+            EmailAnalyticsModel.objects.create(
+                tracking_id=f'open-{n}',
+                user=self.user,
+                template_key='weekly_digest',
+                opened_at=wednesday + timedelta(days=1, hours=-5) - timedelta(weeks=n),
+            )
+
+    def test_profiles_follow_each_users_history(self):
+        self.assertEqual(SendTimeModel.rebuild_profiles(), 1)
+
+        profile = SendTimeProfile.objects.get(user=self.user)
+        self.assertEqual(profile.daily_hours[2], 14)
+        self.assertEqual(profile.daily_hours[3], 9)
+        self.assertEqual(profile.sample_size, 8 + 3 * SendTimeModel.OPEN_WEIGHT)
+        self.assertEqual(profile.top_slots[0], SendTimeModel.slot(3, 14))
+
+    def test_users_without_history_get_the_population_hours(self):
+        SendTimeModel.rebuild_profiles()
+
+        self.assertFalse(SendTimeProfile.objects.filter(user=self.quiet).exists())
+        daily_hours = SendTimeModel.get_daily_hours(self.quiet.id)
+        self.assertEqual(daily_hours[2], 14)
+        self.assertEqual(daily_hours[0], SendTimeModel.ALLOWED_HOURS[0])
+
+
+class TemplateValidationTests(SimpleTestCase):
+
+    def template(self, body, variables=(), subject=''):
+        return MessageTemplate(key='habit_reminder', name='Reminder', body=body, subject=subject, variables=list(variables))
+
+    def test_declared_loop_and_builtin_variables_are_accepted(self):
+        validate_template(self.template(
+            '{% for habit in habits %}{{ habit.title }}{% endfor %} {{ user_name }}',
+            ['habits', 'streak'],
+            subject='{{ streak }} days',
+        ))
+
+    def test_undeclared_variables_are_rejected(self):
+        with self.assertRaisesMessage(TemplateValidationError, 'undeclared variables: level, streak'):
+            validate_template(self.template('{{ streak }}', subject='Level {{ level }}'))
+
+    def test_templates_that_do_not_parse_are_rejected(self):
+        with self.assertRaisesMessage(TemplateValidationError, 'does not parse'):
+            validate_template(self.template('{% if %}'))
+
+        with self.assertRaises(ValidationError):
+            self.template('{{ streak }}').clean()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TemplateRendererTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.renderer = TemplateRenderer()
+        self.row = MessageTemplate.objects.create(
+            key='habit_reminder',
+            name='Reminder',
+            subject='Time for {{ habit }}',
+            body='<p>Hi {{ user_name }}, {{ habit }}</p>',
+            variables=['habit'],
+        )
+
+    def test_rows_are_compiled_once_and_email_bodies_escaped(self):
+        with mock.patch('messaging.templating.CompiledTemplate', wraps=CompiledTemplate) as compile_row:
+            for _ in range(3):
+                rendered = self.renderer.render('habit_reminder', 'email', {'user_name': 'Ana', 'habit': '<b>Run</b>'})
+
+        compile_row.assert_called_once()
+        self.assertEqual(rendered['subject'], 'Time for <b>Run</b>')
+        self.assertEqual(rendered['html'], '<p>Hi Ana, &lt;b&gt;Run&lt;/b&gt;</p>')
+
+    def test_channel_rows_win_and_chat_bodies_are_plain_text(self):
+        MessageTemplate.objects.create(
+            key='habit_reminder.telegram', name='Reminder (Telegram)', body=' {{ habit }} now? ', variables=['habit'],
+        )
+
+        rendered = self.renderer.render('habit_reminder', 'telegram', {'habit': '<Run>'})
+
+        self.assertEqual(rendered['text'], '<Run> now?')
+        self.assertIsNone(rendered['html'])
+
+    def test_saves_elsewhere_are_picked_up_on_the_next_render(self):
+        self.renderer.render('habit_reminder', 'email', {'habit': 'Run'})
+
+        self.row.body = '<p>New copy: {{ habit }}</p>'
+        self.row.save()
+
+        self.assertEqual(self.renderer.render('habit_reminder', 'email', {'habit': 'Run'})['html'], '<p>New copy: Run</p>')
+
+        self.row.is_active = False
+        self.row.save()
+        self.assertIsNone(self.renderer.render('habit_reminder', 'email', {'habit': 'Run'}))
+
+    def test_invalid_rows_fall_back_to_built_in_copy(self):
+        MessageTemplate.objects.filter(id=self.row.id).update(body='{{ undeclared }}')
+
+        self.assertIsNone(self.renderer.render('habit_reminder', 'email', {}))
+
+
+class BroadcastSegmentTests(SimpleTestCase):
+
+    def test_invalid_segments_are_explained(self):
+        self.assertIsNone(validate_segment({'type': 'engagement', 'bucket': 'at_risk'}))
+        self.assertEqual(validate_segment([]), 'Segment must be an object')
+        self.assertEqual(validate_segment({'type': 'course'}), 'Course segments need a course_code')
+        self.assertEqual(validate_segment({'type': 'inactive', 'days': 'soon'}), 'Inactive days must be a number')
+        self.assertIn('must be one of', validate_segment({'type': 'everyone'}))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BroadcastSenderTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('messaging.broadcasts.email_rate_limiter.acquire', return_value=(True, 0.0))
+        self.acquire = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        MessageTemplate.objects.create(
+            key='course_news', name='Course news', subject='News', body='<p>Hi {{ user_name }}, {{ note }}</p>', variables=['note'],
+        )
+        course = Course.objects.create(title='Biology', code='BIO101')
+        self.students = sorted(
+            (User.objects.create_user(email=f'student{i}@example.com', name=f'Student {i}') for i in range(3)),
+            key=lambda user: user.id,
+        )
+        for student in self.students:
+            Enrollment.objects.create(user=student, course=course)
+
+        opted_out = User.objects.create_user(email='optout@example.com', name='Opted out')
+        Enrollment.objects.create(user=opted_out, course=course)
+        ChannelPreference.objects.create(user=opted_out, allow_prompts=False)
+        User.objects.create_user(email='other@example.com', name='Other')
+
+        self.broadcast = Broadcast.objects.create(
+            template_key='course_news',
+            segment_json={'type': 'course', 'course_code': 'BIO101'},
+            context_json={'note': 'lab moved to Friday'},
+        )
+
+    def sender(self):
+        return BroadcastSender(Broadcast.objects.get(id=self.broadcast.id), chunk_size=2, render_processes=0)
+
+    def test_segment_is_sent_in_chunks_and_completed(self):
+        self.assertEqual(self.sender().run(), (True, 0))
+
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), sorted(u.email for u in self.students))
+        self.assertIn('Hi Student 0, lab moved to Friday', mail.outbox[0].body)
+        self.broadcast.refresh_from_db()
+        self.assertEqual((self.broadcast.status, self.broadcast.sent_count, self.broadcast.cursor), ('completed', 3, self.students[-1].id))
+        self.assertEqual((self.broadcast.claimed_by, self.broadcast.claimed_at), ('', None))
+        self.assertEqual(OutboundMessage.objects.filter(template_key='course_news', status='sent').count(), 3)
+
+    def test_rate_limited_broadcast_resumes_from_its_cursor(self):
+        self.acquire.side_effect = [(True, 0.0), (True, 0.0), (False, 60.0)]
+
+        self.assertEqual(self.sender().run(), (False, 60.0))
+        self.broadcast.refresh_from_db()
+        self.assertEqual((self.broadcast.status, self.broadcast.sent_count, self.broadcast.cursor), ('running', 2, self.students[1].id))
+
+        self.acquire.side_effect = None
+        self.assertEqual(self.sender().run(), (True, 0))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), sorted(u.email for u in self.students))
+
+    def test_live_lease_held_by_another_runner_is_left_alone(self):
+        Broadcast.objects.filter(id=self.broadcast.id).update(claimed_by='other', claimed_at=timezone.now())
+
+        self.assertEqual(self.sender().run(), (True, 0))
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(Broadcast.objects.get(id=self.broadcast.id).status, 'queued')
+
+    def test_missing_template_fails_the_broadcast(self):
+        MessageTemplate.objects.filter(key='course_news').update(is_active=False)
+
+        self.assertEqual(self.sender().run(), (True, 0))
+        broadcast = Broadcast.objects.get(id=self.broadcast.id)
+        self.assertEqual(broadcast.status, 'failed')
+        self.assertIn('No active email template', broadcast.error_message)
+
+    def test_inactive_segment_selects_lapsed_users(self):
+        lapsed = self.students[0]
+        User.objects.filter(id=lapsed.id).update(last_activity_at=timezone.now() - timedelta(days=10))
+        User.objects.exclude(id=lapsed.id).update(last_activity_at=timezone.now())
+
+        self.assertEqual(list(segment_queryset({'type': 'inactive', 'days': 7})), [lapsed])
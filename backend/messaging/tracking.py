@@ -0,0 +1,215 @@
+"""
+Email open and click tracking
+
+The tracking endpoints never touch the database: they push the event onto a
+buffer and answer immediately. A background flush drains the buffer and
+applies all events for a batch with a handful of set-based statements
+(counter increments, first-seen timestamps kept with COALESCE) plus one bulk
+insert of click rows.
+"""
+import base64
+import ipaddress
+import logging
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, CharField, DateTimeField, F, GenericIPAddressField, IntegerField, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.buffers import EventBuffer
+from .email_analytics import EmailAnalytics
+from .models import EmailAnalyticsModel, EmailClickModel
+
+logger = logging.getLogger(__name__)
+
+
+# 1x1 transparent GIF served for every open
+TRACKING_PIXEL = base64.b64decode('R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7')
+
+
+def clean_ip(value):
+    """A valid IP address string, or None for anything else (headers are client-controlled)"""
+    try:
+        return str(ipaddress.ip_address((value or '').strip()))
+    except ValueError:
+        return None
+
+
+class EmailTracker:
+    """Buffer tracking events on the request path and apply them in bulk"""
+
+    buffer = EventBuffer('email_tracking')
+
+    FLUSH_DELAY_SECONDS = 10
+    FLUSH_BATCH_SIZE = 5000
+    UPDATE_CHUNK_SIZE = 500
+
+    @staticmethod
+    def record_open(tracking_id, user_agent=None, ip_address=None):
+        EmailTracker.record('open', tracking_id, user_agent=user_agent, ip_address=ip_address)
+
+    @staticmethod
+    def record_click(tracking_id, url, user_agent=None, ip_address=None):
+        EmailTracker.record('click', tracking_id, url=url, user_agent=user_agent, ip_address=ip_address)
+
+    @staticmethod
+    def record(event_type, tracking_id, **fields):
+        """Append an event and make sure a flush is scheduled"""
+        try:
+            EmailTracker.buffer.push({
+                'type': event_type,
+                'tracking_id': tracking_id,
+                'ts': timezone.now().isoformat(),
+                **fields,
+            })
+            EmailTracker.schedule_flush()
+        except Exception as e:
+            logger.error(f"Error buffering email {event_type} for {tracking_id}: {str(e)}")
+
+    @staticmethod
+    def schedule_flush():
+        """At most one pending flush task at a time"""
+        from .tasks import flush_email_tracking
+
+        if cache.add('email_tracking:flush_scheduled', 1, EmailTracker.FLUSH_DELAY_SECONDS * 3):
+            flush_email_tracking.apply_async(countdown=EmailTracker.FLUSH_DELAY_SECONDS)
+
+    @staticmethod
+    def flush(max_events=None):
+        """Drain the buffer and apply its events. Returns the number of events applied."""
+        cache.delete('email_tracking:flush_scheduled')
+
+        events = EmailTracker.buffer.drain(max_events or EmailTracker.FLUSH_BATCH_SIZE)
+        if not events:
+            return 0
+
+        try:
+            opens, clicks = EmailTracker.summarize(events)
+
+            tracking_ids = set(opens) | set(clicks)
+            analytics_ids = dict(
+                EmailAnalyticsModel.objects.filter(tracking_id__in=tracking_ids).values_list('tracking_id', 'id')
+            )
+            unknown = len(tracking_ids) - len(analytics_ids)
+            if unknown:
+                logger.warning(f"Dropped tracking events for {unknown} unknown tracking ids")
+
+            with transaction.atomic():
+                EmailTracker.apply_opens({t: s for t, s in opens.items() if t in analytics_ids})
+                EmailTracker.apply_clicks({t: s for t, s in clicks.items() if t in analytics_ids}, analytics_ids)
+        except Exception:
+            # Drained events are only in memory now; put them back for the next flush
+            EmailTracker.buffer.push_many(events)
+            EmailTracker.schedule_flush()
+            raise
+
+        # More events arrived than one batch holds; keep going
+        if len(EmailTracker.buffer):
+            EmailTracker.schedule_flush()
+
+        logger.info(f"Applied {len(events)} email tracking events")
+        return len(events)
+
+    @staticmethod
+    def summarize(events):
+        """Collapse raw events into per-tracking-id summaries"""
+        opens = OrderedDict()
+        clicks = OrderedDict()
+
+        for event in events:
+            ts = parse_datetime(event['ts'])
+            target = opens if event['type'] == 'open' else clicks
+            summary = target.setdefault(event['tracking_id'], {'count': 0, 'first_at': ts, 'urls': []})
+
+            summary['count'] += 1
+            summary['first_at'] = min(summary['first_at'], ts)
+            if event.get('user_agent'):
+                summary['user_agent'] = event['user_agent']
+            ip_address = clean_ip(event.get('ip_address'))
+            if ip_address:
+                summary['ip_address'] = ip_address
+            if event['type'] == 'click':
+                summary['urls'].append((event.get('url', ''), ts, event.get('user_agent'), clean_ip(event.get('ip_address'))))
+
+        return opens, clicks
+
+    @staticmethod
+    def apply_opens(opens):
+        """One UPDATE per chunk: add open counts, keep the first open time, refresh device info"""
+        tracking_ids = list(opens)
+
+        for i in range(0, len(tracking_ids), EmailTracker.UPDATE_CHUNK_SIZE):
+            chunk = tracking_ids[i:i + EmailTracker.UPDATE_CHUNK_SIZE]
+
+            updates = {
+                'open_count': F('open_count') + Case(
+                    *[When(tracking_id=t, then=Value(opens[t]['count'])) for t in chunk],
+                    default=Value(0), output_field=IntegerField(),
+                ),
+                'opened_at': Coalesce('opened_at', Case(
+                    *[When(tracking_id=t, then=Value(opens[t]['first_at'])) for t in chunk],
+                    output_field=DateTimeField(),
+                )),
+                'status': Case(
+                    When(status__in=['sent', 'delivered'], then=Value('opened')),
+                    default=F('status'), output_field=CharField(),
+                ),
+            }
+
+            with_ip = [t for t in chunk if opens[t].get('ip_address')]
+            if with_ip:
+                updates['ip_address'] = Case(
+                    *[When(tracking_id=t, then=Value(opens[t]['ip_address'])) for t in with_ip],
+                    default=F('ip_address'), output_field=GenericIPAddressField(),
+                )
+
+            with_agent = [t for t in chunk if opens[t].get('user_agent')]
+            if with_agent:
+                updates['user_agent'] = Case(
+                    *[When(tracking_id=t, then=Value(opens[t]['user_agent'])) for t in with_agent],
+                    default=F('user_agent'), output_field=CharField(),
+                )
+                updates['device_type'] = Case(
+                    *[When(tracking_id=t, then=Value(EmailAnalytics.parse_device_type(opens[t]['user_agent']))) for t in with_agent],
+                    default=F('device_type'), output_field=CharField(),
+                )
+
+            EmailAnalyticsModel.objects.filter(tracking_id__in=chunk).update(**updates)
+
+    @staticmethod
+    def apply_clicks(clicks, analytics_ids):
+        """One UPDATE per chunk for click counters plus one bulk insert of click rows"""
+        tracking_ids = list(clicks)
+
+        for i in range(0, len(tracking_ids), EmailTracker.UPDATE_CHUNK_SIZE):
+            chunk = tracking_ids[i:i + EmailTracker.UPDATE_CHUNK_SIZE]
+
+            EmailAnalyticsModel.objects.filter(tracking_id__in=chunk).update(
+                click_count=F('click_count') + Case(
+                    *[When(tracking_id=t, then=Value(clicks[t]['count'])) for t in chunk],
+                    default=Value(0), output_field=IntegerField(),
+                ),
+                first_clicked_at=Coalesce('first_clicked_at', Case(
+                    *[When(tracking_id=t, then=Value(clicks[t]['first_at'])) for t in chunk],
+                    output_field=DateTimeField(),
+                )),
+                status=Case(
+                    When(status__in=['sent', 'delivered', 'opened'], then=Value('clicked')),
+                    default=F('status'), output_field=CharField(),
+                ),
+            )
+
+        EmailClickModel.objects.bulk_create([
+            EmailClickModel(
+                analytics_id=analytics_ids[tracking_id],
+                url=url[:2048],
+                clicked_at=clicked_at,
+                user_agent=user_agent or '',
+                ip_address=ip_address,
+            )
+            for tracking_id, summary in clicks.items()
+            for url, clicked_at, user_agent, ip_address in summary['urls']
+        ])
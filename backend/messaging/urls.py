@@ -9,4 +9,10 @@ urlpatterns = [
     path('channels/preferences/', views.ChannelPreferencesView.as_view(), name='channel-preferences'),
     path('habits/<int:habit_id>/reminder/', views.TriggerHabitReminderView.as_view(), name='trigger-reminder'),
     path('notifications/stats/', views.NotificationStatsView.as_view(), name='notification-stats'),
+    path('broadcasts/', views.BroadcastView.as_view(), name='broadcasts'),
+    path('broadcasts/<uuid:broadcast_id>/', views.BroadcastDetailView.as_view(), name='broadcast-detail'),
+    path('email/track/open/<str:tracking_id>', views.track_email_open, name='email-track-open'),
+    path('email/track/click/<str:tracking_id>', views.track_email_click, name='email-track-click'),
+    path('webhooks/telegram/', views.telegram_webhook, name='telegram-webhook'),
+    path('webhooks/whatsapp/', views.whatsapp_webhook, name='whatsapp-webhook'),
 ]
\ No newline at end of file
@@ -3,13 +3,29 @@ from rest_framework.generics import ListAPIView, CreateAPIView, UpdateAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseRedirect
 from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+from django.conf import settings
+from urllib.parse import urlsplit
+import hmac
+import json
+import logging
 
-from .models import OutboundMessage, InboundMessage, ConsentLog
-from .tasks import send_habit_reminder, send_achievement_notification
+from .models import OutboundMessage, InboundMessage, ConsentLog, Broadcast, MessageTemplate
+from .tasks import send_habit_reminder, send_achievement_notification, process_outbox, send_broadcast
 from accounts.models import ContactMethod, ChannelPreference
 from accounts.serializers import ContactMethodSerializer
-from .serializers import OutboundMessageSerializer, ChannelPreferenceSerializer
+from .serializers import OutboundMessageSerializer, ChannelPreferenceSerializer, BroadcastSerializer
+from .broadcasts import can_broadcast, validate_segment
+from core.buffers import BufferUnavailable
+from .link_tracking import click_fallback_url, verify_click
+from .tracking import EmailTracker, TRACKING_PIXEL, clean_ip
+from .webhooks import InboundWriter, extract_telegram, extract_whatsapp, verify_telegram, verify_whatsapp
+
+logger = logging.getLogger(__name__)
 
 
 class SendMessageView(APIView):
@@ -55,6 +71,9 @@ class SendMessageView(APIView):
                 status='queued'
             )
             
+            # Wake the outbox now rather than waiting for the next scheduled run
+            transaction.on_commit(lambda: process_outbox.delay())
+            
             return Response({
                 'status': 'Message queued for delivery',
                 'message_id': str(outbound_message.id)
@@ -220,4 +239,147 @@ class NotificationStatsView(APIView):
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+
+class BroadcastView(APIView):
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        """List broadcasts the user started"""
+        broadcasts = Broadcast.objects.filter(created_by=request.user)[:50]
+        return Response(BroadcastSerializer(broadcasts, many=True).data)
+    
+    def post(self, request):
+        """Send one template to a course, engagement bucket or inactive segment"""
+        serializer = BroadcastSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        segment = serializer.validated_data.get('segment_json') or {}
+        
+        error = validate_segment(segment)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not can_broadcast(request.user, segment):
+            return Response(
+                {'error': 'Only coaches of this course can broadcast to it'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        template_key = serializer.validated_data['template_key']
+        if not MessageTemplate.objects.filter(
+            key=template_key, is_active=True, channel__in=['all', 'email']
+        ).exists():
+            return Response(
+                {'error': f'No active email template {template_key}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        with transaction.atomic():
+            broadcast = serializer.save(created_by=request.user)
+            transaction.on_commit(lambda: send_broadcast.delay(str(broadcast.id)))
+        
+        return Response(BroadcastSerializer(broadcast).data, status=status.HTTP_201_CREATED)
+
+
+class BroadcastDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, broadcast_id):
+        """Progress of one broadcast"""
+        try:
+            broadcast = Broadcast.objects.get(id=broadcast_id, created_by=request.user)
+        except Broadcast.DoesNotExist:
+            return Response({'error': 'Broadcast not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(BroadcastSerializer(broadcast).data)
+
+
+def get_client_ip(request):
+    """First valid address in X-Forwarded-For, else the socket address, else None"""
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded:
+        ip_address = clean_ip(forwarded.split(',')[0])
+        if ip_address:
+            return ip_address
+    return clean_ip(request.META.get('REMOTE_ADDR'))
+
+
+@require_GET
+def track_email_open(request, tracking_id):
+    """Serve the open pixel; the open is buffered, not written"""
+    EmailTracker.record_open(
+        tracking_id,
+        user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        ip_address=get_client_ip(request),
+    )
+    
+    response = HttpResponse(TRACKING_PIXEL, content_type='image/gif')
+    response['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+    return response
+
+
+@require_GET
+def track_email_click(request, tracking_id):
+    """Redirect to the original link; the click is buffered, not written"""
+    url = request.GET.get('url', '')
+    
+    # Only redirect to web links we signed for this tracking id
+    if urlsplit(url).scheme not in ('http', 'https') or not verify_click(tracking_id, url, request.GET.get('sig')):
+        return HttpResponseRedirect(click_fallback_url())
+    
+    EmailTracker.record_click(
+        tracking_id,
+        url,
+        user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        ip_address=get_client_ip(request),
+    )
+    return HttpResponseRedirect(url)
+
+
+@csrf_exempt
+@require_POST
+def telegram_webhook(request):
+    """Verify and buffer a Telegram update; rows are written by the batch writer"""
+    if not verify_telegram(request):
+        return HttpResponseForbidden()
+    
+    try:
+        InboundWriter.enqueue(extract_telegram(json.loads(request.body)))
+    except BufferUnavailable:
+        # Not acknowledged, so the provider delivers it again later
+        logger.error("Inbound buffer unavailable, refusing Telegram update")
+        return HttpResponse(status=503)
+    except ValueError:
+        # Malformed bodies are never going to parse; don't invite a retry
+        logger.warning("Ignoring malformed Telegram update")
+    
+    return HttpResponse(status=200)
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def whatsapp_webhook(request):
+    """Answer Meta's subscription handshake, or verify and buffer a notification"""
+    if request.method == 'GET':
+        verify_token = getattr(settings, 'WHATSAPP_VERIFY_TOKEN', '')
+        if (
+            request.GET.get('hub.mode') == 'subscribe'
+            and verify_token
+            and hmac.compare_digest(request.GET.get('hub.verify_token', ''), verify_token)
+        ):
+            return HttpResponse(request.GET.get('hub.challenge', ''))
+        return HttpResponseForbidden()
+    
+    if not verify_whatsapp(request):
+        return HttpResponseForbidden()
+    
+    try:
+        InboundWriter.enqueue(extract_whatsapp(json.loads(request.body)))
+    except BufferUnavailable:
+        # Not acknowledged, so the provider delivers it again later
+        logger.error("Inbound buffer unavailable, refusing WhatsApp notification")
+        return HttpResponse(status=503)
+    except ValueError:
+        logger.warning("Ignoring malformed WhatsApp notification")
+    
+    return HttpResponse(status=200)
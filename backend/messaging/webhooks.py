@@ -0,0 +1,255 @@
+"""
+Telegram and WhatsApp webhook ingestion
+
+Webhook requests only verify the payload, pull out the few fields we keep and
+push them onto a buffer; providers get their 200 without waiting on the
+database. A batch writer drains the buffer, resolves sender addresses to
+users through a cached ContactMethod index, and inserts the InboundMessage
+rows with a single bulk insert before kicking off inbound processing.
+"""
+import hashlib
+import hmac
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import ContactMethod
+from core.buffers import EventBuffer
+from .models import InboundMessage
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_address(channel, address):
+    """Telegram chat ids as-is; WhatsApp numbers as digits only"""
+    address = str(address).strip()
+    if channel == 'whatsapp':
+        return ''.join(ch for ch in address if ch.isdigit())
+    return address
+
+
+def verify_telegram(request):
+    """Telegram echoes the secret_token given to setWebhook in a header"""
+    secret = getattr(settings, 'TELEGRAM_WEBHOOK_SECRET', '')
+    if not secret:
+        return False
+    received = request.META.get('HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN', '')
+    return hmac.compare_digest(received, secret)
+
+
+def verify_whatsapp(request):
+    """Meta signs the raw body with the app secret (X-Hub-Signature-256)"""
+    secret = getattr(settings, 'WHATSAPP_APP_SECRET', '')
+    if not secret:
+        return False
+    expected = 'sha256=' + hmac.new(secret.encode(), request.body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(request.META.get('HTTP_X_HUB_SIGNATURE_256', ''), expected)
+
+
+def extract_telegram(payload):
+    """Text messages from one Telegram update"""
+    message = payload.get('message') or payload.get('edited_message') or {}
+    if not message.get('text'):
+        return []
+    return [{
+        'channel': 'telegram',
+        'address': str(message.get('chat', {}).get('id', '')),
+        'text': message['text'],
+        'provider_msg_id': f"{payload.get('update_id', '')}",
+    }]
+
+
+def extract_whatsapp(payload):
+    """Text messages from one WhatsApp Cloud API notification (may hold several)"""
+    events = []
+    for entry in payload.get('entry', []):
+        for change in entry.get('changes', []):
+            for message in change.get('value', {}).get('messages', []):
+                if message.get('type') == 'text':
+                    text = message.get('text', {}).get('body', '')
+                elif message.get('type') == 'button':
+                    text = message.get('button', {}).get('text', '')
+                else:
+                    continue
+                events.append({
+                    'channel': 'whatsapp',
+                    'address': message.get('from', ''),
+                    'text': text,
+                    'provider_msg_id': message.get('id', ''),
+                })
+    return events
+
+
+class ContactIndex:
+    """Cached (channel, address) -> user id lookups for verified, consenting contacts"""
+
+    TTL_SECONDS = 60 * 60
+    MISS_TTL_SECONDS = 5 * 60
+
+    @staticmethod
+    def key(channel, address):
+        return f'contact_index:{channel}:{address}'
+
+    @staticmethod
+    def resolve(pairs):
+        """Map each (channel, normalized address) to a user id, or None if unknown"""
+        pairs = set(pairs)
+        keys = {pair: ContactIndex.key(*pair) for pair in pairs}
+        cached = cache.get_many(list(keys.values()))
+
+        resolved = {}
+        missing = []
+        for pair, key in keys.items():
+            if key in cached:
+                resolved[pair] = cached[key] or None
+            else:
+                missing.append(pair)
+
+        if missing:
+            found = ContactIndex.load(missing)
+            resolved.update(found)
+            # Cache misses too, briefly, so unknown senders don't hit the database every time
+            cache.set_many({keys[p]: found[p] for p in missing if p in found}, ContactIndex.TTL_SECONDS)
+            cache.set_many({keys[p]: '' for p in missing if p not in found}, ContactIndex.MISS_TTL_SECONDS)
+
+        return resolved
+
+    @staticmethod
+    def load(pairs):
+        """One query for all uncached pairs"""
+        by_channel = {}
+        for channel, address in pairs:
+            by_channel.setdefault(channel, set()).add(address)
+
+        found = {}
+        for channel, addresses in by_channel.items():
+            # WhatsApp numbers may be stored with a leading +
+            candidates = set(addresses)
+            if channel == 'whatsapp':
+                candidates |= {f'+{a}' for a in addresses}
+
+            rows = ContactMethod.objects.filter(
+                channel=channel, address__in=candidates, verified=True
+            ).exclude(consent='revoked').values_list('address', 'user_id')
+
+            for address, user_id in rows:
+                found[(channel, normalize_address(channel, address))] = str(user_id)
+
+        return found
+
+    @staticmethod
+    def invalidate(channel, address):
+        cache.delete(ContactIndex.key(channel, normalize_address(channel, address)))
+
+
+class InboundWriter:
+    """Buffer webhook messages and persist them in bulk"""
+
+    # Acknowledged webhooks are never resent, so never fall back to process memory
+    buffer = EventBuffer('inbound_webhooks', durable=True)
+
+    FLUSH_DELAY_SECONDS = 1
+    FLUSH_BATCH_SIZE = 5000
+    DEDUP_TTL_SECONDS = 24 * 60 * 60
+
+    @staticmethod
+    def enqueue(events):
+        """
+        Called on the request path: one buffer push per message, no database access.
+
+        Raises BufferUnavailable when the messages cannot be queued durably;
+        the webhook must then fail so the provider retries.
+        """
+        now = timezone.now().isoformat()
+        for event in events:
+            event['address'] = normalize_address(event['channel'], event['address'])
+            event['ts'] = now
+            InboundWriter.buffer.push(event)
+        if events:
+            InboundWriter.schedule_flush()
+
+    @staticmethod
+    def dedup_key(channel, provider_msg_id):
+        return f'inbound_seen:{channel}:{provider_msg_id}'
+
+    @staticmethod
+    def schedule_flush():
+        """At most one pending flush task at a time"""
+        from .tasks import flush_inbound_webhooks
+
+        if cache.add('inbound_webhooks:flush_scheduled', 1, InboundWriter.FLUSH_DELAY_SECONDS * 10):
+            flush_inbound_webhooks.apply_async(countdown=InboundWriter.FLUSH_DELAY_SECONDS)
+
+    @staticmethod
+    def flush(max_events=None):
+        """Drain the buffer into InboundMessage rows. Returns the number of rows written."""
+        from .tasks import process_inbound_messages
+
+        cache.delete('inbound_webhooks:flush_scheduled')
+
+        events = InboundWriter.buffer.drain(max_events or InboundWriter.FLUSH_BATCH_SIZE)
+        if not events:
+            return 0
+
+        try:
+            users = ContactIndex.resolve((e['channel'], e['address']) for e in events)
+
+            # Providers retry slow or failed deliveries; keep one copy of each message
+            seen_keys = [
+                InboundWriter.dedup_key(e['channel'], e['provider_msg_id'])
+                for e in events if e.get('provider_msg_id')
+            ]
+            seen = set(cache.get_many(seen_keys))
+
+            rows = []
+            new_keys = []
+            unknown = 0
+            for event in events:
+                user_id = users.get((event['channel'], event['address']))
+                if not user_id:
+                    unknown += 1
+                    continue
+
+                if event.get('provider_msg_id'):
+                    key = InboundWriter.dedup_key(event['channel'], event['provider_msg_id'])
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    new_keys.append(key)
+
+                rows.append(InboundMessage(
+                    user_id=user_id,
+                    channel=event['channel'],
+                    text=event['text'],
+                    meta_json={
+                        'provider_msg_id': event.get('provider_msg_id', ''),
+                        'address': event['address'],
+                        'received_at': event['ts'],
+                    },
+                ))
+
+            if rows:
+                with transaction.atomic():
+                    InboundMessage.objects.bulk_create(rows, batch_size=1000)
+                    # Only stored messages count as seen, so retries of a failed batch get in
+                    transaction.on_commit(lambda: cache.set_many(
+                        dict.fromkeys(new_keys, 1), InboundWriter.DEDUP_TTL_SECONDS
+                    ))
+                process_inbound_messages.delay()
+        except Exception:
+            # Drained events are only in memory now; put them back for the next flush
+            InboundWriter.buffer.push_many(events)
+            InboundWriter.schedule_flush()
+            raise
+
+        if unknown:
+            logger.warning(f"Dropped {unknown} inbound messages from unknown senders")
+
+        if len(InboundWriter.buffer):
+            InboundWriter.schedule_flush()
+
+        logger.info(f"Wrote {len(rows)} inbound messages from {len(events)} webhook events")
+        return len(rows)
@@ -0,0 +1,16 @@
+"""
+Celery application for Eurekia Quanta
+
+Workers and beat are started with `celery -A quanta ...`. Configuration is
+read from the CELERY_* Django settings, including CELERY_BEAT_SCHEDULE, and
+tasks are discovered in each installed app's tasks module.
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quanta.settings')
+
+app = Celery('quanta')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
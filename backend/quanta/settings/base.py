@@ -4,6 +4,8 @@ Contains common settings shared across environments
 """
 import os
 from pathlib import Path
+
+from celery.schedules import crontab
 from django.core.management.utils import get_random_secret_key
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -139,6 +141,69 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+# Outbound email lanes: login codes and transactional mail get their own
+# queues so a bulk fan-out never sits in front of them
+CELERY_TASK_ROUTES = {
+    'messaging.tasks.send_otp_email': {'queue': 'email_otp'},
+    'messaging.tasks.send_achievement_notification': {'queue': 'email_transactional'},
+    'messaging.tasks.send_habit_reminder': {'queue': 'email_bulk'},
+    'messaging.tasks.send_weekly_progress_summary': {'queue': 'email_bulk'},
+    'messaging.tasks.send_progress_digests': {'queue': 'email_bulk'},
+    'messaging.tasks.flush_pending_notifications': {'queue': 'email_transactional'},
+}
+
+# Periodic jobs, run by `celery -A quanta beat`
+CELERY_BEAT_SCHEDULE = {
+    # Retries whose backoff has elapsed and claims left by a dead worker are
+    # only picked up when the outbox runs again
+    'process-outbox': {
+        'task': 'messaging.tasks.process_outbox',
+        'schedule': float(os.environ.get('OUTBOX_POLL_SECONDS', 30)),
+    },
+    # Reads of complete days come from these rollup tables; each run
+    # recomputes the last week, so late-buffered events are picked up
+    # Inactivity rules and streak breaks are found by this sweep; each run
+    # covers only the time since the previous one
+    'fire-aha-inactivity-timers': {
+        'task': 'messaging.tasks.fire_aha_inactivity_timers',
+        'schedule': float(os.environ.get('AHA_SWEEP_SECONDS', 5 * 60)),
+    },
+    # Digest runs are checkpointed per period, so a repeated start only resumes
+    'send-weekly-digests': {
+        'task': 'messaging.tasks.send_progress_digests',
+        'schedule': crontab(day_of_week='mon', hour=9, minute=0),
+        'args': ('weekly',),
+    },
+    'send-monthly-digests': {
+        'task': 'messaging.tasks.send_progress_digests',
+        'schedule': crontab(day_of_month=1, hour=9, minute=0),
+        'args': ('monthly',),
+    },
+    # Jobs backed off after a failure, or left due when the debounce kick
+    # could not be queued, only run when the worker runs again
+    'process-embedding-jobs': {
+        'task': 'ai_services.tasks.process_embedding_jobs',
+        'schedule': float(os.environ.get('EMBEDDING_POLL_SECONDS', 60)),
+    },
+    'rollup-email-analytics': {
+        'task': 'messaging.tasks.rollup_email_analytics',
+        'schedule': crontab(minute=10),
+    },
+    'rollup-ai-usage': {
+        'task': 'reports.tasks.rollup_ai_usage',
+        'schedule': crontab(minute=20),
+    },
+    'rebuild-send-time-profiles': {
+        'task': 'messaging.tasks.rebuild_send_time_profiles',
+        'schedule': crontab(hour=2, minute=30),
+    },
+    # The recommender has nothing to suggest until this has run once
+    'refresh-popular-habits': {
+        'task': 'ai_services.tasks.refresh_popular_habits',
+        'schedule': crontab(hour=3, minute=0),
+    },
+}
+
 # Default channel layer (will be overridden in production)
 CHANNEL_LAYERS = {
     'default': {
@@ -152,8 +217,136 @@ AI_SERVICES = {
     'GOOGLE_AI_ENABLED': True,
     'EMBEDDINGS_DIMENSION': 768,
     'MAX_CONTEXT_LENGTH': 4000,
+    'NODE_TIMEOUT_SECONDS': int(os.environ.get('AI_NODE_TIMEOUT_SECONDS', 10)),  # Per report-graph LLM call
+    # Load tests only: fake LLM calls of this many seconds when no GEMINI_API_KEY is set
+    'SIMULATED_LLM_LATENCY_SECONDS': float(os.environ.get('AI_SIMULATED_LLM_LATENCY_SECONDS', 0)),
 }
 
 # Email configuration (base settings)
 EMAIL_TIMEOUT = 30
-EMAIL_USE_LOCALTIME = False
\ No newline at end of file
+EMAIL_USE_LOCALTIME = False
+
+# Provider send limits, shared by all workers. LANE_RESERVE is the share of
+# each budget a lane must leave untouched for higher-priority lanes.
+EMAIL_RATE_LIMIT = {
+    'PER_SECOND': int(os.environ.get('EMAIL_RATE_PER_SECOND', 5)),
+    'PER_DAY': int(os.environ.get('EMAIL_RATE_PER_DAY', 2000)),
+    'LANE_RESERVE': {
+        'otp': 0.0,
+        'transactional': 0.1,
+        'bulk': 0.3,
+    },
+}
+# Outbox delivery of queued OutboundMessage rows
+OUTBOX = {
+    'BATCH_SIZE': int(os.environ.get('OUTBOX_BATCH_SIZE', 100)),
+    'MAX_ATTEMPTS': 5,
+    'LEASE_SECONDS': 300,
+    'BACKOFF_BASE_SECONDS': 30,
+    'BACKOFF_MAX_SECONDS': 3600,
+}
+
+# Recipients per digest chunk (one SMTP connection and one checkpoint per chunk)
+DIGEST_CHUNK_SIZE = int(os.environ.get('DIGEST_CHUNK_SIZE', 200))
+# A digest run claimed by a runner that stopped checkpointing is taken over after this
+DIGEST_LEASE_SECONDS = int(os.environ.get('DIGEST_LEASE_SECONDS', 600))
+
+# Achievement/milestone/badge emails arriving within this window are merged into one
+NOTIFICATION_COALESCE_WINDOW_SECONDS = int(os.environ.get('NOTIFICATION_COALESCE_WINDOW_SECONDS', 600))
+
+# Public base URL of the email open/click tracking endpoints
+EMAIL_TRACKING_BASE_URL = os.environ.get('EMAIL_TRACKING_BASE_URL', 'https://quanta.app/api/email/track')
+
+# Inbound chat message processing
+INBOUND = {
+    'BATCH_SIZE': int(os.environ.get('INBOUND_BATCH_SIZE', 200)),
+    'LLM_BATCH_SIZE': 20,  # Ambiguous messages classified per LLM prompt
+}
+
+# Chat channel webhooks
+TELEGRAM_WEBHOOK_SECRET = os.environ.get('TELEGRAM_WEBHOOK_SECRET', '')  # secret_token given to setWebhook
+WHATSAPP_APP_SECRET = os.environ.get('WHATSAPP_APP_SECRET', '')  # Signs X-Hub-Signature-256
+WHATSAPP_VERIFY_TOKEN = os.environ.get('WHATSAPP_VERIFY_TOKEN', '')  # Subscription handshake
+
+# Outbound chat channels. TRANSPORT 'mock' swaps in a local fake provider (tests, benchmarks).
+TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '')
+WHATSAPP_ACCESS_TOKEN = os.environ.get('WHATSAPP_ACCESS_TOKEN', '')
+WHATSAPP_PHONE_NUMBER_ID = os.environ.get('WHATSAPP_PHONE_NUMBER_ID', '')
+CHAT_CHANNELS = {
+    'telegram': {
+        'TRANSPORT': os.environ.get('TELEGRAM_TRANSPORT', 'http'),
+        'RATE_PER_SECOND': int(os.environ.get('TELEGRAM_RATE_PER_SECOND', 30)),
+        'CONCURRENCY': 16,
+        'TIMEOUT': 10,
+    },
+    'whatsapp': {
+        'TRANSPORT': os.environ.get('WHATSAPP_TRANSPORT', 'http'),
+        'RATE_PER_SECOND': int(os.environ.get('WHATSAPP_RATE_PER_SECOND', 80)),
+        'CONCURRENCY': 16,
+        'TIMEOUT': 10,
+    },
+}
+
+# Segment broadcasts. RENDER_PROCESSES > 1 renders chunks in a process pool
+# (needs a worker pool that may fork, e.g. a threads/solo Celery pool).
+BROADCAST = {
+    'CHUNK_SIZE': int(os.environ.get('BROADCAST_CHUNK_SIZE', 500)),
+    'RENDER_PROCESSES': int(os.environ.get('BROADCAST_RENDER_PROCESSES', 0)),
+    'LEASE_SECONDS': int(os.environ.get('BROADCAST_LEASE_SECONDS', 600)),  # See messaging.leases
+}
+
+# Background embedding pipeline (ai_services.embeddings)
+EMBEDDINGS = {
+    'BATCH_SIZE': int(os.environ.get('EMBEDDING_BATCH_SIZE', 100)),  # Texts per embed_documents call
+    'CLAIM_SIZE': 500,
+    'CACHE_SIZE': int(os.environ.get('EMBEDDING_CACHE_SIZE', 10000)),  # Vectors kept per process
+    'MAX_ATTEMPTS': 5,
+    'LEASE_SECONDS': 300,
+    'BACKOFF_BASE_SECONDS': 30,
+    'BACKOFF_MAX_SECONDS': 3600,
+    'DEBOUNCE_SECONDS': 5,
+    'RUN_SECONDS': 60,
+}
+
+# Per-user semantic search over HNSW indexes (ai_services.search)
+VECTOR_SEARCH = {
+    'EF_SEARCH': int(os.environ.get('VECTOR_SEARCH_EF_SEARCH', 100)),  # Candidate list size; higher = better recall, slower
+    'MAX_SCAN_TUPLES': 20000,  # Iterative scan budget when the user filter discards most candidates
+}
+
+# Nearest-neighbour habit recommendations (ai_services.recommender)
+RECOMMENDER = {
+    'NEIGHBOURS': 50,  # Similar users per ANN lookup
+    'DUPLICATE_SIMILARITY': 0.9,  # Suggestions this close to an existing habit are dropped
+    'RELATED_SIMILARITY': 0.55,
+    'MIN_USERS': 2,  # A title needs this many users to count as popular
+    'MAX_POPULAR_HABITS': 5000,
+    'PHRASE_WITH_LLM': os.environ.get('RECOMMENDER_PHRASE_WITH_LLM', 'False').lower() == 'true',
+}
+
+# Cached AI reports (reports.cache): fresh for TTL, then served stale while regenerating
+AI_REPORT_CACHE = {
+    'ENABLED': os.environ.get('AI_REPORT_CACHE_ENABLED', 'True').lower() == 'true',
+    'TTL_SECONDS': int(os.environ.get('AI_REPORT_CACHE_TTL_SECONDS', 6 * 3600)),
+    'STALE_SECONDS': 24 * 3600,
+    'REFRESH_LOCK_SECONDS': 120,
+}
+
+# Coalescing of identical concurrent AI calls (core.singleflight)
+SINGLE_FLIGHT = {
+    'DISTRIBUTED': True,  # Also coalesce across processes through a cache lock
+    'LOCK_SECONDS': 120,  # Longest a leader may hold a key
+    'WAIT_SECONDS': 90,  # Followers compute themselves after waiting this long
+    'RESULT_SECONDS': 10,  # How long a result stays available to followers in other processes
+    'POLL_SECONDS': 0.2,
+}
+
+# AI limits (ai_services.limits): per-user daily budgets and a provider concurrency ceiling
+AI_RATE_LIMIT = {
+    'ENABLED': os.environ.get('AI_RATE_LIMIT_ENABLED', 'True').lower() == 'true',
+    'REQUESTS_PER_DAY': int(os.environ.get('AI_REQUESTS_PER_USER_PER_DAY', 100)),
+    'TOKENS_PER_DAY': int(os.environ.get('AI_TOKENS_PER_USER_PER_DAY', 200000)),
+    'MAX_CONCURRENCY': int(os.environ.get('AI_MAX_CONCURRENCY', 32)),  # Calls in flight toward the provider, all processes
+    'SLOT_WAIT_SECONDS': 5,  # A call waits this long for a free slot before failing
+    'SLOT_LEASE_SECONDS': 120,  # Slots of crashed workers are reclaimed after this
+}
@@ -86,13 +86,29 @@ if REDIS_URL != 'redis://localhost:6379/0':
         },
     }
 
-# Cache configuration
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# Cache configuration. Event buffers, rate limits, single-flight locks and
+# metrics live in this cache and must be shared by web and Celery processes,
+# so development uses the same Redis as docker-compose and Celery.
+# DJANGO_LOCMEM_CACHE=1 runs without Redis: all of those become per-process
+# (buffered tracking and AI usage are never flushed by the worker) and chat
+# webhooks answer 503 because their buffer refuses to fall back.
+if os.environ.get('DJANGO_LOCMEM_CACHE'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            }
+        }
     }
-}
 
 # Development logging
 LOGGING = {
@@ -0,0 +1,182 @@
+"""
+Cache of AI-generated reports keyed on bucketed user context
+
+A report is worth regenerating only when the user's situation has
+meaningfully changed, so the key is a hash of the quantized inputs
+(completion rate rounded to 10%, streak bucket, habit count...) rather than
+of the exact numbers. Entries are fresh for TTL_SECONDS; after that, or once
+the user checks in again, they are stale: still served immediately while one
+background task regenerates them. Hits, stale hits and misses are counted
+per report kind. Concurrent misses for the same entry (a double tap, several
+tabs) share one generation through core.singleflight.
+
+Callers pass an `admit` callable (ai_services.limits) that is only consulted
+when a report has to be generated: a cache hit costs the provider nothing,
+so it neither spends the user's request budget nor waits on provider
+capacity. A refused miss raises AIRateLimitExceeded; a refused stale hit is
+served without the background refresh.
+"""
+import hashlib
+import json
+import logging
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from ai_services.limits import AIRateLimitExceeded
+from core.metrics import get_counts, increment
+from core.singleflight import report_flight
+
+logger = logging.getLogger(__name__)
+
+
+OUTCOMES = ('hit', 'stale', 'miss')
+
+
+def get_config():
+    return getattr(settings, 'AI_REPORT_CACHE', {})
+
+
+def streak_bucket(days):
+    """Coarse streak ranges; moving within one does not change the report"""
+    for upper, label in ((0, '0'), (2, '1-2'), (6, '3-6'), (13, '7-13'), (29, '14-29'), (99, '30-99')):
+        if days <= upper:
+            return label
+    return '100+'
+
+
+def rate_bucket(rate, step=10):
+    """Percentage rounded to the nearest `step`"""
+    return int(round((rate or 0) / step) * step)
+
+
+class ReportCache:
+    """Per-user report cache with stale-while-revalidate"""
+
+    def __init__(self, ttl=None, stale_ttl=None):
+        config = get_config()
+        self.ttl = ttl or config.get('TTL_SECONDS', 6 * 3600)
+        self.stale_ttl = stale_ttl or config.get('STALE_SECONDS', 24 * 3600)
+        self.refresh_lock_seconds = config.get('REFRESH_LOCK_SECONDS', 120)
+        self.enabled = config.get('ENABLED', True)
+
+    def key(self, kind, user_id, context, subject_id=None):
+        digest = hashlib.sha1(json.dumps(context, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        return f"ai_report:{kind}:{user_id}:{subject_id or '-'}:{digest}"
+
+    @staticmethod
+    def generation_key(user_id):
+        return f'ai_report_generation:{user_id}'
+
+    def get_or_generate(self, kind, user_id, context, generate, subject_id=None, admit=None):
+        """
+        Cached report for this context, or `generate()`'s result.
+
+        Returns (report, outcome) where outcome is 'hit', 'stale' or 'miss'.
+        Stale reports are returned as they are and refreshed in the background.
+        `admit()`, if given, runs before any generation and may raise
+        AIRateLimitExceeded.
+        """
+        key, report, outcome, generation = self.resolve(kind, user_id, context, subject_id, admit)
+        if report is None:
+            report = report_flight.do(key, generate)
+            self.store(key, user_id, report, generation)
+        return report, outcome
+
+    async def aget_or_generate(self, kind, user_id, context, agenerate, subject_id=None, admit=None):
+        """get_or_generate for async callers; `agenerate` is a coroutine function"""
+        key, report, outcome, generation = await sync_to_async(self.resolve)(kind, user_id, context, subject_id, admit)
+        if report is None:
+            report = await report_flight.ado(key, agenerate)
+            await sync_to_async(self.store)(key, user_id, report, generation)
+        return report, outcome
+
+    def resolve(self, kind, user_id, context, subject_id=None, admit=None):
+        """(key, cached report or None, outcome, generation) for a lookup, counted"""
+        key = self.key(kind, user_id, context, subject_id)
+        if not self.enabled:
+            if admit is not None:
+                admit()
+            return key, None, 'miss', None
+
+        entry, generation = self.lookup(key, user_id)
+
+        if entry is not None:
+            fresh = entry['generation'] == generation and time.time() - entry['created'] < self.ttl
+            if fresh:
+                self.count(kind, 'hit')
+                return key, entry['report'], 'hit', generation
+
+            self.count(kind, 'stale')
+            self.schedule_refresh(kind, user_id, key, subject_id, admit)
+            return key, entry['report'], 'stale', generation
+
+        self.count(kind, 'miss')
+        if admit is not None:
+            admit()
+        return key, None, 'miss', generation
+
+    def lookup(self, key, user_id):
+        generation_key = self.generation_key(user_id)
+        values = cache.get_many([key, generation_key])
+        return values.get(key), values.get(generation_key)
+
+    def current_generation(self, user_id):
+        return cache.get(self.generation_key(user_id))
+
+    def store(self, key, user_id, report, generation):
+        """
+        Keep a generated report. Fallback reports, and workflow reports with
+        a branch that fell back (a timeout, a provider error), are not worth
+        keeping: the next request should try again.
+        """
+        if not self.enabled or report.get('analysis_method') != 'langgraph_workflow' or report.get('degraded'):
+            return
+        cache.set(
+            key,
+            {'report': report, 'created': time.time(), 'generation': generation},
+            self.ttl + self.stale_ttl,
+        )
+
+    def schedule_refresh(self, kind, user_id, key, subject_id=None, admit=None):
+        """One background regeneration per entry at a time"""
+        if not cache.add(f'{key}:refreshing', True, self.refresh_lock_seconds):
+            return
+        if admit is not None:
+            try:
+                admit()
+            except AIRateLimitExceeded:
+                # Serve the stale report; a later request can refresh it
+                cache.delete(f'{key}:refreshing')
+                return
+        from .tasks import refresh_ai_report
+        try:
+            refresh_ai_report.delay(kind, str(user_id), str(subject_id) if subject_id else None)
+        except Exception as e:
+            logger.error(f"Error scheduling report refresh for {key}: {str(e)}")
+
+    def invalidate(self, user_ids):
+        """Mark every cached report of these users stale (e.g. after new check-ins)"""
+        generation = uuid.uuid4().hex
+        cache.set_many({self.generation_key(user_id): generation for user_id in user_ids}, None)
+
+    def count(self, kind, outcome):
+        increment(f'ai_report_cache:{kind}:{outcome}')
+
+    def stats(self, kinds):
+        """Hit, stale and miss counts and hit rate per report kind"""
+        counts = get_counts([f'ai_report_cache:{kind}:{outcome}' for kind in kinds for outcome in OUTCOMES])
+
+        stats = {}
+        for kind in kinds:
+            kind_counts = {outcome: counts[f'ai_report_cache:{kind}:{outcome}'] for outcome in OUTCOMES}
+            total = sum(kind_counts.values())
+            kind_counts['hit_rate'] = round((kind_counts['hit'] + kind_counts['stale']) / total, 3) if total else 0.0
+            stats[kind] = kind_counts
+        return stats
+
+
+report_cache = ReportCache()
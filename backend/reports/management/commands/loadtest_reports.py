@@ -0,0 +1,81 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test the AI report endpoints at increasing concurrency. Run it once against '
+        'gunicorn gthread (quanta.wsgi) and once against daphne (quanta.asgi) started with '
+        'AI_SIMULATED_LLM_LATENCY_SECONDS=2 and AI_REPORT_CACHE_ENABLED=False, and compare '
+        'where throughput stops scaling and latency starts queueing.'
+    )
+
+    ENDPOINTS = {
+        'progress': '/api/reports/progress/',
+        'hero': '/api/reports/hero/',
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', required=True, help='Base URL of a running server, e.g. http://localhost:8000')
+        parser.add_argument('--token', required=True, help='Access token sent as the Authorization header')
+        parser.add_argument('--auth-scheme', default='Bearer', help='Authorization scheme (Bearer for JWT, Token for DRF tokens)')
+        parser.add_argument('--endpoint', choices=list(self.ENDPOINTS), default='progress')
+        parser.add_argument(
+            '--concurrency',
+            default='8,32,128,256',
+            help='Comma-separated numbers of simultaneous clients to try',
+        )
+        parser.add_argument('--requests', type=int, default=None, help='Requests per level (default: 4x the concurrency)')
+        parser.add_argument('--timeout', type=float, default=60.0, help='Client timeout per request in seconds')
+
+    def handle(self, *args, **options):
+        import requests
+
+        levels = [int(level) for level in options['concurrency'].split(',') if level]
+        if not levels:
+            raise CommandError('Give at least one concurrency level')
+
+        url = options['url'].rstrip('/') + self.ENDPOINTS[options['endpoint']]
+        headers = {'Authorization': f"{options['auth_scheme']} {options['token']}"}
+        local = threading.local()
+
+        def fire(_):
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            started = time.perf_counter()
+            try:
+                status_code = local.session.post(url, json={}, headers=headers, timeout=options['timeout']).status_code
+            except requests.RequestException as e:
+                status_code = type(e).__name__
+            return (time.perf_counter() - started) * 1000, status_code
+
+        self.stdout.write(f'POST {url}')
+        self.stdout.write(f"{'clients':>8} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+
+        for concurrency in levels:
+            count = options['requests'] or concurrency * 4
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(executor.map(fire, range(count)))
+            duration = time.perf_counter() - started
+
+            latencies = sorted(latency for latency, _ in results)
+            errors = [code for _, code in results if code != 200]
+            percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+            line = (
+                f'{concurrency:>8} {count / duration:>8.1f} {percentile(0.50):>9.0f} '
+                f'{percentile(0.95):>9.0f} {percentile(0.99):>9.0f} {len(errors):>7}'
+            )
+            self.stdout.write(self.style.ERROR(line) if errors else line)
+            if errors:
+                self.stdout.write(f'    e.g. {errors[:5]}')
+
+        self.stdout.write(
+            'A worker pool saturates at workers x threads in-flight requests (8 for the default gthread '
+            'setup); beyond that p50 grows with the queue. Async views keep scaling until the LLM or database does.'
+        )
@@ -0,0 +1,62 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:04
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='aiusage',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='aiusage',
+            name='feature',
+            field=models.CharField(choices=[('report', 'Report Generation'), ('insight', 'Insight'), ('coach_prompt', 'Coach Prompt'), ('recommendation', 'Recommendation'), ('email', 'Email Personalization'), ('chat_intent', 'Chat Intent'), ('embedding', 'Embedding')], max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='aiusage',
+            name='model',
+            field=models.CharField(choices=[('gemini-1.5', 'Gemini 1.5'), ('gemini-flash', 'Gemini Flash'), ('gemini-pro', 'Gemini Pro'), ('gemini-1.5-flash-002', 'Gemini 1.5 Flash 002'), ('text-embedding-004', 'Text Embedding 004'), ('simulated', 'Simulated')], max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='aiusage',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ai_usage', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='AIUsageDaily',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('feature', models.CharField(choices=[('report', 'Report Generation'), ('insight', 'Insight'), ('coach_prompt', 'Coach Prompt'), ('recommendation', 'Recommendation'), ('email', 'Email Personalization'), ('chat_intent', 'Chat Intent'), ('embedding', 'Embedding')], max_length=50)),
+                ('model', models.CharField(choices=[('gemini-1.5', 'Gemini 1.5'), ('gemini-flash', 'Gemini Flash'), ('gemini-pro', 'Gemini Pro'), ('gemini-1.5-flash-002', 'Gemini 1.5 Flash 002'), ('text-embedding-004', 'Text Embedding 004'), ('simulated', 'Simulated')], max_length=50)),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('errors', models.PositiveIntegerField(default=0)),
+                ('users', models.PositiveIntegerField(default=0)),
+                ('token_in', models.BigIntegerField(default=0)),
+                ('token_out', models.BigIntegerField(default=0)),
+                ('latency_ms_total', models.BigIntegerField(default=0)),
+                ('latency_ms_p95', models.PositiveIntegerField(default=0)),
+                ('latency_ms_max', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'ai_usage_daily_rollups',
+                'ordering': ['-date', 'feature'],
+                'indexes': [models.Index(fields=['date'], name='ai_usage_da_date_7b7cd7_idx')],
+                'unique_together': {('date', 'feature', 'model')},
+            },
+        ),
+    ]
@@ -1,8 +1,27 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 import uuid
 
 
+def estimate_cost(model, token_in, token_out):
+    """Rough USD cost of a call; adjust the rates to actual pricing"""
+    model = model.lower()
+    if 'embedding' in model:
+        input_rate = 0.00001  # per 1k tokens
+        output_rate = 0.0
+    elif 'flash' in model:
+        input_rate = 0.00015  # per 1k tokens
+        output_rate = 0.0006  # per 1k tokens
+    else:
+        input_rate = 0.0005  # per 1k tokens
+        output_rate = 0.0015  # per 1k tokens
+    
+    input_cost = (token_in / 1000) * input_rate
+    output_cost = (token_out / 1000) * output_rate
+    return round(input_cost + output_cost, 6)
+
+
 class Report(models.Model):
     REPORT_TYPES = [
         ('progress', 'Progress Report'),
@@ -32,11 +51,19 @@ class AIUsage(models.Model):
         ('report', 'Report Generation'),
         ('insight', 'Insight'),
         ('coach_prompt', 'Coach Prompt'),
+        ('recommendation', 'Recommendation'),
+        ('email', 'Email Personalization'),
+        ('chat_intent', 'Chat Intent'),
+        ('embedding', 'Embedding'),
     ]
     
     MODEL_CHOICES = [
         ('gemini-1.5', 'Gemini 1.5'),
         ('gemini-flash', 'Gemini Flash'),
+        ('gemini-pro', 'Gemini Pro'),
+        ('gemini-1.5-flash-002', 'Gemini 1.5 Flash 002'),
+        ('text-embedding-004', 'Text Embedding 004'),
+        ('simulated', 'Simulated'),
     ]
     
     STATUS_CHOICES = [
@@ -45,7 +72,8 @@ class AIUsage(models.Model):
     ]
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ai_usage')
+    # Empty for background work such as the embedding pipeline
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='ai_usage')
     course = models.ForeignKey('core.Course', on_delete=models.SET_NULL, null=True, blank=True)
     feature = models.CharField(max_length=50, choices=FEATURE_CHOICES)
     model = models.CharField(max_length=50, choices=MODEL_CHOICES)
@@ -56,7 +84,8 @@ class AIUsage(models.Model):
     error_message = models.TextField(blank=True)
     request_data = models.JSONField(default=dict, blank=True)
     response_data = models.JSONField(default=dict, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Time of the call, not of the (batched) insert
+    created_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         db_table = 'ai_usage'
@@ -67,7 +96,7 @@ class AIUsage(models.Model):
         ]
     
     def __str__(self):
-        return f"{self.user.name} - {self.feature} - {self.status}"
+        return f"{self.user.name if self.user else 'system'} - {self.feature} - {self.status}"
     
     @property
     def total_tokens(self):
@@ -75,15 +104,37 @@ class AIUsage(models.Model):
     
     @property
     def estimated_cost(self):
-        # Rough estimation based on typical pricing
-        # Adjust these rates based on actual pricing
-        if 'flash' in self.model.lower():
-            input_rate = 0.00015  # per 1k tokens
-            output_rate = 0.0006  # per 1k tokens
-        else:
-            input_rate = 0.0005  # per 1k tokens
-            output_rate = 0.0015  # per 1k tokens
-        
-        input_cost = (self.token_in / 1000) * input_rate
-        output_cost = (self.token_out / 1000) * output_rate
-        return round(input_cost + output_cost, 6)
+        return estimate_cost(self.model, self.token_in, self.token_out)
+
+
+class AIUsageDaily(models.Model):
+    """Per-day, per-feature, per-model AI usage, keyed by call date"""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    date = models.DateField()
+    feature = models.CharField(max_length=50, choices=AIUsage.FEATURE_CHOICES)
+    model = models.CharField(max_length=50, choices=AIUsage.MODEL_CHOICES)
+    requests = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    users = models.PositiveIntegerField(default=0)
+    token_in = models.BigIntegerField(default=0)
+    token_out = models.BigIntegerField(default=0)
+    latency_ms_total = models.BigIntegerField(default=0)
+    latency_ms_p95 = models.PositiveIntegerField(default=0)
+    latency_ms_max = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'ai_usage_daily_rollups'
+        ordering = ['-date', 'feature']
+        unique_together = ['date', 'feature', 'model']
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} - {self.feature} - {self.model} - {self.requests} requests"
+    
+    @property
+    def estimated_cost(self):
+        return estimate_cost(self.model, self.token_in, self.token_out)
@@ -0,0 +1,286 @@
+"""
+Inputs for AI reports and their cached generation
+
+The gather_* methods collect the numbers a report is built from. The LLM
+workflow only runs when the quantized version of those numbers has no fresh
+cached report (see reports.cache).
+"""
+from asgiref.sync import async_to_sync
+from django.utils import timezone
+from datetime import timedelta
+import logging
+
+from habits.models import Habit, Checkin
+from ai_services.langgraph_service import langgraph_ai_service
+from .cache import rate_bucket, report_cache, streak_bucket
+
+logger = logging.getLogger(__name__)
+
+
+REPORT_KINDS = ('progress', 'hero', 'insight')
+
+
+class ReportService:
+    """Report inputs, AI generation and caching"""
+    
+    @staticmethod
+    def gather_progress_data(user) -> dict:
+        """Gather comprehensive habit data for AI analysis."""
+        habits = Habit.objects.filter(user=user, is_active=True)
+        
+        # Date ranges
+        today = timezone.now().date()
+        week_ago = today - timedelta(days=7)
+        month_ago = today - timedelta(days=30)
+        
+        # Basic stats
+        total_habits = habits.count()
+        active_habits = habits.filter(is_active=True).count()
+        
+        # Completion rates
+        week_checkins = Checkin.objects.filter(
+            habit__user=user,
+            date__gte=week_ago
+        ).count()
+        
+        month_checkins = Checkin.objects.filter(
+            habit__user=user,
+            date__gte=month_ago
+        ).count()
+        
+        possible_week_checkins = active_habits * 7
+        possible_month_checkins = active_habits * 30
+        
+        completion_rate_7d = (week_checkins / possible_week_checkins * 100) if possible_week_checkins > 0 else 0
+        completion_rate_30d = (month_checkins / possible_month_checkins * 100) if possible_month_checkins > 0 else 0
+        
+        # Streaks and patterns
+        current_streaks = []
+        longest_streak = 0
+        
+        for habit in habits:
+            streak = habit.get_current_streak()
+            if streak > 0:
+                current_streaks.append({
+                    'habit_title': habit.title,
+                    'streak': streak
+                })
+            
+            if streak > longest_streak:
+                longest_streak = streak
+        
+        # Recent activity  
+        recent_checkins = list(
+            Checkin.objects.filter(
+                habit__user=user,
+                date__gte=week_ago
+            ).values('habit__title', 'date', 'note')[:20]
+        )
+        
+        # Weekly pattern
+        weekly_pattern = {}
+        for i in range(7):
+            day_date = today - timedelta(days=i)
+            day_checkins = Checkin.objects.filter(
+                habit__user=user,
+                date=day_date
+            ).count()
+            weekly_pattern[day_date.strftime('%A')] = day_checkins
+        
+        # Difficulty levels
+        difficulty_levels = list(habits.values_list('difficulty_level', flat=True).distinct())
+        
+        return {
+            'total_habits': total_habits,
+            'active_habits': active_habits,
+            'completion_rate_7d': completion_rate_7d,
+            'completion_rate_30d': completion_rate_30d,
+            'overall_completion_rate': completion_rate_30d,
+            'longest_streak': longest_streak,
+            'current_streaks': current_streaks,
+            'recent_checkins': recent_checkins,
+            'weekly_pattern': weekly_pattern,
+            'difficulty_levels': difficulty_levels
+        }
+    
+    @staticmethod
+    def gather_hero_data(user) -> dict:
+        """Gather data for hero infographic."""
+        habits = Habit.objects.filter(user=user, is_active=True)
+        
+        # Date ranges
+        today = timezone.now().date()
+        week_ago = today - timedelta(days=7)
+        
+        # Basic stats
+        active_habits = habits.count()
+        
+        # Completion rate
+        week_checkins = Checkin.objects.filter(
+            habit__user=user,
+            date__gte=week_ago
+        ).count()
+        
+        possible_checkins = active_habits * 7
+        completion_rate = (week_checkins / possible_checkins * 100) if possible_checkins > 0 else 0
+        
+        # Longest current streak
+        longest_streak = 0
+        for habit in habits:
+            streak = habit.get_current_streak()
+            if streak > longest_streak:
+                longest_streak = streak
+        
+        # Recent achievements (simplified)
+        achievements = []
+        if completion_rate >= 80:
+            achievements.append("🏆 Week Champion")
+        if longest_streak >= 7:
+            achievements.append("🔥 Streak Master")
+        if week_checkins > 0:
+            achievements.append("💪 Consistent Hero")
+        
+        return {
+            'active_habits': active_habits,
+            'completion_rate': completion_rate,
+            'longest_streak': longest_streak,
+            'recent_achievements': achievements
+        }
+    
+    @staticmethod
+    def gather_habit_data(habit) -> dict:
+        """Gather data for a single habit analysis."""
+        today = timezone.now().date()
+        week_ago = today - timedelta(days=7)
+        month_ago = today - timedelta(days=30)
+        
+        # Basic habit info
+        current_streak = habit.get_current_streak()
+        
+        # Completion stats
+        month_checkins = Checkin.objects.filter(
+            habit=habit,
+            date__gte=month_ago
+        ).count()
+        
+        possible_checkins = 30  # Assuming daily habit
+        completion_rate = (month_checkins / possible_checkins * 100) if possible_checkins > 0 else 0
+        
+        # Recent activity
+        recent_checkins = list(
+            Checkin.objects.filter(
+                habit=habit,
+                date__gte=week_ago
+            ).values('date', 'note')[:14]
+        )
+        
+        return {
+            'title': habit.title,
+            'difficulty_level': habit.difficulty_level,
+            'cadence': habit.cadence,
+            'current_streak': current_streak,
+            'longest_streak': current_streak,  # Simplified
+            'completion_rate': completion_rate,
+            'recent_checkins': recent_checkins
+        }
+    
+    @staticmethod
+    def ai_input(kind, data) -> dict:
+        """The habits_data the LangGraph workflow receives for a report kind"""
+        if kind == 'hero':
+            return {
+                'total_habits': data['active_habits'],
+                'overall_completion_rate': data['completion_rate'],
+                'longest_streak': data['longest_streak']
+            }
+        if kind == 'insight':
+            return {
+                'total_habits': 1,
+                'overall_completion_rate': data['completion_rate'],
+                'longest_streak': data['current_streak'],
+                'current_streaks': [data['current_streak']]
+            }
+        return data
+    
+    @staticmethod
+    def quantize(kind, data) -> dict:
+        """The part of the input that decides whether a new report is worth generating"""
+        if kind == 'hero':
+            return {
+                'habits': data['active_habits'],
+                'rate': rate_bucket(data['completion_rate']),
+                'streak': streak_bucket(data['longest_streak']),
+            }
+        if kind == 'insight':
+            return {
+                'rate': rate_bucket(data['completion_rate']),
+                'streak': streak_bucket(data['current_streak']),
+                'difficulty': data['difficulty_level'],
+            }
+        return {
+            'habits': data['total_habits'],
+            'rate_7d': rate_bucket(data['completion_rate_7d']),
+            'rate_30d': rate_bucket(data['completion_rate_30d']),
+            'streak': streak_bucket(data['longest_streak']),
+            'streaking_habits': len(data['current_streaks']),
+        }
+    
+    @staticmethod
+    def generate(kind, user, data) -> dict:
+        """Run the LangGraph report workflow (uncached)"""
+        return async_to_sync(langgraph_ai_service.generate_progress_report)(
+            user, ReportService.ai_input(kind, data)
+        )
+    
+    @staticmethod
+    async def agenerate(kind, user, data) -> dict:
+        """Run the LangGraph report workflow (uncached) without blocking the event loop"""
+        return await langgraph_ai_service.generate_progress_report(user, ReportService.ai_input(kind, data))
+    
+    @staticmethod
+    async def aget_ai_report(kind, user, data, subject_id=None, admit=None):
+        """get_ai_report for async views"""
+        return await report_cache.aget_or_generate(
+            kind,
+            user.id,
+            ReportService.quantize(kind, data),
+            lambda: ReportService.agenerate(kind, user, data),
+            subject_id=subject_id,
+            admit=admit,
+        )
+    
+    @staticmethod
+    def get_ai_report(kind, user, data, subject_id=None, admit=None):
+        """
+        AI report for this input, from cache when the bucketed input is unchanged.
+        
+        `admit()` runs only when the report has to be generated (see
+        reports.cache). Returns (report, cache_outcome).
+        """
+        return report_cache.get_or_generate(
+            kind,
+            user.id,
+            ReportService.quantize(kind, data),
+            lambda: ReportService.generate(kind, user, data),
+            subject_id=subject_id,
+            admit=admit,
+        )
+    
+    @staticmethod
+    def refresh(kind, user, subject_id=None):
+        """Regenerate and cache a report from current data (stale-while-revalidate)"""
+        # Read before generating, so check-ins made meanwhile still mark it stale
+        generation = report_cache.current_generation(user.id)
+        
+        if kind == 'insight':
+            habit = Habit.objects.get(id=subject_id, user=user)
+            data = ReportService.gather_habit_data(habit)
+        elif kind == 'hero':
+            data = ReportService.gather_hero_data(user)
+        else:
+            data = ReportService.gather_progress_data(user)
+        
+        report = ReportService.generate(kind, user, data)
+        key = report_cache.key(kind, user.id, ReportService.quantize(kind, data), subject_id)
+        report_cache.store(key, user.id, report, generation)
+        return report
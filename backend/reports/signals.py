@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+import logging
+
+from habits.models import Checkin
+from .cache import report_cache
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Checkin)
+def invalidate_cached_reports(sender, instance, **kwargs):
+    """A new or edited check-in makes the user's cached AI reports stale"""
+    try:
+        user_id = instance.habit.user_id
+        transaction.on_commit(lambda: report_cache.invalidate([user_id]))
+    except Exception as e:
+        logger.error(f"Error invalidating cached reports: {str(e)}")
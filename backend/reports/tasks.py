@@ -0,0 +1,41 @@
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def refresh_ai_report(kind, user_id, subject_id=None):
+    """Regenerate a stale cached AI report in the background"""
+    from accounts.models import User
+    from habits.models import Habit
+    from .services import ReportService
+
+    try:
+        user = User.objects.get(id=user_id)
+        ReportService.refresh(kind, user, subject_id=subject_id)
+        logger.info(f"Refreshed cached {kind} report for user {user_id}")
+    except (User.DoesNotExist, Habit.DoesNotExist):
+        pass
+    except Exception as e:
+        logger.error(f"Error refreshing {kind} report for user {user_id}: {str(e)}")
+
+
+@shared_task
+def flush_ai_usage():
+    """Store buffered AI usage records in bulk"""
+    from .usage import AIUsageTracker
+
+    try:
+        return AIUsageTracker.flush()
+    except Exception as e:
+        logger.error(f"Error in flush_ai_usage task: {str(e)}")
+        return 0
+
+
+@shared_task
+def rollup_ai_usage(days=7):
+    """Refresh the daily AI usage rollups for recent days"""
+    from .usage import AIUsageTracker
+
+    return AIUsageTracker.rollup_daily_usage(days)
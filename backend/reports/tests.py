@@ -1,3 +1,268 @@
-from django.test import TestCase
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import User
+from ai_services.limits import AIRateLimitExceeded
+from ai_services.metering import MeteredEmbeddings, MeteredLLM
+from core.buffers import EventBuffer
+from core.rate_limit import ConcurrencyLimiter, TokenBucket
+from .cache import ReportCache
+from .models import AIUsage, AIUsageDaily
+from .usage import AIUsageTracker
+from .views import ai_limit_response
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def workflow_report(text='report', **extra):
+    return {'analysis_method': 'langgraph_workflow', 'text': text, **extra}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReportCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.cache = ReportCache(ttl=60, stale_ttl=600)
+        self.context = {'rate': 50, 'streak': '3-6'}
+
+        patcher = mock.patch('reports.cache.time.time', return_value=1000.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('reports.tasks.refresh_ai_report.delay')
+        self.refresh = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, generate=None, context=None, admit=None):
+        return self.cache.get_or_generate(
+            'progress', 'user-1', context or self.context, generate or workflow_report, admit=admit
+        )
+
+    def test_miss_then_hit(self):
+        self.assertEqual(self.get(), (workflow_report(), 'miss'))
+
+        generate = mock.Mock()
+        self.assertEqual(self.get(generate), (workflow_report(), 'hit'))
+        generate.assert_not_called()
+        self.refresh.assert_not_called()
+
+    def test_contexts_in_different_buckets_miss(self):
+        self.get()
+
+        self.assertEqual(self.get(context={'rate': 60, 'streak': '3-6'})[1], 'miss')
+
+    def test_expired_entry_is_served_stale_and_refreshed_once(self):
+        self.get()
+        self.clock.return_value += 61
+
+        generate = mock.Mock()
+        self.assertEqual(self.get(generate), (workflow_report(), 'stale'))
+        self.assertEqual(self.get(generate)[1], 'stale')
+
+        generate.assert_not_called()
+        self.refresh.assert_called_once_with('progress', 'user-1', None)
+
+    def test_invalidate_makes_entries_stale(self):
+        self.get()
+        self.cache.invalidate(['user-1'])
+
+        self.assertEqual(self.get()[1], 'stale')
+        self.refresh.assert_called_once()
+
+    def test_invalidate_leaves_other_users_fresh(self):
+        self.cache.get_or_generate('progress', 'user-2', self.context, workflow_report)
+        self.cache.invalidate(['user-1'])
+
+        self.assertEqual(self.cache.get_or_generate('progress', 'user-2', self.context, workflow_report)[1], 'hit')
+
+    def test_fallback_and_degraded_reports_are_not_stored(self):
+        self.get(lambda: {'analysis_method': 'fallback'})
+        self.assertEqual(self.get(lambda: workflow_report(degraded=True))[1], 'miss')
+        self.assertEqual(self.get()[1], 'miss')
+        self.assertEqual(self.get()[1], 'hit')
+
+    def test_admit_is_only_asked_on_a_miss(self):
+        admit = mock.Mock()
+        self.get(admit=admit)
+        self.get(admit=admit)
+
+        admit.assert_called_once_with()
+
+    def test_refused_miss_raises_without_generating(self):
+        generate = mock.Mock()
+        admit = mock.Mock(side_effect=AIRateLimitExceeded('user_requests', 30.0))
+
+        with self.assertRaises(AIRateLimitExceeded):
+            self.get(generate, admit=admit)
+        generate.assert_not_called()
+
+    def test_refused_stale_hit_is_served_without_a_refresh(self):
+        self.get()
+        self.clock.return_value += 61
+        refuse = mock.Mock(side_effect=AIRateLimitExceeded('provider_concurrency', 1.0))
+
+        self.assertEqual(self.get(admit=refuse), (workflow_report(), 'stale'))
+        self.refresh.assert_not_called()
+
+        # The refresh lock was given back, so the next admitted request refreshes
+        self.get(admit=mock.Mock())
+        self.refresh.assert_called_once()
+
+    def test_stats_count_outcomes(self):
+        self.get()
+        self.get()
+        self.cache.invalidate(['user-1'])
+        self.get()
+
+        stats = self.cache.stats(['progress'])['progress']
+        self.assertEqual((stats['hit'], stats['stale'], stats['miss']), (1, 1, 1))
+        self.assertEqual(stats['hit_rate'], 0.667)
+
+    @override_settings(AI_REPORT_CACHE={'ENABLED': False})
+    def test_disabled_cache_always_generates_and_admits(self):
+        report_cache = ReportCache()
+        admit = mock.Mock()
+
+        for _ in range(2):
+            report_cache.get_or_generate('progress', 'user-1', self.context, workflow_report, admit=admit)
+
+        self.assertEqual(admit.call_count, 2)
+
+
+class AILimitResponseTests(SimpleTestCase):
+
+    def test_retry_after_is_whole_seconds_rounded_up(self):
+        response = ai_limit_response(42.2, 'user_requests')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '43')
+        self.assertEqual(response.data['reason'], 'user_requests')
+        self.assertEqual(response.data['retry_after'], 43)
+
+    def test_retry_after_is_at_least_one_second(self):
+        self.assertEqual(ai_limit_response(0.0, 'provider_concurrency')['Retry-After'], '1')
+
+
+class FakeLLM:
+    """Provider client whose generate() reports usage metadata"""
+
+    model = 'models/gemini-1.5-flash-002'
+
+    def __init__(self, error=None):
+        self.error = error
+
+    def generate(self, prompts):
+        if self.error is not None:
+            raise self.error
+        info = {'usage_metadata': {'prompt_token_count': 12, 'candidates_token_count': 3}}
+        return SimpleNamespace(generations=[[SimpleNamespace(text='Keep going!', generation_info=info)]], llm_output=None)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MeteringTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        EventBuffer._local_buffers.clear()
+        TokenBucket._local_state.clear()
+        ConcurrencyLimiter._local_leases.clear()
+        patcher = mock.patch('reports.tasks.flush_ai_usage.apply_async')
+        self.schedule_flush = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_llm_calls_record_provider_token_counts(self):
+        llm = MeteredLLM(FakeLLM())
+
+        self.assertEqual(llm.invoke('Hello', feature='insight', user_id='user-1'), 'Keep going!')
+
+        [event] = AIUsageTracker.buffer.drain()
+        self.assertEqual(
+            (event['feature'], event['model'], event['token_in'], event['token_out'], event['status'], event['user_id']),
+            ('insight', 'gemini-1.5-flash-002', 12, 3, 'ok', 'user-1'),
+        )
+        self.assertEqual(event['request_data'], {'tokens': 'provider'})
+        self.schedule_flush.assert_called_once()
+
+    def test_failed_calls_are_recorded_and_raised(self):
+        llm = MeteredLLM(FakeLLM(error=RuntimeError('quota exceeded')))
+
+        with self.assertRaises(RuntimeError):
+            llm.invoke('Hello')
+
+        [event] = AIUsageTracker.buffer.drain()
+        self.assertEqual((event['status'], event['error_message'], event['token_out']), ('error', 'quota exceeded', 0))
+
+    def test_embedding_calls_are_estimated_and_keep_the_model_name(self):
+        client = mock.Mock(model='models/text-embedding-004')
+        client.embed_documents.return_value = [[0.1], [0.2]]
+        embeddings = MeteredEmbeddings(client)
+
+        self.assertEqual(embeddings.model, 'models/text-embedding-004')
+        embeddings.embed_documents(['Drink water', 'Read twenty pages'])
+
+        [event] = AIUsageTracker.buffer.drain()
+        self.assertEqual((event['feature'], event['model'], event['token_in']), ('embedding', 'text-embedding-004', 6))
+        self.assertIsNone(event['user_id'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AIUsageTrackerTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        EventBuffer._local_buffers.clear()
+        patcher = mock.patch('reports.tasks.flush_ai_usage.apply_async')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(email='ai@example.com', name='AI')
+
+    def test_flush_stores_buffered_records_in_bulk(self):
+        AIUsageTracker.record('report', 'gemini-1.5-flash-002', 100, 20, 850, user_id=self.user.id)
+        AIUsageTracker.record('embedding', 'text-embedding-004', 5, 0, 40, user_id='00000000-0000-0000-0000-000000000000')
+
+        with self.assertNumQueries(2):
+            self.assertEqual(AIUsageTracker.flush(), 2)
+
+        report = AIUsage.objects.get(feature='report')
+        self.assertEqual((report.user_id, report.token_in, report.latency_ms), (self.user.id, 100, 850))
+        # Records of users deleted since the call are kept unattributed
+        self.assertIsNone(AIUsage.objects.get(feature='embedding').user_id)
+        self.assertEqual(AIUsageTracker.flush(), 0)
+
+    def test_failed_flush_puts_the_records_back(self):
+        AIUsageTracker.record('report', 'gemini-1.5-flash-002', 100, 20, 850)
+
+        with mock.patch.object(AIUsage.objects, 'bulk_create', side_effect=RuntimeError('database unavailable')):
+            with self.assertRaises(RuntimeError):
+                AIUsageTracker.flush()
+
+        self.assertEqual(AIUsageTracker.flush(), 1)
+
+    def test_daily_usage_reads_rollups_and_aggregates_today_live(self):
+        two_days_ago = timezone.now() - timedelta(days=2)
+        for latency_ms in (100, 300):
+            AIUsage.objects.create(
+                user=self.user, feature='report', model='gemini-1.5-flash-002',
+                token_in=10, token_out=5, latency_ms=latency_ms, status='ok', created_at=two_days_ago,
+            )
+        AIUsage.objects.create(
+            feature='embedding', model='text-embedding-004', token_in=4, token_out=0, latency_ms=30, status='error',
+        )
+
+        self.assertEqual(AIUsageTracker.rollup_daily_usage(days=7), 1)
+        rollup = AIUsageDaily.objects.get()
+        self.assertEqual((rollup.requests, rollup.users, rollup.token_in, rollup.latency_ms_max), (2, 1, 20, 300))
+
+        # Rolled-up days are no longer read from the raw table
+        AIUsage.objects.filter(feature='report').delete()
+        summary = AIUsageTracker.summarize(AIUsageTracker.get_daily_usage(7), 7)
+
+        self.assertEqual((summary['totals']['requests'], summary['totals']['errors']), (3, 1))
+        self.assertEqual([group['feature'] for group in summary['by_feature']], ['report', 'embedding'])
+        self.assertEqual(summary['by_date'][-1]['requests'], 1)
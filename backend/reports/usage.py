@@ -0,0 +1,290 @@
+"""
+AI usage accounting
+
+Every LLM and embedding call is timed and metered (ai_services.metering,
+core.ai_service) and reported here. Recording only pushes an event onto a
+buffer; a background flush bulk-inserts the AIUsage rows, so accounting adds
+no database write to the request path.
+
+Daily totals per feature and model are rolled up into AIUsageDaily for
+complete days; the current day is aggregated live from the raw table, the
+same split as the email analytics.
+"""
+import logging
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Aggregate, Count, FloatField, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.buffers import EventBuffer
+from .models import AIUsage, AIUsageDaily, estimate_cost
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    """~4 characters per token, for calls whose provider reports no usage"""
+    return len(text or '') // 4
+
+
+class Percentile(Aggregate):
+    """percentile_cont(fraction) WITHIN GROUP (ORDER BY expression)"""
+    function = 'percentile_cont'
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+class AIUsageTracker:
+    """Buffer usage records on the request path and store them in bulk"""
+
+    buffer = EventBuffer('ai_usage')
+
+    FLUSH_DELAY_SECONDS = 10
+    FLUSH_BATCH_SIZE = 5000
+
+    ROLLUP_FIELDS = [
+        'requests', 'errors', 'users', 'token_in', 'token_out',
+        'latency_ms_total', 'latency_ms_p95', 'latency_ms_max',
+    ]
+
+    @staticmethod
+    def record(feature, model, token_in=0, token_out=0, latency_ms=0, status='ok',
+               user_id=None, error_message='', request_data=None):
+        """Append one call's usage and make sure a flush is scheduled"""
+        try:
+            AIUsageTracker.buffer.push({
+                'feature': feature,
+                'model': model,
+                'token_in': int(token_in or 0),
+                'token_out': int(token_out or 0),
+                'latency_ms': int(latency_ms or 0),
+                'status': status,
+                'user_id': str(user_id) if user_id else None,
+                'error_message': (error_message or '')[:1000],
+                'request_data': request_data or {},
+                'ts': timezone.now().isoformat(),
+            })
+            AIUsageTracker.schedule_flush()
+        except Exception as e:
+            logger.error(f"Error buffering AI usage for {feature}: {str(e)}")
+
+    @staticmethod
+    def schedule_flush():
+        """At most one pending flush task at a time"""
+        from .tasks import flush_ai_usage
+
+        if cache.add('ai_usage:flush_scheduled', 1, AIUsageTracker.FLUSH_DELAY_SECONDS * 3):
+            flush_ai_usage.apply_async(countdown=AIUsageTracker.FLUSH_DELAY_SECONDS)
+
+    @staticmethod
+    def flush(max_events=None):
+        """Drain the buffer into AIUsage rows. Returns the number of rows written."""
+        from accounts.models import User
+
+        cache.delete('ai_usage:flush_scheduled')
+
+        events = AIUsageTracker.buffer.drain(max_events or AIUsageTracker.FLUSH_BATCH_SIZE)
+        if not events:
+            return 0
+
+        try:
+            # Users deleted since the call keep their usage, unattributed
+            user_ids = {event['user_id'] for event in events if event.get('user_id')}
+            known_users = {str(pk) for pk in User.objects.filter(id__in=user_ids).values_list('id', flat=True)}
+
+            AIUsage.objects.bulk_create(
+                [
+                    AIUsage(
+                        user_id=event['user_id'] if event.get('user_id') in known_users else None,
+                        feature=event['feature'],
+                        model=event['model'],
+                        token_in=event['token_in'],
+                        token_out=event['token_out'],
+                        latency_ms=event['latency_ms'],
+                        status=event['status'],
+                        error_message=event.get('error_message', ''),
+                        request_data=event.get('request_data') or {},
+                        created_at=parse_datetime(event['ts']),
+                    )
+                    for event in events
+                ],
+                batch_size=1000,
+            )
+        except Exception:
+            # Drained events are only in memory now; put them back for the next flush
+            AIUsageTracker.buffer.push_many(events)
+            AIUsageTracker.schedule_flush()
+            raise
+
+        # More events arrived than one batch holds; keep going
+        if len(AIUsageTracker.buffer):
+            AIUsageTracker.schedule_flush()
+
+        logger.info(f"Stored {len(events)} AI usage records")
+        return len(events)
+
+    @staticmethod
+    def usage_expressions():
+        """Aggregates over AIUsage rows, matching the AIUsageDaily fields"""
+        return {
+            'requests': Count('id'),
+            'errors': Count('id', filter=Q(status='error')),
+            'users': Count('user', distinct=True),
+            'token_in': Sum('token_in'),
+            'token_out': Sum('token_out'),
+            'latency_ms_total': Sum('latency_ms'),
+            'latency_ms_p95': Percentile('latency_ms', 0.95),
+            'latency_ms_max': Max('latency_ms'),
+        }
+
+    @staticmethod
+    def clean_row(row):
+        """Aggregate row with integers in place of NULLs and float percentiles"""
+        for field in AIUsageTracker.ROLLUP_FIELDS:
+            row[field] = int(round(row.get(field) or 0))
+        return row
+
+    @staticmethod
+    def rollup_daily_usage(days=7):
+        """
+        Recompute AIUsageDaily rows for the last `days` complete days.
+
+        Buffered records can land a little after midnight, so recent days
+        are recomputed on every run.
+        """
+        try:
+            today = timezone.now().date()
+            since_date = today - timedelta(days=days)
+
+            rows = AIUsage.objects.filter(
+                created_at__date__gte=since_date,
+                created_at__date__lt=today,
+            ).annotate(
+                day=TruncDate('created_at')
+            ).values('day', 'feature', 'model').annotate(**AIUsageTracker.usage_expressions())
+
+            rollups = [
+                AIUsageDaily(
+                    date=row['day'],
+                    feature=row['feature'],
+                    model=row['model'],
+                    **{field: row[field] for field in AIUsageTracker.ROLLUP_FIELDS},
+                )
+                for row in map(AIUsageTracker.clean_row, rows)
+            ]
+
+            AIUsageDaily.objects.bulk_create(
+                rollups,
+                update_conflicts=True,
+                unique_fields=['date', 'feature', 'model'],
+                update_fields=AIUsageTracker.ROLLUP_FIELDS + ['updated_at'],
+            )
+
+            logger.info(f"Rolled up {len(rollups)} daily AI usage rows")
+            return len(rollups)
+
+        except Exception as e:
+            logger.error(f"Error rolling up AI usage: {str(e)}")
+            return 0
+
+    @staticmethod
+    def get_daily_usage(days):
+        """
+        Usage per (date, feature, model) for the last `days` days, today included.
+
+        Whole days come from AIUsageDaily; today, and any day the rollup has
+        not covered yet, is aggregated live.
+        """
+        today = timezone.now().date()
+        since_date = today - timedelta(days=days - 1)
+
+        rows = list(
+            AIUsageDaily.objects.filter(date__gte=since_date, date__lt=today)
+            .values('date', 'feature', 'model', *AIUsageTracker.ROLLUP_FIELDS)
+        )
+        rolled_up = {row['date'] for row in rows}
+        missing = [since_date + timedelta(days=n) for n in range(days - 1)]
+        missing = [day for day in missing if day not in rolled_up]
+
+        live = (
+            AIUsage.objects.filter(Q(created_at__date__gte=today) | Q(created_at__date__in=missing))
+            .annotate(day=TruncDate('created_at'))
+            .values('day', 'feature', 'model')
+            .annotate(**AIUsageTracker.usage_expressions())
+        )
+        for row in live:
+            row['date'] = row.pop('day')
+            rows.append(AIUsageTracker.clean_row(row))
+        return rows
+
+    @staticmethod
+    def summarize(rows, days):
+        """
+        Totals, a per-day series and per-feature and per-model breakdowns of
+        get_daily_usage() rows. A group's p95 latency is the highest p95 of
+        its rows, an upper bound.
+        """
+        labels = dict(AIUsage.FEATURE_CHOICES)
+        today = timezone.now().date()
+
+        def empty():
+            return {'requests': 0, 'errors': 0, 'token_in': 0, 'token_out': 0,
+                    'latency_ms_total': 0, 'latency_ms_p95': 0, 'latency_ms_max': 0, 'estimated_cost': 0.0}
+
+        def finish(group):
+            requests = group['requests']
+            latency_ms_total = group.pop('latency_ms_total')
+            group['total_tokens'] = group['token_in'] + group['token_out']
+            group['estimated_cost'] = round(group['estimated_cost'], 4)
+            group['average_latency_ms'] = round(latency_ms_total / requests) if requests else 0
+            group['error_rate'] = round(group['errors'] / requests, 4) if requests else 0.0
+            return group
+
+        totals = empty()
+        by_date = {today - timedelta(days=offset): empty() for offset in range(days)}
+        by_feature = {}
+        by_model = {}
+
+        for row in rows:
+            cost = estimate_cost(row['model'], row['token_in'], row['token_out'])
+            groups = (
+                totals,
+                by_date.setdefault(row['date'], empty()),
+                by_feature.setdefault(row['feature'], empty()),
+                by_model.setdefault(row['model'], empty()),
+            )
+            for group in groups:
+                for field in ('requests', 'errors', 'token_in', 'token_out', 'latency_ms_total'):
+                    group[field] += row[field]
+                group['latency_ms_p95'] = max(group['latency_ms_p95'], row['latency_ms_p95'])
+                group['latency_ms_max'] = max(group['latency_ms_max'], row['latency_ms_max'])
+                group['estimated_cost'] += cost
+
+        return {
+            'totals': finish(totals),
+            'by_date': [{'date': date.isoformat(), **finish(group)} for date, group in sorted(by_date.items())],
+            'by_feature': sorted(
+                ({'feature': feature, 'label': labels.get(feature, feature), **finish(group)}
+                 for feature, group in by_feature.items()),
+                key=lambda group: -group['requests'],
+            ),
+            'by_model': sorted(
+                ({'model': model, **finish(group)} for model, group in by_model.items()),
+                key=lambda group: -group['requests'],
+            ),
+        }
+
+    @staticmethod
+    def active_users(days):
+        """Distinct users with at least one AI call in the last `days` days"""
+        since = timezone.now() - timedelta(days=days)
+        return (
+            AIUsage.objects.filter(created_at__gte=since, user__isnull=False)
+            .values('user').distinct().count()
+        )